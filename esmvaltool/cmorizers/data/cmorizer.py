@@ -5,12 +5,14 @@ and reformat to the ESMValTool's data format a set of observations and
 reanalysis.
 """
 import datetime
+import glob
 import importlib
 import logging
 import os
 import shutil
 import subprocess
 import warnings
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
 import esmvalcore
@@ -19,13 +21,35 @@ from esmvalcore._task import write_ncl_settings
 from esmvalcore.config import CFG
 from esmvalcore.config._logging import configure_logging
 
-from esmvaltool import ESMValToolDeprecationWarning
-from esmvaltool.cmorizers.data.utilities import read_cmor_config
+from esmvaltool import ESMValToolDeprecationWarning, __version__
+from esmvaltool.cmorizers.data.downloaders.downloader import close_downloaders
+from esmvaltool.cmorizers.data.downloaders.scheduler import configure_scheduler
+from esmvaltool.cmorizers.data.utilities import (
+    MANIFEST_FILENAME,
+    get_checksum,
+    get_fingerprints,
+    have_inputs_changed,
+    output_profile,
+    read_cmor_config,
+    read_manifest,
+    record_saved_files,
+    write_manifest,
+)
 
 logger = logging.getLogger(__name__)
 datasets_file = os.path.join(os.path.dirname(__file__), 'datasets.yml')
 
 
+def _link_or_copy(source, target):
+    """Hard link a file, or copy it if that is not possible."""
+    if os.path.lexists(target):
+        os.remove(target)
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copy2(source, target)
+
+
 class _Formatter():
     """
     Class to manage the download and formatting of datasets.
@@ -117,6 +141,11 @@ class _Formatter():
         """Run dir folder path."""
         return self.config.run_dir
 
+    @property
+    def max_parallel_tasks(self):
+        """Maximum number of formatting tasks run in parallel, if set."""
+        return self.config.get('max_parallel_tasks')
+
     @property
     def log_level(self):
         """Console log level."""
@@ -126,7 +155,12 @@ class _Formatter():
     def _dataset_to_module(dataset):
         return dataset.lower().replace('-', '_')
 
-    def download(self, start_date, end_date, overwrite):
+    def download(self,
+                 start_date,
+                 end_date,
+                 overwrite,
+                 max_parallel_downloads=1,
+                 max_downloads_per_host=None):
         """Download all datasets.
 
         Parameters
@@ -137,18 +171,32 @@ class _Formatter():
             Last date to download
         overwrite: boolean
             If True, download again existing files
+        max_parallel_downloads: int, optional
+            Maximum number of datasets, and of files within each dataset,
+            downloaded concurrently, by default 1
+        max_downloads_per_host: int, optional
+            Maximum number of concurrent transfers from a single server, by
+            default None (no limit)
         """
         if not self.datasets:
             logger.error('Missing datasets to download')
         logger.info("Downloading original data...")
-        # master directory
-        failed_datasets = []
-        for dataset in self.datasets:
+        scheduler = configure_scheduler(max_parallel_downloads,
+                                        max_downloads_per_host)
+
+        def _download(dataset):
             try:
-                self.download_dataset(dataset, start_date, end_date, overwrite)
+                self.download_dataset(dataset, start_date, end_date,
+                                      overwrite)
             except ValueError:
                 logger.exception('Failed to download %s', dataset)
-                failed_datasets.append(dataset)
+                return False
+            return True
+
+        success = scheduler.map(_download, self.datasets)
+        failed_datasets = [
+            dataset for dataset, ok in zip(self.datasets, success) if not ok
+        ]
         if failed_datasets:
             logger.error('Download failed for datasets %s', failed_datasets)
             return False
@@ -182,12 +230,15 @@ class _Formatter():
             logger.exception('Could not find cmorizer for %s', dataset)
             raise
 
-        downloader.download_dataset(self.config, dataset,
-                                    self.datasets_info['datasets'][dataset],
-                                    start_date, end_date, overwrite)
+        try:
+            downloader.download_dataset(
+                self.config, dataset, self.datasets_info['datasets'][dataset],
+                start_date, end_date, overwrite)
+        finally:
+            close_downloaders(dataset)
         logger.info('%s downloaded', dataset)
 
-    def format(self, start, end, install):
+    def format(self, start, end, install, incremental=False):
         """Format all available datasets.
 
         Parameters
@@ -199,6 +250,10 @@ class _Formatter():
         install: bool
             If True, automatically moves the data to the final location if
             there is no
+        incremental: bool, optional
+            If True, only rebuild the output whose input files, formatter or
+            configuration changed since the data was installed or, if it is
+            not installed, formatted by a previous run, by default False
         """
         logger.info("Running the CMORization scripts.")
         # datasets dictionary of Tier keys
@@ -208,10 +263,44 @@ class _Formatter():
                            self.datasets, self.rawobs)
         logger.info("Processing datasets %s", datasets)
 
-        # loop through tier/datasets to be cmorized
+        # collect the formatting units of all tier/datasets to be cmorized
         failed_datasets = []
+        units = {}
         for dataset in datasets:
-            if not self.format_dataset(dataset, start, end, install):
+            dataset_units = self._get_units(dataset, start, end)
+            if dataset_units is None:
+                failed_datasets.append(dataset)
+            else:
+                units[dataset] = dataset_units
+
+        manifests = {}
+        all_units = []
+        for dataset, dataset_units in units.items():
+            if incremental:
+                manifests[dataset], changed_units = \
+                    self._skip_unchanged_units(dataset, dataset_units,
+                                               install)
+            else:
+                manifests[dataset], changed_units = None, dataset_units
+            all_units.extend(changed_units)
+
+        n_workers = self.max_parallel_tasks
+        if n_workers is None:
+            n_workers = max(
+                [self._get_default_parallel_tasks(unit) for unit in all_units],
+                default=1)
+        results = iter(self._run_units(all_units, start, end, n_workers))
+        for dataset, dataset_units in units.items():
+            # Up to date units keep their manifest entry
+            manifest = manifests[dataset] or {}
+            dataset_results = [
+                manifest[unit['name']]
+                if unit['name'] in manifest else next(results)
+                for unit in dataset_units
+            ]
+            if not self._finish_dataset(dataset, dataset_units,
+                                        dataset_results, install,
+                                        manifests[dataset]):
                 failed_datasets.append(dataset)
 
         if failed_datasets:
@@ -277,6 +366,24 @@ class _Formatter():
             If True, automatically moves the data to the final location if
             there is no data there.
         """
+        units = self._get_units(dataset, start, end)
+        if units is None:
+            return False
+        results = self._run_units(units, start, end, 1)
+        return self._finish_dataset(dataset, units, results, install)
+
+    def _get_units(self, dataset, start, end):
+        """Split the formatting of a dataset in independent units.
+
+        Python formatters that define the functions ``get_tasks`` and
+        ``run_task`` are split in one unit per task, all other formatters
+        are run as a single unit.
+
+        Returns
+        -------
+        list(dict) or None
+            Formatting units, None if the dataset can not be formatted.
+        """
         reformat_script_root = os.path.join(
             os.path.dirname(os.path.abspath(__file__)), 'formatters',
             'datasets', self._dataset_to_module(dataset))
@@ -285,7 +392,7 @@ class _Formatter():
             logger.error("Data for %s not found. Perhaps you are not"
                          " storing it in a RAWOBS/TierX/%s"
                          " (X=2 or 3) directory structure?", dataset, dataset)
-            return False
+            return None
 
         # in-data dir; build out-dir tree
         in_data_dir = os.path.join(self.rawobs, tier, dataset)
@@ -295,30 +402,286 @@ class _Formatter():
         if not os.path.isdir(out_data_dir):
             os.makedirs(out_data_dir)
 
-        # all operations are done in the working dir now
-        os.chdir(out_data_dir)
+        unit = {
+            'dataset': dataset,
+            'name': dataset,
+            'tier': tier,
+            'in_dir': in_data_dir,
+            'out_dir': out_data_dir,
+            'script': None,
+            'task': None,
+            'period': f'{start}/{end}',
+            'record': False,
+        }
         # figure out what language the script is in
         logger.info("Reformat script: %s", reformat_script_root)
         if os.path.isfile(reformat_script_root + '.ncl'):
-            reformat_script = reformat_script_root + '.ncl'
-            success = self._run_ncl_script(in_data_dir, out_data_dir, dataset,
-                                           reformat_script, start, end)
-        elif os.path.isfile(reformat_script_root + '.py'):
-            success = self._run_pyt_script(in_data_dir, out_data_dir, dataset,
-                                           start, end)
-        else:
+            unit['script'] = reformat_script_root + '.ncl'
+            return [unit]
+        if not os.path.isfile(reformat_script_root + '.py'):
             logger.error('Could not find formatter for %s', dataset)
-            return False
-        if success:
-            logger.info('Formatting successful for dataset %s', dataset)
-        else:
+            return None
+        unit['script'] = reformat_script_root + '.py'
+        try:
+            module = importlib.import_module(
+                'esmvaltool.cmorizers.data.formatters.datasets.' +
+                self._dataset_to_module(dataset))
+            if not (hasattr(module, 'get_tasks')
+                    and hasattr(module, 'run_task')):
+                return [unit]
+            tasks = module.get_tasks(in_data_dir, out_data_dir,
+                                     read_cmor_config(dataset), self.config,
+                                     start, end)
+        except Exception:
+            logger.exception('Could not get the formatting tasks of %s',
+                             dataset)
+            return None
+        units = []
+        for task in tasks:
+            name = '_'.join(
+                str(value) for value in task.values()
+                if isinstance(value, (str, int)))
+            units.append(dict(unit, name=f'{dataset}_{name}', task=task))
+        logger.info("Formatting of %s split in %s tasks", dataset,
+                    len(units))
+        return units
+
+    @staticmethod
+    def _get_default_parallel_tasks(unit):
+        """Get the number of tasks run in parallel if it is not configured.
+
+        Python formatters can set ``DEFAULT_MAX_PARALLEL_TASKS``, all others
+        are run one after another.
+        """
+        if unit['task'] is None:
+            return 1
+        module = importlib.import_module(
+            'esmvaltool.cmorizers.data.formatters.datasets.' +
+            os.path.splitext(os.path.basename(unit['script']))[0])
+        return getattr(module, 'DEFAULT_MAX_PARALLEL_TASKS', 1)
+
+    def _get_install_dir(self, dataset, tier):
+        """Get the folder where a formatted dataset is installed."""
+        rootpath = self.config['rootpath']
+        target_dir = rootpath.get('OBS', rootpath['default'])[0]
+        return os.path.join(target_dir, tier, dataset)
+
+    @staticmethod
+    def _get_unit_inputs(unit):
+        """Get the input files of a formatting unit.
+
+        These are the files listed in the task key ``in_files``, if any, or
+        all the files of the dataset input directory.
+        """
+        if unit['task'] and 'in_files' in unit['task']:
+            return sorted(path for path in unit['task']['in_files']
+                          if os.path.isfile(path))
+        return sorted(
+            os.path.join(root, filename)
+            for root, _, filenames in os.walk(unit['in_dir'])
+            for filename in filenames)
+
+    @staticmethod
+    def _get_unit_key(unit):
+        """Get the hashes that identify how a unit is formatted."""
+        config_file = os.path.join(os.path.dirname(__file__), 'cmor_config',
+                                   f"{unit['dataset']}.yml")
+        return {
+            'config': (get_checksum(config_file)
+                       if os.path.isfile(config_file) else None),
+            'formatter': get_checksum(unit['script']),
+            'period': unit['period'],
+            'version': __version__,
+        }
+
+    @staticmethod
+    def _get_previous_output_dir(unit):
+        """Get the most recent output of a unit's dataset in another run.
+
+        Only output folders with a manifest are considered.
+        """
+        out_dir = os.path.abspath(unit['out_dir'])
+        sessions_dir = os.path.dirname(os.path.dirname(os.path.dirname(
+            out_dir)))
+        manifests = [
+            path for path in glob.glob(
+                os.path.join(sessions_dir, '*', unit['tier'],
+                             unit['dataset'], MANIFEST_FILENAME))
+            if os.path.dirname(path) != out_dir
+        ]
+        if not manifests:
+            return None
+        return os.path.dirname(max(manifests, key=os.path.getmtime))
+
+    def _skip_unchanged_units(self, dataset, units, install):
+        """Find the units whose previous output is up to date.
+
+        The output is compared with the installed dataset if it is going to
+        be updated, otherwise with the most recent output of a previous run.
+        Up to date output of a previous run is linked into the output folder.
+
+        Returns
+        -------
+        dict
+            Manifest entries of the up to date units.
+        list(dict)
+            Units that need to be run.
+        """
+        if not units:
+            return {}, units
+        previous_dir = self._get_install_dir(dataset, units[0]['tier'])
+        installed = install and os.path.isdir(previous_dir)
+        if not installed:
+            previous_dir = self._get_previous_output_dir(units[0])
+        previous = read_manifest(previous_dir) if previous_dir else {}
+        manifest = {}
+        changed_units = []
+        for unit in units:
+            unit['record'] = True
+            entry = previous.get(unit['name'])
+            if (entry is not None
+                    and all(entry[key] == value
+                            for key, value in self._get_unit_key(unit).items())
+                    and all(os.path.isfile(os.path.join(previous_dir, name))
+                            for name in entry['outputs'])
+                    and not have_inputs_changed(self._get_unit_inputs(unit),
+                                                entry['inputs'])):
+                manifest[unit['name']] = entry
+                if not installed:
+                    for name in entry['outputs']:
+                        _link_or_copy(os.path.join(previous_dir, name),
+                                      os.path.join(unit['out_dir'], name))
+            else:
+                changed_units.append(unit)
+        logger.info("%s of %s formatting tasks of %s are up to date",
+                    len(manifest), len(units), dataset)
+        return manifest, changed_units
+
+    def _run_units(self, units, start, end, n_workers):
+        """Run formatting units, using up to n_workers processes.
+
+        Returns
+        -------
+        list(dict or None)
+            Result of each unit, None if it failed.
+        """
+        if n_workers == 1 or len(units) < 2:
+            return [self._run_unit(unit, start, end) for unit in units]
+        n_workers = min(n_workers, len(units))
+        logger.info("Running %s formatting tasks using %s processes",
+                    len(units), n_workers)
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            futures = [
+                executor.submit(self._run_unit, unit, start, end)
+                for unit in units
+            ]
+        results = []
+        for unit, future in zip(units, futures):
+            try:
+                results.append(future.result())
+            except Exception:
+                # e.g. a worker process died
+                logger.exception('Formatting task %s failed', unit['name'])
+                results.append(None)
+        return results
+
+    def _run_unit(self, unit, start, end):
+        """Run a formatting unit, writing its log to the run directory.
+
+        Returns
+        -------
+        dict or None
+            Manifest entry of the unit if it must be recorded, an empty dict
+            otherwise, or None if the unit failed.
+        """
+        log_dir = os.path.join(self.run_dir, unit['dataset'])
+        os.makedirs(log_dir, exist_ok=True)
+        handler = logging.FileHandler(
+            os.path.join(log_dir, f"{unit['name']}.log"), encoding='utf-8')
+        handler.setFormatter(logging.Formatter(
+            '%(asctime)s UTC [%(process)d] %(levelname)-7s '
+            '%(name)s:%(lineno)s %(message)s'))
+        logging.getLogger().addHandler(handler)
+        cwd = os.getcwd()
+        try:
+            entry = {}
+            if unit['record']:
+                entry = self._get_unit_key(unit)
+                entry['inputs'] = get_fingerprints(
+                    self._get_unit_inputs(unit))
+            # all operations are done in the working dir now
+            os.chdir(unit['out_dir'])
+            with record_saved_files() as outputs:
+                if unit['script'].endswith('.ncl'):
+                    success = self._run_ncl_script(
+                        unit['in_dir'], unit['out_dir'], unit['dataset'],
+                        unit['script'], start, end)
+                else:
+                    success = self._run_pyt_script(
+                        unit['in_dir'], unit['out_dir'], unit['dataset'],
+                        start, end, unit['task'])
+            if not success:
+                return None
+            if unit['record']:
+                if unit['script'].endswith('.ncl'):
+                    # NCL scripts do not report what they save
+                    outputs = [
+                        name for name in os.listdir(unit['out_dir'])
+                        if name.endswith('.nc')
+                    ]
+                entry['outputs'] = sorted(
+                    os.path.basename(path) for path in outputs)
+            return entry
+        except Exception:
+            logger.exception('Formatting task %s failed', unit['name'])
+            return None
+        finally:
+            os.chdir(cwd)
+            logging.getLogger().removeHandler(handler)
+            handler.close()
+
+    def _finish_dataset(self, dataset, units, results, install,
+                        manifest=None):
+        """Report the result of a dataset and install it if requested.
+
+        Parameters
+        ----------
+        manifest: dict, optional
+            Manifest entries of the units that did not need to run, their
+            result is the same entry. If given, the manifest of the dataset
+            is written and the new output is merged into an already installed
+            dataset.
+
+        Returns
+        -------
+        bool
+            True if all units of the dataset were successful.
+        """
+        if manifest is not None:
+            manifest = dict(manifest)
+            for unit, result in zip(units, results):
+                if result is not None:
+                    manifest[unit['name']] = result
+        if any(result is None for result in results):
             logger.error('Formatting failed for dataset %s', dataset)
+            if manifest is not None and units:
+                write_manifest(units[0]['out_dir'], manifest)
             return False
+        logger.info('Formatting successful for dataset %s', dataset)
+        if not units:
+            return True
+        out_data_dir = units[0]['out_dir']
+        if manifest is not None:
+            write_manifest(out_data_dir, manifest)
         if install:
-            rootpath = self.config['rootpath']
-            target_dir = rootpath.get('OBS', rootpath['default'])[0]
-            target_dir = os.path.join(target_dir, tier, dataset)
-            if os.path.isdir(target_dir):
+            target_dir = self._get_install_dir(dataset, units[0]['tier'])
+            if os.path.isdir(target_dir) and manifest is not None:
+                logger.info('Updating dataset %s in folder %s', dataset,
+                            target_dir)
+                for name in os.listdir(out_data_dir):
+                    shutil.move(os.path.join(out_data_dir, name),
+                                os.path.join(target_dir, name))
+            elif os.path.isdir(target_dir):
                 logger.info(
                     'Automatic installation of dataset %s skipped: '
                     'target folder %s already exists', dataset, target_dir)
@@ -398,7 +761,8 @@ class _Formatter():
             return False
         return True
 
-    def _run_pyt_script(self, in_dir, out_dir, dataset, start, end):
+    def _run_pyt_script(self, in_dir, out_dir, dataset, start, end,
+                        task=None):
         """Run the Python cmorization mechanism."""
         module_name = ('esmvaltool.cmorizers.data.formatters.datasets.' +
                        dataset.lower().replace("-", "_"))
@@ -406,8 +770,18 @@ class _Formatter():
         logger.info("CMORizing dataset %s using Python script %s", dataset,
                     module.__file__)
         cmor_cfg = read_cmor_config(dataset)
-        module.cmorization(in_dir, out_dir, cmor_cfg, self.config, start, end)
-        logger.info('CMORization of dataset %s finished!', dataset)
+        with output_profile(cmor_cfg.get('output')):
+            if task is None:
+                module.cmorization(in_dir, out_dir, cmor_cfg, self.config,
+                                   start, end)
+            else:
+                module.run_task(in_dir, out_dir, cmor_cfg, self.config,
+                                start, end, task)
+        if task is None:
+            logger.info('CMORization of dataset %s finished!', dataset)
+        else:
+            logger.info('CMORization of dataset %s finished for task %s',
+                        dataset, task)
         return True
 
 
@@ -459,6 +833,8 @@ class DataCommand():
                  end=None,
                  overwrite=False,
                  config_dir=None,
+                 max_parallel_downloads=1,
+                 max_downloads_per_host=None,
                  **kwargs):
         """Download datasets.
 
@@ -484,6 +860,12 @@ class DataCommand():
         config_dir: str, optional
             Path to additional ESMValTool configuration directory. See
             :ref:`esmvalcore:config_yaml_files` for details.
+        max_parallel_downloads: int, optional
+            Maximum number of datasets, and of files within each dataset,
+            downloaded concurrently, by default 1
+        max_downloads_per_host: int, optional
+            Maximum number of concurrent transfers from a single server, by
+            default None (no limit)
 
         """
         if config_file is not None:
@@ -500,7 +882,8 @@ class DataCommand():
         self.formatter.start(
             'download', datasets, config_file, config_dir, kwargs
         )
-        self.formatter.download(start, end, overwrite)
+        self.formatter.download(start, end, overwrite, max_parallel_downloads,
+                                max_downloads_per_host)
 
     def format(self,
                datasets,
@@ -509,6 +892,7 @@ class DataCommand():
                end=None,
                install=False,
                config_dir=None,
+               incremental=False,
                **kwargs):
         """Format datasets.
 
@@ -534,6 +918,10 @@ class DataCommand():
         config_dir: str, optional
             Path to additional ESMValTool configuration directory. See
             :ref:`esmvalcore:config_yaml_files` for details.
+        incremental : bool, optional
+            If true, only rebuild output whose input files, formatter or
+            configuration changed since the dataset was installed, by
+            default False
 
         """
         if config_file is not None:
@@ -550,7 +938,7 @@ class DataCommand():
         self.formatter.start(
             'formatting', datasets, config_file, config_dir, kwargs
         )
-        self.formatter.format(start, end, install)
+        self.formatter.format(start, end, install, incremental)
 
     def prepare(self,
                 datasets,
@@ -560,6 +948,9 @@ class DataCommand():
                 overwrite=False,
                 install=False,
                 config_dir=None,
+                max_parallel_downloads=1,
+                max_downloads_per_host=None,
+                incremental=False,
                 **kwargs):
         """Download and format a set of datasets.
 
@@ -587,6 +978,16 @@ class DataCommand():
         config_dir: str, optional
             Path to additional ESMValTool configuration directory. See
             :ref:`esmvalcore:config_yaml_files` for details.
+        max_parallel_downloads: int, optional
+            Maximum number of datasets, and of files within each dataset,
+            downloaded concurrently, by default 1
+        max_downloads_per_host: int, optional
+            Maximum number of concurrent transfers from a single server, by
+            default None (no limit)
+        incremental : bool, optional
+            If true, only rebuild output whose input files, formatter or
+            configuration changed since the dataset was installed, by
+            default False
 
         """
         if config_file is not None:
@@ -603,8 +1004,10 @@ class DataCommand():
         self.formatter.start(
             'preparation', datasets, config_file, config_dir, kwargs
         )
-        if self.formatter.download(start, end, overwrite):
-            self.formatter.format(start, end, install)
+        if self.formatter.download(start, end, overwrite,
+                                   max_parallel_downloads,
+                                   max_downloads_per_host):
+            self.formatter.format(start, end, install, incremental)
         else:
             logger.warning("Download failed, skipping format step")
 
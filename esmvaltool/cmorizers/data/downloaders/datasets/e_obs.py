@@ -31,11 +31,12 @@ def download_dataset(config, dataset, dataset_info, start_date, end_date,
         dataset_info=dataset_info,
         overwrite=overwrite,
     )
+    server_paths = []
     for var in ['TG', 'TN', 'TX', 'RR', 'PP']:
         for grid in ('0.1deg', '0.25deg'):
             for version in ('20.0e', ):
-                downloader.download_file(
+                server_paths.append(
                     "https://knmi-ecad-assets-prd.s3.amazonaws.com/ensembles/"
                     f"data/Grid_{grid}_reg_ensemble/"
-                    f"{var.lower()}_ens_mean_{grid}_reg_v{version}.nc",
-                    wget_options=[])
+                    f"{var.lower()}_ens_mean_{grid}_reg_v{version}.nc")
+    downloader.download_files(server_paths, wget_options=[])
@@ -1,6 +1,12 @@
 """Downloader base class."""
 
 import os
+from collections import defaultdict
+
+from .scheduler import get_manifest, get_scheduler
+
+# Downloaders created for each dataset, closed by close_downloaders
+_DOWNLOADERS = defaultdict(list)
 
 
 class BaseDownloader():
@@ -16,6 +22,9 @@ class BaseDownloader():
         Dataset information from the datasets.yml file
     overwrite : bool
         Overwrite already downloaded files
+
+    Downloaders are closed by :func:`close_downloaders` when the download of
+    their dataset ends. They can also be used as context managers.
     """
     def __init__(self, config, dataset, dataset_info, overwrite):
         self._config = config
@@ -23,6 +32,18 @@ class BaseDownloader():
         self.dataset = dataset
         self.dataset_info = dataset_info
         self.overwrite = overwrite
+        _DOWNLOADERS[dataset].append(self)
+
+    def __enter__(self):
+        """Enter context."""
+        return self
+
+    def __exit__(self, *_):
+        """Close the downloader before exiting context."""
+        self.close()
+
+    def close(self):
+        """Release the connections held by the downloader."""
 
     @property
     def local_folder(self):
@@ -46,3 +67,39 @@ class BaseDownloader():
             Path to the RAWOBS folder
         """
         return self._config['rootpath']['RAWOBS'][0]
+
+    @property
+    def scheduler(self):
+        """Scheduler used to run concurrent transfers.
+
+        Returns
+        -------
+        DownloadScheduler
+            Download scheduler shared by all downloaders
+        """
+        return get_scheduler()
+
+    @property
+    def manifest(self):
+        """Record of the files already downloaded for this dataset.
+
+        Returns
+        -------
+        DownloadManifest
+            Download manifest of the dataset
+        """
+        return get_manifest(
+            os.path.join(self.rawobs_folder, '.download_manifests',
+                         f'Tier{self.tier}_{self.dataset}.jsonl'))
+
+
+def close_downloaders(dataset):
+    """Close all downloaders created for a dataset.
+
+    Parameters
+    ----------
+    dataset : str
+        Dataset name
+    """
+    for downloader in _DOWNLOADERS.pop(dataset, []):
+        downloader.close()
@@ -3,7 +3,12 @@
 import ftplib
 import logging
 import os
+import posixpath
+import queue
 import re
+import threading
+import time
+from contextlib import contextmanager
 
 from progressbar import (
     ETA,
@@ -19,9 +24,151 @@ from .downloader import BaseDownloader
 logger = logging.getLogger(__name__)
 
 
+def _close_session(client):
+    """Close an FTP session, even if the connection is broken."""
+    try:
+        client.quit()
+    except ftplib.all_errors:
+        client.close()
+
+
+class FTPSessionPool():
+    """Pool of authenticated FTP sessions to a server.
+
+    Sessions are opened lazily, kept alive with ``NOOP`` when they have been
+    idle for a while and transparently replaced if the connection was lost.
+
+    Parameters
+    ----------
+    server : str
+        FTP server URL
+    size : int, optional
+        Maximum number of open sessions, by default 1
+    port : int, optional
+        FTP server port, by default 21
+    keepalive : float, optional
+        Idle time, in seconds, after which a session is checked with ``NOOP``
+        before being reused, by default 60
+    timeout : float, optional
+        Timeout, in seconds, of the blocking operations of the sessions, by
+        default 60
+    """
+    def __init__(self, server, size=1, port=21, keepalive=60, timeout=60):
+        self.server = server
+        self.port = port
+        self.size = max(1, int(size))
+        self.keepalive = keepalive
+        self.timeout = timeout
+        self.cwd = None
+        # All open sessions, both idle and borrowed
+        self._sessions = set()
+        self._lock = threading.Lock()
+        # Idle sessions as (client, working directory, last use) tuples. A
+        # None client is a free slot for which a session must be opened.
+        self._idle = queue.LifoQueue()
+        for _ in range(self.size):
+            self._idle.put((None, None, 0.))
+
+    def _connect(self):
+        client = ftplib.FTP(timeout=self.timeout)
+        with self._lock:
+            self._sessions.add(client)
+        try:
+            client.connect(self.server, self.port)
+            client.login()
+        except BaseException:
+            self._discard(client)
+            raise
+        return client
+
+    def _discard(self, client):
+        with self._lock:
+            self._sessions.discard(client)
+        _close_session(client)
+
+    def _acquire(self):
+        """Get a live session in the pool working directory."""
+        client, cwd, last_used = self._idle.get()
+        try:
+            if (client is not None
+                    and time.monotonic() - last_used > self.keepalive):
+                try:
+                    client.voidcmd('NOOP')
+                except ftplib.all_errors:
+                    logger.debug('FTP session to %s expired, reconnecting',
+                                 self.server)
+                    self._discard(client)
+                    client = None
+            if client is None:
+                client = self._connect()
+                cwd = None
+            if self.cwd is not None and cwd != self.cwd:
+                client.cwd(self.cwd)
+                cwd = self.cwd
+        except BaseException:
+            if client is not None:
+                self._discard(client)
+            self._release(None)
+            raise
+        return client, cwd
+
+    def _release(self, client, cwd=None):
+        with self._lock:
+            if client not in self._sessions:
+                # The session was closed while it was borrowed
+                client = None
+        self._idle.put((client, cwd, time.monotonic()))
+
+    @contextmanager
+    def session(self):
+        """Borrow a session from the pool.
+
+        If the connection breaks while the session is in use, it is
+        discarded and a new one is opened the next time it is needed.
+
+        Yields
+        ------
+        ftplib.FTP
+            Authenticated FTP session in the pool working directory
+        """
+        client, cwd = self._acquire()
+        try:
+            yield client
+        except (OSError, EOFError, ftplib.error_temp, ftplib.error_proto):
+            self._discard(client)
+            self._release(None)
+            raise
+        except BaseException:
+            self._release(client, cwd)
+            raise
+        self._release(client, cwd)
+
+    def close(self):
+        """Close all sessions, including those that are in use.
+
+        Sessions that are in use fail on their next command and are
+        discarded when they are returned to the pool.
+        """
+        idle = []
+        while True:
+            try:
+                idle.append(self._idle.get_nowait())
+            except queue.Empty:
+                break
+        with self._lock:
+            sessions = list(self._sessions)
+        for client in sessions:
+            self._discard(client)
+        for _ in idle:
+            self._release(None)
+
+
 class FTPDownloader(BaseDownloader):
     """Downloader for FTP repositories.
 
+    Files are transferred in parallel through a pool of FTP sessions, while
+    the main session is used to browse the server.
+
     Parameters
     ----------
     config : dict
@@ -34,17 +181,55 @@ class FTPDownloader(BaseDownloader):
         Dataset information from the datasets.yml file
     overwrite : bool
         Overwrite already downloaded files
+    port : int, optional
+        FTP server port, by default 21
+    max_sessions : int, optional
+        Maximum number of sessions used to transfer files in parallel. By
+        default, one per download worker.
     """
-    def __init__(self, config, server, dataset, dataset_info, overwrite):
+    def __init__(self,
+                 config,
+                 server,
+                 dataset,
+                 dataset_info,
+                 overwrite,
+                 port=21,
+                 max_sessions=None):
         super().__init__(config, dataset, dataset_info, overwrite)
         self._client = None
+        self._pool = None
+        self._cwd = '/'
+        self._listings = {}
         self.server = server
+        self.port = port
+        self.max_sessions = max_sessions
+        self.retries = 2
+        self.timeout = 60
 
     def connect(self):
         """Connect to the FTP server."""
-        self._client = ftplib.FTP(self.server)
+        self._client = ftplib.FTP(timeout=self.timeout)
+        self._client.connect(self.server, self.port)
         logger.info(self._client.getwelcome())
         self._client.login()
+        if self._pool is not None:
+            self._pool.close()
+        self._pool = FTPSessionPool(
+            self.server,
+            size=self.max_sessions or self.scheduler.max_workers,
+            port=self.port,
+            timeout=self.timeout,
+        )
+        self._pool.cwd = self._cwd
+
+    def close(self):
+        """Close all connections to the FTP server."""
+        if self._pool is not None:
+            self._pool.close()
+            self._pool = None
+        if self._client is not None:
+            _close_session(self._client)
+            self._client = None
 
     def set_cwd(self, path):
         """Set current working directory in the remote.
@@ -57,7 +242,21 @@ class FTPDownloader(BaseDownloader):
         logger.debug('Current working directory: %s', self._client.pwd())
         logger.debug('Setting working directory to %s', path)
         self._client.cwd(path)
-        logger.debug('New working directory: %s', self._client.pwd())
+        self._cwd = self._client.pwd()
+        self._pool.cwd = self._cwd
+        logger.debug('New working directory: %s', self._cwd)
+
+    def _remote_id(self, server_path):
+        """Get a unique identifier of a remote path for the manifest."""
+        path = posixpath.normpath(posixpath.join(self._cwd, server_path))
+        return f'ftp://{self.server}{path}'
+
+    def _list(self, server_path):
+        """List a remote folder, reusing the result of previous calls."""
+        folder_id = self._remote_id(server_path)
+        if folder_id not in self._listings:
+            self._listings[folder_id] = self._client.nlst(server_path)
+        return self._listings[folder_id]
 
     def list_folders(self, server_path='.'):
         """List folder in the remote.
@@ -72,9 +271,13 @@ class FTPDownloader(BaseDownloader):
         list(str)
             List of folder names
         """
-        filenames = self._client.mlsd(server_path, facts=['type'])
+        folder_id = 'mlsd:' + self._remote_id(server_path)
+        if folder_id not in self._listings:
+            self._listings[folder_id] = list(
+                self._client.mlsd(server_path, facts=['type']))
         return [
-            filename for filename, facts in filenames if facts['type'] == 'dir'
+            filename for filename, facts in self._listings[folder_id]
+            if facts['type'] == 'dir'
         ]
 
     def exists(self, server_path):
@@ -85,7 +288,7 @@ class FTPDownloader(BaseDownloader):
         server_path : str
             Path to check for existence.
         """
-        return server_path in self._client.nlst()
+        return server_path in self._list('.')
 
     def download_folder(self, server_path, sub_folder='', filter_files=None):
         """Download files from a given folder.
@@ -100,8 +303,14 @@ class FTPDownloader(BaseDownloader):
             If set, only download files that match this regular expression,
             by default None
         """
-        # get filenames within the directory
-        filenames = self._client.nlst(server_path)
+        folder_id = self._remote_id(server_path)
+        # reuse the listing of an interrupted run, if any
+        filenames = None
+        if not self.overwrite:
+            filenames = self.manifest.get_listing(folder_id)
+        if filenames is None:
+            filenames = self._list(server_path)
+            self.manifest.set_listing(folder_id, filenames)
         logger.info('Downloading files in %s', server_path)
         if filter_files:
             expression = re.compile(filter_files)
@@ -109,8 +318,10 @@ class FTPDownloader(BaseDownloader):
                 filename for filename in filenames
                 if expression.match(os.path.basename(filename))
             ]
-        for filename in filenames:
-            self.download_file(filename, sub_folder)
+        self.scheduler.map(
+            lambda filename: self.download_file(filename, sub_folder),
+            filenames)
+        self.manifest.set_listing(folder_id, filenames, complete=True)
 
     def download_file(self, server_path, sub_folder=''):
         """Download a file from the server.
@@ -125,42 +336,73 @@ class FTPDownloader(BaseDownloader):
         os.makedirs(os.path.join(self.local_folder, sub_folder), exist_ok=True)
         local_path = os.path.join(self.local_folder, sub_folder,
                                   os.path.basename(server_path))
+        source = self._remote_id(server_path)
         if not self.overwrite and os.path.isfile(local_path):
             logger.info('File %s already downloaded. Skipping...', server_path)
+            if not self.manifest.is_complete(source, local_path):
+                self.manifest.mark_complete(source, local_path)
             return
         logger.info('Downloading %s', server_path)
         logger.debug('Downloading to %s', local_path)
 
-        self._client.sendcmd("TYPE i")
-        size = self._client.size(server_path)
+        # data is written to a partial file first, so that interrupted
+        # transfers can be resumed with the REST command
+        partial_path = local_path + '.part'
+        if self.overwrite and os.path.isfile(partial_path):
+            os.remove(partial_path)
+        for attempt in range(self.retries + 1):
+            try:
+                self._retrieve(server_path, partial_path)
+                break
+            except (OSError, EOFError, ftplib.error_temp) as ex:
+                if attempt == self.retries:
+                    raise
+                logger.warning('Download of %s interrupted (%s), retrying',
+                               server_path, ex)
+        os.replace(partial_path, local_path)
+        self.manifest.mark_complete(source, local_path)
+
+    def _retrieve(self, server_path, partial_path):
+        """Download a file, or its missing part, using a pooled session."""
+        offset = 0
+        if os.path.isfile(partial_path):
+            offset = os.path.getsize(partial_path)
+
+        with self._pool.session() as client:
+            client.sendcmd("TYPE i")
+            size = client.size(server_path)
+            if offset > size:
+                os.remove(partial_path)
+                offset = 0
+            if offset:
+                logger.info('Resuming download of %s at byte %s',
+                            server_path, offset)
+
+            widgets = [
+                DataSize(),
+                Bar(),
+                Percentage(), ' ',
+                FileTransferSpeed(), ' (',
+                ETA(), ')'
+            ]
 
-        widgets = [
-            DataSize(),
-            Bar(),
-            Percentage(), ' ',
-            FileTransferSpeed(), ' (',
-            ETA(), ')'
-        ]
+            progress = ProgressBar(max_value=size, widgets=widgets)
+            progress.start()
+            progress.update(offset)
 
-        progress = ProgressBar(max_value=size, widgets=widgets)
-        progress.start()
+            with open(partial_path, 'ab' if offset else 'wb') as file_handler:
 
-        with open(local_path, 'wb') as file_handler:
+                def _file_write(data):
+                    file_handler.write(data)
+                    nonlocal progress
+                    progress += len(data)
 
-            def _file_write(data):
-                file_handler.write(data)
-                nonlocal progress
-                progress += len(data)
+                with self.scheduler.host_slot(self.server):
+                    client.retrbinary(f'RETR {server_path}',
+                                      _file_write,
+                                      rest=offset or None)
 
-            try:
-                self._client.retrbinary(f'RETR {server_path}', _file_write)
-            except Exception:
-                file_handler.close()
-                if os.path.exists(local_path):
-                    os.remove(local_path)
-                raise
-
-        progress.finish()
+            progress.finish()
 
 
 class CCIDownloader(FTPDownloader):
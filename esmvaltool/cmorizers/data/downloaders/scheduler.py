@@ -0,0 +1,285 @@
+"""Scheduling and bookkeeping for concurrent, resumable downloads."""
+
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+
+class DownloadScheduler():
+    """Bounded worker pool for downloads.
+
+    Parameters
+    ----------
+    max_workers : int, optional
+        Maximum number of tasks run concurrently by a single call to
+        :meth:`map`, by default 1 (sequential execution)
+    max_per_host : int, optional
+        Maximum number of concurrent transfers from a single host, shared by
+        all workers. If None, only ``max_workers`` applies.
+    """
+    def __init__(self, max_workers=1, max_per_host=None):
+        self.max_workers = max(1, int(max_workers))
+        self.max_per_host = max_per_host
+        self._host_slots = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def get_host(server_path):
+        """Get the host name of a remote path.
+
+        Parameters
+        ----------
+        server_path : str
+            URL or host name
+
+        Returns
+        -------
+        str
+            Host name, or the given path if it is not a URL
+        """
+        host = urlparse(server_path).netloc
+        if not host:
+            return server_path
+        return host.rsplit('@', 1)[-1]
+
+    @contextmanager
+    def host_slot(self, server_path):
+        """Reserve one of the transfer slots available for a host.
+
+        Parameters
+        ----------
+        server_path : str
+            URL or host name of the remote
+        """
+        if not self.max_per_host:
+            yield
+            return
+        host = self.get_host(server_path)
+        with self._lock:
+            if host not in self._host_slots:
+                self._host_slots[host] = threading.BoundedSemaphore(
+                    self.max_per_host)
+            semaphore = self._host_slots[host]
+        with semaphore:
+            yield
+
+    def map(self, function, items):
+        """Apply a function to all items using the worker pool.
+
+        All tasks are run to completion even if some of them fail. The first
+        exception raised by a task is then re-raised.
+
+        Parameters
+        ----------
+        function : callable
+            Function to apply, it receives a single item as argument
+        items : iterable
+            Items to process
+
+        Returns
+        -------
+        list
+            Results, in the same order as ``items``
+        """
+        items = list(items)
+        if self.max_workers == 1 or len(items) < 2:
+            return [function(item) for item in items]
+        n_workers = min(self.max_workers, len(items))
+        with ThreadPoolExecutor(max_workers=n_workers) as executor:
+            futures = [executor.submit(function, item) for item in items]
+        errors = [
+            future.exception() for future in futures
+            if future.exception() is not None
+        ]
+        if errors:
+            raise errors[0]
+        return [future.result() for future in futures]
+
+
+_SCHEDULER = DownloadScheduler()
+
+
+def get_scheduler():
+    """Get the scheduler shared by all downloaders.
+
+    Returns
+    -------
+    DownloadScheduler
+        Current download scheduler
+    """
+    return _SCHEDULER
+
+
+def configure_scheduler(max_workers=1, max_per_host=None):
+    """Replace the scheduler shared by all downloaders.
+
+    Parameters
+    ----------
+    max_workers : int, optional
+        Maximum number of concurrent tasks, by default 1
+    max_per_host : int, optional
+        Maximum number of concurrent transfers from a single host, by default
+        None
+
+    Returns
+    -------
+    DownloadScheduler
+        New download scheduler
+    """
+    global _SCHEDULER
+    _SCHEDULER = DownloadScheduler(max_workers, max_per_host)
+    return _SCHEDULER
+
+
+class DownloadManifest():
+    """On-disk record of completed downloads.
+
+    The manifest is an append-only JSON lines file, so that it can be updated
+    cheaply after each transfer and an interrupted run can continue where it
+    stopped.
+
+    Parameters
+    ----------
+    path : str
+        Path to the manifest file
+    """
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._files = {}
+        self._folders = {}
+        self._load()
+
+    def _load(self):
+        if not os.path.isfile(self.path):
+            return
+        with open(self.path, 'r', encoding='utf-8') as manifest_file:
+            for line in manifest_file:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # Last line of an interrupted write
+                    logger.debug('Ignoring corrupt line in %s', self.path)
+                    continue
+                if 'folder' in entry:
+                    self._folders[entry['folder']] = entry
+                else:
+                    self._files[entry['source']] = entry
+
+    def _append(self, entry):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, 'a', encoding='utf-8') as manifest_file:
+            manifest_file.write(json.dumps(entry) + '\n')
+
+    def is_complete(self, source, local_path):
+        """Check if a file has been completely downloaded.
+
+        Parameters
+        ----------
+        source : str
+            Remote path of the file
+        local_path : str
+            Local path of the file
+
+        Returns
+        -------
+        bool
+            True if the download of ``source`` finished and ``local_path``
+            still has the recorded size
+        """
+        with self._lock:
+            entry = self._files.get(source)
+        if entry is None or not os.path.isfile(local_path):
+            return False
+        return os.path.getsize(local_path) == entry['size']
+
+    def mark_complete(self, source, local_path):
+        """Record a finished download.
+
+        Parameters
+        ----------
+        source : str
+            Remote path of the file
+        local_path : str
+            Local path of the file
+        """
+        entry = {
+            'source': source,
+            'path': local_path,
+            'size': os.path.getsize(local_path),
+        }
+        with self._lock:
+            self._files[source] = entry
+            self._append(entry)
+
+    def get_listing(self, folder):
+        """Get the listing of a folder whose download did not finish.
+
+        Parameters
+        ----------
+        folder : str
+            Remote path of the folder
+
+        Returns
+        -------
+        list(str) or None
+            Recorded listing, or None if the folder has not been listed yet or
+            if all its files were downloaded.
+        """
+        with self._lock:
+            entry = self._folders.get(folder)
+        if entry is None or entry['complete']:
+            return None
+        return entry['files']
+
+    def set_listing(self, folder, filenames, complete=False):
+        """Record the listing of a folder.
+
+        Parameters
+        ----------
+        folder : str
+            Remote path of the folder
+        filenames : list(str)
+            Files in the folder
+        complete : bool, optional
+            True if all files have been downloaded, by default False
+        """
+        entry = {
+            'folder': folder,
+            'files': list(filenames),
+            'complete': complete,
+        }
+        with self._lock:
+            self._folders[folder] = entry
+            self._append(entry)
+
+
+_MANIFESTS = {}
+_MANIFESTS_LOCK = threading.Lock()
+
+
+def get_manifest(path):
+    """Get the manifest stored at a given path.
+
+    All downloaders of a dataset share the same instance.
+
+    Parameters
+    ----------
+    path : str
+        Path to the manifest file
+
+    Returns
+    -------
+    DownloadManifest
+        Manifest
+    """
+    with _MANIFESTS_LOCK:
+        if path not in _MANIFESTS:
+            _MANIFESTS[path] = DownloadManifest(path)
+        return _MANIFESTS[path]
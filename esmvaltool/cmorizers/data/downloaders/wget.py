@@ -32,7 +32,8 @@ class WGetDownloader(BaseDownloader):
             f'{server_path}',
         ]
         logger.debug(command)
-        subprocess.check_output(command)
+        with self.scheduler.host_slot(server_path):
+            subprocess.check_output(command)
 
     def download_file(self, server_path, wget_options):
         """Download file.
@@ -44,15 +45,44 @@ class WGetDownloader(BaseDownloader):
         wget_options: list(str)
             Extra options for wget
         """
-        command = ['wget'] + wget_options + self.overwrite_options + [
-            f'--directory-prefix={self.local_folder}',
+        local_path = os.path.join(self.local_folder,
+                                  os.path.basename(server_path))
+        if not self.overwrite:
+            if self.manifest.is_complete(server_path, local_path):
+                logger.info('File %s already downloaded. Skipping...',
+                            server_path)
+                return
+            if os.path.exists(local_path):
+                logger.info('File %s already exists. Skipping...', local_path)
+                return
+        # Download to a temporary file, so that partial downloads can be
+        # resumed without touching complete files
+        part_path = f'{local_path}.part'
+        os.makedirs(self.local_folder, exist_ok=True)
+        command = ['wget'] + wget_options + self.resume_options + [
             '--no-directories',
+            f'--output-document={part_path}',
             server_path,
         ]
-        if self.overwrite:
-            command.append(f'-O {os.path.basename(server_path)}')
         logger.debug(command)
-        subprocess.check_output(command)
+        with self.scheduler.host_slot(server_path):
+            subprocess.check_output(command)
+        os.replace(part_path, local_path)
+        self.manifest.mark_complete(server_path, local_path)
+
+    def download_files(self, server_paths, wget_options):
+        """Download several files concurrently.
+
+        Parameters
+        ----------
+        server_paths: list(str)
+            Paths to remote files
+        wget_options: list(str)
+            Extra options for wget
+        """
+        self.scheduler.map(
+            lambda server_path: self.download_file(server_path, wget_options),
+            server_paths)
 
     def login(self, server_path, wget_options):
         """Login.
@@ -77,6 +107,19 @@ class WGetDownloader(BaseDownloader):
             ]
         return []
 
+    @property
+    def resume_options(self):
+        """Get options to continue partial downloads of single files.
+
+        Only the temporary ``.part`` file of a download is continued, complete
+        files are never appended to.
+        """
+        if not self.overwrite:
+            return [
+                '--continue',
+            ]
+        return []
+
 
 class NASADownloader(WGetDownloader):
     """Downloader for the NASA repository."""
@@ -92,12 +92,11 @@ For further details on obtaining daily values from ERA-Interim,
     https://confluence.ecmwf.int/display/CKB/ERA-Interim%3A+How+to+calculate+daily+total+precipitation
 """
 import logging
+import os
 import re
 from collections import defaultdict
-from concurrent.futures import ProcessPoolExecutor, as_completed
 from copy import deepcopy
 from datetime import datetime, timedelta
-from os import cpu_count
 from pathlib import Path
 from warnings import catch_warnings, filterwarnings
 
@@ -111,6 +110,9 @@ from esmvaltool.cmorizers.data import utilities as utils
 
 logger = logging.getLogger(__name__)
 
+# Number of tasks run in parallel if max_parallel_tasks is not configured
+DEFAULT_MAX_PARALLEL_TASKS = max(int(os.cpu_count() / 1.5), 1)
+
 
 def _fix_units(cube, definition):
     """Fix issues with the units."""
@@ -468,46 +470,43 @@ def _get_in_files_by_year(in_dir, var):
                 len(var['files']), ', '.join(in_files[year]))
             in_files.pop(year)
 
-    return in_files.values()
-
-
-def _run(jobs, n_workers):
-    """Run CMORization jobs using n_workers."""
-    if n_workers == 1:
-        for job in jobs:
-            _extract_variable(*job)
-    else:
-        with ProcessPoolExecutor(max_workers=n_workers) as executor:
-            futures = {}
-            for job in jobs:
-                future = executor.submit(_extract_variable, *job)
-                futures[future] = job[0]
-
-            for future in as_completed(futures):
-                try:
-                    future.result()
-                except:  # noqa
-                    logger.error("Failed to CMORize %s",
-                                 ', '.join(futures[future]))
-                    raise
+    return in_files
 
 
-def cmorization(in_dir, out_dir, cfg, cfg_user, start_date, end_date):
-    """Run CMORizer for ERA-Interim."""
+def _prepare_cfg(cfg):
+    """Prepare the configuration for CMORization."""
     cfg['attributes']['comment'] = cfg['attributes']['comment'].strip().format(
         year=datetime.now().year)
     cfg.pop('cmor_table')
 
-    n_workers = cfg_user.get('max_parallel_tasks')
-    if n_workers is None:
-        n_workers = int(cpu_count() / 1.5)
-    logger.info("Using at most %s workers", n_workers)
 
-    jobs = []
+def get_tasks(in_dir, out_dir, cfg, cfg_user, start_date, end_date):
+    """Get the independent CMORization tasks, one per variable and year."""
+    tasks = []
     for short_name, var in cfg['variables'].items():
         if 'short_name' not in var:
             var['short_name'] = short_name
-        for in_files in _get_in_files_by_year(in_dir, var):
-            jobs.append([in_files, var, cfg, out_dir])
+        for year, in_files in _get_in_files_by_year(in_dir, var).items():
+            tasks.append({
+                'variable': short_name,
+                'year': year,
+                'in_files': in_files,
+            })
+    return tasks
+
+
+def run_task(in_dir, out_dir, cfg, cfg_user, start_date, end_date, task):
+    """Run a single CMORization task."""
+    _prepare_cfg(cfg)
+    var = cfg['variables'][task['variable']]
+    var.setdefault('short_name', task['variable'])
+    _extract_variable(task['in_files'], var, cfg, out_dir)
 
-    _run(jobs, n_workers)
+
+def cmorization(in_dir, out_dir, cfg, cfg_user, start_date, end_date):
+    """Run CMORizer for ERA-Interim."""
+    _prepare_cfg(cfg)
+    for task in get_tasks(in_dir, out_dir, cfg, cfg_user, start_date,
+                          end_date):
+        var = cfg['variables'][task['variable']]
+        _extract_variable(task['in_files'], var, cfg, out_dir)
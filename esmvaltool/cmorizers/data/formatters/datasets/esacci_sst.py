@@ -67,31 +67,55 @@ def extract_variable(var_info, raw_info, attrs, year):
     return cube
 
 
-def cmorization(in_dir, out_dir, cfg, cfg_user, start_date, end_date):
-    """Cmorization func call."""
+def _get_in_files(in_dir, cfg, year):
+    """Get the monthly input files of a year."""
+    inpfile = os.path.join(in_dir, cfg['filename'])
+    months = ["0" + str(mo) for mo in range(1, 10)] + ["10", "11", "12"]
+    return [inpfile.format(year=year, month=month) for month in months]
+
+
+def _cmorize_year(in_dir, out_dir, cfg, var, year):
+    """CMORize one year of a variable."""
     cmor_table = cfg['cmor_table']
     glob_attrs = cfg['attributes']
+    vals = cfg['variables'][var]
+    var_info = cmor_table.get_variable(vals['mip'], var)
+    glob_attrs['mip'] = vals['mip']
+    raw_info = {'name': vals['raw'], 'file': vals['file']}
+    monthly_cubes = []
+    for in_file in _get_in_files(in_dir, cfg, year):
+        raw_info['file'] = in_file
+        logger.info("CMORizing var %s from file type %s", var,
+                    raw_info['file'])
+        cube = extract_variable(var_info, raw_info, glob_attrs, year)
+        monthly_cubes.append(cube)
+    yearly_cube = concatenate(monthly_cubes)
+    save_variable(yearly_cube,
+                  var,
+                  out_dir,
+                  glob_attrs,
+                  unlimited_dimensions=['time'])
+
+
+def get_tasks(in_dir, out_dir, cfg, cfg_user, start_date, end_date):
+    """Get the independent CMORization tasks, one per variable and year."""
+    return [{
+        'variable': var,
+        'year': year,
+        'in_files': _get_in_files(in_dir, cfg, year),
+    } for var in cfg['variables'] for year in range(1982, 2020)]
 
+
+def run_task(in_dir, out_dir, cfg, cfg_user, start_date, end_date, task):
+    """Run a single CMORization task."""
+    _cmorize_year(in_dir, out_dir, cfg, task['variable'], task['year'])
+
+
+def cmorization(in_dir, out_dir, cfg, cfg_user, start_date, end_date):
+    """Cmorization func call."""
     # run the cmorization
-    for var, vals in cfg['variables'].items():
-        var_info = cmor_table.get_variable(vals['mip'], var)
-        glob_attrs['mip'] = vals['mip']
-        raw_info = {'name': vals['raw'], 'file': vals['file']}
+    for var in cfg['variables']:
         inpfile = os.path.join(in_dir, cfg['filename'])
         logger.info("CMORizing var %s from file type %s", var, inpfile)
-        years = range(1982, 2020)
-        months = ["0" + str(mo) for mo in range(1, 10)] + ["10", "11", "12"]
-        for year in years:
-            monthly_cubes = []
-            for month in months:
-                raw_info['file'] = inpfile.format(year=year, month=month)
-                logger.info("CMORizing var %s from file type %s", var,
-                            raw_info['file'])
-                cube = extract_variable(var_info, raw_info, glob_attrs, year)
-                monthly_cubes.append(cube)
-            yearly_cube = concatenate(monthly_cubes)
-            save_variable(yearly_cube,
-                          var,
-                          out_dir,
-                          glob_attrs,
-                          unlimited_dimensions=['time'])
+        for year in range(1982, 2020):
+            _cmorize_year(in_dir, out_dir, cfg, var, year)
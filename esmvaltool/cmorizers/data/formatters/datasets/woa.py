@@ -130,19 +130,37 @@ def extract_variable(in_files, out_dir, attrs, raw_info, cmor_table):
                       unlimited_dimensions=['time'])
 
 
-def cmorization(in_dir, out_dir, cfg, cfg_user, start_date, end_date):
-    """Cmorization func call."""
+def _cmorize_variable(in_dir, out_dir, cfg, var):
+    """CMORize a single variable."""
     cmor_table = cfg['cmor_table']
     glob_attrs = cfg['attributes']
+    vals = cfg['variables'][var]
+    in_files = collect_files(in_dir, var, cfg)
+    logger.info("CMORizing var %s from input set %s", var, vals['name'])
+    raw_info = cfg['variables'][var]
+    raw_info.update({
+        'var': var,
+        'reference_year': cfg['custom']['reference_year'],
+    })
+    glob_attrs['mip'] = vals['mip']
+    extract_variable(in_files, out_dir, glob_attrs, raw_info, cmor_table)
+
+
+def get_tasks(in_dir, out_dir, cfg, cfg_user, start_date, end_date):
+    """Get the independent CMORization tasks, one per variable."""
+    return [{
+        'variable': var,
+        'in_files': collect_files(in_dir, var, cfg),
+    } for var in cfg['variables']]
+
 
+def run_task(in_dir, out_dir, cfg, cfg_user, start_date, end_date, task):
+    """Run a single CMORization task."""
+    _cmorize_variable(in_dir, out_dir, cfg, task['variable'])
+
+
+def cmorization(in_dir, out_dir, cfg, cfg_user, start_date, end_date):
+    """Cmorization func call."""
     # run the cmorization
-    for var, vals in cfg['variables'].items():
-        in_files = collect_files(in_dir, var, cfg)
-        logger.info("CMORizing var %s from input set %s", var, vals['name'])
-        raw_info = cfg['variables'][var]
-        raw_info.update({
-            'var': var,
-            'reference_year': cfg['custom']['reference_year'],
-        })
-        glob_attrs['mip'] = vals['mip']
-        extract_variable(in_files, out_dir, glob_attrs, raw_info, cmor_table)
+    for var in cfg['variables']:
+        _cmorize_variable(in_dir, out_dir, cfg, var)
@@ -1,10 +1,15 @@
 """Utils module for Python cmorizers."""
 import datetime
 import gzip
+import hashlib
 import logging
 import os
 import re
 import shutil
+import subprocess
+import tarfile
+import tempfile
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from contextlib import contextmanager
 from pathlib import Path
 
@@ -327,9 +332,15 @@ def save_variable(cube, var, outdir, attrs, **kwargs):
         project_id, version etc.
 
     **kwargs: kwargs
-        Keyword arguments to be passed to `iris.save`
+        Keyword arguments to be passed to `iris.save`, these take precedence
+        over the options of the active output profile (see
+        :func:`output_profile`).
     """
     fix_dtype(cube)
+    # The save options may replace the data of the cube
+    cube = cube.copy(cube.core_data())
+    save_kwargs = get_save_options(cube, _OUTPUT_PROFILES[-1])
+    save_kwargs.update(kwargs)
     # CMOR standard
     try:
         time = cube.coord('time')
@@ -366,7 +377,315 @@ def save_variable(cube, var, outdir, attrs, **kwargs):
     logger.info('Saving: %s', file_path)
     status = 'lazy' if cube.has_lazy_data() else 'realized'
     logger.info('Cube has %s data [lazy is preferred]', status)
-    iris.save(cube, file_path, fill_value=1e20, **kwargs)
+    iris.save(cube, file_path, **save_kwargs)
+    for saved_files in _SAVED_FILES:
+        saved_files.append(file_path)
+
+
+_SAVED_FILES = []
+
+_OUTPUT_PROFILES = [{}]
+
+_MIB = 2**20
+
+MANIFEST_FILENAME = '.cmorization_manifest.yml'
+
+
+@contextmanager
+def record_saved_files():
+    """Record the paths of the files written by :func:`save_variable`.
+
+    Yields
+    ------
+    list(str)
+        List to which the paths of the saved files are appended.
+    """
+    saved_files = []
+    _SAVED_FILES.append(saved_files)
+    try:
+        yield saved_files
+    finally:
+        _SAVED_FILES.remove(saved_files)
+
+
+@contextmanager
+def output_profile(profile):
+    """Set the output profile used by :func:`save_variable`.
+
+    The profile is read from the ``output`` section of the dataset's
+    configuration file and may contain the following keys:
+
+    * ``compression``: ``zlib`` or None (default, no compression).
+    * ``complevel``: compression level between 1 and 9, by default 4.
+    * ``shuffle``: apply the HDF5 shuffle filter, by default True.
+    * ``chunking``: ``timeseries`` (chunks spanning the whole time axis,
+      for fast reading of time series at a point), ``map`` (one time step
+      per chunk, for fast reading of maps) or a mapping from coordinate
+      names to chunk sizes. If not given, the netCDF library defaults are
+      used.
+    * ``chunk_size``: target size of a chunk in MiB, by default 4.
+    * ``packing``: ``float32`` (default) or ``int16``, in which case the
+      data is packed using ``scale_factor`` and ``add_offset``. The range
+      of the data is needed for this, so lazy data is realized (once) before
+      it is saved.
+
+    Parameters
+    ----------
+    profile: dict or None
+        Output profile.
+    """
+    _OUTPUT_PROFILES.append(profile or {})
+    try:
+        yield
+    finally:
+        _OUTPUT_PROFILES.pop()
+
+
+def get_chunksizes(cube, chunking, chunk_size=4):
+    """Get the shape of the netCDF chunks of a cube.
+
+    Parameters
+    ----------
+    cube: iris.cube.Cube
+        Cube to save.
+    chunking: str or dict
+        ``timeseries``, ``map`` or a mapping from coordinate names to chunk
+        sizes. Dimensions not in the mapping are not split.
+    chunk_size: float
+        Target size of a chunk in MiB, used for ``timeseries`` and ``map``.
+
+    Returns
+    -------
+    tuple(int) or None
+        Chunk shape, or None for scalar cubes.
+    """
+    shape = cube.shape
+    if not shape:
+        return None
+    chunks = list(shape)
+    if isinstance(chunking, dict):
+        for name, size in chunking.items():
+            for dim in cube.coord_dims(name):
+                chunks[dim] = max(1, min(int(size), shape[dim]))
+        return tuple(chunks)
+    if chunking not in ('timeseries', 'map'):
+        raise ValueError(
+            f"Unknown chunking '{chunking}', expected 'timeseries', 'map' "
+            "or a mapping from coordinate names to chunk sizes")
+    time_dims = ()
+    if cube.coords('time', dim_coords=True):
+        time_dims = cube.coord_dims('time')
+    for dim in time_dims:
+        chunks[dim] = shape[dim] if chunking == 'timeseries' else 1
+    free_dims = [dim for dim in range(len(shape)) if dim not in time_dims]
+    n_elements = chunk_size * _MIB / cube.dtype.itemsize
+    budget = max(1., n_elements / np.prod([chunks[d] for d in time_dims]))
+    n_free = np.prod([shape[d] for d in free_dims])
+    if free_dims and n_free > budget:
+        factor = (budget / n_free)**(1. / len(free_dims))
+        for dim in free_dims:
+            chunks[dim] = max(1, int(shape[dim] * factor))
+    return tuple(chunks)
+
+
+def _get_packing(cube, dtype):
+    """Get the `iris.save` packing options for an integer type.
+
+    Lazy data is realized together with its range, so that it is only
+    computed once.
+    """
+    data = cube.core_data()
+    if cube.has_lazy_data():
+        cube.data, vmin, vmax = da.compute(data, data.min(), data.max())
+    else:
+        vmin, vmax = data.min(), data.max()
+    if np.ma.is_masked(vmin) or np.ma.is_masked(vmax):
+        vmin, vmax = 0., 0.
+    info = np.iinfo(dtype)
+    # The smallest value is kept for the fill value
+    n_steps = float(info.max) - float(info.min) - 1
+    scale_factor = (float(vmax) - float(vmin)) / n_steps or 1.
+    add_offset = float(vmin) - (float(info.min) + 1) * scale_factor
+    return {
+        'dtype': dtype,
+        'scale_factor': scale_factor,
+        'add_offset': add_offset,
+    }
+
+
+def get_save_options(cube, profile):
+    """Translate an output profile to keyword arguments for `iris.save`.
+
+    Lazy data is rechunked so that each dask chunk covers whole netCDF
+    chunks. This way, `iris.save` streams the data to disk chunk by chunk
+    and the memory use does not depend on the size of the cube. Packed data
+    is the exception, it is realized together with its range.
+
+    Parameters
+    ----------
+    cube: iris.cube.Cube
+        Cube to save, its lazy data may be rechunked or realized.
+    profile: dict
+        Output profile, see :func:`output_profile`.
+
+    Returns
+    -------
+    dict
+        Keyword arguments for `iris.save`.
+    """
+    options = {'fill_value': 1e20}
+    compression = profile.get('compression')
+    if compression not in (None, 'zlib'):
+        raise ValueError(
+            f"Compression '{compression}' is not supported by iris, use "
+            "'zlib' or no compression")
+    if compression:
+        options['zlib'] = True
+        options['complevel'] = profile.get('complevel', 4)
+        options['shuffle'] = profile.get('shuffle', True)
+    packing = profile.get('packing', 'float32')
+    if packing == 'int16':
+        options['packing'] = _get_packing(cube, np.int16)
+        options['fill_value'] = np.iinfo(np.int16).min
+    elif packing != 'float32':
+        raise ValueError(
+            f"Unknown packing '{packing}', expected 'float32' or 'int16'")
+    if profile.get('chunking') is not None:
+        chunksizes = get_chunksizes(cube, profile['chunking'],
+                                    profile.get('chunk_size', 4))
+        if chunksizes is not None:
+            options['chunksizes'] = chunksizes
+            if cube.has_lazy_data():
+                data = cube.lazy_data()
+                cube.data = data.rechunk(
+                    da.core.normalize_chunks('auto',
+                                             shape=data.shape,
+                                             dtype=data.dtype,
+                                             previous_chunks=chunksizes))
+    return options
+
+
+def get_checksum(path):
+    """Compute the checksum of a file.
+
+    Parameters
+    ----------
+    path: str
+        Path to the file.
+
+    Returns
+    -------
+    str
+        Hexadecimal BLAKE2 digest of the file contents.
+    """
+    checksum = hashlib.blake2b(digest_size=20)
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(2**20), b''):
+            checksum.update(block)
+    return checksum.hexdigest()
+
+
+def get_fingerprints(paths, recorded=None):
+    """Get size, modification time and checksum of input files.
+
+    Checksums are only computed for files whose size or modification time
+    differ from the recorded ones.
+
+    Parameters
+    ----------
+    paths: list(str)
+        Paths to the files.
+    recorded: dict, optional
+        Previous fingerprints, keyed by path.
+
+    Returns
+    -------
+    dict
+        Fingerprint of each file, keyed by path.
+    """
+    recorded = recorded or {}
+    fingerprints = {}
+    for path in paths:
+        stat = os.stat(path)
+        fingerprint = {'size': stat.st_size, 'mtime': stat.st_mtime}
+        previous = recorded.get(path, {})
+        if all(previous.get(key) == fingerprint[key] for key in fingerprint):
+            fingerprint['checksum'] = previous['checksum']
+        else:
+            fingerprint['checksum'] = get_checksum(path)
+        fingerprints[path] = fingerprint
+    return fingerprints
+
+
+def have_inputs_changed(paths, recorded):
+    """Check if input files differ from the recorded fingerprints.
+
+    Files that were only touched, i.e. have a new modification time but the
+    same contents, are not considered changed.
+
+    Parameters
+    ----------
+    paths: list(str)
+        Paths to the current input files.
+    recorded: dict
+        Recorded fingerprints, keyed by path.
+
+    Returns
+    -------
+    bool
+        True if files were added, removed or modified.
+    """
+    if set(paths) != set(recorded):
+        return True
+    for path in paths:
+        stat = os.stat(path)
+        if stat.st_size != recorded[path]['size']:
+            return True
+        if stat.st_mtime == recorded[path]['mtime']:
+            continue
+        if get_checksum(path) != recorded[path]['checksum']:
+            return True
+    return False
+
+
+def read_manifest(folder):
+    """Read the CMORization manifest of an output folder.
+
+    Parameters
+    ----------
+    folder: str
+        Output folder of a dataset.
+
+    Returns
+    -------
+    dict
+        Manifest entries keyed by formatting unit, empty if there is no
+        manifest.
+    """
+    path = os.path.join(folder, MANIFEST_FILENAME)
+    if not os.path.isfile(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as file:
+        return yaml.safe_load(file) or {}
+
+
+def write_manifest(folder, manifest):
+    """Write the CMORization manifest of an output folder.
+
+    The manifest records, for each formatting unit, the fingerprints of its
+    input files, the hashes of the formatter and its configuration, and the
+    output files it created.
+
+    Parameters
+    ----------
+    folder: str
+        Output folder of a dataset.
+    manifest: dict
+        Manifest entries keyed by formatting unit.
+    """
+    path = os.path.join(folder, MANIFEST_FILENAME)
+    with open(path, 'w', encoding='utf-8') as file:
+        yaml.safe_dump(manifest, file)
 
 
 def extract_doi_value(tags):
@@ -539,49 +858,223 @@ def set_units(cube, units):
     return cube
 
 
-def unpack_files_in_folder(folder):
+_ARCHIVE_SUFFIXES = ('.gz', '.tgz', '.tar')
+
+_UNPACK_PREFIX = '.unpack_'
+
+_BUFFER_SIZE = 2**20
+
+
+def _is_archive(filename):
+    """Check if a file should be unpacked."""
+    return (not filename.startswith('.')
+            and filename.endswith(_ARCHIVE_SUFFIXES))
+
+
+@contextmanager
+def _open_gzip(file_name):
+    """Open a gzipped file as a stream.
+
+    The multithreaded decompressor ``pigz`` is used if it is available.
+    """
+    pigz = shutil.which('pigz')
+    if pigz is None:
+        with gzip.open(file_name, 'rb') as stream:
+            yield stream
+        return
+    with subprocess.Popen([pigz, '-dc', file_name],
+                          stdout=subprocess.PIPE) as process:
+        yield process.stdout
+    if process.returncode:
+        raise subprocess.CalledProcessError(process.returncode, process.args)
+
+
+@contextmanager
+def _open_tar(file_name):
+    """Open a (compressed) tar file as a stream."""
+    if file_name.endswith('.tar'):
+        with tarfile.open(file_name, mode='r|') as tar:
+            yield tar
+        return
+    with _open_gzip(file_name) as stream:
+        with tarfile.open(fileobj=stream, mode='r|') as tar:
+            yield tar
+
+
+def _is_tar(file_name):
+    return file_name.endswith(('.tar', '.tgz', '.tar.gz'))
+
+
+def _unpack_archive(file_name, work_dir):
+    """Unpack an archive in a given directory."""
+    if not _is_tar(file_name):
+        _gunzip(file_name, work_dir)
+        return
+    with _open_tar(file_name) as tar:
+        if hasattr(tarfile, 'data_filter'):
+            tar.extractall(work_dir, filter='data')
+        else:
+            tar.extractall(work_dir)
+
+
+def _reserve_files(targets):
+    """Create empty placeholders for files that must not exist yet.
+
+    The names are reserved with ``O_EXCL`` so that concurrent moves cannot
+    overwrite each other. If any of the names is taken, no placeholder is
+    kept.
+    """
+    reserved = []
+    try:
+        for target in targets:
+            os.close(os.open(target, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            reserved.append(target)
+    except BaseException:
+        for target in reserved:
+            os.remove(target)
+        raise
+
+
+def _move_to_folder(source, folder):
+    """Move all files below ``source`` to ``folder`` and remove ``source``.
+
+    Nothing is moved if a file with the same name already exists in
+    ``folder`` or several files below ``source`` have the same name.
+
+    Raises
+    ------
+    FileExistsError
+        Some of the files would overwrite each other or existing files.
+
+    Returns
+    -------
+    list(str)
+        Moved files that need to be unpacked.
+    """
+    moves = {}
+    duplicates = set()
+    for root, _, files in os.walk(source):
+        for filename in files:
+            if filename in moves:
+                duplicates.add(filename)
+            moves[filename] = os.path.join(root, filename)
+    duplicates.update(filename for filename in moves
+                      if os.path.lexists(os.path.join(folder, filename)))
+    try:
+        if duplicates:
+            raise FileExistsError
+        _reserve_files(os.path.join(folder, filename) for filename in moves)
+    except FileExistsError:
+        duplicates = sorted(duplicates) or 'some files'
+        raise FileExistsError(
+            f"Cannot move the files in {source} to {folder}, {duplicates} "
+            "would overwrite files with the same name") from None
+
+    filenames = sorted(moves)
+    n_moved = 0
+    try:
+        for filename in filenames:
+            os.replace(moves[filename], os.path.join(folder, filename))
+            n_moved += 1
+    finally:
+        # Remove the placeholders of files that were not moved
+        for filename in filenames[n_moved:]:
+            os.remove(os.path.join(folder, filename))
+    for root, _, _ in os.walk(source, topdown=False):
+        os.rmdir(root)
+    return [
+        os.path.join(folder, filename) for filename in filenames
+        if _is_archive(filename)
+    ]
+
+
+def _unpack_to_folder(file_name, folder):
+    """Unpack an archive into a folder, flattening its content.
+
+    Each archive is extracted in its own temporary directory so that
+    several archives can be unpacked concurrently and only the extracted
+    files need to be checked for nested archives. The archive is only
+    removed once all its files have been moved.
+
+    Raises
+    ------
+    FileExistsError
+        Extracted files would overwrite files with the same name. The
+        archive and the temporary directory are kept.
+
+    Returns
+    -------
+    list(str)
+        Extracted files that need to be unpacked.
+    """
+    logger.info('Unpacking %s', os.path.basename(file_name))
+    work_dir = tempfile.mkdtemp(prefix=_UNPACK_PREFIX, dir=folder)
+    try:
+        _unpack_archive(file_name, work_dir)
+    except BaseException:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        raise
+    try:
+        archives = _move_to_folder(work_dir, folder)
+    except FileExistsError as exc:
+        raise FileExistsError(
+            f"Cannot unpack {file_name}: {exc}. The extracted files are "
+            f"kept in {work_dir}") from None
+    os.remove(file_name)
+    return archives
+
+
+def unpack_files_in_folder(folder, max_workers=None):
     """Unpack all compressed and tarred files in a given folder.
 
     This function flattens the folder hierarchy, both outside
     and inside the given folder. It also unpack nested files
 
+    Archives are unpacked concurrently and nested archives are queued as
+    soon as they are extracted, so the folder is only listed once.
+
     Parameters
     ----------
     folder : str
         Path to the folder to unpack
+    max_workers : int, optional
+        Maximum number of archives unpacked at the same time, by default
+        the number of CPUs plus four (see
+        :class:`concurrent.futures.ThreadPoolExecutor`)
     """
-    decompress = True
-    while decompress:
-        decompress = False
-        files = os.listdir(folder)
-        files.sort()
-        for filename in files:
-            full_path = os.path.join(folder, filename)
-            if os.path.isdir(full_path):
-                logger.info('Moving files from folder %s', filename)
-                folder_files = os.listdir(full_path)
-                for file_path in folder_files:
-                    shutil.move(os.path.join(full_path, file_path), folder)
-                os.rmdir(full_path)
-                decompress = True
-                continue
-            if filename.startswith('.'):
+    archives = []
+    for filename in sorted(os.listdir(folder)):
+        full_path = os.path.join(folder, filename)
+        if os.path.isdir(full_path):
+            if filename.startswith(_UNPACK_PREFIX):
+                # Leftover of an interrupted run
+                shutil.rmtree(full_path)
                 continue
-            if not filename.endswith(('.gz', '.tgz', '.tar')):
-                continue
-            logger.info('Unpacking %s', filename)
-            shutil.unpack_archive(full_path, folder)
-            os.remove(full_path)
-            decompress = True
+            logger.info('Moving files from folder %s', filename)
+            archives.extend(_move_to_folder(full_path, folder))
+        elif _is_archive(filename):
+            archives.append(full_path)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = {
+            executor.submit(_unpack_to_folder, path, folder)
+            for path in archives
+        }
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                pending.update(
+                    executor.submit(_unpack_to_folder, path, folder)
+                    for path in future.result())
 
 
 def _gunzip(file_name, work_dir):
     filename = os.path.split(file_name)[-1]
     filename = re.sub(r"\.gz$", "", filename, flags=re.IGNORECASE)
 
-    with gzip.open(file_name, 'rb') as f_in:
+    with _open_gzip(file_name) as f_in:
         with open(os.path.join(work_dir, filename), 'wb') as f_out:
-            shutil.copyfileobj(f_in, f_out)
+            shutil.copyfileobj(f_in, f_out, _BUFFER_SIZE)
 
 
 try:
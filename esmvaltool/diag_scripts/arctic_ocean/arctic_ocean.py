@@ -29,12 +29,15 @@ import itertools
 import logging
 import os
 from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 
 import cartopy.crs as ccrs
 from matplotlib import cm
 import numpy as np
 
-from esmvaltool.diag_scripts.arctic_ocean.getdata import (aw_core, hofm_data,
+from esmvaltool.diag_scripts.arctic_ocean.getdata import (aw_core,
+                                                          hofm_data,
+                                                          hofm_extract,
                                                           transect_data,
                                                           tsplot_data)
 from esmvaltool.diag_scripts.arctic_ocean.plotting import (
@@ -52,6 +55,10 @@ logger = logging.getLogger(os.path.basename(__file__))
 def run_hofm_data(cfg):
     """Extract data for Hovmoeller diagrams.
 
+    Every file is read once for all `hofm_regions`. The files of different
+    models and variables are processed in parallel, with up to `n_jobs`
+    processes.
+
     Parameters
     ----------
     cfg: dict
@@ -66,19 +73,32 @@ def run_hofm_data(cfg):
                  to extract monthly values for `hofm_regions`")
 
     logger.info("`hofm_vars` are: %s", cfg['hofm_vars'])
+    areacello_fx = get_fx_filenames(cfg, 'areacello')
+    tasks = []
     # doing the loop for every variable
     for hofm_var in cfg['hofm_vars']:
-        logger.info("Processing %s", hofm_var)
         # get dictionary with model names as key and path to the
         # preprocessed file as a value
         model_filenames = get_clim_model_filenames(cfg, hofm_var)
         model_filenames = OrderedDict(
             sorted(model_filenames.items(), key=lambda t: t[0]))
-        # loop over regions and models
-        for mmodel, region in itertools.product(model_filenames,
-                                                cfg['hofm_regions']):
-            # actual extraction of the data for specific model and region
-            hofm_data(cfg, model_filenames, mmodel, hofm_var, region)
+        for mmodel in model_filenames:
+            tasks.append((hofm_var, model_filenames, mmodel))
+
+    args = [(model_filenames[mmodel], areacello_fx[mmodel], hofm_var,
+             cfg['hofm_regions'], cfg['hofm_depth'])
+            for hofm_var, model_filenames, mmodel in tasks]
+    n_jobs = cfg.get('n_jobs', 1)
+    if n_jobs > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=min(n_jobs, len(tasks))) as exe:
+            results = exe.map(hofm_extract, *zip(*args))
+    else:
+        results = (hofm_extract(*arg) for arg in args)
+    for (hofm_var, model_filenames, mmodel), extracted in zip(tasks, results):
+        logger.info("Save %s data for %s", hofm_var, mmodel)
+        # save the data for all regions of the model
+        hofm_data(cfg, model_filenames, mmodel, hofm_var,
+                  cfg['hofm_regions'], extracted)
 
 
 def hofm_plot_params(cfg, hofm_var, var_number, observations):
@@ -12,10 +12,13 @@ except ImportError as exc:
         import ESMF as esmpy  # noqa: N811
     except ImportError:
         raise exc
+import hashlib
 import logging
 import os
+
 import numpy as np
 from netCDF4 import Dataset, num2date
+from scipy.sparse import csr_matrix, load_npz, save_npz
 
 from esmvaltool.diag_scripts.arctic_ocean.regions import (hofm_regions,
                                                           transect_points)
@@ -28,6 +31,12 @@ from esmvaltool.diag_scripts.shared import ProvenanceLogger
 
 logger = logging.getLogger(os.path.basename(__file__))
 
+# Approximate size of the chunks read for Hovmoeller diagrams
+HOFM_CHUNK_BYTES = 2**27
+
+# Interpolation weights of the transects, by grid and transect
+_TRANSECT_WEIGHTS = {}
+
 
 def load_meta(datapath, fxpath=None):
     """Load metadata of the netCDF file.
@@ -133,103 +142,295 @@ def hofm_save_data(cfg, data_info, oce_hofm):
                               provenance_record)
 
 
-def hofm_data(cfg, model_filenames, mmodel, cmor_var, region):
-    """Extract data for Hovmoeller diagrams from monthly values.
+def hofm_weights(metadata, regions):
+    """Build the area weights of several regions at once.
 
-    Saves the data to files in `diagworkdir`.
+    Only the bounding box of all points that belong to any of the
+    regions has to be read from the data file.
 
     Parameters
     ----------
-    model_filenames: OrderedDict
-        OrderedDict with model names as keys and input files as values.
-    mmodel: str
-        model name that will be processed.
+    metadata: dict
+        output of `load_meta`, should contain areacello.
+    regions: list
+        names of the regions predefined in `hofm_regions` function.
+
+    Returns
+    -------
+    box: tuple of slices
+        bounding box of the regions on the model grid.
+    points: 1d numpy array
+        flat indexes (inside the box) of the points in any of the regions.
+    weights: 2d numpy array
+        area of each point for each region, (regions, points).
+    """
+    shape = metadata['lon2d'].shape
+    indexes = [
+        hofm_regions(region, metadata['lon2d'], metadata['lat2d'])
+        for region in regions
+    ]
+    indexesi = np.hstack([ind[0] for ind in indexes]).astype(int)
+    indexesj = np.hstack([ind[1] for ind in indexes]).astype(int)
+    if indexesi.size == 0:
+        indexesi = indexesj = np.zeros(1, dtype=int)
+    box = (slice(indexesi.min(), indexesi.max() + 1),
+           slice(indexesj.min(), indexesj.max() + 1))
+    box_shape = (box[0].stop - box[0].start, box[1].stop - box[1].start)
+    areacello = np.ma.filled(metadata['areacello'], 0.).reshape(shape)
+    areacello = areacello[box].ravel()
+
+    flat = [
+        np.ravel_multi_index(
+            (ind[0] - box[0].start, ind[1] - box[1].start), box_shape)
+        for ind in indexes
+    ]
+    points = np.unique(np.hstack(flat).astype(int))
+    weights = np.zeros((len(regions), points.shape[0]))
+    for num, region_points in enumerate(flat):
+        # points selected twice for a region are also counted twice
+        np.add.at(weights[num], np.searchsorted(points, region_points),
+                  areacello[region_points])
+    return box, points, weights
+
+
+def hofm_extract_regions(metadata, cmor_var, regions, nlev):
+    """Calculate means over several regions for all time steps and levels.
+
+    The data file is read once, in chunks of time steps of about
+    `HOFM_CHUNK_BYTES` bytes. The means are the same as the ones of
+    `hofm_extract_region`.
+
+    Parameters
+    ----------
+    metadata: dict
+        output of `load_meta`, should contain areacello.
+    cmor_var: str
+        name of the CMOR variable
+    regions: list
+        names of the regions predefined in `hofm_regions` function.
+    nlev: int
+        number of levels to extract.
+
+    Returns
+    -------
+    oce_hofm: 3d numpy array
+        mean values, (regions, levels, time).
+    """
+    box, points, weights = hofm_weights(metadata, regions)
+    variable = metadata['datafile'].variables[cmor_var]
+    series_lenght = get_series_lenght(metadata['datafile'], cmor_var)
+    box_size = (box[0].stop - box[0].start) * (box[1].stop - box[1].start)
+    chunk = max(
+        1, HOFM_CHUNK_BYTES // (nlev * box_size * variable.dtype.itemsize))
+
+    oce_hofm = np.zeros((len(regions), nlev, series_lenght))
+    for start in range(0, series_lenght, chunk):
+        # fix for climatology
+        if variable.ndim < 4:
+            levels_pp = variable[0:nlev, box[0], box[1]][np.newaxis]
+        else:
+            levels_pp = variable[start:start + chunk, 0:nlev, box[0], box[1]]
+        if not isinstance(levels_pp, np.ma.MaskedArray):
+            levels_pp = np.ma.masked_equal(levels_pp, 0)
+        levels_pp = levels_pp.reshape(levels_pp.shape[:2] + (-1, ))
+        levels_pp = levels_pp[..., points]
+        valid = ~np.ma.getmaskarray(levels_pp)
+        total = np.ma.filled(levels_pp, 0.) @ weights.T
+        area = valid @ weights.T
+        with np.errstate(divide='ignore', invalid='ignore'):
+            means = np.where(area > 0, total / area, np.nan)
+        oce_hofm[:, :, start:start + means.shape[0]] = means.transpose(2, 1, 0)
+    return oce_hofm
+
+
+def hofm_extract(datapath, fxpath, cmor_var, regions, max_level):
+    """Extract data for Hovmoeller diagrams of several regions.
+
+    Parameters
+    ----------
+    datapath: str
+        path to the netCDF file with data
+    fxpath: str
+        path to the netCDF file with areacello
     cmor_var: str
         name of the CMOR variable
-    areacello_fx: OrderedDict.
-        dictionary with model names as keys and paths to fx files as values.
+    regions: list
+        names of the regions predefined in `hofm_regions` function.
     max_level: float
         maximum depth level the Hovmoeller diagrams should go to.
-    region: str
-        name of the region predefined in `hofm_regions` function.
-    diagworkdir: str
-        path to work directory.
 
     Returns
     -------
-    None
+    extracted: dict
+        Hovmoeller data of each region (`hofm`), `time`, `levels` and
+        `lev_limit` of the data.
     """
-    logger.info("Extract  %s data for %s, region %s", cmor_var, mmodel, region)
-    areacello_fx = get_fx_filenames(cfg, 'areacello')
-    metadata = load_meta(datapath=model_filenames[mmodel],
-                         fxpath=areacello_fx[mmodel])
+    metadata = load_meta(datapath=datapath, fxpath=fxpath)
 
-    lev_limit = metadata['lev'][
-        metadata['lev'] <= cfg['hofm_depth']].shape[0] + 1
+    lev_limit = metadata['lev'][metadata['lev'] <= max_level].shape[0] + 1
+    nlev = metadata['lev'][0:lev_limit].shape[0]
 
-    indexes = hofm_regions(region, metadata['lon2d'], metadata['lat2d'])
+    oce_hofm = hofm_extract_regions(metadata, cmor_var, regions, nlev)
+    metadata['datafile'].close()
 
-    series_lenght = get_series_lenght(metadata['datafile'], cmor_var)
+    extracted = {}
+    extracted['hofm'] = dict(zip(regions, oce_hofm))
+    extracted['time'] = metadata['time']
+    extracted['levels'] = metadata['lev']
+    extracted['lev_limit'] = lev_limit
+    return extracted
 
-    oce_hofm = np.zeros((metadata['lev'][0:lev_limit].shape[0], series_lenght))
-    for mon in range(series_lenght):
-        for ind, _ in enumerate(metadata['lev'][0:lev_limit]):
-            oce_hofm[ind, mon] = hofm_extract_region(metadata, cmor_var,
-                                                     indexes, ind, mon)
-    data_info = {}
-    data_info['basedir'] = cfg['work_dir']
-    data_info['variable'] = cmor_var
-    data_info['mmodel'] = mmodel
-    data_info['region'] = region
-    data_info['time'] = metadata['time']
-    data_info['levels'] = metadata['lev']
-    data_info['lev_limit'] = lev_limit
-    data_info['ori_file'] = model_filenames[mmodel]
-    data_info['areacello'] = areacello_fx[mmodel]
 
-    hofm_save_data(cfg, data_info, oce_hofm)
+def hofm_data(cfg, model_filenames, mmodel, cmor_var, regions,
+              extracted=None):
+    """Extract data for Hovmoeller diagrams from monthly values.
 
-    metadata['datafile'].close()
+    Saves the data to files in `diagworkdir`.
 
+    Parameters
+    ----------
+    model_filenames: OrderedDict
+        OrderedDict with model names as keys and input files as values.
+    mmodel: str
+        model name that will be processed.
+    cmor_var: str
+        name of the CMOR variable
+    regions: str or list
+        name(s) of the region(s) predefined in `hofm_regions` function.
+    extracted: dict, optional
+        output of `hofm_extract` if the data were already extracted.
 
-def transect_level(datafile, cmor_var, level, grid, locstream):
-    """Interpolation for one level of transect."""
+    Returns
+    -------
+    None
+    """
+    if isinstance(regions, str):
+        regions = [regions]
+    areacello_fx = get_fx_filenames(cfg, 'areacello')
+    if extracted is None:
+        logger.info("Extract  %s data for %s, regions %s", cmor_var, mmodel,
+                    regions)
+        extracted = hofm_extract(model_filenames[mmodel],
+                                 areacello_fx[mmodel], cmor_var, regions,
+                                 cfg['hofm_depth'])
+
+    for region in regions:
+        data_info = {}
+        data_info['basedir'] = cfg['work_dir']
+        data_info['variable'] = cmor_var
+        data_info['mmodel'] = mmodel
+        data_info['region'] = region
+        data_info['time'] = extracted['time']
+        data_info['levels'] = extracted['levels']
+        data_info['lev_limit'] = extracted['lev_limit']
+        data_info['ori_file'] = model_filenames[mmodel]
+        data_info['areacello'] = areacello_fx[mmodel]
+
+        hofm_save_data(cfg, data_info, extracted['hofm'][region])
+
+
+def transect_regrid_weights(ifilename, lon_s4new, lat_s4new):
+    """Compute the weights of the interpolation to the transect points.
 
+    Parameters
+    ----------
+    ifilename: str
+        path to the netCDF file with the model grid.
+    lon_s4new: 1d numpy array
+        longitudes of the transect points.
+    lat_s4new: 1d numpy array
+        latitudes of the transect points.
+
+    Returns
+    -------
+    weights: scipy.sparse.csr_matrix
+        weights of the nearest neighbour interpolation, (transect points,
+        flattened 2D model field).
+    """
+    # open with ESMF/esmpy
+    grid = esmpy.Grid(filename=ifilename, filetype=esmpy.FileFormat.GRIDSPEC)
     sourcefield = esmpy.Field(
         grid,
         staggerloc=esmpy.StaggerLoc.CENTER,
         name='MPI',
     )
-    # load model data
-    model_data = datafile.variables[cmor_var][0, level, :, :]
-
-    # ESMF do not understand masked arrays, so fill them
-    if isinstance(model_data, np.ma.core.MaskedArray):
-        sourcefield.data[...] = model_data.filled(0).T
-    else:
-        sourcefield.data[...] = model_data.T
 
+    # create instans of the location stream (set of points)
+    locstream = esmpy.LocStream(lon_s4new.shape[0],
+                                name="Atlantic Inflow Section",
+                                coord_sys=esmpy.CoordSys.SPH_DEG)
+    # appoint the section locations
+    locstream["ESMF:Lon"] = lon_s4new
+    locstream["ESMF:Lat"] = lat_s4new
+    locstream["ESMF:Mask"] = np.array(np.ones(lon_s4new.shape[0]),
+                                      dtype=np.int32)
     # create a field we giong to intorpolate TO
     dstfield = esmpy.Field(locstream, name='dstfield')
-    dstfield.data[:] = 0.0
 
-    # create an object to regrid data
-    # from the source to the destination field
-    dst_mask_values = None
-    # if domask:
-    dst_mask_values = np.array([0])
+    regrid = esmpy.Regrid(sourcefield,
+                          dstfield,
+                          regrid_method=esmpy.RegridMethod.NEAREST_STOD,
+                          unmapped_action=esmpy.UnmappedAction.IGNORE,
+                          dst_mask_values=np.array([0]),
+                          factors=True)
+    factors = regrid.get_weights_dict(deep_copy=True)
+    regrid.destroy()
+
+    # ESMF sequence indices start at 1, with longitude varying fastest,
+    # so they are the indices of the flattened (lat, lon) field
+    return csr_matrix(
+        (factors['weights'],
+         (factors['row_dst'] - 1, factors['col_src'] - 1)),
+        shape=(lon_s4new.shape[0], sourcefield.data.size))
+
 
-    regrid = esmpy.Regrid(
-        sourcefield,
-        dstfield,
-        regrid_method=esmpy.RegridMethod.NEAREST_STOD,
-        # regrid_method=esmpy.RegridMethod.BILINEAR,
-        unmapped_action=esmpy.UnmappedAction.IGNORE,
-        dst_mask_values=dst_mask_values)
+def transect_weights(cfg, ifilename, datafile, lon_s4new, lat_s4new):
+    """Get the cached weights of the interpolation to the transect points.
+
+    The weights only depend on the model grid and on the transect, so they
+    are computed once and reused for all levels and `transects_vars`. They
+    are kept in memory and stored in the directory given by the
+    ``cache_dir`` script option, by default the work directory.
+
+    Parameters
+    ----------
+    cfg: dict
+        configuration dictionary ESMValTool format.
+    ifilename: str
+        path to the netCDF file with the model grid.
+    datafile: instance of netCDF4 Dataset
+        points to the file.
+    lon_s4new: 1d numpy array
+        longitudes of the transect points.
+    lat_s4new: 1d numpy array
+        latitudes of the transect points.
 
-    # do the regridding from source to destination field
-    dstfield = regrid(sourcefield, dstfield)
-    return dstfield
+    Returns
+    -------
+    weights: scipy.sparse.csr_matrix
+        weights of the nearest neighbour interpolation.
+    """
+    key = hashlib.sha256()
+    for values in (datafile.variables['lon'][:], datafile.variables['lat'][:],
+                   lon_s4new, lat_s4new):
+        values = np.asarray(np.ma.getdata(values), dtype=np.float64)
+        key.update(str(values.shape).encode())
+        key.update(values.tobytes())
+    key = key.hexdigest()[:16]
+    if key in _TRANSECT_WEIGHTS:
+        return _TRANSECT_WEIGHTS[key]
+
+    cache_dir = cfg.get('cache_dir', cfg['work_dir'])
+    os.makedirs(cache_dir, exist_ok=True)
+    filename = os.path.join(cache_dir, f'transect_weights_{key}.npz')
+    if os.path.isfile(filename):
+        logger.info("Using cached transect weights from %s", filename)
+        weights = load_npz(filename).tocsr()
+    else:
+        weights = transect_regrid_weights(ifilename, lon_s4new, lat_s4new)
+        save_npz(filename, weights)
+    _TRANSECT_WEIGHTS[key] = weights
+    return weights
 
 
 def transect_save_data(cfg, data_info, secfield, lon_s4new, lat_s4new):
@@ -299,37 +500,20 @@ def transect_data(cfg, mmodel, cmor_var, region, mult=2):
                             extension='.nc')
     # open with netCDF4
     datafile = Dataset(ifilename)
-    # open with ESMF/esmpy
-    grid = esmpy.Grid(filename=ifilename, filetype=esmpy.FileFormat.GRIDSPEC)
 
     # get depth of the levels
     lev = datafile.variables['lev'][:]
 
-    # indexesi, indexesj = hofm_regions(region, lon2d, lat2d)
     lon_s4new, lat_s4new = transect_points(region, mult=mult)
+    weights = transect_weights(cfg, ifilename, datafile, lon_s4new, lat_s4new)
 
-    # masking true
-    # domask = True
-
-    # create instans of the location stream (set of points)
-    locstream = esmpy.LocStream(lon_s4new.shape[0],
-                                name="Atlantic Inflow Section",
-                                coord_sys=esmpy.CoordSys.SPH_DEG)
+    # load model data for all levels
+    model_data = datafile.variables[cmor_var][0, :, :, :]
+    # masked points are interpolated as zeros
+    model_data = np.ma.filled(model_data, 0).reshape(model_data.shape[0], -1)
+    # interpolate all levels at once, (points, levels)
+    secfield = weights @ model_data.T
 
-    # appoint the section locations
-    locstream["ESMF:Lon"] = lon_s4new
-    locstream["ESMF:Lat"] = lat_s4new
-    # if domask:
-    locstream["ESMF:Mask"] = np.array(np.ones(lon_s4new.shape[0]),
-                                      dtype=np.int32)
-    # initialise array for the section
-    secfield = np.zeros(
-        (lon_s4new.shape[0], datafile.variables[cmor_var].shape[1]))
-
-    # loop over depth levels
-    for level in range(0, datafile.variables[cmor_var].shape[1]):
-        secfield[:, level] = transect_level(datafile, cmor_var, level, grid,
-                                            locstream).data
     data_info = {}
     data_info['basedir'] = cfg['work_dir']
     data_info['variable'] = cmor_var
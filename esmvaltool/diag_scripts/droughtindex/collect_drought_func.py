@@ -28,6 +28,7 @@ import logging
 import os
 from pprint import pformat
 import numpy as np
+import dask.array as da
 import iris
 from iris.analysis import Aggregator
 import cartopy.crs as cart
@@ -40,25 +41,14 @@ from esmvaltool.diag_scripts.shared import (ProvenanceLogger,
 logger = logging.getLogger(os.path.basename(__file__))
 
 
-def _get_data_hlp(axis, data, ilat, ilon):
-    """Get data_help dependend on axis."""
-    if axis == 0:
-        data_help = (data[:, ilat, ilon])[:, 0]
-    elif axis == 1:
-        data_help = (data[ilat, :, ilon])[:, 0]
-    elif axis == 2:
-        data_help = data[ilat, ilon, :]
-
-    return data_help
-
-
 def _get_drought_data(cfg, cube):
     """Prepare data and calculate characteristics."""
     # make a new cube to increase the size of the data array
     # Make an aggregator from the user function.
     spell_no = Aggregator('spell_count',
                           count_spells,
-                          units_func=lambda units: 1)
+                          units_func=lambda units: 1,
+                          lazy_func=lazy_count_spells)
     new_cube = _make_new_cube(cube)
 
     # calculate the number of drought events and their average duration
@@ -241,7 +231,8 @@ def get_provenance_record(ancestor_files, caption,
 def _make_new_cube(cube):
     """Make a new cube with an extra dimension for result of spell count."""
     new_shape = cube.shape + (4,)
-    new_data = iris.util.broadcast_to_shape(cube.data, new_shape, [0, 1, 2])
+    new_data = iris.util.broadcast_to_shape(cube.core_data(), new_shape,
+                                            [0, 1, 2])
     new_cube = iris.cube.Cube(new_data)
     new_cube.add_dim_coord(iris.coords.DimCoord(
         cube.coord('time').points, long_name='time'), 0)
@@ -386,63 +377,106 @@ def _plot_single_maps(cfg, cube2, drought_show, tstype, input_filenames):
     plot_map_spei(cfg, cube2, np.arange(-2.8, -1.8, 0.2), name_dict)
 
 
-def runs_of_ones_array_spei(bits, spei):
-    """Set 1 at beginning ond -1 at the end of events."""
-    # make sure all runs of ones are well-bounded
-    bounded = np.hstack(([0], bits, [0]))
-    # get 1 at run starts and -1 at run ends
-    difs = np.diff(bounded)
-    run_starts, = np.where(difs > 0)
-    run_ends, = np.where(difs < 0)
-    spei_sum = np.full(len(run_starts), 0.5)
-    for iii, indexs in enumerate(run_starts):
-        spei_sum[iii] = np.sum(spei[indexs:run_ends[iii]])
-
-    return [run_ends - run_starts, spei_sum]
-
-
-def count_spells(data, threshold, axis):
-    """Functions for Iris Aggregator to count spells."""
+def spell_statistics(data, threshold, axis=-1):
+    """Compute the characteristics of drought events at all points at once.
+
+    A drought event is a run of consecutive time steps with values below
+    ``threshold``.
+
+    Parameters
+    ----------
+    data : numpy.ndarray or numpy.ma.MaskedArray
+        Index (e.g. SPEI) time series.
+    threshold : float
+        Events are time steps with values below this threshold.
+    axis : int, optional
+        Time axis of ``data``.
+
+    Returns
+    -------
+    numpy.ndarray
+        Array with the shape of ``data`` without ``axis`` and an extra last
+        dimension containing the number of events, their mean duration,
+        their mean severity index and the mean index during the events.
+        Points where all values are masked are set to NaN.
+    """
+    data = np.ma.masked_array(np.moveaxis(np.ma.asanyarray(data), axis, -1))
+    out_shape = data.shape[:-1]
+    n_time = data.shape[-1]
+    data = data.reshape(-1, n_time)
+    n_points = data.shape[0]
+    valid = ~np.ma.getmaskarray(data)
+    values = np.ma.getdata(data).astype(np.float64)
+    values[~valid] = 0.0
+    hits = np.ma.getdata(data < threshold)
+
+    # Get 1 at run starts and -1 at run ends
+    bounded = np.zeros((n_points, n_time + 2), dtype=np.int8)
+    bounded[:, 1:-1] = hits
+    difs = np.diff(bounded, axis=1)
+    point, run_starts = np.nonzero(difs > 0)
+    run_ends = np.nonzero(difs < 0)[1]
+    events = run_ends - run_starts
+
+    # Sum the values of each event, events without valid values are NaN
+    offsets = point * n_time
+    bounds = np.column_stack((offsets + run_starts, offsets + run_ends))
+    bounds = bounds.ravel()
+    spei_sum = np.add.reduceat(np.append(values.ravel(), 0.0), bounds)[::2]
+    n_valid = np.add.reduceat(np.append(valid.ravel(), 0), bounds)[::2]
+    spei_sum[n_valid == 0] = np.nan
+
+    def _sum_per_point(weights):
+        return np.bincount(point, weights=weights, minlength=n_points)
+
+    n_events = _sum_per_point(None)
+    valid_hits = hits & valid
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean_events = _sum_per_point(events) / n_events
+        mean_hits = (np.sum(values * valid_hits, axis=1) /
+                     np.sum(valid_hits, axis=1))
+        severity = (_sum_per_point(spei_sum * events) / n_events /
+                    (mean_hits * mean_events))
+        mean_spei = _sum_per_point(spei_sum / events) / n_events
+
+    return_var = np.stack([n_events, mean_events, severity, mean_spei],
+                          axis=-1)
+    return_var[~valid.any(axis=1)] = np.nan
+    return return_var.reshape(out_shape + (4, ))
+
+
+def _drop_spell_dim(data, axis):
+    """Remove the extra dimension added by :func:`_make_new_cube`."""
     if axis < 0:
         # just cope with negative axis numbers
         axis += data.ndim
-    data = data[:, :, 0, :]
-    if axis > 2:
+    spell_dim = max(dim for dim in range(data.ndim) if dim != axis)
+    index = [slice(None)] * data.ndim
+    index[spell_dim] = 0
+    if axis > spell_dim:
         axis = axis - 1
+    return data[tuple(index)], axis
+
 
-    listshape = []
-    inoax = []
-    for iii, ishape in enumerate(data.shape):
-        if iii != axis:
-            listshape.append(ishape)
-            inoax.append(iii)
-
-    listshape.append(4)
-    return_var = np.zeros(tuple(listshape))
-
-    for ilat in range(listshape[0]):
-        for ilon in range(listshape[1]):
-            data_help = _get_data_hlp(axis, data, ilat, ilon)
-
-            if data_help.count() == 0:
-                return_var[ilat, ilon, 0] = data_help[0]
-                return_var[ilat, ilon, 1] = data_help[0]
-                return_var[ilat, ilon, 2] = data_help[0]
-                return_var[ilat, ilon, 3] = data_help[0]
-            else:
-                data_hits = data_help < threshold
-                [events, spei_sum] = runs_of_ones_array_spei(data_hits,
-                                                             data_help)
-
-                return_var[ilat, ilon, 0] = np.count_nonzero(events)
-                return_var[ilat, ilon, 1] = np.mean(events)
-                return_var[ilat, ilon, 2] = np.mean((spei_sum * events) /
-                                                    (np.mean(data_help
-                                                             [data_hits])
-                                                     * np.mean(events)))
-                return_var[ilat, ilon, 3] = np.mean(spei_sum / events)
-
-    return return_var
+def count_spells(data, threshold, axis):
+    """Functions for Iris Aggregator to count spells."""
+    data, axis = _drop_spell_dim(data, axis)
+    return spell_statistics(data, threshold, axis)
+
+
+def lazy_count_spells(data, threshold, axis):
+    """Lazy version of :func:`count_spells` for Iris Aggregator.
+
+    The data is processed chunk by chunk, chunks contain the whole time
+    series of a region.
+    """
+    data, axis = _drop_spell_dim(data, axis)
+    data = da.moveaxis(data, axis, -1).rechunk({-1: -1})
+    return da.map_blocks(spell_statistics,
+                         data,
+                         threshold,
+                         dtype=np.float64,
+                         chunks=data.chunks[:-1] + ((4, ), ))
 
 
 def get_latlon_index(coords, lim1, lim2):
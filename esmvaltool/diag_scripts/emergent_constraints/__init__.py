@@ -9,16 +9,9 @@ import iris.pandas
 import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
-import scipy
 import seaborn as sns
 import yaml
-from packaging.version import Version
-from scipy import integrate
 from scipy.stats import linregress
-if Version(scipy.version.version) < Version('1.14.0'):
-    from scipy.integrate import simps as simpson
-else:
-    from scipy.integrate import simpson
 
 from esmvaltool.diag_scripts.shared import (
     ProvenanceLogger,
@@ -46,6 +39,14 @@ PANDAS_PRINT_OPTIONS = [
     'display.max_colwidth', None,
 ]
 
+# Composite Gauss-Legendre quadrature used to integrate the combined PDF of an
+# emergent constraint over the observations: nodes per panel, minimum and
+# maximum number of panels and maximum number of grid points evaluated at once
+PDF_QUADRATURE_NODES = 20
+PDF_QUADRATURE_PANELS = 10
+PDF_QUADRATURE_MAX_PANELS = 1000
+PDF_GRID_SIZE = 2**23
+
 
 def _check_x_y_arrays(x_array, y_array):
     """Ensure that the X and Y arrays have correct shapes."""
@@ -616,6 +617,36 @@ def _gaussian_pdf(x_val, x_mean, x_std):
     return np.exp(-(x_val - x_mean)**2 / 2.0 / x_std**2) / norm
 
 
+def _get_constraint_from_pdf(y_lin, y_pdf, confidence_level):
+    """Get confidence range and best estimate from PDF of target variable."""
+    y_mean = np.sum(y_lin * y_pdf) / np.sum(y_pdf)
+    y_cdf = cdf(y_lin, y_pdf)
+    y_index_range = np.nonzero((y_cdf >= (1.0 - confidence_level) / 2.0)
+                               & (y_cdf <= (1.0 + confidence_level) / 2.0))
+    y_range = y_lin[y_index_range]
+    return (np.min(y_range), y_mean, np.max(y_range))
+
+
+def _get_n_panels(x_range, slope, y_std):
+    """Get number of quadrature panels needed for a conditional PDF."""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        n_panels = np.ceil(x_range * np.abs(slope) / y_std)
+    if not np.isfinite(n_panels):
+        return PDF_QUADRATURE_MAX_PANELS
+    return int(np.clip(n_panels, PDF_QUADRATURE_PANELS,
+                       PDF_QUADRATURE_MAX_PANELS))
+
+
+def _get_quadrature(n_panels):
+    """Get nodes and weights of composite Gauss-Legendre rule on [-1, 1]."""
+    (nodes, weights) = np.polynomial.legendre.leggauss(PDF_QUADRATURE_NODES)
+    edges = np.linspace(-1.0, 1.0, n_panels + 1)
+    centers = (edges[1:, np.newaxis] + edges[:-1, np.newaxis]) / 2.0
+    half_widths = (edges[1:, np.newaxis] - edges[:-1, np.newaxis]) / 2.0
+    return ((centers + half_widths * nodes).ravel(),
+            (half_widths * weights).ravel())
+
+
 def _get_target_pdf(x_data,
                     y_data,
                     obs_mean,
@@ -623,46 +654,92 @@ def _get_target_pdf(x_data,
                     n_points=1000,
                     necessary_p_value=None):
     """Get PDF of target variable including linear regression information."""
-    (x_data, y_data) = _check_x_y_arrays(x_data, y_data)
-    spe = standard_prediction_error(x_data, y_data)
-    reg = linregress(x_data, y_data)
+    (y_lins, y_pdfs, regs) = _get_target_pdfs(
+        [x_data],
+        [y_data],
+        obs_mean,
+        obs_std,
+        n_points=n_points,
+        necessary_p_value=necessary_p_value,
+    )
+    return (y_lins[0], y_pdfs[0], regs[0])
 
-    # Get evenly spaced range of y
-    y_range = 1.5 * (np.max(y_data) - np.min(y_data))
-    y_lin = np.linspace(
-        np.min(y_data) - y_range,
-        np.max(y_data) + y_range, n_points)
+
+def _get_target_pdfs(x_data,
+                     y_data,
+                     obs_mean,
+                     obs_std,
+                     n_points=1000,
+                     necessary_p_value=None):
+    """Get PDFs of target variables for multiple emergent constraints.
+
+    The combined PDF P(y,x) = P(x) P(y|x) of every constraint is evaluated on
+    a grid of y values and quadrature nodes in x (within three standard
+    deviations of the observations) and integrated over x. The width of
+    P(y|x) is at least a tenth of the spacing of the y grid, so near-perfect
+    fits do not need an unbounded number of nodes.
+
+    """
+    n_constraints = len(x_data)
+    obs_mean = np.broadcast_to(np.ravel(obs_mean), (n_constraints, ))
+    obs_std = np.broadcast_to(np.ravel(obs_std), (n_constraints, ))
+    data = [_check_x_y_arrays(x_arr, y_arr)
+            for (x_arr, y_arr) in zip(x_data, y_data)]
+    regs = [linregress(x_arr, y_arr) for (x_arr, y_arr) in data]
+    spes = [standard_prediction_error(x_arr, y_arr) for (x_arr, y_arr) in data]
+    x_ranges = 3.0 * obs_std
+
+    # Evenly spaced ranges of y
+    y_lins = np.empty((n_constraints, n_points))
+    for (idx, (_, y_arr)) in enumerate(data):
+        y_range = 1.5 * (np.max(y_arr) - np.min(y_arr))
+        y_lins[idx] = np.linspace(
+            np.min(y_arr) - y_range,
+            np.max(y_arr) + y_range, n_points)
+    min_y_stds = 0.1 * (y_lins[:, -1] - y_lins[:, -2])
+
+    # The conditional PDF P(y|x) has a width of the standard prediction error
+    # divided by the slope in x, every panel covers at most two of these
+    n_panels = PDF_QUADRATURE_PANELS
+    for (x_range, reg, spe, min_y_std, (x_arr, _)) in zip(
+            x_ranges, regs, spes, min_y_stds, data):
+        n_panels = max(
+            n_panels,
+            _get_n_panels(x_range, reg.slope,
+                          max(spe(np.mean(x_arr)), min_y_std)))
+    (nodes, weights) = _get_quadrature(n_panels)
+
+    # Grid points
+    x_new = obs_mean[:, np.newaxis] + x_ranges[:, np.newaxis] * nodes
+    x_weights = x_ranges[:, np.newaxis] * weights * _gaussian_pdf(
+        x_new, obs_mean[:, np.newaxis], obs_std[:, np.newaxis])
+    y_preds = np.empty_like(x_new)
+    y_stds = np.empty_like(x_new)
+    for (idx, (reg, spe)) in enumerate(zip(regs, spes)):
+        y_preds[idx] = reg.slope * x_new[idx] + reg.intercept
+        y_stds[idx] = np.maximum(spe(x_new[idx]), min_y_stds[idx])
+
+    # PDF of target variable P(y) (for multiple constraints and nodes at once)
+    y_pdfs = np.zeros((n_constraints, n_points))
+    x_chunk_size = min(max(PDF_GRID_SIZE // n_points, 1), nodes.size)
+    chunk_size = max(PDF_GRID_SIZE // (n_points * x_chunk_size), 1)
+    for start in range(0, n_constraints, chunk_size):
+        chunk = slice(start, start + chunk_size)
+        for x_start in range(0, nodes.size, x_chunk_size):
+            x_chunk = slice(x_start, x_start + x_chunk_size)
+            cond_pdf = _gaussian_pdf(y_lins[chunk, :, np.newaxis],
+                                     y_preds[chunk, np.newaxis, x_chunk],
+                                     y_stds[chunk, np.newaxis, x_chunk])
+            y_pdfs[chunk] += np.einsum('cyx,cx->cy', cond_pdf,
+                                       x_weights[chunk, x_chunk])
 
     # Use unconstrained value of desired and necessary
     if necessary_p_value is not None:
-        if reg.pvalue > necessary_p_value:
-            y_pdf = _gaussian_pdf(y_lin, np.mean(y_data), np.std(y_data))
-            return (y_lin, y_pdf, reg)
-
-    # Helper functions for calculation of constrained target variable
-    def obs_pdf(x_new):
-        """Return PDF of observations P(x)."""
-        return _gaussian_pdf(x_new, obs_mean, obs_std)
-
-    def cond_pdf(x_new, y_new):
-        """Return conditional PDF P(y|x)."""
-        y_pred = reg.slope * x_new + reg.intercept
-        y_std = spe(x_new)
-        return _gaussian_pdf(y_new, y_pred, y_std)
-
-    def comb_pdf(x_new, y_new):
-        """Return combined PDF P(y,x)."""
-        return obs_pdf(x_new) * cond_pdf(x_new, y_new)
-
-    # PDF of target variable P(y)
-    x_range = 3 * obs_std
-    y_pdf = [
-        integrate.quad(comb_pdf,
-                       obs_mean - x_range,
-                       obs_mean + x_range,
-                       args=(y, ))[0] for y in y_lin
-    ]
-    return (y_lin, np.array(y_pdf), reg)
+        for (idx, (reg, (_, y_arr))) in enumerate(zip(regs, data)):
+            if reg.pvalue > necessary_p_value:
+                y_pdfs[idx] = _gaussian_pdf(y_lins[idx], np.mean(y_arr),
+                                            np.std(y_arr))
+    return (y_lins, y_pdfs, regs)
 
 
 def check_metadata(metadata, allowed_var_types=None):
@@ -1420,23 +1497,29 @@ def plot_target_distributions(training_data, pred_input_data, attributes,
             index=summary_columns, name=feature, dtype=np.float64
         )
 
-        # Iterate over groups
-        for (idx, group) in enumerate(groups):
+        # Calculate PDFs of target variable for all groups at once
+        x_sub_data = []
+        y_sub_data = []
+        for group in groups:
             try:
-                x_sub_data = x_data.loc[group]
-                y_sub_data = y_data.loc[group]
+                x_sub_data.append(x_data.loc[group])
+                y_sub_data.append(y_data.loc[group])
             except KeyError:
-                x_sub_data = x_data
-                y_sub_data = y_data
-            (y_lin, y_pdf) = target_pdf(
-                x_sub_data,
-                y_sub_data,
-                pred_input_data['mean'][feature].values,
-                pred_input_data['error'][feature].values,
-            )
+                x_sub_data.append(x_data)
+                y_sub_data.append(y_data)
+        (y_lins, y_pdfs, regs) = _get_target_pdfs(
+            x_sub_data,
+            y_sub_data,
+            pred_input_data['mean'][feature].values,
+            pred_input_data['error'][feature].values,
+        )
+
+        # Iterate over groups
+        for (idx, group) in enumerate(groups):
+            (y_lin, y_pdf, reg) = (y_lins[idx], y_pdfs[idx], regs[idx])
 
             # Plots
-            axes = sns.histplot(y_sub_data,
+            axes = sns.histplot(y_sub_data[idx],
                                 bins=7,
                                 stat='density',
                                 color=colors[idx],
@@ -1448,15 +1531,9 @@ def plot_target_distributions(training_data, pred_input_data, attributes,
                       label=group)
 
             # Print results
-            (y_min, y_mean, y_max) = get_constraint(
-                x_sub_data,
-                y_sub_data,
-                pred_input_data['mean'][feature].values,
-                pred_input_data['error'][feature].values,
-                confidence_level=cfg['confidence_level'],
-            )
+            (y_min, y_mean, y_max) = _get_constraint_from_pdf(
+                y_lin, y_pdf, cfg['confidence_level'])
             y_error = np.max([y_max - y_mean, y_mean - y_min])
-            reg = linregress(x_sub_data.values, y_sub_data.values)
             logger.info(
                 "Constrained %s for feature '%s' and group '%s': %.2f ± %.2f "
                 "(%i%% confidence level), R2 = %f, p = %f", label,
@@ -1604,7 +1681,7 @@ def regression_line(x_data, y_data, n_points=1000):
 
     """
     (x_data, y_data) = _check_x_y_arrays(x_data, y_data)
-    spe = np.vectorize(standard_prediction_error(x_data, y_data))
+    spe = standard_prediction_error(x_data, y_data)
     out = {}
     reg = linregress(x_data, y_data)
     x_range = np.max(x_data) - np.min(x_data)
@@ -1662,9 +1739,56 @@ def target_pdf(x_data,
     return (y_lin, y_pdf)
 
 
+def target_pdfs(x_data,
+                y_data,
+                obs_mean,
+                obs_std,
+                n_points=1000,
+                necessary_p_value=None):
+    """Calculate PDFs for target variable of multiple emergent constraints.
+
+    Parameters
+    ----------
+    x_data : list of numpy.ndarray
+        X data of the emergent constraints.
+    y_data : list of numpy.ndarray
+        Y data of the emergent constraints.
+    obs_mean : float or numpy.ndarray
+        Mean of observational data (one value for all constraints or one
+        value per constraint).
+    obs_std : float or numpy.ndarray
+        Standard deviation of observational data (one value for all
+        constraints or one value per constraint).
+    n_points : int, optional (default: 1000)
+        Number of sampled points for PDFs of target variable.
+    necessary_p_value : float, optional
+        If given, return unconstrained PDF (using Gaussian distribution with
+        unconstrained mean and standard deviation) for every emergent
+        relationship whose `p`-value is greater than the given necessary
+        `p`-value.
+
+    Returns
+    -------
+    tuple of numpy.ndarray
+        x and y values for the PDFs (arrays of shape ``(len(x_data),
+        n_points)``).
+
+    """
+    (y_lins, y_pdfs, _) = _get_target_pdfs(x_data,
+                                           y_data,
+                                           obs_mean,
+                                           obs_std,
+                                           n_points=n_points,
+                                           necessary_p_value=necessary_p_value)
+    return (y_lins, y_pdfs)
+
+
 def cdf(data, pdf):
     """Calculate cumulative distribution function for a 1-dimensional PDF.
 
+    The CDF is integrated with Simpson's rule (using the correction of
+    Cartwright for the last interval of an odd number of intervals).
+
     Parameters
     ----------
     data : numpy.ndarray
@@ -1678,9 +1802,31 @@ def cdf(data, pdf):
         Corresponding cumulative distribution function (CDF).
 
     """
-    idx_range = range(1, len(data) + 1)
-    cum_dens = [simpson(pdf[:idx], x=data[:idx]) for idx in idx_range]
-    return np.array(cum_dens)
+    data = np.asarray(data, dtype=np.float64)
+    pdf = np.asarray(pdf, dtype=np.float64)
+    cum_dens = np.zeros(len(data))
+    if len(data) < 2:
+        return cum_dens
+    diffs = np.diff(data)
+
+    # Even number of intervals: sum of Simpson's rule for pairs of intervals
+    (h_0, h_1) = (diffs[:-1:2], diffs[1::2])
+    h_sum = h_0 + h_1
+    cum_dens[2::2] = np.cumsum(
+        h_sum / 6.0 * (pdf[:-2:2] * (2.0 - h_1 / h_0) +
+                       pdf[1:-1:2] * h_sum**2 / (h_0 * h_1) +
+                       pdf[2::2] * (2.0 - h_0 / h_1)))
+
+    # Odd number of intervals: correct last interval
+    cum_dens[1] = 0.5 * diffs[0] * (pdf[0] + pdf[1])
+    idx = np.arange(3, len(data), 2)
+    (h_0, h_1) = (diffs[idx - 2], diffs[idx - 1])
+    alpha = (2.0 * h_1**2 + 3.0 * h_0 * h_1) / (6.0 * (h_0 + h_1))
+    beta = (h_1**2 + 3.0 * h_0 * h_1) / (6.0 * h_0)
+    eta = h_1**3 / (6.0 * h_0 * (h_0 + h_1))
+    cum_dens[idx] = (cum_dens[idx - 1] + alpha * pdf[idx] +
+                     beta * pdf[idx - 1] - eta * pdf[idx - 2])
+    return cum_dens
 
 
 def constraint_info_array(x_data,
@@ -1764,12 +1910,7 @@ def get_constraint(x_data, y_data, obs_mean, obs_std, confidence_level=0.66):
     """
     (x_data, y_data) = _check_x_y_arrays(x_data, y_data)
     (y_lin, y_pdf) = target_pdf(x_data, y_data, obs_mean, obs_std)
-    y_mean = np.sum(y_lin * y_pdf) / np.sum(y_pdf)
-    y_cdf = cdf(y_lin, y_pdf)
-    y_index_range = np.nonzero((y_cdf >= (1.0 - confidence_level) / 2.0)
-                               & (y_cdf <= (1.0 + confidence_level) / 2.0))
-    y_range = y_lin[y_index_range]
-    return (np.min(y_range), y_mean, np.max(y_range))
+    return _get_constraint_from_pdf(y_lin, y_pdf, confidence_level)
 
 
 def get_constraint_from_df(training_data,
@@ -45,14 +45,13 @@ from pprint import pformat
 
 import dask.array as da
 import iris
+import joblib
 import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
 import seaborn as sns
 from esmvalcore.cmor.fixes import add_plev_from_altitude
 from iris import NameConstraint
-from joblib import Parallel, delayed
-from scipy.interpolate import interp1d
 from scipy.stats import linregress
 
 import esmvaltool.diag_scripts.emergent_constraints as ec
@@ -110,18 +109,93 @@ def _get_cube(datasets, short_name):
                           NameConstraint(var_name=short_name))
 
 
-def _get_level_width(air_pressure_bounds, ref_lev, ref_zg):
-    """Get level widths of a single grid cell."""
-    ref_lev = ref_lev.compressed()
-    ref_zg = ref_zg.compressed()
-    if len(ref_lev) < 2:
-        return np.full(air_pressure_bounds.shape[0], np.nan)
-    func = interp1d(ref_lev, ref_zg, kind='cubic', fill_value='extrapolate')
-    level_widths = []
-    for bounds in air_pressure_bounds:
-        level_width = abs(func(bounds[0]) - func(bounds[1]))
-        level_widths.append(level_width)
-    return np.array(level_widths)
+def _get_level_width(lower_bounds, upper_bounds, ref_zg, ref_lev):
+    """Get level widths of multiple grid cells.
+
+    The geopotential height of every grid cell (last dimension of
+    ``ref_zg``) is interpolated to the air pressure bounds with a cubic spline
+    using not-a-knot boundary conditions (like
+    :class:`scipy.interpolate.interp1d` with ``kind='cubic'``). The splines of
+    all grid cells are calculated at once with a single tridiagonal solve;
+    values outside the reference levels are extrapolated with the outermost
+    polynomials. Grid cells with less than two valid values result in NaNs,
+    grid cells with two (three) valid values use a linear (quadratic)
+    polynomial.
+
+    """
+    out_shape = lower_bounds.shape
+    n_levels = ref_lev.shape[0]
+    lower_bounds = lower_bounds.reshape(-1, out_shape[-1])
+    upper_bounds = upper_bounds.reshape(-1, out_shape[-1])
+    ref_zg = np.ma.filled(
+        np.ma.asarray(ref_zg, dtype=np.float64).reshape(-1, n_levels),
+        np.nan)
+
+    # Sort valid values of every grid cell by level and move them to the front
+    order = np.argsort(ref_lev)
+    ref_zg = ref_zg[:, order]
+    valid = np.isfinite(ref_zg)
+    n_valid = valid.sum(axis=1)
+    idx = np.argsort(~valid, axis=1, kind='stable')
+    x_ref = ref_lev[order][idx]
+    y_ref = np.take_along_axis(ref_zg, idx, axis=1)
+    rows = np.arange(ref_zg.shape[0])
+    last = np.maximum(n_valid - 1, 0)
+    cols = np.arange(n_levels)
+    padding = cols >= n_valid[:, np.newaxis]
+    x_ref = np.where(padding,
+                     x_ref[rows, last][:, np.newaxis] + cols -
+                     last[:, np.newaxis], x_ref)
+    y_ref = np.where(padding | ~np.isfinite(y_ref),
+                     np.nan_to_num(y_ref[rows, last])[:, np.newaxis], y_ref)
+    dx_ref = np.diff(x_ref, axis=1)
+    slope = np.diff(y_ref, axis=1) / dx_ref
+
+    # Tridiagonal system for the derivatives at the reference levels (padded
+    # levels get the trivial equation s = 0)
+    sub = np.zeros_like(x_ref)
+    diag = np.ones_like(x_ref)
+    sup = np.zeros_like(x_ref)
+    rhs = np.zeros_like(x_ref)
+    sub[:, 1:-1] = dx_ref[:, 1:]
+    diag[:, 1:-1] = 2.0 * (dx_ref[:, :-1] + dx_ref[:, 1:])
+    sup[:, 1:-1] = dx_ref[:, :-1]
+    rhs[:, 1:-1] = 3.0 * (dx_ref[:, 1:] * slope[:, :-1] +
+                          dx_ref[:, :-1] * slope[:, 1:])
+    for arr in (sub, sup, rhs):
+        arr[padding] = 0.0
+    diag[padding] = 1.0
+    _set_not_a_knot_conditions((sub, diag, sup, rhs), x_ref, slope, n_valid)
+    for level in range(1, n_levels):
+        weight = sub[:, level] / diag[:, level - 1]
+        diag[:, level] -= weight * sup[:, level - 1]
+        rhs[:, level] -= weight * rhs[:, level - 1]
+    derivs = np.empty_like(x_ref)
+    derivs[:, -1] = rhs[:, -1] / diag[:, -1]
+    for level in range(n_levels - 2, -1, -1):
+        derivs[:, level] = rhs[:, level] - sup[:, level] * derivs[:, level + 1]
+        derivs[:, level] /= diag[:, level]
+
+    # Evaluate splines at all bounds
+    def spline(x_new):
+        """Evaluate cubic splines of all grid cells."""
+        interval = np.zeros(x_new.shape, dtype=int)
+        for level in range(1, n_levels - 1):
+            interval += (x_ref[:, [level]] <= x_new) & (
+                level < n_valid[:, np.newaxis] - 1)
+        step = np.take_along_axis(dx_ref, interval, axis=1)
+        slope_int = np.take_along_axis(slope, interval, axis=1)
+        deriv_0 = np.take_along_axis(derivs, interval, axis=1)
+        deriv_1 = np.take_along_axis(derivs, interval + 1, axis=1)
+        coef_2 = (3.0 * slope_int - 2.0 * deriv_0 - deriv_1) / step
+        coef_3 = (deriv_0 + deriv_1 - 2.0 * slope_int) / step**2
+        x_diff = x_new - np.take_along_axis(x_ref, interval, axis=1)
+        return np.take_along_axis(y_ref, interval, axis=1) + x_diff * (
+            deriv_0 + x_diff * (coef_2 + x_diff * coef_3))
+
+    level_widths = np.abs(spline(lower_bounds) - spline(upper_bounds))
+    level_widths[n_valid < 2] = np.nan
+    return level_widths.reshape(out_shape)
 
 
 def _get_level_widths(cube, zg_cube, n_jobs=1):
@@ -135,41 +209,39 @@ def _get_level_widths(cube, zg_cube, n_jobs=1):
         raise ValueError(
             f"Derived coordinate 'air_pressure' of cube "
             f"{cube.summary(shorten=True)} does not have bounds")
-    if air_pressure_coord.shape == cube.shape:
-        air_pressure_bounds = air_pressure_coord.bounds
-    else:
-        air_pressure_bounds = np.expand_dims(air_pressure_coord.bounds, 0)
-        air_pressure_bounds = np.broadcast_to(air_pressure_bounds,
+    air_pressure_bounds = da.asarray(air_pressure_coord.core_bounds())
+    if air_pressure_coord.shape != cube.shape:
+        air_pressure_bounds = da.broadcast_to(air_pressure_bounds[np.newaxis],
                                               cube.shape + (2, ))
-    air_pressure_bounds = np.moveaxis(air_pressure_bounds, z_idx, -2)
-    air_pressure_shape = air_pressure_bounds.shape[:-1]
-    air_pressure_bounds = air_pressure_bounds.reshape(-1, cube.shape[z_idx], 2)
+    air_pressure_bounds = da.moveaxis(air_pressure_bounds, z_idx, -2)
 
-    # Geopotential height (pressure level -> altitude)
+    # Geopotential height (pressure level -> altitude), processed in blocks
+    # along the first dimension (usually time)
     (z_coord_zg, z_idx_zg) = _get_z_coord(zg_cube)
-    ref_zg = np.moveaxis(zg_cube.data, z_idx_zg,
-                         -1).reshape(-1, zg_cube.shape[z_idx_zg])
-    mask = np.ma.getmaskarray(ref_zg)
-    ref_lev = np.expand_dims(z_coord_zg.points, 0)
-    ref_lev = np.ma.array(np.broadcast_to(ref_lev, ref_zg.shape), mask=mask)
+    ref_zg = da.moveaxis(zg_cube.lazy_data(), z_idx_zg, -1)
+    ref_zg = ref_zg.rechunk(
+        {idx: 'auto' if idx == 0 else -1 for idx in range(ref_zg.ndim)})
 
     # Check shapes
-    if air_pressure_bounds.shape[0] != ref_zg.shape[0]:
+    if air_pressure_bounds.shape[:-2] != ref_zg.shape[:-1]:
         raise ValueError(f"Expected identical first dimensions for cubes "
                          f"{cube.summary(shorten=True)} and "
                          f"{zg_cube.summary(shorten=True)}, got shapes "
                          f"{air_pressure_bounds.shape} and {ref_zg.shape}")
 
-    # Calculate level widths in parallel
-    parallel = Parallel(n_jobs=n_jobs)
-    level_widths = parallel(
-        [delayed(_get_level_width)(b, l, z) for (b, l, z) in zip(
-            air_pressure_bounds, ref_lev, ref_zg)]
+    # Calculate level widths for all grid cells of a block at once
+    chunks = ref_zg.chunks[:-1] + (-1, )
+    level_widths = da.map_blocks(
+        _get_level_width,
+        air_pressure_bounds[..., 0].rechunk(chunks),
+        air_pressure_bounds[..., 1].rechunk(chunks),
+        ref_zg,
+        ref_lev=z_coord_zg.points,
+        dtype=np.float64,
     )
-    level_widths = np.ma.masked_invalid(level_widths)
-    level_widths = level_widths.reshape(air_pressure_shape)
-    level_widths = np.moveaxis(level_widths, -1, z_idx)
-    return level_widths
+    level_widths = da.moveaxis(level_widths, -1, z_idx)
+    level_widths = da.ma.masked_invalid(level_widths)
+    return level_widths.compute(num_workers=joblib.effective_n_jobs(n_jobs))
 
 
 def _get_level_width_coord(cube, zg_cube, n_jobs=1):
@@ -418,6 +490,49 @@ def _regression_slope_metric(x_data, y_data):
     return reg.slope
 
 
+def _set_not_a_knot_conditions(system, x_ref, slope, n_valid):
+    """Set not-a-knot boundary conditions in tridiagonal spline systems."""
+    (sub, diag, sup, rhs) = system
+    rows = np.arange(x_ref.shape[0])
+    dx_ref = np.diff(x_ref, axis=1)
+
+    # At least four valid values: cubic polynomial for first and last two
+    # intervals (see scipy.interpolate.CubicSpline)
+    cells = rows[n_valid >= 4]
+    last = n_valid[cells] - 1
+    dist = x_ref[cells, 2] - x_ref[cells, 0]
+    diag[cells, 0] = dx_ref[cells, 1]
+    sup[cells, 0] = dist
+    rhs[cells, 0] = ((dx_ref[cells, 0] + 2.0 * dist) * dx_ref[cells, 1] *
+                     slope[cells, 0] +
+                     dx_ref[cells, 0]**2 * slope[cells, 1]) / dist
+    dist = x_ref[cells, last] - x_ref[cells, last - 2]
+    sub[cells, last] = dist
+    diag[cells, last] = dx_ref[cells, last - 2]
+    sup[cells, last] = 0.0
+    rhs[cells, last] = (
+        dx_ref[cells, last - 1]**2 * slope[cells, last - 2] +
+        (2.0 * dist + dx_ref[cells, last - 1]) * dx_ref[cells, last - 2] *
+        slope[cells, last - 1]) / dist
+
+    # Three valid values: quadratic polynomial
+    cells = rows[n_valid == 3]
+    diag[cells, 0] = 1.0
+    sup[cells, 0] = 1.0
+    rhs[cells, 0] = 2.0 * slope[cells, 0]
+    sub[cells, 2] = 1.0
+    diag[cells, 2] = 1.0
+    sup[cells, 2] = 0.0
+    rhs[cells, 2] = 2.0 * slope[cells, 1]
+
+    # Two valid values: linear polynomial
+    cells = rows[n_valid == 2]
+    diag[cells, :2] = 1.0
+    sup[cells, :2] = 0.0
+    sub[cells, 1] = 0.0
+    rhs[cells, :2] = slope[cells, :1]
+
+
 def _similarity_metric(cube, ref_cube, metric):
     """Calculate similarity metric between two cubes."""
     if metric == 'regression_slope':
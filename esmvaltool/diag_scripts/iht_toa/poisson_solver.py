@@ -10,12 +10,21 @@ If the solver fails to converge, the tolerance can be increased.
 
 Convergence is achieved faster by using a preconditioner on the output field.
 
+Alternatively, the spherical Laplacian can be assembled as a sparse matrix
+and solved with a direct sparse LU factorization. The factorization only
+depends on the grid, so it is computed once and reused for all source fields
+on the same grid.
+
 The heat transport is calculated as the gradient of the energy flux potential,
 the output of the Poisson solver.
 """
 
+from functools import lru_cache
+
 import numpy as np
 from numba import jit
+from scipy.sparse import coo_matrix
+from scipy.sparse.linalg import splu
 
 
 def swap_bounds(array):
@@ -25,13 +34,9 @@ def swap_bounds(array):
     boundaries.
     """
     shape0, shape1 = np.array(array.shape) - 2
-    wrap_point = int(shape1 / 2 + 1)
-    for i in range(1, shape1 + 1):
-        array[0, i] = array[1, wrap_point]
-        array[shape0 + 1, i] = array[shape0, wrap_point]
-        wrap_point += 1
-        if wrap_point > shape1:
-            wrap_point = 1
+    wrap = _get_wrap_indices(shape1) + 1
+    array[0, 1:shape1 + 1] = array[1, wrap]
+    array[shape0 + 1, 1:shape1 + 1] = array[shape0, wrap]
 
     array[:, 0] = array[:, shape1]
     array[:, shape1 + 1] = array[:, 1]
@@ -39,6 +44,11 @@ def swap_bounds(array):
     return array
 
 
+def _get_wrap_indices(n_lon):
+    """Longitude index of the point on the other side of the pole."""
+    return (np.arange(n_lon) + n_lon // 2) % n_lon
+
+
 def dot_prod(a_matrix, b_matrix):
     """Calculate dot product of two matrices only over source term size."""
     shape0, shape1 = np.array(a_matrix.shape) - 2
@@ -83,6 +93,115 @@ def precon_b(m_e, m_n, cx_matrix):
                                m_n[j, i] * cx_matrix[j + 1, i])
 
 
+@jit(nopython=True)
+def ilu_factors(a_matrix, m_matrix, alf):
+    """Calculate the ILU/SIP preconditioner factors in ``m_matrix``."""
+    shape0, shape1 = np.array(m_matrix.shape[1:]) - 1
+    for j in range(1, shape0 + 1):
+        for i in range(1, shape1 + 1):
+            m_matrix[2, j, i] = (a_matrix[2, j - 1, i - 1] /
+                                 (1.0 + alf * m_matrix[0, j - 1, i]))
+
+            m_matrix[1, j, i] = (a_matrix[1, j - 1, i - 1] /
+                                 (1.0 + alf * m_matrix[3, j, i - 1]))
+
+            m_matrix[4, j, i] = (a_matrix[4, j - 1, i - 1] -
+                                 m_matrix[2, j, i] *
+                                 (m_matrix[3, j - 1, i] -
+                                 alf * m_matrix[0, j - 1, i]) -
+                                 m_matrix[1, j, i] *
+                                 (m_matrix[0, j, i - 1] -
+                                 alf * m_matrix[3, j, i - 1]))
+
+            m_matrix[4, j, i] = 1.0 / m_matrix[4, j, i]
+
+            m_matrix[0, j, i] = ((a_matrix[0, j - 1, i - 1] -
+                                 alf * m_matrix[2, j, i] *
+                                 m_matrix[0, j - 1, i]) *
+                                 m_matrix[4, j, i])
+
+            m_matrix[3, j, i] = ((a_matrix[3, j - 1, i - 1] -
+                                 alf * m_matrix[1, j, i] *
+                                 m_matrix[3, j, i - 1]) *
+                                 m_matrix[4, j, i])
+
+
+def get_metrics(n_lat):
+    """Calculate the metrics hpi and hvj of a regular latitude grid."""
+    deltay = np.pi / n_lat
+    yyy = -0.5 * np.pi + 0.5 * deltay + deltay * np.arange(n_lat)
+    hpi = np.cos(yyy)
+    hvj = np.zeros(n_lat + 1)
+    hvj[1:-1] = np.cos(yyy[:-1] + 0.5 * deltay)
+    return hpi, hvj
+
+
+def get_stencil(src_shape):
+    """Calculate the five-point stencil of the spherical Laplacian (Eq. 8).
+
+    The values are the contributions from each of the four neighbouring
+    cells and the diagonal: A_w is the contribution from i-1, A_e is from
+    i+1, A_s is j-1, A_n is j+1, and A_p is the diagonal.
+    """
+    hpi, hvj = get_metrics(src_shape[0])
+
+    # Spherical Laplacian variables
+    aaa = 1.0 / ((2.0 * np.pi / src_shape[1])**2.)
+    bbb = 1.0 / ((np.pi / src_shape[0])**2.)
+    txa = aaa / hpi**2.0
+    tyb = bbb / hpi
+
+    a_matrix = np.zeros((5, *src_shape))
+    a_matrix[0] = txa[:, np.newaxis]
+    a_matrix[1] = txa[:, np.newaxis]
+    a_matrix[2] = (tyb * hvj[:-1])[:, np.newaxis]
+    a_matrix[3] = (tyb * hvj[1:])[:, np.newaxis]
+    a_matrix[4] = -a_matrix[0:4].sum(axis=0)
+    return a_matrix
+
+
+def assemble_laplacian(src_shape):
+    """Assemble the spherical Laplacian as a sparse matrix.
+
+    The unknowns are the grid cells in row-major (latitude, longitude)
+    order. The neighbours across the poles are the cells on the other side
+    of the pole, as in :func:`swap_bounds`.
+    """
+    n_lat, n_lon = src_shape
+    a_matrix = get_stencil(src_shape)
+    lat, lon = np.meshgrid(np.arange(n_lat), np.arange(n_lon), indexing='ij')
+    across_pole = _get_wrap_indices(n_lon)[lon]
+    south = np.where(lat == 0, lat * n_lon + across_pole,
+                     (lat - 1) * n_lon + lon)
+    north = np.where(lat == n_lat - 1, lat * n_lon + across_pole,
+                     (lat + 1) * n_lon + lon)
+    neighbours = [
+        lat * n_lon + (lon + 1) % n_lon,  # e
+        lat * n_lon + (lon - 1) % n_lon,  # w
+        south,
+        north,
+        lat * n_lon + lon,  # p
+    ]
+    rows = np.tile((lat * n_lon + lon).ravel(), 5)
+    cols = np.concatenate([cells.ravel() for cells in neighbours])
+    return coo_matrix((a_matrix.ravel(), (rows, cols)),
+                      shape=(n_lat * n_lon, n_lat * n_lon)).tocsr()
+
+
+@lru_cache(maxsize=8)
+def get_sparse_solver(src_shape):
+    """Get the LU factorization of the spherical Laplacian on a grid.
+
+    The Laplacian is singular, the solution is only defined up to a
+    constant. The equation of the first cell is replaced by setting its
+    value to zero, which makes the matrix invertible.
+    """
+    laplacian = assemble_laplacian(src_shape).tolil()
+    laplacian[0, :] = 0.0
+    laplacian[0, 0] = 1.0
+    return splu(laplacian.tocsc())
+
+
 class SphericalPoisson:
     """Poisson solver over the sphere.
 
@@ -90,15 +209,23 @@ class SphericalPoisson:
     calculate meridional heat transport (MHT).
     """
 
-    def __init__(self, logger, source, tolerance=2.0e-4):
-        """Initialise solver with source field, metrics and matrices."""
+    def __init__(self, logger, source, tolerance=2.0e-4, solver='bicgstab'):
+        """Initialise solver with source field, metrics and matrices.
+
+        ``solver`` is either ``bicgstab`` for the preconditioned Bi-CGSTAB
+        solver or ``sparse`` for a sparse direct solver.
+        """
+        if solver not in ('bicgstab', 'sparse'):
+            raise ValueError(f"Unknown Poisson solver '{solver}'")
         self.logger = logger
         self.source = source
         self.tolerance = tolerance
+        self.solver = solver
         self.energy_flux_potential = None
         self.meridional_heat_transport = None
         logger.info("Initialising Poisson solver.")
-        self.set_matrices()
+        if solver == 'bicgstab':
+            self.set_matrices()
 
     def set_matrices(self):
         """Calculate A and M matrices.
@@ -107,74 +234,17 @@ class SphericalPoisson:
         A_matrix are the values are the contributions from each of the
         four neighbouring cells: e,w,s,n,p.
         """
-        # Calculate metrics hpi and hvj
+        a_matrix = get_stencil(self.source.shape)
         src_shape = np.array(self.source.shape)
-        hpi = np.zeros(src_shape[0])
-        hvj = np.zeros(src_shape[0] + 1)
-        deltay = np.pi / src_shape[0]
-        yyy = -0.5 * np.pi + 0.5 * deltay
-        hvj[0] = 0.0
-        for j in range(0, src_shape[0]):
-            hpi[j] = np.cos(yyy)
-            hvj[j + 1] = np.cos(yyy + 0.5 * deltay)
-            yyy += deltay
-        hvj[-1] = 0.0
-
-        # Storing the full matrix
-        a_matrix = np.zeros((5, *src_shape))
 
         # ILU factors
         m_matrix = np.zeros((5, *(src_shape + 1)))
 
-        # Spherical Laplacian variables
-        aaa = 1.0 / ((2.0 * np.pi / src_shape[1])**2.)
-        bbb = 1.0 / ((np.pi / src_shape[0])**2.)
-
-        # First calculate the Poisson equations 5-point stencil
-        # A_w is the contribution from i-1, A_e is from i+1,
-        # A_s is j-1, A_n is j+1, and A_p is the diagonal
-        for j in range(0, src_shape[0]):
-            txa = aaa / hpi[j]**2.0
-            tyb = bbb / hpi[j]
-
-            for i in range(0, src_shape[1]):
-                a_matrix[0, j, i] = txa
-                a_matrix[1, j, i] = txa
-                a_matrix[2, j, i] = tyb * hvj[j]
-                a_matrix[3, j, i] = tyb * hvj[j + 1]
-                a_matrix[4, j, i] = -a_matrix[0:4, j, i].sum()
-
         # ILU/SIP preconditioner factors: alf = 0.0 is ILU
         alf = 0.9
         m_matrix[4] += 1.0
 
-        for j in range(1, src_shape[0] + 1):
-            for i in range(1, src_shape[1] + 1):
-                m_matrix[2, j, i] = (a_matrix[2, j - 1, i - 1] /
-                                     (1.0 + alf * m_matrix[0, j - 1, i]))
-
-                m_matrix[1, j, i] = (a_matrix[1, j - 1, i - 1] /
-                                     (1.0 + alf * m_matrix[3, j, i - 1]))
-
-                m_matrix[4, j, i] = (a_matrix[4, j - 1, i - 1] -
-                                     m_matrix[2, j, i] *
-                                     (m_matrix[3, j - 1, i] -
-                                     alf * m_matrix[0, j - 1, i]) -
-                                     m_matrix[1, j, i] *
-                                     (m_matrix[0, j, i - 1] -
-                                     alf * m_matrix[3, j, i - 1]))
-
-                m_matrix[4, j, i] = 1.0 / m_matrix[4, j, i]
-
-                m_matrix[0, j, i] = ((a_matrix[0, j - 1, i - 1] -
-                                     alf * m_matrix[2, j, i] *
-                                     m_matrix[0, j - 1, i]) *
-                                     m_matrix[4, j, i])
-
-                m_matrix[3, j, i] = ((a_matrix[3, j - 1, i - 1] -
-                                     alf * m_matrix[1, j, i] *
-                                     m_matrix[3, j, i - 1]) *
-                                     m_matrix[4, j, i])
+        ilu_factors(a_matrix, m_matrix, alf)
 
         self.a_matrix = a_matrix
         self.m_matrix = m_matrix
@@ -189,7 +259,13 @@ class SphericalPoisson:
         https://doi.org/10.1137/0913035.
         This solver implements the preconditioned Bi-CGSTAB algorithm,
         described in page 638 of that paper.
+
+        With the ``sparse`` solver, the equation is solved with the LU
+        factorization of the Laplacian instead.
         """
+        if self.solver == 'sparse':
+            self.solve_sparse()
+            return
         bbb = np.zeros(np.array(self.source.shape) + 2)
         xxx = np.zeros(np.array(self.source.shape) + 2)
         bbb[1:-1, 1:-1] = self.source
@@ -252,6 +328,25 @@ class SphericalPoisson:
 
         self.energy_flux_potential = xxx
 
+    def solve_sparse(self):
+        """Solve equation for the source term with a sparse direct solver.
+
+        The source term is made consistent with the singular Laplacian by
+        removing its mean weighted with the grid metrics. The origin of the
+        energy flux potential is arbitrary, the solution has zero mean.
+        """
+        hpi = get_metrics(self.source.shape[0])[0]
+        weights = np.broadcast_to(hpi[:, np.newaxis], self.source.shape)
+        source = self.source - np.average(self.source, weights=weights)
+        source = source.ravel()
+        source[0] = 0.0
+        solution = get_sparse_solver(self.source.shape).solve(source)
+
+        xxx = np.zeros(np.array(self.source.shape) + 2)
+        xxx[1:-1, 1:-1] = solution.reshape(self.source.shape)
+        xxx[1:-1, 1:-1] -= xxx[1:-1, 1:-1].mean()
+        self.energy_flux_potential = swap_bounds(xxx)
+
     def calc_meridional_heat_transport(self):
         """Meridional heat transport of energy flux potential.
 
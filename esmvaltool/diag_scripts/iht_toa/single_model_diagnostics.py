@@ -185,7 +185,10 @@ def weight_zm(cube, latitude=None):
     return cube.data * cube_areas.data
 
 
-def call_poisson(flux_cube, latitude='latitude', longitude='longitude'):
+def call_poisson(flux_cube,
+                 latitude='latitude',
+                 longitude='longitude',
+                 solver='bicgstab'):
     """Call the Poisson solver with the data in ``flux_cube`` as source term.
 
        Return the energy flux potential and implied meridional heat transport
@@ -199,11 +202,14 @@ def call_poisson(flux_cube, latitude='latitude', longitude='longitude'):
         Name of latitude coordinate in ``cube``.
     longitude : string
         Name of longitude coordinate in ``cube``.
+    solver : string
+        Poisson solver, ``bicgstab`` or ``sparse``.
 
     Returns
     -------
     efp_cube: :class:`iris.cube.Cube`
-        Energy flux potential cube.
+        Energy flux potential cube. Its attribute ``poisson_solver`` records
+        the solver, which determines the (arbitrary) origin of the potential.
     mht_cube: :class:`iris.cube.Cube`
         Implied meridional heat transport associated
         with the source flux field.
@@ -224,7 +230,8 @@ def call_poisson(flux_cube, latitude='latitude', longitude='longitude'):
     logger.info("Calling spherical_poisson")
     sphpo = SphericalPoisson(logger,
                              source=data * (earth_radius**2.0),
-                             tolerance=2.0e-4)
+                             tolerance=2.0e-4,
+                             solver=solver)
     sphpo.solve()
     sphpo.calc_meridional_heat_transport()
     logger.info("Ending spherical_poisson")
@@ -237,6 +244,12 @@ def call_poisson(flux_cube, latitude='latitude', longitude='longitude'):
                               units='J s-1',
                               dim_coords_and_dims=[(flux_cube.coords()[0], 0),
                                                    (flux_cube.coords()[1], 1)])
+    efp_cube.attributes['poisson_solver'] = solver
+    if solver == 'sparse':
+        # The origin of the potential differs from the bicgstab solution
+        efp_cube.attributes['comment'] = (
+            "The origin of the energy flux potential is arbitrary, it is "
+            "chosen so that the mean of the potential is zero.")
 
     # MHT data cube
     collapsed_longitude = iris.coords.AuxCoord(180.0,
@@ -322,15 +335,18 @@ class ImpliedHeatTransport:
        MHT: meridional heat transport
     """
 
-    def __init__(self, flx_files):
+    def __init__(self, flx_files, solver='bicgstab'):
         """Calculate all the diagnostics for all fluxes in ``flx_files``.
 
         Parameters
         ----------
         flx_files : list
             List of files with input data.
+        solver : string
+            Poisson solver, ``bicgstab`` or ``sparse``.
         """
         self.flx_files = flx_files
+        self.solver = solver
 
         # Create cube lists for the different datasets
         self.flx_clim = iris.cube.CubeList()
@@ -370,14 +386,14 @@ class ImpliedHeatTransport:
         """
         # Loop over climatologies
         for flx in self.flx_clim:
-            efp, mht = call_poisson(flx)
+            efp, mht = call_poisson(flx, solver=self.solver)
             self.efp_clim.append(efp)
             self.mht_clim.append(mht)
         # Loop over rolling means
         for flx_rm in self.flx_rolling_mean:
             mht_series = iris.cube.CubeList()
             for flx in flx_rm.slices_over('time'):
-                efp, mht = call_poisson(flx)
+                efp, mht = call_poisson(flx, solver=self.solver)
                 mht_series.append(mht)
             # Append MHT rolling mean after merging time series.
             self.mht_rolling_mean.append(mht_series.merge_cube())
@@ -981,7 +997,8 @@ def main(config):
         iht[model_name] = {}
         for dataset_name, files in datasets.items():
             logger.info("Dataset %s", dataset_name)
-            iht[model_name][dataset_name] = ImpliedHeatTransport(files)
+            iht[model_name][dataset_name] = ImpliedHeatTransport(
+                files, solver=config.get('solver', 'bicgstab'))
 
     # Produce plots
     plot_single_model_diagnostics(iht, config)
@@ -1,6 +1,5 @@
 """Resample the target model for the selected time periods."""
 import logging
-from itertools import product
 from pathlib import Path
 
 import matplotlib.pyplot as plt
@@ -98,30 +97,93 @@ def get_segment_season_means(cfg):
     return segments_season_means, provenance
 
 
-def _find_single_top1000(segment_means, target):
+def _combination_sums(values):
+    """Sum the values of all combinations of one member per segment.
+
+    values: numpy 2d array with shape (n_segments, n_members)
+
+    The combinations are ordered as in ``itertools.product``.
+    """
+    sums = np.zeros(1)
+    for segment_values in values:
+        sums = np.add.outer(sums, segment_values).ravel()
+    return sums
+
+
+def _find_single_top1000(segment_means,
+                         target,
+                         n_combinations=1000,
+                         block_size=2**22):
     """Select n_combinations that are closest to the target.
 
-    First, get all possible combinations, then select n_combinations.
-    Store the result under 'filename'
+    The mean over the segments is the sum of one value per segment, so the
+    segments are split in two halves and the sums of all combinations of
+    each half are computed. For every combination of the first half, only
+    the n_combinations sums of the second half closest to the target can be
+    part of the result. These are found with a binary search in the sorted
+    sums of the second half. The candidates are processed in blocks of at
+    most block_size elements, keeping only the best n_combinations found so
+    far, so memory use does not grow with the number of combinations.
     """
     n_segments = len(segment_means.segment)
     n_members = len(segment_means.ensemble_member)
-    segment_indices = range(n_segments)
     segment_means = segment_means.values  # much faster indexing
 
-    all_possible_combinations = product(range(n_members), repeat=n_segments)
-    results = []
-
-    for combination in all_possible_combinations:
-        results.append(
-            list(combination) +
-            [abs(segment_means[segment_indices, combination].mean() - target)])
+    n_head = n_segments // 2
+    head_sums = _combination_sums(segment_means[:n_head])
+    tail_sums = _combination_sums(segment_means[n_head:])
+    tail_order = np.argsort(tail_sums, kind='stable')
+    tail_sums = tail_sums[tail_order]
+    n_combinations = min(n_combinations, len(head_sums) * len(tail_sums))
+    target_sum = target * n_segments
+
+    heads_per_block = max(1, block_size // (2 * n_combinations))
+    best_distance = np.empty(0)
+    best_head = np.empty(0, dtype=np.int64)
+    best_tail = np.empty(0, dtype=np.int64)
+    for start in range(0, len(head_sums), heads_per_block):
+        heads = np.arange(start, min(start + heads_per_block, len(head_sums)))
+        remainders = target_sum - head_sums[heads]
+        nearest = np.searchsorted(tail_sums, remainders)
+        low = np.maximum(nearest - n_combinations, 0)
+        high = np.minimum(nearest + n_combinations, len(tail_sums))
+        if len(best_distance) == n_combinations:
+            # Skip sums further from the target than the ones kept so far
+            radius = best_distance.max() * n_segments
+            low = np.maximum(
+                low, np.searchsorted(tail_sums, remainders - radius))
+            high = np.minimum(
+                high,
+                np.searchsorted(tail_sums, remainders + radius, side='right'))
+        counts = np.maximum(high - low, 0)
+        offsets = np.repeat(low - np.cumsum(counts) + counts, counts)
+        heads = np.repeat(heads, counts)
+        tails = np.arange(len(heads)) + offsets
+        distance = np.abs(
+            (head_sums[heads] + tail_sums[tails]) / n_segments - target)
+
+        # Merge with the best combinations found so far
+        distance = np.concatenate([best_distance, distance])
+        heads = np.concatenate([best_head, heads])
+        tails = np.concatenate([best_tail, tails])
+        if len(distance) > n_combinations:
+            keep = np.argpartition(distance, n_combinations - 1)
+            keep = keep[:n_combinations]
+            distance, heads, tails = distance[keep], heads[keep], tails[keep]
+        best_distance, best_head, best_tail = distance, heads, tails
+
+    # Convert the flat indices back to one ensemble member per segment
+    order = np.lexsort((best_tail, best_head, best_distance))
+    indices = best_head[order] * len(tail_sums) + tail_order[best_tail[order]]
+    members = []
+    for _ in range(n_segments):
+        members.insert(0, indices % n_members)
+        indices = indices // n_members
 
     # Create a pandas dataframe with the combinations and distance to target
-    dataframe = pd.DataFrame(results,
-                             columns=list(segment_indices) + ['distance'])
-    top1000 = dataframe.sort_values('distance').head(1000)
-    return top1000
+    dataframe = pd.DataFrame(dict(enumerate(members)))
+    dataframe['distance'] = best_distance[order]
+    return dataframe
 
 
 def get_all_top1000s(cfg, segment_season_means):
@@ -253,36 +315,56 @@ def _penalties(overlap):
         funclist=[0, 1, 5, 100])
 
 
-def _best_subset(combinations, n_sample=8):
+def _best_subset(combinations,
+                 n_sample=8,
+                 n_iterations=10000,
+                 batch_size=1000,
+                 rng=None):
     """Find n samples with minimal reuse of ensemble members per segment.
 
     combinations: a pandas series with the remaining candidates
     n: the final number of samples drawn from the remaining set.
+
+    The penalties of n_iterations random sets of samples are computed in
+    batches of batch_size sets, and the first set with the lowest penalty
+    is selected.
     """
     # Convert series of 1d arrays to 2d array (much faster!)
     combinations = np.array(
-        [list(combination) for combination in combinations])
+        [list(combination) for combination in combinations], dtype=np.int64)
 
     # Store the indices in a nice dataframe
     n_segments = combinations.shape[1]
+    n_members = combinations.max() + 1
     best_subset = pd.DataFrame(
         data=np.empty((n_sample, n_segments), dtype=np.int64),
         columns=[f'Segment {x}' for x in range(n_segments)],
         index=[f'Combination {x}' for x in range(n_sample)])
 
     # Random number generator
-    rng = np.random.default_rng()
-
-    lowest_penalty = 500  # just a random high value
-    for _ in range(10000):
-        subset = rng.choice(combinations, size=n_sample)
-        penalty = 0
-        for segment in subset.T:
-            _, counts = np.unique(segment, return_counts=True)
-            penalty += _penalties(counts).sum()
-        if penalty < lowest_penalty:
-            lowest_penalty = penalty
-            best_subset.loc[:, :] = subset
+    if rng is None:
+        rng = np.random.default_rng()
+
+    # Penalty for each possible number of reuses of a segment
+    penalties = _penalties(np.arange(n_sample + 1))
+
+    lowest_penalty = None
+    for start in range(0, n_iterations, batch_size):
+        n_batch = min(batch_size, n_iterations - start)
+        subsets = combinations[rng.integers(len(combinations),
+                                            size=(n_batch, n_sample))]
+
+        # Count how often each member is used for each segment
+        counters = (np.arange(n_batch * n_segments).reshape(
+            n_batch, 1, n_segments) * n_members + subsets)
+        counts = np.bincount(counters.ravel(),
+                             minlength=n_batch * n_segments * n_members)
+        penalty = penalties[counts].reshape(n_batch, -1).sum(axis=1)
+
+        best = np.argmin(penalty)
+        if lowest_penalty is None or penalty[best] < lowest_penalty:
+            lowest_penalty = penalty[best]
+            best_subset.loc[:, :] = subsets[best]
 
     return best_subset
 
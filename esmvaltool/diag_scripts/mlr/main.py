@@ -26,6 +26,12 @@ efecv_kwargs: dict, optional
     If specified, use these additional keyword arguments to perform a
     exhaustive feature elimination using cross-validation. May not be used
     together with ``grid_search_cv_param_grid`` or ``rfecv_kwargs``.
+fitted_pipelines_dir: str, optional
+    If given, save the fitted pipelines of the MLR models in this directory
+    and reuse them in later runs with identical training data and settings
+    (e.g. when only the prediction input, the output options or the plots
+    change). Options that only affect the output (e.g. ``only_predict``) are
+    ignored when looking for a matching pipeline.
 grid_search_cv_kwargs: dict, optional
     Keyword arguments for the grid search cross-validation, see
     `<https://scikit-learn.org/stable/modules/generated/
@@ -52,6 +58,10 @@ only_predict: bool, optional (default: False)
     If ``True``, only use
     :meth:`esmvaltool.diag_scripts.mlr.models.MLRModel.predict` and do not
     create any other output (CSV files, plots, etc.).
+parallel_groups: int, optional (default: 1)
+    Number of groups (given by ``group_metadata`` or ``pseudo_reality``) whose
+    MLR models are created concurrently in separate processes. The jobs given
+    by ``n_jobs`` are shared among these processes.
 pattern: str, optional
     Pattern matched against ancestor file names.
 plot_partial_dependences: bool, optional (default: False)
@@ -108,11 +118,15 @@ Additional optional parameters are optional parameters for
 
 """
 
+import hashlib
+import json
 import logging
 import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from copy import deepcopy
 from pprint import pformat
 
+from joblib import effective_n_jobs
 from sklearn.gaussian_process import kernels as sklearn_kernels
 
 from esmvaltool.diag_scripts import mlr
@@ -126,6 +140,72 @@ from esmvaltool.diag_scripts.shared import (
 
 logger = logging.getLogger(os.path.basename(__file__))
 
+# Options that do not affect the fitted pipeline (ignored when looking for a
+# fitted pipeline that can be reused)
+NON_TRAINING_OPTIONS = [
+    'auxiliary_data_dir',
+    'fitted_pipelines_dir',
+    'input_data',
+    'input_files',
+    'log_level',
+    'n_jobs',
+    'only_predict',
+    'output_file_type',
+    'parallel_groups',
+    'plot_dir',
+    'plot_partial_dependences',
+    'predict_kwargs',
+    'profile_diagnostic',
+    'recipe',
+    'run_dir',
+    'save_lime_importance',
+    'save_mlr_model_error',
+    'save_propagated_errors',
+    'scheduler_address',
+    'script',
+    'sub_dir',
+    'version',
+    'work_dir',
+    'write_netcdf',
+    'write_plots',
+]
+
+
+def _fit_mlr_model(cfg, mlr_model):
+    """Fit MLR model using the desired method."""
+    if ('grid_search_cv_param_grid' in cfg and
+            cfg['grid_search_cv_param_grid']):
+        cv_param_grid = cfg['grid_search_cv_param_grid']
+        cv_kwargs = cfg.get('grid_search_cv_kwargs', {})
+        mlr_model.grid_search_cv(cv_param_grid, **cv_kwargs)
+    elif 'efecv_kwargs' in cfg:
+        mlr_model.efecv(**cfg['efecv_kwargs'])
+    elif 'rfecv_kwargs' in cfg:
+        mlr_model.rfecv(**cfg['rfecv_kwargs'])
+    else:
+        mlr_model.fit()
+
+
+def _get_fitted_pipeline_path(cfg, mlr_model_type, mlr_model):
+    """Get path of fitted pipeline for the settings and the training data."""
+    if not cfg.get('fitted_pipelines_dir'):
+        return None
+    settings = {
+        key: val
+        for (key, val) in cfg.items() if key not in NON_TRAINING_OPTIONS
+    }
+    training_files = [
+        (path, os.stat(path).st_mtime_ns)
+        for path in mlr_model.get_ancestors(prediction_names=[])
+    ]
+    key = json.dumps([mlr_model_type, settings, training_files],
+                     sort_keys=True,
+                     default=str)
+    digest = hashlib.sha256(key.encode()).hexdigest()[:16]
+    os.makedirs(cfg['fitted_pipelines_dir'], exist_ok=True)
+    return os.path.join(cfg['fitted_pipelines_dir'],
+                        f'{mlr_model_type}_{digest}.joblib')
+
 
 def _get_grouped_data(cfg, input_data):
     """Group input data to create individual MLR models for each group."""
@@ -208,6 +288,50 @@ def _get_raw_input_data(cfg):
     return input_data
 
 
+def _log_group(mlr_model_type, group_attribute, descr):
+    """Log creation of MLR model for a group."""
+    if descr is not None:
+        attr = '' if group_attribute is None else f'{group_attribute} '
+        logger.info("Creating MLR model '%s' for %s'%s'", mlr_model_type,
+                    attr, descr)
+
+
+def _run_mlr_groups(cfg, mlr_model_type, group_attribute, grouped_datasets):
+    """Run MLR models of all groups (one after another or in parallel)."""
+    groups = []
+    for (descr, datasets) in grouped_datasets.items():
+        group_cfg = dict(cfg)
+        if descr is not None:
+            group_cfg['sub_dir'] = descr
+        groups.append((descr, group_cfg, datasets))
+    parallel_groups = min(cfg.get('parallel_groups', 1), len(groups))
+
+    # Run groups one after another
+    if parallel_groups < 2:
+        for (descr, group_cfg, datasets) in groups:
+            _log_group(mlr_model_type, group_attribute, descr)
+            run_mlr_group(group_cfg, mlr_model_type, datasets)
+        return
+
+    # Run independent groups concurrently and share the available jobs
+    n_jobs = max(effective_n_jobs(cfg.get('n_jobs')) // parallel_groups, 1)
+    logger.info(
+        "Running MLR models of %i groups in %i parallel processes with %i "
+        "job(s) each", len(groups), parallel_groups, n_jobs)
+    with ProcessPoolExecutor(max_workers=parallel_groups,
+                             initializer=mlr.ignore_warnings) as executor:
+        futures = {}
+        for (descr, group_cfg, datasets) in groups:
+            _log_group(mlr_model_type, group_attribute, descr)
+            group_cfg['n_jobs'] = n_jobs
+            future = executor.submit(run_mlr_group, group_cfg,
+                                     mlr_model_type, datasets)
+            futures[future] = descr
+        for future in as_completed(futures):
+            future.result()
+            logger.info("Finished MLR model for '%s'", futures[future])
+
+
 def _update_mlr_model(mlr_model_type, mlr_model):
     """Update MLR model parameters during run time."""
     if mlr_model_type == 'gpr_sklearn':
@@ -247,49 +371,48 @@ def get_grouped_data(cfg):
     return (None, {None: input_data})
 
 
+def run_mlr_group(cfg, mlr_model_type, datasets):
+    """Run MLR model of desired type on the input data of a single group."""
+    mlr_model = MLRModel.create(mlr_model_type, datasets, **cfg)
+
+    # Update MLR model parameters dynamically
+    _update_mlr_model(mlr_model_type, mlr_model)
+
+    # Fit (or reuse fitted pipeline) and predict
+    pipeline_path = _get_fitted_pipeline_path(cfg, mlr_model_type, mlr_model)
+    if pipeline_path is not None and os.path.isfile(pipeline_path):
+        mlr_model.load_fitted_pipeline(pipeline_path)
+    else:
+        _fit_mlr_model(cfg, mlr_model)
+        if pipeline_path is not None:
+            mlr_model.save_fitted_pipeline(pipeline_path)
+    predict_args = {
+        'save_mlr_model_error': cfg.get('save_mlr_model_error'),
+        'save_lime_importance': cfg.get('save_lime_importance'),
+        'save_propagated_errors': cfg.get('save_propagated_errors'),
+        **cfg.get('predict_kwargs', {}),
+    }
+    mlr_model.predict(**predict_args)
+
+    # Print further information
+    mlr_model.print_correlation_matrices()
+    mlr_model.print_regression_metrics()
+    mlr_model.test_normality_of_residuals()
+
+    # Skip further output if desired
+    if not cfg.get('only_predict'):
+        mlr_model.export_training_data()
+        mlr_model.export_prediction_data()
+        run_mlr_model_plots(cfg, mlr_model, mlr_model_type)
+
+
 def run_mlr_model(cfg, mlr_model_type, group_attribute, grouped_datasets):
     """Run MLR model(s) of desired type on input data."""
-    for (descr, datasets) in grouped_datasets.items():
-        if descr is not None:
-            attr = '' if group_attribute is None else f'{group_attribute} '
-            logger.info("Creating MLR model '%s' for %s'%s'", mlr_model_type,
-                        attr, descr)
-            cfg['sub_dir'] = descr
-        mlr_model = MLRModel.create(mlr_model_type, datasets, **cfg)
-
-        # Update MLR model parameters dynamically
-        _update_mlr_model(mlr_model_type, mlr_model)
-
-        # Fit and predict
-        if ('grid_search_cv_param_grid' in cfg and
-                cfg['grid_search_cv_param_grid']):
-            cv_param_grid = cfg['grid_search_cv_param_grid']
-            cv_kwargs = cfg.get('grid_search_cv_kwargs', {})
-            mlr_model.grid_search_cv(cv_param_grid, **cv_kwargs)
-        elif 'efecv_kwargs' in cfg:
-            mlr_model.efecv(**cfg['efecv_kwargs'])
-        elif 'rfecv_kwargs' in cfg:
-            mlr_model.rfecv(**cfg['rfecv_kwargs'])
-        else:
-            mlr_model.fit()
-        predict_args = {
-            'save_mlr_model_error': cfg.get('save_mlr_model_error'),
-            'save_lime_importance': cfg.get('save_lime_importance'),
-            'save_propagated_errors': cfg.get('save_propagated_errors'),
-            **cfg.get('predict_kwargs', {}),
-        }
-        mlr_model.predict(**predict_args)
-
-        # Print further information
-        mlr_model.print_correlation_matrices()
-        mlr_model.print_regression_metrics()
-        mlr_model.test_normality_of_residuals()
-
-        # Skip further output if desired
-        if not cfg.get('only_predict'):
-            mlr_model.export_training_data()
-            mlr_model.export_prediction_data()
-            run_mlr_model_plots(cfg, mlr_model, mlr_model_type)
+    try:
+        _run_mlr_groups(cfg, mlr_model_type, group_attribute,
+                        grouped_datasets)
+    finally:
+        MLRModel.clear_cube_cache()
 
 
 def run_mlr_model_plots(cfg, mlr_model, mlr_model_type):
@@ -302,12 +302,13 @@ from inspect import getfullargspec
 from pprint import pformat
 
 import iris
+import joblib
 import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
 import seaborn as sns
 from cf_units import Unit
-from joblib import Parallel, delayed
+from joblib import Parallel, delayed, effective_n_jobs
 from lime.lime_tabular import LimeTabularExplainer
 from matplotlib.ticker import ScalarFormatter
 from scipy.stats import shapiro
@@ -343,6 +344,40 @@ from esmvaltool.diag_scripts.shared import (
 
 logger = logging.getLogger(os.path.basename(__file__))
 
+# Number of chunks of the prediction input per job for LIME
+LIME_CHUNKS_PER_JOB = 4
+
+# Loaded (lazy) cubes by file name, modification time, data type and target
+# units, shared by all MLR models created in this process until
+# MLRModel.clear_cube_cache() is called
+_CUBE_CACHE = {}
+
+
+def _explain_instances(x_pred, explainer, predict_fn):
+    """Get local coefficients of LIME explanations for multiple inputs.
+
+    Note
+    ----
+    Ignore warnings about missing feature names here because they are not
+    used.
+
+    """
+    coefs = np.zeros(x_pred.shape)
+    with warnings.catch_warnings():
+        warnings.filterwarnings(
+            'ignore',
+            message=('X does not have valid feature names, but '
+                     'SimpleImputer was fitted with feature names'),
+            category=UserWarning,
+            module='sklearn',
+        )
+        for (row, x_single_pred) in zip(coefs, x_pred):
+            explanation = explainer.explain_instance(x_single_pred,
+                                                     predict_fn)
+            for (idx, coef) in explanation.local_exp[1]:
+                row[idx] = coef
+    return coefs
+
 
 class MLRModel():
     """Base class for MLR models."""
@@ -351,6 +386,9 @@ class MLRModel():
     _MODELS = {}
     _MLR_MODEL_TYPE = None
 
+    # Prediction of the whole pipeline is linear in the features
+    _LINEAR_PREDICTION = False
+
     @staticmethod
     def _load_mlr_models():
         """Load MLR models from :mod:`esmvaltool.diag_scripts.mlr.models`."""
@@ -405,6 +443,11 @@ class MLRModel():
             mlr_model_type, subclass._CLF_TYPE)
         return subclass(*args, **kwargs)
 
+    @staticmethod
+    def clear_cube_cache():
+        """Clear the cubes cached by all MLR models of this process."""
+        _CUBE_CACHE.clear()
+
     def __init__(self, input_datasets, **kwargs):
         """Initialize class members.
 
@@ -920,6 +963,27 @@ class MLRModel():
         # LIME
         self._load_lime_explainer()
 
+    def load_fitted_pipeline(self, path):
+        """Load fitted pipeline instead of fitting the MLR model.
+
+        Parameters
+        ----------
+        path : str
+            File created by :meth:`save_fitted_pipeline`.
+
+        """
+        logger.info("Loading fitted pipeline from %s", path)
+        self._clf = joblib.load(path)
+        self._check_fit_status('Loading fitted pipeline')
+        self._parameters = self._get_clf_parameters()
+        logger.debug("Pipeline steps:")
+        logger.debug(pformat(list(self._clf.named_steps.keys())))
+        logger.debug("Parameters:")
+        logger.debug(pformat(self.parameters))
+
+        # LIME
+        self._load_lime_explainer()
+
     def plot_1d_model(self, filename=None, n_points=1000):
         """Plot lineplot that represents the MLR model.
 
@@ -1521,7 +1585,10 @@ class MLRModel():
         save_propagated_errors : bool, optional (default: False)
             Additionally saves propagated errors from
             ``prediction_input_error`` datasets. Only possible when these are
-            available.
+            available. If this and ``save_lime_importance`` are given, the
+            LIME explanations are only calculated once. For linear models
+            without categorical features, the local coefficients used for
+            both are calculated exactly instead of using LIME.
         **kwargs : keyword arguments, optional
             Additional options for the final regressors ``predict()`` function.
 
@@ -1769,6 +1836,24 @@ class MLRModel():
         # LIME
         self._load_lime_explainer()
 
+    def save_fitted_pipeline(self, path):
+        """Save fitted pipeline so that it can be reused in later runs.
+
+        Parameters
+        ----------
+        path : str
+            Path to the output file.
+
+        Raises
+        ------
+        sklearn.exceptions.NotFittedError
+            MLR model is not fitted.
+
+        """
+        self._check_fit_status('Saving pipeline')
+        joblib.dump(self._clf, path)
+        logger.info("Saved fitted pipeline to %s", path)
+
     def test_normality_of_residuals(self):
         """Perform Shapiro-Wilk test to normality of residuals.
 
@@ -2391,49 +2476,57 @@ class MLRModel():
                                        columns=['units'])
         return label
 
-    def _get_lime_feature_importance(self, x_pred):
-        """Get most important feature given by LIME."""
-        logger.info(
-            "Calculating local feature importance using LIME (this may take "
-            "a while...)")
-        x_pred = self._impute_nans(x_pred)
+    def _get_lime_coefficients(self, x_pred):
+        """Get local coefficients of the features given by LIME.
 
-        # Most important feature for single input
-        def _most_important_feature(x_single_pred, explainer, predict_fn):
-            """Get most important feature for single input.
+        Each input is only explained once, the coefficients are used for the
+        feature importance as well as for the propagated input errors. For
+        linear models without categorical features, the coefficients are
+        identical for all inputs and calculated exactly instead.
 
-            Note
-            ----
-            Ignore warnings about missing feature names here because they are
-            not used.
+        """
+        x_pred = self._impute_nans(x_pred)
+        if self._LINEAR_PREDICTION and not self.categorical_features.size:
+            logger.info("Calculating local coefficients of linear model")
+            scaler = self._lime_explainer.scaler
+            x_lin = scaler.mean_ + np.vstack(
+                [np.zeros_like(scaler.scale_),
+                 np.diag(scaler.scale_)])
+            y_lin = np.ravel(
+                self._clf.predict(pd.DataFrame(x_lin,
+                                               columns=x_pred.columns)))
+            coefs = y_lin[1:] - y_lin[0]
+            return np.broadcast_to(coefs, x_pred.shape)
 
-            """
-            with warnings.catch_warnings():
-                warnings.filterwarnings(
-                    'ignore',
-                    message=('X does not have valid feature names, but '
-                             'SimpleImputer was fitted with feature names'),
-                    category=UserWarning,
-                    module='sklearn',
-                )
-                explanation = explainer.explain_instance(x_single_pred,
-                                                         predict_fn)
-            local_exp = explanation.local_exp[1]
-            sorted_exp = sorted(local_exp, key=lambda elem: elem[0])
-            norm = sum(abs(elem[1]) for elem in sorted_exp)
-            return [abs(elem[1]) / norm for elem in sorted_exp]
-
-        # Apply on whole input (using multiple processes)
+        logger.info(
+            "Calculating local explanations using LIME (this may take a "
+            "while...)")
+
+        # Apply on chunks of the input (using multiple processes)
+        n_jobs = effective_n_jobs(self._cfg['n_jobs'])
+        n_chunks = 1 if n_jobs == 1 else n_jobs * LIME_CHUNKS_PER_JOB
+        n_chunks = max(1, min(n_chunks, len(x_pred.index)))
         parallel = Parallel(n_jobs=self._cfg['n_jobs'])
-        lime_feature_importance = parallel(
+        coefs = parallel(
             [
-                delayed(_most_important_feature)(
-                    x,
+                delayed(_explain_instances)(
+                    chunk,
                     explainer=self._lime_explainer,
                     predict_fn=self._clf.predict,
-                ) for x in x_pred.values
+                ) for chunk in np.array_split(x_pred.values, n_chunks)
             ]
         )
+        return np.concatenate(coefs)
+
+    def _get_lime_feature_importance(self, x_pred, lime_coefs=None):
+        """Get most important feature given by LIME."""
+        logger.info("Calculating local feature importance using LIME")
+        if lime_coefs is None:
+            lime_coefs = self._get_lime_coefficients(x_pred)
+        abs_coefs = np.abs(lime_coefs)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            lime_feature_importance = (abs_coefs /
+                                       abs_coefs.sum(axis=1, keepdims=True))
         lime_feature_importance = np.array(lime_feature_importance,
                                            dtype=self._cfg['dtype'])
         lime_feature_importance = np.moveaxis(lime_feature_importance, -1, 0)
@@ -2515,21 +2608,29 @@ class MLRModel():
                 self._estimate_mlr_model_error(len(x_pred.index),
                                                get_mlr_model_error))
 
+        # Local explanations (used for LIME feature importance and
+        # propagation of prediction input errors)
+        if get_propagated_errors and x_err is None:
+            raise ValueError(
+                f"'save_propagated_errors' is not possible because no "
+                f"'prediction_input_error' data for prediction "
+                f"'{self._get_name(pred_name)}' is available")
+        lime_coefs = None
+        if get_lime_importance or get_propagated_errors:
+            lime_coefs = self._get_lime_coefficients(x_pred)
+
         # LIME feature importance
         if get_lime_importance:
-            lime_importance = self._get_lime_feature_importance(x_pred)
+            lime_importance = self._get_lime_feature_importance(
+                x_pred, lime_coefs=lime_coefs)
             for (feature, importance) in lime_importance.items():
                 pred_dict[f'lime_importance___{feature}'] = importance
 
         # Propagate prediction input errors
         if get_propagated_errors:
-            if x_err is None:
-                raise ValueError(
-                    f"'save_propagated_errors' is not possible because no "
-                    f"'prediction_input_error' data for prediction "
-                    f"'{self._get_name(pred_name)}' is available")
             pred_dict['squared_propagated_input_error'] = (
-                self._propagate_input_errors(x_pred, x_err))
+                self._propagate_input_errors(x_pred, x_err,
+                                             lime_coefs=lime_coefs))
 
         # Calculate residuals relative to reference if possible
         if y_ref is not None:
@@ -2753,32 +2854,16 @@ class MLRModel():
 
     def _load_cube(self, dataset):
         """Load iris cube, check data type and convert units if desired."""
-        logger.debug("Loading %s", dataset['filename'])
-        cube = iris.load_cube(dataset['filename'])
-
-        # Check dtype
-        if not np.issubdtype(cube.dtype, np.number):
-            raise TypeError(
-                f"Data type of cube loaded from '{dataset['filename']}' is "
-                f"'{cube.dtype}', at the moment only numeric data is "
-                f"supported")
-
-        # Convert dtypes
-        cube.data = cube.core_data().astype(self._cfg['dtype'],
-                                            casting='same_kind')
-        for coord in cube.coords():
-            try:
-                coord.points = coord.points.astype(self._cfg['dtype'],
-                                                   casting='same_kind')
-            except TypeError:
-                logger.debug(
-                    "Cannot convert dtype of coordinate array '%s' from '%s' "
-                    "to '%s'", coord.name(), coord.points.dtype,
-                    self._cfg['dtype'])
+        key = (dataset['filename'], os.path.getmtime(dataset['filename']),
+               np.dtype(self._cfg['dtype']).str,
+               dataset.get('convert_units_to'))
+        if key not in _CUBE_CACHE:
+            _CUBE_CACHE[key] = self._read_cube(dataset)
+        else:
+            logger.debug("Using cached cube of %s", dataset['filename'])
+        cube = _CUBE_CACHE[key].copy()
 
-        # Convert and check units
-        if dataset.get('convert_units_to'):
-            self._convert_units_in_cube(cube, dataset['convert_units_to'])
+        # Check units
         if not cube.units == Unit(dataset['units']):
             raise ValueError(
                 f"Units of cube '{dataset['filename']}' for "
@@ -3119,58 +3204,53 @@ class MLRModel():
                 metric = f'root_{metric}'
             logger.info("Weighted %s: %s", metric, value)
 
-    def _propagate_input_errors(self, x_pred, x_err):
+    def _propagate_input_errors(self, x_pred, x_err, lime_coefs=None):
         """Propagate errors from prediction input."""
-        logger.info(
-            "Propagating prediction input errors using LIME (this may take a "
-            "while...)")
+        logger.info("Propagating prediction input errors using LIME")
         if 'feature_selection' in self._clf.named_steps:
             logger.warning(
                 "Propagating input errors might not work correctly when a "
                 "'feature_selection' step is present (usually because of "
                 "calling rfecv())")
-        x_pred = self._impute_nans(x_pred)
+        if lime_coefs is None:
+            lime_coefs = self._get_lime_coefficients(x_pred)
+
+        # Categorical features are ignored
+        x_err_scaled = (np.nan_to_num(x_err.values) /
+                        self._lime_explainer.scaler.scale_)
+        numerical = ~np.isin(self.features, self.categorical_features)
+        errors = np.sum((x_err_scaled * lime_coefs)[:, numerical]**2, axis=1)
+        return np.array(errors, dtype=self._cfg['dtype'])
+
+    def _read_cube(self, dataset):
+        """Read iris cube from file and convert data type and units."""
+        logger.debug("Loading %s", dataset['filename'])
+        cube = iris.load_cube(dataset['filename'])
 
-        # Propagated error for single input
-        def _propagated_error(x_single_pred, x_single_err, explainer,
-                              predict_fn, features, categorical_features):
-            """Get propagated prediction input error for single input.
+        # Check dtype
+        if not np.issubdtype(cube.dtype, np.number):
+            raise TypeError(
+                f"Data type of cube loaded from '{dataset['filename']}' is "
+                f"'{cube.dtype}', at the moment only numeric data is "
+                f"supported")
 
-            Note
-            ----
-            Ignore warnings about missing feature names here because they are
-            not used.
+        # Convert dtypes
+        cube.data = cube.core_data().astype(self._cfg['dtype'],
+                                            casting='same_kind')
+        for coord in cube.coords():
+            try:
+                coord.points = coord.points.astype(self._cfg['dtype'],
+                                                   casting='same_kind')
+            except TypeError:
+                logger.debug(
+                    "Cannot convert dtype of coordinate array '%s' from '%s' "
+                    "to '%s'", coord.name(), coord.points.dtype,
+                    self._cfg['dtype'])
 
-            """
-            with warnings.catch_warnings():
-                warnings.filterwarnings(
-                    'ignore',
-                    message=('X does not have valid feature names, but '
-                             'SimpleImputer was fitted with feature names'),
-                    category=UserWarning,
-                    module='sklearn',
-                )
-                exp = explainer.explain_instance(x_single_pred, predict_fn)
-            x_single_err = np.nan_to_num(x_single_err)
-            x_err_scaled = x_single_err / explainer.scaler.scale_
-            squared_error = 0.0
-            for (idx, coef) in exp.local_exp[1]:
-                if features[idx] in categorical_features:
-                    continue
-                squared_error += (x_err_scaled[idx] * coef)**2
-            return squared_error
-
-        # Apply on whole input (using multiple processes)
-        parallel = Parallel(n_jobs=self._cfg['n_jobs'])
-        errors = parallel(
-            [delayed(_propagated_error)(
-                x, x_e, explainer=self._lime_explainer,
-                predict_fn=self._clf.predict,
-                features=self.features,
-                categorical_features=self.categorical_features,
-            ) for (x, x_e) in zip(x_pred.values, x_err.values)]
-        )
-        return np.array(errors, dtype=self._cfg['dtype'])
+        # Convert units
+        if dataset.get('convert_units_to'):
+            self._convert_units_in_cube(cube, dataset['convert_units_to'])
+        return cube
 
     def _remove_missing_features(self, x_data, y_data, sample_weights):
         """Remove missing values in the features data (if desired)."""
@@ -16,6 +16,7 @@ class LinearModel(MLRModel):
     """Base class for linear Machine Learning models."""
 
     _CLF_TYPE = None
+    _LINEAR_PREDICTION = True
 
     def plot_coefs(self, filename=None):
         """Plot linear coefficients of models.
@@ -114,6 +114,10 @@ OPS = {
     'sum': iris.analysis.SUM,
 }
 
+# Maximum number of elements of the data used to estimate the covariance
+# structure that are standardized at once
+COV_CHUNK_SIZE = 2**22
+
 
 def _calculate_lower_error_bound(cfg, squared_error_cube, basepath):
     """Calculate lower error bound."""
@@ -209,22 +213,45 @@ def _collapse_regular_cube(cfg, cube, power=1):
     return cube
 
 
-def _corrcoef(array, rowvar=True, weights=None):
-    """Fast version of :func:`numpy.ma.corrcoef`."""
-    if not rowvar:
-        array = array.T
-        if weights is not None:
-            weights = weights.T
+def _standardize(array, weights=None):
+    """Standardize rows of an array.
+
+    The dot products of the returned rows are the Pearson correlation
+    coefficients of the rows of the input (like :func:`numpy.ma.corrcoef`).
+    Masked elements and rows without variance are set to zero, i.e., they
+    do not contribute to the correlations.
+
+    """
     mean = np.ma.average(array, axis=1, weights=weights).reshape(-1, 1)
     if weights is None:
         sqrt_weights = 1.0
     else:
         sqrt_weights = np.ma.sqrt(weights)
     demean = (array - mean) * sqrt_weights
-    res = np.ma.dot(demean, demean.T)
-    row_norms = np.ma.sqrt(np.ma.sum(demean**2, axis=1))
-    res /= np.ma.outer(row_norms, row_norms)
-    return res
+    row_norms = np.ma.sqrt(np.ma.sum(demean**2, axis=1)).reshape(-1, 1)
+    return np.ma.filled(demean / row_norms, 0.0)
+
+
+def _project_on_standardized(vectors, array, weights=None):
+    """Project vectors on the standardized columns of an array.
+
+    Calculates ``vectors @ z`` for the standardized columns ``z`` of
+    ``array`` (see :func:`_standardize`) with shape ``(N, S)`` for ``N``
+    columns and ``S`` rows. For the matrix of Pearson correlation
+    coefficients ``p = z @ z.T`` of the columns, ``x @ p @ x`` is then given
+    by the squared norm of the projection of ``x`` without calculating the
+    ``N x N`` matrix ``p``. The columns are standardized in chunks of at
+    most :const:`COV_CHUNK_SIZE` elements.
+
+    """
+    n_cols = max(1, COV_CHUNK_SIZE // array.shape[0])
+    projection = 0.0
+    for idx in range(0, array.shape[1], n_cols):
+        cols = slice(idx, idx + n_cols)
+        col_weights = None if weights is None else weights[:, cols].T
+        standardized = _standardize(array[:, cols].T, weights=col_weights)
+        projection = projection + vectors[..., cols] @ standardized
+    return projection
 
 
 def _estim_cov_differing_shape(cfg, squared_error_cube, cov_est_cube, weights):
@@ -257,16 +284,12 @@ def _estim_cov_differing_shape(cfg, squared_error_cube, cov_est_cube, weights):
             f"and 'prediction_output_error' datasets, got {cov_est.shape} and "
             f"{error.shape}")
 
-    # Estimate covariance
-    error = error.ravel()
-    cov_est = cov_est.reshape(-1, *error.shape)
-    pearson_coeffs = _corrcoef(cov_est, rowvar=False)
-    covariance = pearson_coeffs * np.ma.outer(error, error)
-
-    # Collapse covariance
-    weights = weights.ravel()
-    weights = np.outer(weights, weights)
-    error = np.ma.sqrt(np.ma.sum(covariance * weights))
+    # Collapse estimated covariance (pearson_coeffs * outer(error, error)
+    # weighted with outer(weights, weights)) without calculating it
+    weighted_error = error.ravel() * np.ma.getdata(weights).ravel()
+    cov_est = cov_est.reshape(-1, *weighted_error.shape)
+    projection = _project_on_standardized(weighted_error, cov_est)
+    error = np.sqrt(projection @ projection)
     return error
 
 
@@ -290,25 +313,28 @@ def _estim_cov_identical_shape(squared_error_cube, cov_est_cube, weights):
         cov_est = cov_est.reshape(cov_est.shape[0], -1)
         weights = weights.reshape(weights.shape[0], -1)
 
-    # Pearson coefficients (= normalized covariance) over both dimensions
-    pearson_dim0 = _corrcoef(cov_est, weights=weights)
-    pearson_dim1 = _corrcoef(cov_est, rowvar=False, weights=weights)
-
-    # Covariances
-    cov_dim0 = (np.einsum('...i,...j->...ij', error, error) *
-                np.einsum('...i,...j->...ij', weights, weights) * pearson_dim1)
-    cov_dim1 = (np.einsum('i...,j...->...ij', error, error) *
-                np.einsum('i...,j...->...ij', weights, weights) * pearson_dim0)
-
-    # Errors over dimensions
-    error_dim0 = np.ma.sqrt(np.ma.sum(cov_dim0, axis=(1, 2)))
-    error_dim1 = np.ma.sqrt(np.ma.sum(cov_dim1, axis=(1, 2)))
+    # Pearson coefficients (= normalized covariance) over dimension 0 (the
+    # ones over dimension 1 are only used implicitly, since this matrix can
+    # be very large)
+    standardized_dim0 = _standardize(cov_est, weights=weights)
+    pearson_dim0 = standardized_dim0 @ standardized_dim0.T
+
+    # Errors over dimensions (the covariances are the Pearson coefficients
+    # multiplied by the outer products of the weighted errors)
+    weighted_error = error * np.ma.getdata(weights)
+    projection_dim0 = _project_on_standardized(weighted_error,
+                                               cov_est,
+                                               weights=weights)
+    error_dim0 = np.sqrt(np.sum(projection_dim0**2, axis=1))
+    error_dim1 = np.sqrt(
+        np.sum(weighted_error * (pearson_dim0 @ weighted_error), axis=0))
 
     # Collapse further (all weights are already included in first step)
-    cov_order_0 = pearson_dim0 * np.ma.outer(error_dim0, error_dim0)
-    cov_order_1 = pearson_dim1 * np.ma.outer(error_dim1, error_dim1)
-    error_order_0 = np.ma.sqrt(np.ma.sum(cov_order_0))
-    error_order_1 = np.ma.sqrt(np.ma.sum(cov_order_1))
+    error_order_0 = np.sqrt(error_dim0 @ pearson_dim0 @ error_dim0)
+    projection_order_1 = _project_on_standardized(error_dim1,
+                                                  cov_est,
+                                                  weights=weights)
+    error_order_1 = np.sqrt(projection_order_1 @ projection_order_1)
     logger.debug(
         "Found real errors %e and %e after collapsing with different "
         "orderings, using maximum", error_order_0, error_order_1)
@@ -1,15 +1,17 @@
 """Diagnostic to select grid points within a shapefile."""
+import hashlib
 import logging
 import os
-from copy import deepcopy
 
 import fiona
 import iris
 import numpy as np
+import shapely
 import xlsxwriter
 from netCDF4 import Dataset, num2date
-from shapely.geometry import MultiPoint, shape
-from shapely.ops import nearest_points
+from scipy.sparse import csr_matrix
+from shapely.geometry import shape
+from shapely.strtree import STRtree
 
 from esmvaltool.diag_scripts.shared import (
     ProvenanceLogger,
@@ -134,96 +136,175 @@ def shapeselect(cfg, cube):
     if not os.path.isabs(shppath):
         shppath = os.path.join(cfg['auxiliary_data_dir'], shppath)
     wgtmet = cfg['weighting_method']
-    if ((cube.coord('latitude').ndim == 1
-         and cube.coord('longitude').ndim == 1)):
-        coordpoints = [(x, y) for x in cube.coord('longitude').points
-                       for y in cube.coord('latitude').points]
-        for i, crd in enumerate(coordpoints):
-            if crd[0] > 180:
-                coordpoints[i] = (coordpoints[i][0] - 360., coordpoints[i][1])
-    else:
+    if not ((cube.coord('latitude').ndim == 1
+             and cube.coord('longitude').ndim == 1)):
         raise ValueError("Support for 2-d coords not implemented!")
-    multipoint = MultiPoint(coordpoints)
-    points = list(multipoint.geoms)
-    with fiona.open(shppath) as shp:
-        gpx = []
-        gpy = []
-        cnt = -1
-        ncts = np.zeros((cube.coord('time').shape[0], len(shp)))
-        nclon = np.zeros((len(shp)))  # Takes representative point
-        nclat = np.zeros((len(shp)))
-        for ishp, multipol in enumerate(shp):
-            cnt += 1
-            multi = shape(multipol['geometry'])
-            if wgtmet == 'mean_inside':
-                gpx, gpy = mean_inside(gpx, gpy, points, multi, cube)
-                if not gpx:
-                    gpx, gpy = representative(gpx, gpy, multipoint, multi,
-                                              cube)
-            elif wgtmet == 'representative':
-                gpx, gpy = representative(gpx, gpy, multipoint, multi, cube)
-            if len(gpx) == 1:
-                ncts[:, ishp] = np.reshape(cube.data[:, gpy, gpx],
-                                           (cube.data.shape[0], ))
-            else:
-                ncts[:, ishp] = np.mean(cube.data[:, gpy, gpx], axis=1)
-            gxx, gyy = representative([], [], multipoint, multi, cube)
-            nclon[ishp] = cube.coord('longitude').points[gxx]
-            nclat[ishp] = cube.coord('latitude').points[gyy]
+    cache_file = get_cache_filename(cfg, cube, shppath, wgtmet)
+    if os.path.exists(cache_file):
+        logger.debug("Loading grid cell selection from %s", cache_file)
+        weights, reprs = load_selection(cache_file)
+    else:
+        with fiona.open(shppath) as shp:
+            shapes = np.array(
+                [shape(multipol['geometry']) for multipol in shp])
+        weights, reprs = get_selection(shapes, cube, wgtmet)
+        logger.debug("Saving grid cell selection to %s", cache_file)
+        save_selection(cache_file, weights, reprs)
+    ncts = extract_time_series(cube, weights)
+    nlon = cube.coord('longitude').shape[0]
+    nclon = cube.coord('longitude').points[reprs % nlon]
+    nclat = cube.coord('latitude').points[reprs // nlon]
     return ncts, nclon, nclat
 
 
-def mean_inside(gpx, gpy, points, multi, cube):
-    """Find points inside shape."""
-    for point in points:
-        if point.within(multi):
-            if point.x < 0:
-                addx = 360.
-            else:
-                addx = 0.
-            xxx, yyy = best_match(
-                cube.coord('longitude').points,
-                cube.coord('latitude').points, point.x + addx, point.y)
-            gpx.append(xxx)
-            gpy.append(yyy)
-    return gpx, gpy
-
-
-def representative(gpx, gpy, multipoint, multi, cube):
-    """Find representative point in shape."""
-    reprpoint = multi.representative_point()
-    nearest = nearest_points(reprpoint, multipoint)
-    npx = nearest[1].coords[0][0]
-    npy = nearest[1].coords[0][1]
-    if npx < 0:
-        addx = 360.
-    else:
-        addx = 0.
-    xxx, yyy = best_match(
-        cube.coord('longitude').points,
-        cube.coord('latitude').points, npx + addx, npy)
-    gpx.append(xxx)
-    gpy.append(yyy)
-    return gpx, gpy
-
-
-def best_match(iin, jin, pex, pey):
-    """Identify the grid points in 2-d with minimum distance."""
-    if iin.shape != 2 or jin.shape != 2:
-        gpx = deepcopy(iin)
-        gpy = deepcopy(jin)
-        gpxx = np.zeros((len(gpx), len(gpy)))
-        gpyy = np.zeros((len(gpx), len(gpy)))
-        for gpi in range(0, len(gpy)):
-            gpxx[:, gpi] = gpx
-        for gpj in range(0, len(gpx)):
-            gpyy[gpj, :] = gpy
+def _get_grid_points(cube):
+    """Get the grid points as shapely points, with longitudes in [-180, 180].
+
+    The points are ordered as the flattened (latitude, longitude) grid.
+    """
+    lon = cube.coord('longitude').points
+    lon = np.where(lon > 180., lon - 360., lon)
+    lons, lats = np.meshgrid(lon, cube.coord('latitude').points)
+    return shapely.points(lons.ravel(), lats.ravel())
+
+
+def _get_grid_cells(cube):
+    """Get the grid cells as shapely boxes, ordered as the grid points."""
+    bounds = []
+    for name in ('longitude', 'latitude'):
+        coord = cube.coord(name).copy()
+        if not coord.has_bounds():
+            coord.guess_bounds()
+        bounds.append(coord.bounds)
+    lon_bounds, lat_bounds = bounds
+    lon_points = cube.coord('longitude').points
+    lon_bounds = np.where(lon_points[:, np.newaxis] > 180., lon_bounds - 360.,
+                          lon_bounds)
+    lon_min, lat_min = np.meshgrid(lon_bounds.min(axis=1),
+                                   lat_bounds.min(axis=1))
+    lon_max, lat_max = np.meshgrid(lon_bounds.max(axis=1),
+                                   lat_bounds.max(axis=1))
+    return shapely.box(lon_min.ravel(), lat_min.ravel(), lon_max.ravel(),
+                       lat_max.ravel())
+
+
+def get_selection(shapes, cube, method):
+    """Find the grid cells belonging to each shape.
+
+    Parameters
+    ----------
+    shapes : numpy.ndarray of shapely.Geometry
+        Shapes to select.
+    cube : iris.cube.Cube
+        Cube with 1-d latitude and longitude coordinates.
+    method : str
+        ``mean_inside`` for the grid points inside the shape,
+        ``representative`` for a single grid point close to the
+        representative point of the shape, or ``area_weighted`` for all grid
+        cells overlapping with the shape, weighted by the area of the overlap.
+        If no grid points are inside a shape, ``mean_inside`` and
+        ``area_weighted`` use the ``representative`` grid point.
+
+    Returns
+    -------
+    scipy.sparse.csr_matrix
+        Weights with shape (number of shapes, number of grid cells), where
+        the grid cells are ordered as the flattened (latitude, longitude) grid.
+    numpy.ndarray
+        Index of the representative grid cell of each shape.
+    """
+    points = _get_grid_points(cube)
+    tree = STRtree(points)
+    shape_idx, cell_idx = tree.query_nearest(
+        shapely.point_on_surface(shapes))
+    _, first = np.unique(shape_idx, return_index=True)
+    reprs = cell_idx[first]
+
+    if method == 'representative':
+        shape_idx = np.arange(len(shapes))
+        cell_idx = reprs
+        weights = np.ones(len(shapes))
+    elif method == 'mean_inside':
+        shape_idx, cell_idx = tree.query(shapes, predicate='contains')
+        weights = np.ones(len(shape_idx))
+    elif method == 'area_weighted':
+        cells = _get_grid_cells(cube)
+        shape_idx, cell_idx = STRtree(cells).query(shapes,
+                                                   predicate='intersects')
+        weights = shapely.area(
+            shapely.intersection(shapes[shape_idx], cells[cell_idx]))
+        weights *= np.cos(np.radians(shapely.get_y(points[cell_idx])))
+        inside = weights > 0.
+        shape_idx, cell_idx = shape_idx[inside], cell_idx[inside]
+        weights = weights[inside]
     else:
-        gpxx = deepcopy(iin)
-        gpyy = deepcopy(jin)
-    distance = ((gpxx - pex)**2 + (gpyy - pey)**2)**0.5
-    ind = np.unravel_index(np.argmin(distance, axis=None), distance.shape)
-    return ind[0], ind[1]
+        raise ValueError(f"Unknown weighting_method '{method}'")
+
+    empty = np.setdiff1d(np.arange(len(shapes)), shape_idx)
+    weights = csr_matrix(
+        (np.concatenate([weights, np.ones(len(empty))]),
+         (np.concatenate([shape_idx, empty]),
+          np.concatenate([cell_idx, reprs[empty]]))),
+        shape=(len(shapes), len(points)))
+    return weights, reprs
+
+
+def extract_time_series(cube, weights):
+    """Compute the weighted mean of the selected grid cells of all shapes.
+
+    Masked values are ignored.
+
+    Returns
+    -------
+    numpy.ndarray
+        Time series with shape (time, number of shapes).
+    """
+    data = cube.data.reshape(cube.shape[0], -1)
+    valid = (~np.ma.getmaskarray(data)).astype(np.float64)
+    total = weights @ np.ma.filled(data, 0.).T
+    norm = weights @ valid.T
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (total / norm).T
+
+
+def get_cache_filename(cfg, cube, shppath, method):
+    """Get the file caching the selection for a grid and a shapefile.
+
+    The cache is stored in the directory given by the ``cache_dir`` script
+    option, by default the work directory.
+    """
+    key = hashlib.sha256()
+    for name in ('longitude', 'latitude'):
+        coord = cube.coord(name)
+        key.update(np.asarray(coord.points, dtype=np.float64).tobytes())
+        if method == 'area_weighted' and coord.has_bounds():
+            key.update(np.asarray(coord.bounds, dtype=np.float64).tobytes())
+    stat = os.stat(shppath)
+    shapefile_id = f'{os.path.abspath(shppath)}:{stat.st_size}:{stat.st_mtime}'
+    key.update(shapefile_id.encode())
+    cache_dir = cfg.get('cache_dir', cfg['work_dir'])
+    os.makedirs(cache_dir, exist_ok=True)
+    return os.path.join(cache_dir,
+                        f'shapeselect_{method}_{key.hexdigest()[:16]}.npz')
+
+
+def save_selection(filename, weights, reprs):
+    """Save the selection of grid cells."""
+    np.savez(filename,
+             data=weights.data,
+             indices=weights.indices,
+             indptr=weights.indptr,
+             shape=weights.shape,
+             reprs=reprs)
+
+
+def load_selection(filename):
+    """Load a selection of grid cells saved by :func:`save_selection`."""
+    with np.load(filename) as selection:
+        weights = csr_matrix(
+            (selection['data'], selection['indices'], selection['indptr']),
+            shape=tuple(selection['shape']))
+        return weights, selection['reprs']
 
 
 def write_netcdf(path, var, plon, plat, cube, cfg):
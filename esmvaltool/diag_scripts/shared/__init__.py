@@ -1,6 +1,7 @@
 """Code that is shared between multiple diagnostic scripts."""
 from . import io, iris_helpers, names, plot
 from ._base import (
+    MetadataIndex,
     ProvenanceLogger,
     extract_variables,
     get_cfg,
@@ -29,6 +30,7 @@ __all__ = [
     # Log provenance
     'ProvenanceLogger',
     # Select and sort input metadata
+    'MetadataIndex',
     'select_metadata',
     'sorted_metadata',
     'group_metadata',
@@ -1,6 +1,9 @@
 """Convenience functions for running a diagnostic script."""
 import argparse
 import contextlib
+import copy
+import fnmatch
+import functools
 import glob
 import logging
 import os
@@ -18,6 +21,25 @@ logger = logging.getLogger(__name__)
 
 iris.FUTURE.save_split_attrs = True
 
+# Use the fast C implementation of the YAML loader and dumper if available
+_SafeLoader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+_SafeDumper = getattr(yaml, 'CSafeDumper', yaml.SafeDumper)
+
+# Placeholder for attributes that are not present in the metadata
+_MISSING = object()
+
+# Parsed metadata files of this process by file name
+_METADATA_CACHE = {}
+
+# While run_diagnostic is running, provenance records for its run_dir are
+# appended as YAML documents to a file per process and these files are combined
+# when the diagnostic ends (an environment variable holding the provenance file
+# is used so that worker processes inherit the setting)
+_PROVENANCE_BUFFERED = '_ESMVALTOOL_BUFFER_PROVENANCE'
+_PROVENANCE_SHARDS = 'diagnostic_provenance.[0-9]*.yml'
+# Output files with a provenance record in this process, by provenance file
+_PROVENANCE_LOGGED = {}
+
 
 def get_plot_filename(basename, cfg):
     """Get a valid path for saving a diagnostic plot.
@@ -171,14 +193,23 @@ class ProvenanceLogger:
 
             with ProvenanceLogger(cfg) as provenance_logger:
                 provenance_logger.log(output_file, record)
+
+    Inside :func:`run_diagnostic`, the records for its ``run_dir`` are
+    appended to a file per process instead of rewriting the whole provenance
+    file each time. These files are combined into
+    ``diagnostic_provenance.yml`` when the diagnostic ends. Provenance files
+    in other directories are written directly.
     """
 
     def __init__(self, cfg):
         """Create a provenance logger."""
         self._log_file = os.path.join(cfg['run_dir'],
                                       'diagnostic_provenance.yml')
+        self._buffered = (os.path.abspath(self._log_file) == os.environ.get(
+            _PROVENANCE_BUFFERED))
+        self._logged = _PROVENANCE_LOGGED.setdefault(self._log_file, set())
 
-        if not os.path.exists(self._log_file):
+        if self._buffered or not os.path.exists(self._log_file):
             self.table = {}
         else:
             with open(self._log_file, 'r') as file:
@@ -211,19 +242,31 @@ class ProvenanceLogger:
         """  # noqa
         if isinstance(filename, Path):
             filename = str(filename)
-        if filename in self.table:
+        if filename in self.table or (self._buffered
+                                      and filename in self._logged):
             raise KeyError(
                 "Provenance record for {} already exists.".format(filename))
 
         self.table[filename] = record
+        if self._buffered:
+            self._logged.add(filename)
 
     def _save(self):
         """Save the provenance log to file."""
         dirname = os.path.dirname(self._log_file)
         if not os.path.exists(dirname):
             os.makedirs(dirname)
-        with open(self._log_file, 'w') as file:
-            yaml.safe_dump(self.table, file)
+        if self._buffered:
+            shard = os.path.join(
+                dirname, f'diagnostic_provenance.{os.getpid()}.yml')
+            with open(shard, 'a') as file:
+                yaml.dump(self.table,
+                          file,
+                          Dumper=_SafeDumper,
+                          explicit_start=True)
+        else:
+            with open(self._log_file, 'w') as file:
+                yaml.safe_dump(self.table, file)
 
     def __enter__(self):
         """Enter context."""
@@ -234,6 +277,223 @@ class ProvenanceLogger:
         self._save()
 
 
+def _invalidates_index(method):
+    """Wrap a method that modifies metadata so it invalidates the index."""
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        result = method(self, *args, **kwargs)
+        self._changed()
+        return result
+
+    return wrapper
+
+
+class _Metadata(dict):
+    """Metadata describing a single preprocessed file of :class:`InputData`.
+
+    Changes to the metadata are reported to the :class:`InputData` so the
+    hash indexes are rebuilt when they are used next time. Copies of the
+    metadata are normal dictionaries.
+    """
+
+    __slots__ = ('_input_data', )
+
+    def __init__(self, input_data, metadata):
+        super().__init__(metadata)
+        self._input_data = input_data
+
+    def _changed(self):
+        self._input_data._version += 1
+
+    def __reduce__(self):
+        return (dict, (dict(self), ))
+
+    __setitem__ = _invalidates_index(dict.__setitem__)
+    __delitem__ = _invalidates_index(dict.__delitem__)
+    __ior__ = _invalidates_index(dict.__ior__)
+    clear = _invalidates_index(dict.clear)
+    pop = _invalidates_index(dict.pop)
+    popitem = _invalidates_index(dict.popitem)
+    setdefault = _invalidates_index(dict.setdefault)
+    update = _invalidates_index(dict.update)
+
+
+class InputData(dict):
+    """Metadata describing the preprocessed data, indexed by filename.
+
+    This is a dictionary like ``cfg['input_data']`` has always been, but
+    :meth:`values` returns a :class:`MetadataIndex`. Metadata added to the
+    dictionary after creation is fine, but it is only indexed if it was
+    also present when the dictionary was created.
+    """
+
+    __slots__ = ('_metadata', '_version')
+
+    def __init__(self, input_files=()):
+        super().__init__()
+        self._metadata = None
+        self._version = 0
+        for filename, metadata in dict(input_files).items():
+            dict.__setitem__(self, filename, _Metadata(self, metadata))
+
+    def _changed(self):
+        self._metadata = None
+        self._version += 1
+
+    def __reduce__(self):
+        return (dict, (dict(self), ))
+
+    def values(self):
+        """Get the metadata of all files.
+
+        Returns
+        -------
+        :obj:`MetadataIndex` or :obj:`dict_values`
+            The metadata of all files, indexed if all metadata was present
+            when the dictionary was created.
+        """
+        if self._metadata is None:
+            metadata = super().values()
+            if all(
+                    isinstance(m, _Metadata) and m._input_data is self
+                    for m in metadata):
+                self._metadata = MetadataIndex(metadata, self)
+            else:
+                return metadata
+        return self._metadata
+
+    __setitem__ = _invalidates_index(dict.__setitem__)
+    __delitem__ = _invalidates_index(dict.__delitem__)
+    __ior__ = _invalidates_index(dict.__ior__)
+    clear = _invalidates_index(dict.clear)
+    pop = _invalidates_index(dict.pop)
+    popitem = _invalidates_index(dict.popitem)
+    setdefault = _invalidates_index(dict.setdefault)
+    update = _invalidates_index(dict.update)
+
+
+class MetadataIndex(tuple):
+    """Metadata describing preprocessed data with hash indexes by attribute.
+
+    This is what ``cfg['input_data'].values()`` returns. It can be used
+    like a list of metadata, but :func:`select_metadata`,
+    :func:`group_metadata` and :func:`sorted_metadata` look up the
+    metadata in hash indexes, which are built once for each attribute when
+    they are first needed. This makes selecting metadata from recipes with
+    many datasets fast.
+
+    Note that it is a snapshot: files added to or removed from
+    ``cfg['input_data']`` afterwards are not included.
+    """
+
+    def __new__(cls, metadata, input_data=None):
+        """Create a metadata index."""
+        self = super().__new__(cls, metadata)
+        self._input_data = input_data
+        self._version = None
+        self._indexes = {}
+        self._sort_keys = {}
+        return self
+
+    def __reduce__(self):
+        return (list, (list(self), ))
+
+    def _check_version(self):
+        """Discard the indexes if the metadata changed after building them."""
+        version = None if self._input_data is None else \
+            self._input_data._version
+        if version != self._version:
+            self._indexes.clear()
+            self._sort_keys.clear()
+            self._version = version
+
+    def _positions(self, attribute):
+        """Get the positions of the metadata for each value of attribute."""
+        self._check_version()
+        if attribute not in self._indexes:
+            index = {}
+            try:
+                for i, attributes in enumerate(self):
+                    value = attributes.get(attribute, _MISSING)
+                    index.setdefault(value, []).append(i)
+            except TypeError:
+                # Values that are not hashable cannot be indexed
+                index = None
+            self._indexes[attribute] = index
+        return self._indexes[attribute]
+
+    def select(self, **attributes):
+        """Select metadata, see :func:`select_metadata`."""
+        candidates = None
+        for attribute, value in attributes.items():
+            if value == '*':
+                continue
+            index = self._positions(attribute)
+            if index is None:
+                continue
+            try:
+                positions = index.get(value, [])
+            except TypeError:
+                continue
+            if candidates is None or len(positions) < len(candidates):
+                candidates = positions
+
+        if candidates is None:
+            candidates = range(len(self))
+        selection = []
+        for i in candidates:
+            attribs = self[i]
+            if all(a in attribs and (
+                    attribs[a] == attributes[a] or attributes[a] == '*')
+                   for a in attributes):
+                selection.append(attribs)
+        return selection
+
+    def group(self, attribute):
+        """Group metadata, see :func:`group_metadata`.
+
+        Returns None if the values of attribute cannot be indexed.
+        """
+        index = self._positions(attribute)
+        if index is None:
+            return None
+        groups = {}
+        for key, positions in index.items():
+            groups.setdefault(None if key is _MISSING else key,
+                              []).append(positions)
+        for key, positions in groups.items():
+            if len(positions) > 1:
+                # metadata without the attribute is grouped with None
+                positions = [sorted(i for p in positions for i in p)]
+            groups[key] = [self[i] for i in positions[0]]
+        return groups
+
+    def sorted_by(self, sort):
+        """Sort metadata, see :func:`sorted_metadata`."""
+        self._check_version()
+        keys = []
+        for attribute in sort:
+            if attribute not in self._sort_keys:
+                self._sort_keys[attribute] = [
+                    str(attributes.get(attribute, '')).lower()
+                    for attributes in self
+                ]
+            keys.append(self._sort_keys[attribute])
+        order = sorted(range(len(self)),
+                       key=lambda i: tuple(key[i] for key in keys))
+        return [self[i] for i in order]
+
+
+for _dumper in (yaml.SafeDumper, yaml.Dumper, getattr(yaml, 'CSafeDumper',
+                                                      None),
+                getattr(yaml, 'CDumper', None)):
+    if _dumper is not None:
+        _dumper.add_representer(InputData, _dumper.represent_dict)
+        _dumper.add_representer(_Metadata, _dumper.represent_dict)
+        _dumper.add_representer(MetadataIndex, _dumper.represent_list)
+
+
 def select_metadata(metadata, **attributes):
     """Select specific metadata describing preprocessed data.
 
@@ -251,6 +511,9 @@ def select_metadata(metadata, **attributes):
     :obj:`list` of :obj:`dict`
         A list of matching metadata.
     """
+    if isinstance(metadata, MetadataIndex):
+        return metadata.select(**attributes)
+
     selection = []
     for attribs in metadata:
         if all(a in attribs and (
@@ -277,12 +540,16 @@ def group_metadata(metadata, attribute, sort=None):
     :obj:`dict` of :obj:`list` of :obj:`dict`
         A dictionary containing the requested groups.
     """
-    groups = {}
-    for attributes in metadata:
-        key = attributes.get(attribute)
-        if key not in groups:
-            groups[key] = []
-        groups[key].append(attributes)
+    groups = None
+    if isinstance(metadata, MetadataIndex):
+        groups = metadata.group(attribute)
+    if groups is None:
+        groups = {}
+        for attributes in metadata:
+            key = attributes.get(attribute)
+            if key not in groups:
+                groups[key] = []
+            groups[key].append(attributes)
 
     if sort:
         groups = sorted_group_metadata(groups, sort)
@@ -310,6 +577,9 @@ def sorted_metadata(metadata, sort):
     if isinstance(sort, str):
         sort = [sort]
 
+    if isinstance(metadata, MetadataIndex):
+        return metadata.sorted_by(sort)
+
     def normalized_variable_key(attributes):
         """Define a key to sort the list of attributes by."""
         return tuple(str(attributes.get(k, '')).lower() for k in sort)
@@ -429,6 +699,50 @@ def get_cfg(filename=None):
     return cfg
 
 
+def _read_metadata_file(filename):
+    """Read a metadata file, using a cached copy if it is up to date.
+
+    The content of each file is cached in memory, so it is only parsed once
+    per process.
+    """
+    stat = os.stat(filename)
+    signature = (stat.st_mtime_ns, stat.st_size)
+    cached = _METADATA_CACHE.get(filename)
+    if cached is None or cached[0] != signature:
+        with open(filename) as file:
+            cached = (signature, yaml.load(file, Loader=_SafeLoader))
+        _METADATA_CACHE[filename] = cached
+    return copy.deepcopy(cached[1])
+
+
+def _combine_provenance(log_file):
+    """Combine the provenance records of all processes into one file."""
+    shards = sorted(
+        glob.glob(os.path.join(os.path.dirname(log_file),
+                               _PROVENANCE_SHARDS)))
+    if not shards:
+        return
+
+    table = {}
+    if os.path.exists(log_file):
+        with open(log_file, 'r') as file:
+            table = yaml.load(file, Loader=_SafeLoader)
+    for shard in shards:
+        with open(shard, 'r') as file:
+            for records in yaml.load_all(file, Loader=_SafeLoader):
+                for filename, record in (records or {}).items():
+                    if filename in table:
+                        raise KeyError(
+                            "Provenance record for {} already exists.".format(
+                                filename))
+                    table[filename] = record
+
+    with open(log_file, 'w') as file:
+        yaml.dump(table, file, Dumper=_SafeDumper)
+    for shard in shards:
+        os.remove(shard)
+
+
 def _get_input_data_files(cfg):
     """Get a dictionary containing all data input files."""
     metadata_files = []
@@ -441,11 +755,9 @@ def _get_input_data_files(cfg):
 
     input_files = {}
     for filename in metadata_files:
-        with open(filename) as file:
-            metadata = yaml.safe_load(file)
-            input_files.update(metadata)
+        input_files.update(_read_metadata_file(filename))
 
-    return input_files
+    return InputData(input_files)
 
 
 @contextlib.contextmanager
@@ -538,8 +850,10 @@ def run_diagnostic():
         p for p in output_directories
         if Path(p).exists() and any(Path(p).iterdir())
     ]
-    old_content.extend(p for p in glob.glob(f"{cfg['run_dir']}{os.sep}*")
-                       if not os.path.basename(p) in default_files)
+    old_content.extend(
+        p for p in glob.glob(f"{cfg['run_dir']}{os.sep}*")
+        if not (os.path.basename(p) in default_files
+                or fnmatch.fnmatch(os.path.basename(p), _PROVENANCE_SHARDS)))
 
     if old_content:
         if args.force:
@@ -564,9 +878,12 @@ def run_diagnostic():
             os.makedirs(output_directory)
 
     provenance_file = os.path.join(cfg['run_dir'], 'diagnostic_provenance.yml')
-    if os.path.exists(provenance_file):
-        logger.info("Removing %s from previous run.", provenance_file)
-        os.remove(provenance_file)
+    for filename in [provenance_file] + glob.glob(
+            os.path.join(cfg['run_dir'], _PROVENANCE_SHARDS)):
+        if os.path.exists(filename):
+            logger.info("Removing %s from previous run.", filename)
+            os.remove(filename)
+    _PROVENANCE_LOGGED.pop(provenance_file, None)
 
     if not args.no_distributed and 'scheduler_address' in cfg:
         try:
@@ -580,7 +897,21 @@ def run_diagnostic():
     else:
         client = contextlib.nullcontext()
 
-    with client:
-        yield cfg
+    os.environ[_PROVENANCE_BUFFERED] = os.path.abspath(provenance_file)
+    succeeded = False
+    try:
+        with client:
+            yield cfg
+        succeeded = True
+    finally:
+        os.environ.pop(_PROVENANCE_BUFFERED, None)
+        try:
+            _combine_provenance(provenance_file)
+        except Exception:
+            if succeeded:
+                raise
+            # Do not hide the exception raised by the diagnostic
+            logger.exception("Unable to combine the provenance records in %s",
+                             cfg['run_dir'])
 
     logger.info("End of diagnostic script run.")
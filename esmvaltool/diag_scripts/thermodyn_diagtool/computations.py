@@ -201,7 +201,16 @@ def budgets(model, wdir, aux_file, input_data):
     return input_list, eb_gmean, eb_file, toab_ymm_file
 
 
-def direntr(logger, model, wdir, input_data, aux_file, te_file, lect, flags):
+def direntr(logger,
+            model,
+            wdir,
+            input_data,
+            aux_file,
+            te_file,
+            lect,
+            flags,
+            engine='cdo',
+            keep=False):
     """Compute the material entropy production with the direct method.
 
     The function computes the material entropy production with the direct
@@ -224,6 +233,9 @@ def direntr(logger, model, wdir, input_data, aux_file, te_file, lect, flags):
            and energy budgets are computed, if the material entropy production
            has to be computed, if using the indirect, the direct method, or
            both methods;
+    engine: the engine used for the computation of the auxiliary fields
+            ('cdo' or 'iris');
+    keep: if True, intermediate auxiliary fields are stored;
 
     Returns
     -------
@@ -233,8 +245,13 @@ def direntr(logger, model, wdir, input_data, aux_file, te_file, lect, flags):
     @author: Valerio Lembo, Hamburg University, 2018.
     """
     lec = flags[1]
-    aux_files = mkthe.init_mkthe_direntr(model, wdir, input_data, te_file,
-                                         flags)
+    aux_files = mkthe.init_mkthe_direntr(model,
+                                         wdir,
+                                         input_data,
+                                         te_file,
+                                         flags,
+                                         engine=engine,
+                                         keep=keep)
     htop_file = aux_files[1]
     prr_file = aux_files[2]
     tabl_file = aux_files[3]
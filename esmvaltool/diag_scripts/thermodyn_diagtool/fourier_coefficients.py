@@ -32,9 +32,34 @@ def fourier_coeff(tadiagfile, outfile, ta_input, tas_input):
     ta_input: the name of a file containing t,u,v,w fields;
     tas_input: the name of a file containing t2m field.
     """
+    coeffs = compute_coeff(ta_input, tas_input, tadiagfile)
+    dict_v = {key: coeffs[key] for key in ('ta', 'ua', 'va', 'wap')}
+    file_desc = 'Fourier coefficients'
+    pr_output(dict_v, ta_input, outfile, file_desc, coeffs['wave'])
+
+
+def compute_coeff(ta_input, tas_input, tadiagfile=None):
+    """Compute Fourier coefficients in lon direction and keep them in memory.
+
+    Arguments:
+    ---------
+    ta_input: the name of a file containing t,u,v,w fields;
+    tas_input: the name of a file containing t2m field;
+    tadiagfile: the name of a file to store modified t fields (optional).
+
+    Returns a dictionary with the Fourier coefficients of t,u,v,w as
+    (time,level,lat,wave), the coordinates lat, plev, time and wave and the
+    attributes of the latitude and wave coordinates (lat_attrs, wave_attrs),
+    the same content as a file written by fourier_coeff and read by
+    read_coeff.
+    """
     with Dataset(ta_input) as dataset:
         lon = dataset.variables['lon'][:]
         lat = dataset.variables['lat'][:]
+        lat_attrs = {
+            ncattr: dataset.variables['lat'].getncattr(ncattr)
+            for ncattr in dataset.variables['lat'].ncattrs()
+        }
         lev = dataset.variables['plev'][:]
         time = dataset.variables['time'][:]
         t_a = dataset.variables['ta'][:, :, :, :]
@@ -47,7 +72,7 @@ def fourier_coeff(tadiagfile, outfile, ta_input, tas_input):
     ntime = len(time)
     i = np.min(np.where(2 * nlat <= GP_RES))
     trunc = FC_RES[i] + 1
-    wave2 = np.linspace(0, trunc - 1, trunc)
+    wave2 = np.linspace(0, trunc - 1, trunc).astype(lev.dtype)
     with Dataset(tas_input) as dataset:
         tas = dataset.variables['tas'][:, :, :]
     tas = tas[:, ::-1, :]
@@ -91,7 +116,8 @@ def fourier_coeff(tadiagfile, outfile, ta_input, tas_input):
         dat[i, :, :, :] = (ta2_fx[:, i, :, :] *
                            (1 - 1 * np.array(mask[i, :, :, :])))
         t_a[:, i, :, :] = dat[i, :, :, :] + tafr_bar[i, :, :, :]
-    pr_output_diag(t_a, ta_input, tadiagfile, 'ta')
+    if tadiagfile is not None:
+        pr_output_diag(t_a, ta_input, tadiagfile, 'ta')
     tafft_p = np.fft.fft(t_a, axis=3)[:, :, :, :int(trunc / 2)] / (nlon)
     uafft_p = np.fft.fft(u_a, axis=3)[:, :, :, :int(trunc / 2)] / (nlon)
     vafft_p = np.fft.fft(v_a, axis=3)[:, :, :, :int(trunc / 2)] / (nlon)
@@ -108,9 +134,44 @@ def fourier_coeff(tadiagfile, outfile, ta_input, tas_input):
     vafft[:, :, :, 1::2] = np.imag(vafft_p)
     wapfft[:, :, :, 0::2] = np.real(wapfft_p)
     wapfft[:, :, :, 1::2] = np.imag(wapfft_p)
-    dict_v = {'ta': tafft, 'ua': uafft, 'va': vafft, 'wap': wapfft}
-    file_desc = 'Fourier coefficients'
-    pr_output(dict_v, ta_input, outfile, file_desc, wave2)
+    return {
+        'ta': tafft,
+        'ua': uafft,
+        'va': vafft,
+        'wap': wapfft,
+        'lat': lat,
+        'lat_attrs': lat_attrs,
+        'plev': lev,
+        'time': time,
+        'wave': wave2,
+        # fourier_coeff does not write any attributes of the wave coordinate
+        'wave_attrs': {},
+    }
+
+
+def read_coeff(filename):
+    """Read Fourier coefficients from a file written by fourier_coeff.
+
+    Arguments:
+    ---------
+    filename: the name of the file containing the Fourier coefficients.
+
+    Returns a dictionary with the same content as the one provided by
+    compute_coeff.
+    """
+    with Dataset(filename) as dataset:
+        coeffs = {
+            key: dataset.variables[key][:, :, :, :]
+            for key in ('ta', 'ua', 'va', 'wap')
+        }
+        for key in ('lat', 'plev', 'time', 'wave'):
+            coeffs[key] = dataset.variables[key][:]
+        for key in ('lat', 'wave'):
+            coeffs[f'{key}_attrs'] = {
+                ncattr: dataset.variables[key].getncattr(ncattr)
+                for ncattr in dataset.variables[key].ncattrs()
+            }
+    return coeffs
 
 
 def pr_output(dict_v, nc_f, fileo, file_desc, wave2):
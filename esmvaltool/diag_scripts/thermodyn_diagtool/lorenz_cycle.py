@@ -7,10 +7,12 @@ The module contains the following functions:
               reservoirs and conversion terms, storing them separately in
               NetCDF files and providing a flux diagram and a table outputs,
               the latter separately for the two hemispheres;
+    - accumulate: it adds blocks of timesteps to the running sums of
+                  reservoirs and conversion terms;
     - averages: a script computing time, global and zonal averages;
-    - averages_comp: a script computing global mean of the output fields;
     - bsslzr: it contains the coefficients for the conversion from regular
               lonlat grid to Gaussian grid;
+    - dfdlat: it computes meridional derivatives with centred differences;
     - diagram: it is the interface between the main program and a
                class "Fluxogram", producing the flux diagram;
     - gauaw: it uses the coefficients provided in bsslzr for the lonlat to
@@ -18,6 +20,8 @@ The module contains the following functions:
     - globall_cg: it computes the global and hemispheric means at each
                   timestep;
     - init: initializes the table and ingests input fields;
+    - lec_year: it computes the LEC for a single year, from the extraction
+                of the year to the flux diagram and table outputs;
     - makek: computes the KE reservoirs;
     - makea: computes the APE reservoirs;
     - mka2k: computes the APE->KE conversion terms;
@@ -38,6 +42,8 @@ The module contains the following functions:
              the reservoirs;
     - table_conv: prints the global and hemispheric mean values of the
                   conversion terms;
+    - time_mean: computes the time mean of reservoirs and conversion terms
+                 from their running sums;
     - varatts: prints the attributes of a variable in a Nc file;
     - weights: computes the weights for vertical integrations and meridional
                averages;
@@ -52,7 +58,10 @@ References.
 
 import math
 import os
+import shutil
 import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
 
 import numpy as np
 from cdo import Cdo
@@ -70,23 +79,44 @@ PS = 101100.0
 NW_1 = 3
 NW_2 = 9
 NW_3 = 21
+NT_BLOCK = 32
 
 
-def lorenz(outpath, model, year, filenc, plotfile, logfile):
+def lorenz(outpath,
+           model,
+           year,
+           filenc,
+           plotfile,
+           logfile,
+           block_size=NT_BLOCK,
+           write_maps=True):
     """Manage input and output fields and calling functions.
 
     Receive fields t,u,v,w as input fields in Fourier
     coefficients (time,level,wave,lon) and compute the LEC.
 
+    The reservoirs and conversion terms are computed for blocks of
+    block_size timesteps at once, and only their running sums over time are
+    kept, so that the memory needed does not depend on the number of
+    timesteps.
+
     Arguments:
     ----------
         outpath: ath where output fields are stored (as NetCDF fields);
         model: name of the model that is analysed;
         year: year that is considered;
-        filenc: name of the file containing the input fields;
+        filenc: name of the file containing the input fields, or the
+                dictionary of Fourier coefficients provided by
+                fourier_coefficients.compute_coeff;
         plotfile: name of the file that will contain the flux diagram;
-        logfile: name of the file containing the table as a .txt file.
+        logfile: name of the file containing the table as a .txt file;
+        block_size: number of timesteps processed at once (all of them if
+                    None);
+        write_maps: if True, the time mean (lat,wave) fields of the
+                    reservoirs and conversion terms are stored as NetCDF.
     """
+    if isinstance(filenc, str):
+        filenc = fourier_coefficients.read_coeff(filenc)
     ta_c, ua_c, va_c, wap_c, dims, lev, lat = init(logfile, filenc)
     nlev = int(dims[0])
     ntime = int(dims[1])
@@ -105,52 +135,60 @@ def lorenz(outpath, model, year, filenc, plotfile, logfile):
     for l_l in range(nlat):
         gam_ztmn[:, l_l] = stabil(ta_ztmn[:, l_l], lev, nlev)
     gam_tmn = stabil(ta_gmn, lev, nlev)
-    e_k = np.zeros([nlev, ntime, nlat, ntp - 1])
-    ape = np.zeros([nlev, ntime, nlat, ntp - 1])
-    a2k = np.zeros([nlev, ntime, nlat, ntp - 1])
-    ae2az = np.zeros([nlev, ntime, nlat, ntp - 1])
-    ke2kz = np.zeros([nlev, ntime, nlat, ntp - 1])
-    at2as = np.zeros([nlev, ntime, nlat, ntp - 1])
-    kt2ks = np.zeros([nlev, ntime, nlat, ntp - 1])
-    for t_t in range(ntime):
-        ta_tan = ta_c[:, t_t, :, :] - ta_tmn
-        ua_tan = ua_c[:, t_t, :, :] - ua_tmn
-        va_tan = va_c[:, t_t, :, :] - va_tmn
-        wap_tan = wap_c[:, t_t, :, :] - wap_tmn
+    if block_size is None:
+        block_size = ntime
+    sums = {}
+    for t_0 in range(0, ntime, block_size):
+        block = slice(t_0, t_0 + block_size)
+        ta_tan = np.moveaxis(ta_c[:, block], 1, 0) - ta_tmn
+        ua_tan = np.moveaxis(ua_c[:, block], 1, 0) - ua_tmn
+        va_tan = np.moveaxis(va_c[:, block], 1, 0) - va_tmn
+        wap_tan = np.moveaxis(wap_c[:, block], 1, 0) - wap_tmn
         # Compute zonal means
         _, ta_tgan = averages(ta_tan, g_w)
         _, wap_tgan = averages(wap_tan, g_w)
         # Compute kinetic energy
-        e_k[:, t_t, :, :] = makek(ua_tan, va_tan)
+        accumulate(sums, 'ek', makek(ua_tan, va_tan))
         # Compute available potential energy
-        ape[:, t_t, :, :] = makea(ta_tan, ta_tgan, gam_tmn)
+        accumulate(sums, 'ape', makea(ta_tan, ta_tgan, gam_tmn))
         # Compute conversion between kin.en. and pot.en.
-        a2k[:, t_t, :, :] = mka2k(wap_tan, ta_tan, wap_tgan, ta_tgan, lev)
+        accumulate(sums, 'a2k',
+                   mka2k(wap_tan, ta_tan, wap_tgan, ta_tgan, lev))
         # Compute conversion between zonal and eddy APE
-        ae2az[:, t_t, :, :] = mkaeaz(va_tan, wap_tan, ta_tan, ta_tmn, ta_gmn,
-                                     lev, y_l, gam_tmn, nlat, nlev)
+        accumulate(
+            sums, 'ae2az',
+            mkaeaz(va_tan, wap_tan, ta_tan, ta_tmn, ta_gmn, lev, y_l, gam_tmn,
+                   nlat, nlev))
         # Compute conversion between zonal and eddy KE
-        ke2kz[:, t_t, :, :] = mkkekz(ua_tan, va_tan, wap_tan, ua_tmn, va_tmn,
-                                     lev, y_l, nlat, ntp, nlev)
+        accumulate(
+            sums, 'ke2kz',
+            mkkekz(ua_tan, va_tan, wap_tan, ua_tmn, va_tmn, lev, y_l, nlat,
+                   ntp, nlev))
         # Compute conversion between stationary and transient eddy APE
-        at2as[:, t_t, :, :] = mkatas(ua_tan, va_tan, wap_tan, ta_tan, ta_ztmn,
-                                     gam_ztmn, lev, y_l, nlat, ntp, nlev)
+        accumulate(
+            sums, 'at2as',
+            mkatas(ua_tan, va_tan, wap_tan, ta_tan, ta_ztmn, gam_ztmn, lev,
+                   y_l, nlat, ntp, nlev))
         # Compute conversion between stationary and transient eddy KE
-        kt2ks[:, t_t, :, :] = mkktks(ua_tan, va_tan, ua_tmn, va_tmn, y_l, nlat,
-                                     ntp, nlev)
-    ek_tgmn = averages_comp(e_k, g_w, d_s, dims)
+        accumulate(
+            sums, 'kt2ks',
+            mkktks(ua_tan, va_tan, ua_tmn, va_tmn, y_l, nlat, ntp, nlev))
+    e_k, ape, a2k, ae2az, ke2kz, at2as, kt2ks = (
+        time_mean(sums, name)
+        for name in ('ek', 'ape', 'a2k', 'ae2az', 'ke2kz', 'at2as', 'kt2ks'))
+    ek_tgmn = globall_cg(e_k, g_w, d_s, dims)
     table(ek_tgmn, ntp, 'TOT. KIN. EN.    ', logfile, flag=0)
-    ape_tgmn = averages_comp(ape, g_w, d_s, dims)
+    ape_tgmn = globall_cg(ape, g_w, d_s, dims)
     table(ape_tgmn, ntp, 'TOT. POT. EN.     ', logfile, flag=0)
-    a2k_tgmn = averages_comp(a2k, g_w, d_s, dims)
+    a2k_tgmn = globall_cg(a2k, g_w, d_s, dims)
     table(a2k_tgmn, ntp, 'KE -> APE (trans) ', logfile, flag=1)
-    ae2az_tgmn = averages_comp(ae2az, g_w, d_s, dims)
+    ae2az_tgmn = globall_cg(ae2az, g_w, d_s, dims)
     table(ae2az_tgmn, ntp, 'AZ <-> AE (trans) ', logfile, flag=1)
-    ke2kz_tgmn = averages_comp(ke2kz, g_w, d_s, dims)
+    ke2kz_tgmn = globall_cg(ke2kz, g_w, d_s, dims)
     table(ke2kz_tgmn, ntp, 'KZ <-> KE (trans) ', logfile, flag=1)
-    at2as_tgmn = averages_comp(at2as, g_w, d_s, dims)
+    at2as_tgmn = globall_cg(at2as, g_w, d_s, dims)
     table(at2as_tgmn, ntp, 'ASE  <->  ATE   ', logfile, flag=1)
-    kt2ks_tgmn = averages_comp(kt2ks, g_w, d_s, dims)
+    kt2ks_tgmn = globall_cg(kt2ks, g_w, d_s, dims)
     table(kt2ks_tgmn, ntp, 'KSE  <->  KTE   ', logfile, flag=1)
     ek_st = makek(ua_tmn, va_tmn)
     ek_stgmn = globall_cg(ek_st, g_w, d_s, dims)
@@ -174,6 +212,8 @@ def lorenz(outpath, model, year, filenc, plotfile, logfile):
         a2k_tgmn, a2k_stgmn, at2as_tgmn, kt2ks_tgmn, ke2kz_tgmn, ke2kz_stgmn
     ]
     lec_strength = diagram(plotfile, list_diag, dims)
+    if not write_maps:
+        return lec_strength
     nc_f = outpath + '/ek_tmap_{}_{}.nc'.format(model, year)
     output(e_k, d_s, filenc, 'ek', nc_f)
     nc_f = outpath + '/ape_tmap_{}_{}.nc'.format(model, year)
@@ -187,32 +227,36 @@ def lorenz(outpath, model, year, filenc, plotfile, logfile):
     return lec_strength
 
 
-def averages(x_c, g_w):
-    """Compute time, zonal and global mean averages of initial fields.
+def accumulate(sums, name, fld):
+    """Add a block of timesteps of a LEC component to its running sums.
 
     Arguments:
     ----------
-    x_c: the input field as (lev, lat, wave);
-    g_w: the Gaussian weights for meridional averaging;
+    sums: a dictionary with the running sums and number of valid timesteps
+          of each component;
+    name: the name of the component;
+    fld: the component of the LEC (time, lev, lat, wave);
     """
-    xc_ztmn = np.squeeze(np.real(x_c[:, :, 0]))
-    xc_gmn = np.nansum(xc_ztmn * g_w[np.newaxis, :], axis=1) / np.nansum(g_w)
-    return xc_ztmn, xc_gmn
+    valid = ~np.isnan(fld)
+    total = np.where(valid, fld, 0.).sum(axis=0)
+    count = valid.sum(axis=0)
+    if name in sums:
+        total += sums[name][0]
+        count += sums[name][1]
+    sums[name] = (total, count)
 
 
-def averages_comp(fld, g_w, d_s, dims):
-    """Compute the global mean averages of reservoirs and conversion terms.
+def averages(x_c, g_w):
+    """Compute time, zonal and global mean averages of initial fields.
 
     Arguments:
     ----------
-    fld: the component of the LEC (time, lev, lat, wave);
+    x_c: the input field as (lev, lat, wave), or (time, lev, lat, wave);
     g_w: the Gaussian weights for meridional averaging;
-    d_s: the Delta sigma of the sigma levels;
-    dims: a list containing the dimensions length0;
     """
-    fld_tmn = np.nanmean(fld, axis=1)
-    fld_tgmn = globall_cg(fld_tmn, g_w, d_s, dims)
-    return fld_tgmn
+    xc_ztmn = np.real(x_c[..., 0])
+    xc_gmn = np.nansum(xc_ztmn * g_w, axis=-1) / np.nansum(g_w)
+    return xc_ztmn, xc_gmn
 
 
 def bsslzr(kdim):
@@ -245,6 +289,26 @@ def bsslzr(kdim):
     return pbes
 
 
+def dfdlat(fld, lat, axis):
+    """Compute the meridional derivative of a field.
+
+    Centred differences are used, except at the first and last latitude.
+
+    Arguments:
+    ----------
+    fld: the field to be differentiated;
+    lat: the latitudes in radians;
+    axis: the latitudinal axis of the field;
+    """
+    nlat = len(lat)
+    i_p = np.append(np.arange(1, nlat), nlat - 1)
+    i_m = np.append(0, np.arange(nlat - 1))
+    shape = [1] * np.ndim(fld)
+    shape[axis] = nlat
+    return ((np.take(fld, i_p, axis=axis) - np.take(fld, i_m, axis=axis)) /
+            np.reshape(lat[i_p] - lat[i_m], shape))
+
+
 def diagram(filen, listf, dims):
     """Diagram interface script.
 
@@ -404,7 +468,7 @@ def globall_cg(d3v, g_w, d_s, dims):
     return gmn
 
 
-def init(logfile, filep):
+def init(logfile, coeffs):
     """Ingest input fields as complex fields and initialise tables.
 
     Receive fields t,u,v,w as input fields in Fourier
@@ -413,8 +477,8 @@ def init(logfile, filep):
 
     Arguments:
     ----------
-    filenc: name of the file containing the input fields;
-    logfile: name of the file containing the table as a .txt file.
+    logfile: name of the file containing the table as a .txt file;
+    coeffs: the dictionary containing the input fields and coordinates.
     """
     with open(logfile, 'w') as log:
         log.write('########################################################\n')
@@ -423,14 +487,13 @@ def init(logfile, filep):
         log.write('#                                                      #\n')
         log.write('########################################################\n')
         log.close()
-    with Dataset(filep) as dataset0:
-        t_a = dataset0.variables['ta'][:, :, :, :]
-        u_a = dataset0.variables['ua'][:, :, :, :]
-        v_a = dataset0.variables['va'][:, :, :, :]
-        wap = dataset0.variables['wap'][:, :, :, :]
-        lev = dataset0.variables['plev'][:]
-        time = dataset0.variables['time'][:]
-        lat = dataset0.variables['lat'][:]
+    t_a = coeffs['ta']
+    u_a = coeffs['ua']
+    v_a = coeffs['va']
+    wap = coeffs['wap']
+    lev = coeffs['plev']
+    time = coeffs['time']
+    lat = coeffs['lat']
     nfc = np.shape(t_a)[3]
     nlev = len(lev)
     ntime = len(time)
@@ -486,14 +549,14 @@ def makek(u_t, v_t):
 
     Arguments:
     ----------
-    u_t: a 3D zonal velocity field;
-    v_t: a 3D meridional velocity field;
+    u_t: a 3D zonal velocity field, or a 4D one with time as first axis;
+    v_t: a 3D meridional velocity field, or a 4D one with time as first axis;
     """
     ck1 = u_t * np.conj(u_t)
     ck2 = v_t * np.conj(v_t)
     e_k = np.real(ck1 + ck2)
-    e_k[:, :, 0] = 0.5 * np.real(u_t[:, :, 0] * u_t[:, :, 0] +
-                                 v_t[:, :, 0] * v_t[:, :, 0])
+    e_k[..., 0] = 0.5 * np.real(u_t[..., 0] * u_t[..., 0] +
+                                v_t[..., 0] * v_t[..., 0])
     return e_k
 
 
@@ -502,14 +565,14 @@ def makea(t_t, t_g, gam):
 
     Arguments:
     ----------
-    t_t_ a 3D temperature field;
-    t_g: a temperature vertical profile;
+    t_t_ a 3D temperature field, or a 4D one with time as first axis;
+    t_g: a temperature vertical profile (time, lev) or (lev);
     gam: a vertical profile of the stability parameter;
     """
     ape = gam[:, np.newaxis, np.newaxis] * np.real(t_t * np.conj(t_t))
-    ape[:, :, 0] = (gam[:, np.newaxis] * 0.5 * np.real(
-        (t_t[:, :, 0] - t_g[:, np.newaxis]) *
-        (t_t[:, :, 0] - t_g[:, np.newaxis])))
+    ape[..., 0] = (gam[:, np.newaxis] * 0.5 * np.real(
+        (t_t[..., 0] - t_g[..., np.newaxis]) *
+        (t_t[..., 0] - t_g[..., np.newaxis])))
     return ape
 
 
@@ -518,17 +581,17 @@ def mka2k(wap, t_t, w_g, t_g, p_l):
 
     Arguments:
     ----------
-    wap: a 3D vertical velocity field;
-    t_t: a 3D temperature field;
-    w_g: a vertical velocity vertical profile;
-    t_g: a temperature vertical profile;
+    wap: a 3D vertical velocity field, or a 4D one with time as first axis;
+    t_t: a 3D temperature field, or a 4D one with time as first axis;
+    w_g: a vertical velocity vertical profile (time, lev) or (lev);
+    t_g: a temperature vertical profile (time, lev) or (lev);
     p_l: the pressure levels;
     """
     a2k = -np.real(R / p_l[:, np.newaxis, np.newaxis] *
                    (t_t * np.conj(wap) + np.conj(t_t) * wap))
-    a2k[:, :, 0] = -np.real(R / p_l[:, np.newaxis] *
-                            (t_t[:, :, 0] - t_g[:, np.newaxis]) *
-                            (wap[:, :, 0] - w_g[:, np.newaxis]))
+    a2k[..., 0] = -np.real(R / p_l[:, np.newaxis] *
+                           (t_t[..., 0] - t_g[..., np.newaxis]) *
+                           (wap[..., 0] - w_g[..., np.newaxis]))
     return a2k
 
 
@@ -537,9 +600,9 @@ def mkaeaz(v_t, wap, t_t, ttt, ttg, p_l, lat, gam, nlat, nlev):
 
     Arguments:
     ----------
-    v_t: a 3D meridional velocity field;
-    wap: a 3D vertical velocity field;
-    t_t: a 3D temperature field;
+    v_t: a 3D meridional velocity field, or a 4D one with time as first axis;
+    wap: a 3D vertical velocity field, or a 4D one with time as first axis;
+    t_t: a 3D temperature field, or a 4D one with time as first axis;
     ttt: a climatological mean 3D temperature field;
     p_l: the pressure levels;
     lat: the latudinal dimension;
@@ -547,49 +610,17 @@ def mkaeaz(v_t, wap, t_t, ttt, ttg, p_l, lat, gam, nlat, nlev):
     nlat: the number of latitudes;
     nlev: the number of levels;
     """
-    dtdp = np.zeros([nlev, nlat])
-    dtdy = np.zeros([nlev, nlat])
     ttt = np.real(ttt)
-    for l_l in np.arange(nlev):
-        if l_l == 0:
-            t_1 = ttt[l_l, :, 0] - ttg[l_l]
-            t_2 = ttt[l_l + 1, :, 0] - ttg[l_l + 1]
-            dtdp[l_l, :] = (t_2 - t_1) / (p_l[l_l + 1] - p_l[l_l])
-        elif l_l == nlev - 1:
-            t_1 = ttt[l_l - 1, :, 0] - ttg[l_l - 1]
-            t_2 = ttt[l_l, :, 0] - ttg[l_l]
-            dtdp[l_l, :] = (t_2 - t_1) / (p_l[l_l] - p_l[l_l - 1])
-        else:
-            t_1 = ttt[l_l, :, 0] - ttg[l_l]
-            t_2 = ttt[l_l + 1, :, 0] - ttg[l_l + 1]
-            dtdp1 = (t_2 - t_1) / (p_l[l_l + 1] - p_l[l_l])
-            t_2 = t_1
-            t_1 = ttt[l_l - 1, :, 0] - ttg[l_l - 1]
-            dtdp2 = (t_2 - t_1) / (p_l[l_l] - p_l[l_l - 1])
-            dtdp[l_l, :] = ((dtdp1 * (p_l[l_l] - p_l[l_l - 1]) + dtdp2 *
-                             (p_l[l_l + 1] - p_l[l_l])) /
-                            (p_l[l_l + 1] - p_l[l_l - 1]))
-        dtdp[l_l, :] = dtdp[l_l, :] - (R / (CP * p_l[l_l]) *
-                                       (ttt[l_l, :, 0] - ttg[l_l]))
-    for i_l in np.arange(nlat):
-        if i_l == 0:
-            t_1 = ttt[:, i_l, 0]
-            t_2 = ttt[:, i_l + 1, 0]
-            dtdy[:, i_l] = (t_2 - t_1) / (lat[i_l + 1] - lat[i_l])
-        elif i_l == nlat - 1:
-            t_1 = ttt[:, i_l - 1, 0]
-            t_2 = ttt[:, i_l, 0]
-            dtdy[:, i_l] = (t_2 - t_1) / (lat[i_l] - lat[i_l - 1])
-        else:
-            t_1 = ttt[:, i_l - 1, 0]
-            t_2 = ttt[:, i_l + 1, 0]
-            dtdy[:, i_l] = (t_2 - t_1) / (lat[i_l + 1] - lat[i_l - 1])
+    t_a = ttt[:, :, 0] - ttg[:, np.newaxis]
+    dtdp = (np.gradient(t_a, p_l, axis=0) -
+            R / (CP * p_l[:, np.newaxis]) * t_a)
+    dtdy = dfdlat(ttt[:, :, 0], lat, 1)
     dtdy = dtdy / AA
     c_1 = np.real(v_t * np.conj(t_t) + t_t * np.conj(v_t))
     c_2 = np.real(wap * np.conj(t_t) + t_t * np.conj(wap))
     ae2az = (gam[:, np.newaxis, np.newaxis] *
              (dtdy[:, :, np.newaxis] * c_1 + dtdp[:, :, np.newaxis] * c_2))
-    ae2az[:, :, 0] = 0.
+    ae2az[..., 0] = 0.
     return ae2az
 
 
@@ -598,9 +629,9 @@ def mkkekz(u_t, v_t, wap, utt, vtt, p_l, lat, nlat, ntp, nlev):
 
     Arguments:
     ----------
-    u_t: a 3D zonal velocity field;
-    v_t: a 3D meridional velocity field;
-    wap: a 3D vertical velocity field;
+    u_t: a 3D zonal velocity field, or a 4D one with time as first axis;
+    v_t: a 3D meridional velocity field, or a 4D one with time as first axis;
+    wap: a 3D vertical velocity field, or a 4D one with time as first axis;
     utt: a climatological mean 3D zonal velocity field;
     vtt: a climatological mean 3D meridional velocity field;
     p_l: the pressure levels;
@@ -609,81 +640,25 @@ def mkkekz(u_t, v_t, wap, utt, vtt, p_l, lat, nlat, ntp, nlev):
     ntp: the number of wavenumbers;
     nlev: the number of vertical levels;
     """
-    dudp = np.zeros([nlev, nlat])
-    dvdp = np.zeros([nlev, nlat])
-    dudy = np.zeros([nlev, nlat])
-    dvdy = np.zeros([nlev, nlat])
-    for l_l in np.arange(nlev):
-        if l_l == 0:
-            dudp[l_l, :] = ((np.real(utt[l_l + 1, :, 0] - utt[l_l, :, 0])) /
-                            (p_l[l_l + 1] - p_l[l_l]))
-            dvdp[l_l, :] = ((np.real(vtt[l_l + 1, :, 0] - vtt[l_l, :, 0])) /
-                            (p_l[l_l + 1] - p_l[l_l]))
-        elif l_l == nlev - 1:
-            dudp[l_l, :] = ((np.real(utt[l_l, :, 0] - utt[l_l - 1, :, 0])) /
-                            (p_l[l_l] - p_l[l_l - 1]))
-            dvdp[l_l, :] = ((np.real(vtt[l_l, :, 0] - vtt[l_l - 1, :, 0])) /
-                            (p_l[l_l] - p_l[l_l - 1]))
-        else:
-            dudp1 = ((np.real(utt[l_l + 1, :, 0] - utt[l_l, :, 0])) /
-                     (p_l[l_l + 1] - p_l[l_l]))
-            dvdp1 = ((np.real(vtt[l_l + 1, :, 0] - vtt[l_l, :, 0])) /
-                     (p_l[l_l + 1] - p_l[l_l]))
-            dudp2 = ((np.real(utt[l_l, :, 0] - utt[l_l - 1, :, 0])) /
-                     (p_l[l_l] - p_l[l_l - 1]))
-            dvdp2 = ((np.real(vtt[l_l, :, 0] - vtt[l_l - 1, :, 0])) /
-                     (p_l[l_l] - p_l[l_l - 1]))
-            dudp[l_l, :] = ((dudp1 * (p_l[l_l] - p_l[l_l - 1]) + dudp2 *
-                             (p_l[l_l + 1] - p_l[l_l])) /
-                            (p_l[l_l + 1] - p_l[l_l - 1]))
-            dvdp[l_l, :] = ((dvdp1 * (p_l[l_l] - p_l[l_l - 1]) + dvdp2 *
-                             (p_l[l_l + 1] - p_l[l_l])) /
-                            (p_l[l_l + 1] - p_l[l_l - 1]))
-    for i_l in np.arange(nlat):
-        if i_l == 0:
-            dudy[:, i_l] = ((np.real(utt[:, i_l + 1, 0] - utt[:, i_l, 0])) /
-                            (lat[i_l + 1] - lat[i_l]))
-            dvdy[:, i_l] = ((np.real(vtt[:, i_l + 1, 0] - vtt[:, i_l, 0])) /
-                            (lat[i_l + 1] - lat[i_l]))
-        elif i_l == nlat - 1:
-            dudy[:, i_l] = ((np.real(utt[:, i_l, 0] - utt[:, i_l - 1, 0])) /
-                            (lat[i_l] - lat[i_l - 1]))
-            dvdy[:, i_l] = ((np.real(vtt[:, i_l, 0] - vtt[:, i_l - 1, 0])) /
-                            (lat[i_l] - lat[i_l - 1]))
-        else:
-            dudy[:,
-                 i_l] = ((np.real(utt[:, i_l + 1, 0] - utt[:, i_l - 1, 0])) /
-                         (lat[i_l + 1] - lat[i_l - 1]))
-            dvdy[:,
-                 i_l] = ((np.real(vtt[:, i_l + 1, 0] - vtt[:, i_l - 1, 0])) /
-                         (lat[i_l + 1] - lat[i_l - 1]))
-    dudy = dudy / AA
-    dvdy = dvdy / AA
-    c_1 = np.zeros([nlev, nlat, ntp - 1])
-    c_2 = np.zeros([nlev, nlat, ntp - 1])
-    c_3 = np.zeros([nlev, nlat, ntp - 1])
-    c_4 = np.zeros([nlev, nlat, ntp - 1])
-    c_5 = np.zeros([nlev, nlat, ntp - 1])
-    c_6 = np.zeros([nlev, nlat, ntp - 1])
+    utt = np.real(utt[:, :, 0])
+    vtt = np.real(vtt[:, :, 0])
+    dudp = np.gradient(utt, p_l, axis=0)
+    dvdp = np.gradient(vtt, p_l, axis=0)
+    dudy = dfdlat(utt, lat, 1) / AA
+    dvdy = dfdlat(vtt, lat, 1) / AA
     u_u = np.real(u_t * np.conj(u_t) + u_t * np.conj(u_t))
     u_v = np.real(u_t * np.conj(v_t) + v_t * np.conj(u_t))
     v_v = np.real(v_t * np.conj(v_t) + v_t * np.conj(v_t))
     u_w = np.real(u_t * np.conj(wap) + wap * np.conj(u_t))
     v_w = np.real(v_t * np.conj(wap) + wap * np.conj(v_t))
-    for i_l in np.arange(nlat):
-        c_1[:, i_l, :] = dudy[:, i_l][:, np.newaxis] * u_v[:, i_l, :]
-        c_2[:, i_l, :] = dvdy[:, i_l][:, np.newaxis] * v_v[:, i_l, :]
-        c_5[:, i_l, :] = (np.tan(lat[i_l]) / AA *
-                          np.real(utt[:, i_l, 0])[:, np.newaxis] *
-                          (u_v[:, i_l, :]))
-        c_6[:, i_l, :] = -(np.tan(lat[i_l]) / AA *
-                           np.real(vtt[:, i_l, 0])[:, np.newaxis] *
-                           (u_u[:, i_l, :]))
-    for l_l in np.arange(nlev):
-        c_3[l_l, :, :] = dudp[l_l, :][:, np.newaxis] * u_w[l_l, :, :]
-        c_4[l_l, :, :] = dvdp[l_l, :][:, np.newaxis] * v_w[l_l, :, :]
+    c_1 = dudy[:, :, np.newaxis] * u_v
+    c_2 = dvdy[:, :, np.newaxis] * v_v
+    c_3 = dudp[:, :, np.newaxis] * u_w
+    c_4 = dvdp[:, :, np.newaxis] * v_w
+    c_5 = (np.tan(lat) / AA * utt)[:, :, np.newaxis] * u_v
+    c_6 = -(np.tan(lat) / AA * vtt)[:, :, np.newaxis] * u_u
     ke2kz = (c_1 + c_2 + c_3 + c_4 + c_5 + c_6)
-    ke2kz[:, :, 0] = 0.
+    ke2kz[..., 0] = 0.
     return ke2kz
 
 
@@ -692,10 +667,10 @@ def mkatas(u_t, v_t, wap, t_t, ttt, g_w, p_l, lat, nlat, ntp, nlev):
 
     Arguments:
     ----------
-    u_t: a 3D zonal velocity field;
-    v_t: a 3D meridional velocity field;
-    wap: a 3D vertical velocity field;
-    t_t: a 3D temperature field;
+    u_t: a 3D zonal velocity field, or a 4D one with time as first axis;
+    v_t: a 3D meridional velocity field, or a 4D one with time as first axis;
+    wap: a 3D vertical velocity field, or a 4D one with time as first axis;
+    t_t: a 3D temperature field, or a 4D one with time as first axis;
     ttt: a climatological mean 3D temperature field;
     g_w: the gaussian weights;
     p_l: the pressure levels;
@@ -704,64 +679,24 @@ def mkatas(u_t, v_t, wap, t_t, ttt, g_w, p_l, lat, nlat, ntp, nlev):
     ntp: the number of wavenumbers;
     nlev: the number of vertical levels;
     """
-    t_r = np.fft.ifft(t_t, axis=2)
-    u_r = np.fft.ifft(u_t, axis=2)
-    v_r = np.fft.ifft(v_t, axis=2)
-    w_r = np.fft.ifft(wap, axis=2)
+    t_r = np.fft.ifft(t_t, axis=-1)
+    u_r = np.fft.ifft(u_t, axis=-1)
+    v_r = np.fft.ifft(v_t, axis=-1)
+    w_r = np.fft.ifft(wap, axis=-1)
     tur = t_r * u_r
     tvr = t_r * v_r
     twr = t_r * w_r
-    t_u = np.fft.fft(tur, axis=2)
-    t_v = np.fft.fft(tvr, axis=2)
-    t_w = np.fft.fft(twr, axis=2)
+    t_u = np.fft.fft(tur, axis=-1)
+    t_v = np.fft.fft(tvr, axis=-1)
+    t_w = np.fft.fft(twr, axis=-1)
     c_1 = (t_u * np.conj(ttt[:, :, np.newaxis]) -
            ttt[:, :, np.newaxis] * np.conj(t_u))
     c_6 = (t_w * np.conj(ttt[:, :, np.newaxis]) -
            ttt[:, :, np.newaxis] * np.conj(t_w))
-    c_2 = np.zeros([nlev, nlat, ntp - 1])
-    c_3 = np.zeros([nlev, nlat, ntp - 1])
-    c_5 = np.zeros([nlev, nlat, ntp - 1])
-    for i_l in range(nlat):
-        if i_l == 0:
-            c_2[:, i_l, :] = np.real(
-                t_v[:, i_l, :] / (AA * (lat[i_l + 1] - lat[i_l])) *
-                np.conj(ttt[:, i_l + 1, np.newaxis] - ttt[:, i_l, np.newaxis]))
-            c_3[:, i_l, :] = np.real(
-                np.conj(t_v[:, i_l, :]) / (AA * (lat[i_l + 1] - lat[i_l])) *
-                (ttt[:, i_l + 1, np.newaxis] - ttt[:, i_l, np.newaxis]))
-        elif i_l == nlat - 1:
-            c_2[:, i_l, :] = np.real(
-                t_v[:, i_l, :] / (AA * (lat[i_l] - lat[i_l - 1])) *
-                np.conj(ttt[:, i_l, np.newaxis] - ttt[:, i_l - 1, np.newaxis]))
-            c_3[:, i_l, :] = np.real(
-                np.conj(t_v[:, i_l, :]) / (AA * (lat[i_l] - lat[i_l - 1])) *
-                (ttt[:, i_l, np.newaxis] - ttt[:, i_l - 1, np.newaxis]))
-        else:
-            c_2[:, i_l, :] = np.real(t_v[:, i_l, :] /
-                                     (AA * (lat[i_l + 1] - lat[i_l - 1])) *
-                                     np.conj(ttt[:, i_l + 1, np.newaxis] -
-                                             ttt[:, i_l - 1, np.newaxis]))
-            c_3[:, i_l, :] = np.real(
-                np.conj(t_v[:, i_l, :]) / (AA *
-                                           (lat[i_l + 1] - lat[i_l - 1])) *
-                (ttt[:, i_l + 1, np.newaxis] - ttt[:, i_l - 1, np.newaxis]))
-    for l_l in range(nlev):
-        if l_l == 0:
-            c_5[l_l, :, :] = (
-                (ttt[l_l + 1, :, np.newaxis] - ttt[l_l, :, np.newaxis]) /
-                (p_l[l_l + 1] - p_l[l_l]))
-        elif l_l == nlev - 1:
-            c_5[l_l, :, :] = (
-                (ttt[l_l, :, np.newaxis] - ttt[l_l - 1, :, np.newaxis]) /
-                (p_l[l_l] - p_l[l_l - 1]))
-        else:
-            c51 = ((ttt[l_l + 1, :, np.newaxis] - ttt[l_l, :, np.newaxis]) /
-                   (p_l[l_l + 1] - p_l[l_l]))
-            c52 = ((ttt[l_l, :, np.newaxis] - ttt[l_l - 1, :, np.newaxis]) /
-                   (p_l[l_l] - p_l[l_l - 1]))
-            c_5[l_l, :, :] = ((c51 * (p_l[l_l] - p_l[l_l - 1]) + c52 *
-                               (p_l[l_l + 1] - p_l[l_l])) /
-                              (p_l[l_l + 1] - p_l[l_l - 1]))
+    dtdy = dfdlat(ttt, lat, 1)[:, :, np.newaxis] / AA
+    c_2 = np.real(t_v * np.conj(dtdy))
+    c_3 = np.real(np.conj(t_v) * dtdy)
+    c_5 = np.gradient(ttt, p_l, axis=0)[:, :, np.newaxis]
     k_k = np.arange(0, ntp - 1)
     at2as = (((k_k - 1)[np.newaxis, np.newaxis, :] * np.imag(c_1) /
               (AA * np.cos(lat[np.newaxis, :, np.newaxis])) +
@@ -769,7 +704,7 @@ def mkatas(u_t, v_t, wap, t_t, ttt, g_w, p_l, lat, nlat, ntp, nlev):
               np.real(c_2 + c_3) + R /
               (CP * p_l[:, np.newaxis, np.newaxis]) * np.real(c_6)) *
              g_w[:, :, np.newaxis])
-    at2as[:, :, 0] = 0.
+    at2as[..., 0] = 0.
     return at2as
 
 
@@ -778,8 +713,8 @@ def mkktks(u_t, v_t, utt, vtt, lat, nlat, ntp, nlev):
 
     Arguments:
     ----------
-    u_t: a 3D zonal velocity field;
-    v_t: a 3D meridional velocity field;
+    u_t: a 3D zonal velocity field, or a 4D one with time as first axis;
+    v_t: a 3D meridional velocity field, or a 4D one with time as first axis;
     utt: a climatological mean 3D zonal velocity field;
     vtt: a climatological mean 3D meridional velocity field;
     lat: the latitude dimension;
@@ -787,46 +722,30 @@ def mkktks(u_t, v_t, utt, vtt, lat, nlat, ntp, nlev):
     ntp: the number of wavenumbers;
     nlev: the number of vertical levels;
     """
-    dut = np.zeros([nlev, nlat, ntp - 1])
-    dvt = np.zeros([nlev, nlat, ntp - 1])
-    dlat = np.zeros([nlat])
-    utt = np.real(utt)
-    vtt = np.real(vtt)
-    u_r = np.fft.irfft(u_t, axis=2)
-    v_r = np.fft.irfft(v_t, axis=2)
+    dutdy = dfdlat(np.real(utt), lat, 1)
+    dvtdy = dfdlat(np.real(vtt), lat, 1)
+    u_r = np.fft.irfft(u_t, axis=-1)
+    v_r = np.fft.irfft(v_t, axis=-1)
     uur = u_r * u_r
     uvr = u_r * v_r
     vvr = v_r * v_r
-    u_u = np.fft.rfft(uur, axis=2)
-    v_v = np.fft.rfft(vvr, axis=2)
-    u_v = np.fft.rfft(uvr, axis=2)
+    u_u = np.fft.rfft(uur, axis=-1)
+    v_v = np.fft.rfft(vvr, axis=-1)
+    u_v = np.fft.rfft(uvr, axis=-1)
     c_1 = u_u * np.conj(u_t) - u_t * np.conj(u_u)
     # c_3 = u_v * np.conj(u_t) + u_t * np.conj(u_v)
     c_5 = u_u * np.conj(v_t) + v_t * np.conj(u_u)
     c_6 = u_v * np.conj(v_t) - v_t * np.conj(u_v)
-    for i_l in range(nlat):
-        if i_l == 0:
-            dut[:, i_l, :] = (utt[:, i_l + 1, :] - utt[:, i_l, :])
-            dvt[:, i_l, :] = (vtt[:, i_l + 1, :] - vtt[:, i_l, :])
-            dlat[i_l] = (lat[i_l + 1] - lat[i_l])
-        elif i_l == nlat - 1:
-            dut[:, i_l, :] = (utt[:, i_l, :] - utt[:, i_l - 1, :])
-            dvt[:, i_l, :] = (vtt[:, i_l, :] - vtt[:, i_l - 1, :])
-            dlat[i_l] = (lat[i_l] - lat[i_l - 1])
-        else:
-            dut[:, i_l, :] = (utt[:, i_l + 1, :] - utt[:, i_l - 1, :])
-            dvt[:, i_l, :] = (vtt[:, i_l + 1, :] - vtt[:, i_l - 1, :])
-            dlat[i_l] = (lat[i_l + 1] - lat[i_l - 1])
-    c21 = np.conj(u_u) * dut / dlat[np.newaxis, :, np.newaxis]
-    c22 = u_u * np.conj(dut) / dlat[np.newaxis, :, np.newaxis]
-    c41 = np.conj(v_v) * dvt / dlat[np.newaxis, :, np.newaxis]
-    c42 = v_v * np.conj(dvt) / dlat[np.newaxis, :, np.newaxis]
+    c21 = np.conj(u_u) * dutdy
+    c22 = u_u * np.conj(dutdy)
+    c41 = np.conj(v_v) * dvtdy
+    c42 = v_v * np.conj(dvtdy)
     k_k = np.arange(0, ntp - 1)
     kt2ks = (np.real(c21 + c22 + c41 + c42) / AA +
              np.tan(lat)[np.newaxis, :, np.newaxis] * np.real(c_1 - c_5) / AA +
              np.imag(c_1 + c_6) * (k_k - 1)[np.newaxis, np.newaxis, :] /
              (AA * np.cos(lat)[np.newaxis, :, np.newaxis]))
-    kt2ks[:, :, 0] = 0
+    kt2ks[..., 0] = 0
     return kt2ks
 
 
@@ -837,12 +756,11 @@ def output(fld, d_s, filenc, name, nc_f):
     ----------
     fld: the annual mean fields (lev, lat, wave);
     d_s: Delta sigma;
-    filenc: the input file containing the Fourier coefficients of t,u,v,w;
+    filenc: the dictionary containing the Fourier coefficients of t,u,v,w;
     name: the variable name;
     nc_f: the name of the output file (with path)
     """
-    fld_tmn = np.nanmean(fld, axis=1)
-    fld_aux = fld_tmn * d_s[:, np.newaxis, np.newaxis]
+    fld_aux = fld * d_s[:, np.newaxis, np.newaxis]
     fld_vmn = np.nansum(fld_aux, axis=0) / np.nansum(d_s)
     removeif(nc_f)
     pr_output(fld_vmn, name, filenc, nc_f)
@@ -859,34 +777,30 @@ def pr_output(varo, varname, filep, nc_f):
     ----------
     varo: the field to be stored;
     varname: the name of the variables to be saved;
-    filep: the existing dataset, containing the metadata;
+    filep: the dictionary of Fourier coefficients, containing the metadata;
     nc_f: the name of the output file;
 
     @author: Chris Slocum (2014), modified by Valerio Lembo (2018).
     """
-    fourc = fourier_coefficients
     with Dataset(nc_f, 'w', format='NETCDF4') as w_nc_fid:
         w_nc_fid.description = "Outputs of LEC program"
-        with Dataset(filep, 'r') as nc_fid:
-            # Extract data from NetCDF file
-            wave = nc_fid.variables['wave'][:]
-            ntp = int(len(wave) / 2)
-            # Writing NetCDF files
-            fourc.extr_lat(nc_fid, w_nc_fid, 'lat')
-            w_nc_fid.createDimension('wave', ntp)
-            w_nc_dim = w_nc_fid.createVariable('wave',
-                                               nc_fid.variables['wave'].dtype,
-                                               ('wave', ))
-            for ncattr in nc_fid.variables['wave'].ncattrs():
-                w_nc_dim.setncattr(ncattr,
-                                   nc_fid.variables['wave'].getncattr(ncattr))
+        lat = filep['lat']
+        w_nc_fid.createDimension('lat', len(lat))
+        w_nc_dim = w_nc_fid.createVariable('lat', lat.dtype, ('lat', ))
+        w_nc_dim.setncatts(filep['lat_attrs'])
+        w_nc_fid.variables['lat'][:] = lat
+        wave = filep['wave']
+        ntp = int(len(wave) / 2)
+        w_nc_fid.createDimension('wave', ntp)
+        w_nc_dim = w_nc_fid.createVariable('wave', wave.dtype, ('wave', ))
+        w_nc_dim.setncatts(filep['wave_attrs'])
         w_nc_fid.variables['wave'][:] = wave[0:ntp]
         w_nc_var = w_nc_fid.createVariable(varname, 'f8', ('lat', 'wave'))
         varatts(w_nc_var, varname, 1, 0)
         w_nc_fid.variables[varname][:] = varo
 
 
-def preproc_lec(model, wdir, pdir, input_data):
+def preproc_lec(model, wdir, pdir, input_data, n_jobs=1, write_maps=True):
     """Preprocess fields for LEC computations and send it to lorenz program.
 
     This function computes the interpolation of ta, ua, va, wap daily fields to
@@ -895,6 +809,9 @@ def preproc_lec(model, wdir, pdir, input_data):
     global and hemispheric time series of each conversion and reservoir term
     of the LEC is provided.
 
+    Years are processed independently (see lec_year), with up to n_jobs of
+    them running at the same time in separate processes.
+
     Arguments:
     ----------
     model: the model name;
@@ -903,9 +820,11 @@ def preproc_lec(model, wdir, pdir, input_data):
       to store tables of conversion/reservoir terms and the flux diagram for
       year;
     filelist: a list of file names containing the input fields;
+    n_jobs: the maximum number of years processed in parallel;
+    write_maps: if True, the annual mean (lat,wave) fields of the reservoirs
+      and conversion terms are stored as NetCDF.
     """
     cdo = Cdo()
-    fourc = fourier_coefficients
     ta_file = e.select_metadata(input_data, short_name='ta',
                                 dataset=model)[0]['filename']
     tas_file = e.select_metadata(input_data, short_name='tas',
@@ -954,42 +873,61 @@ def preproc_lec(model, wdir, pdir, input_data):
                                                        va_file_mask, wap_file),
                    options='-b F32',
                    output=energy3_file)
-    yrs = cdo.showyear(input=energy3_file)
-    yrs = str(yrs)
-    yrs2 = yrs.split()
-    y_i = 0
-    lect = np.zeros(len(yrs2))
-    for y_r in yrs2:
-        y_rl = [y_n for y_n in y_r]
-        y_ro = ''
-        for e_l in y_rl:
-            e_l = str(e_l)
-            if e_l.isdigit() is True:
-                y_ro += e_l
-        # print(filter(str.isdigit, str(y_r)))
-        enfile_yr = wdir + '/inputen.nc'
-        tasfile_yr = wdir + '/tas_yr.nc'
-        tadiag_file = wdir + '/ta_filled.nc'
-        ncfile = wdir + '/fourier_coeff.nc'
-        cdo.selyear(y_ro,
-                    input=energy3_file,
-                    options='-b F32',
-                    output=enfile_yr)
-        cdo.selyear(y_ro, input=tas_file, options='-b F32', output=tasfile_yr)
-        fourc.fourier_coeff(tadiag_file, ncfile, enfile_yr, tasfile_yr)
-        diagfile = (ldir + '/{}_{}_lec_diagram.png'.format(model, y_ro))
-        logfile = (ldir + '/{}_{}_lec_table.txt'.format(model, y_ro))
-        lect[y_i] = lorenz(wdir, model, y_ro, ncfile, diagfile, logfile)
-        y_i = y_i + 1
-        os.remove(enfile_yr)
-        os.remove(tasfile_yr)
-        os.remove(tadiag_file)
-        os.remove(ncfile)
+    yrs = str(cdo.showyear(input=energy3_file)).split()
+    years = [''.join(filter(str.isdigit, y_r)) for y_r in yrs]
+    args = [(model, y_r, wdir, ldir, energy3_file, tas_file, write_maps)
+            for y_r in years]
+    if n_jobs > 1 and len(years) > 1:
+        with ProcessPoolExecutor(max_workers=min(n_jobs, len(years))) as exe:
+            lect = list(exe.map(lec_year, *zip(*args)))
+    else:
+        lect = [lec_year(*arg) for arg in args]
     os.remove(maskorog)
     os.remove(ua_file_mask)
     os.remove(va_file_mask)
     os.remove(energy3_file)
-    return lect
+    return np.array(lect)
+
+
+def lec_year(model, year, wdir, ldir, energy_file, tas_file, write_maps=True):
+    """Compute the LEC for a single year.
+
+    The year is extracted from the input fields to a scratch directory that is
+    unique to this year, so that several years can be processed at the same
+    time. The Fourier coefficients are passed to the lorenz program in memory.
+
+    Arguments:
+    ----------
+    model: the model name;
+    year: the year that is considered;
+    wdir: the working directory where the outputs are stored;
+    ldir: the directory where the tables and flux diagrams are stored;
+    energy_file: the file containing the gap-filled t,u,v,w fields;
+    tas_file: the file containing the near-surface temperature;
+    write_maps: if True, the annual mean (lat,wave) fields of the reservoirs
+      and conversion terms are stored as NetCDF.
+    """
+    cdo = Cdo()
+    scratch = tempfile.mkdtemp(prefix='lec_{}_'.format(year), dir=wdir)
+    try:
+        enfile_yr = os.path.join(scratch, 'inputen.nc')
+        tasfile_yr = os.path.join(scratch, 'tas_yr.nc')
+        cdo.selyear(year, input=energy_file, options='-b F32',
+                    output=enfile_yr)
+        cdo.selyear(year, input=tas_file, options='-b F32',
+                    output=tasfile_yr)
+        coeffs = fourier_coefficients.compute_coeff(enfile_yr, tasfile_yr)
+    finally:
+        shutil.rmtree(scratch)
+    diagfile = os.path.join(ldir, '{}_{}_lec_diagram.png'.format(model, year))
+    logfile = os.path.join(ldir, '{}_{}_lec_table.txt'.format(model, year))
+    return lorenz(wdir,
+                  model,
+                  year,
+                  coeffs,
+                  diagfile,
+                  logfile,
+                  write_maps=write_maps)
 
 
 def removeif(filename):
@@ -1050,6 +988,19 @@ def table(varin, ntp, name, logfile, flag):
     write_to_tab(logfile, name, vared_tog, varzon)
 
 
+def time_mean(sums, name):
+    """Compute the time mean of a LEC component from its running sums.
+
+    Arguments:
+    ----------
+    sums: a dictionary filled by accumulate;
+    name: the name of the component;
+    """
+    total, count = sums[name]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return total / count
+
+
 def varatts(w_nc_var, varname, tres, vres):
     """Add attributes to the variables, depending on name and time res.
 
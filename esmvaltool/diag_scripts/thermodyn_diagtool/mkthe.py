@@ -3,6 +3,9 @@
 Module for computation of the auxiliary variables needed by the tool.
 
 It contains the following functions:
+- boundary_layer: compute the temperatures and heights of the boundary layer
+                  top and of the lifting condensation level;
+- fldmean: compute the area-weighted global mean of a cube;
 - init_mkthe_te: compute emission temperature from OLR;
 - init_mkthe_wat: initialise wfluxes;
 - init_mkthe_lec: compute monthly mean near-surface zonal and meridional
@@ -10,22 +13,42 @@ It contains the following functions:
 - init_mkthe_direntr: compute auxiliary files needed for material entropy
                       production retrieval with the direct method;
 - input_fields: obtain input fields for mkthe_main;
+- lazy_input_fields: obtain input fields for mkthe_lazy as lazy arrays;
+- load_field: load a single variable from a file as a cube with lazy data;
 - mkthe_main: obtain equivalent potential temperatures, temperatures
               representative of the sensible and latent heat exchanges in
               the lower layers of the troposphere, boundary layer height and
               lifting condensation level temperature.
+- mkthe_lazy: same as mkthe_main, and computation of the working
+              temperatures, in memory with lazy arrays;
+- mkthe_te_lazy: compute emission temperature in memory with lazy arrays;
 - mon_from_day: obtain monthly means from daily means;
 - wfluxes: obtain evaporation and precipitation from precipitation and latent
            heat fluxes;
+- new_field: create a cube from a template cube and new data;
+- save_fields: write cubes to NetCDF files, computing them together;
 - write_output: write auxiliary fields to NetCDF file;
+- yearmonmean: compute annual means from monthly means weighted by the
+               number of days of each month;
+
+The auxiliary fields can be computed with two engines. With 'cdo', every
+step is performed with a CDO operator and stored in a NetCDF file. With
+'iris', the same fields are computed in memory with lazy arrays and only
+the fields needed by the rest of the tool are stored, unless keep is True.
 
 @author: Valerio Lembo, valerio.lembo@uni-hamburg.de, Universitat Hamburg, 2018
 """
 import os
 from shutil import move
 
+import cftime
+import dask
+import dask.array as da
+import iris
+import iris.coord_categorisation
 import numpy as np
 from cdo import Cdo
+from iris.analysis.cartography import area_weights
 from netCDF4 import Dataset
 
 import esmvaltool.diag_scripts.shared as e
@@ -45,9 +68,80 @@ RIC_RS = 0.39  # Critical Richardson number for stable layer
 RIC_RU = 0.28  # Critical Richardson number for unstable layer
 L_C = 2501000  # latent heat of condensation
 SIGMAINV = 17636684.3034  # inverse of the Stefan-Boltzmann constant
+ENGINES = ('cdo', 'iris')
+
+
+def boundary_layer(hfss, huss, p_s, t_e, t_s, vv_hor):
+    """Compute the temperatures at the boundary layer top and at the LCL.
+
+    The fields can be numpy or dask arrays.
+
+    Arguments:
+    ---------
+    hfss: the sensible heat fluxes;
+    huss: the near-surface specific humidity;
+    p_s: the surface pressure;
+    t_e: the emission temperature;
+    t_s: the surface temperature;
+    vv_hor: the near-surface wind speed;
+
+    Returns
+    -------
+    The temperature at the lifting condensation level (LCL), the temperature
+    at the boundary layer top and the height of the boundary layer top.
+    """
+    ricr = RIC_RU
+    h_bl = H_U
+    ricr = np.where(hfss >= 0.75, ricr, RIC_RS)
+    h_bl = np.where(hfss >= 0.75, h_bl, H_S)
+    ev_p = huss * p_s / (huss + GAS_CON / RV)  # Water vapour pressure
+    td_inv = (1 / T_MELT) - (RV / ALV) * np.log(ev_p / RA_1)  # Dewpoint t.
+    t_d = 1 / td_inv
+    hlcl = 125. * (t_s - t_d)  # Empirical formula for LCL height
+    #  Negative heights are replaced by the height of the stable
+    #  boundary layer (lower constraint to the height of the cloud layer)
+    hlcl = np.where(hlcl >= 0., hlcl, h_bl)
+    cp_d = GAS_CON / AKAP
+    ztlcl = t_s - (G_0 / cp_d) * hlcl
+    # Compute the pseudo-adiabatic lapse rate to obtain the height of cloud
+    # top knowing emission temperature.
+    gw_pa = (G_0 / cp_d) * (1 + ((ALV * huss) / (GAS_CON * ztlcl)) /
+                            (1 + ((ALV**2 * huss * 0.622) /
+                                  (cp_d * GAS_CON * ztlcl**2))))
+    htop = -(t_e - ztlcl) / gw_pa + hlcl
+    #  Use potential temperature and critical Richardson number to compute
+    #  temperature and height of the boundary layer top
+    ths = t_s * (P_0 / p_s)**AKAP
+    thz = ths + 0.03 * ricr * (vv_hor)**2 / h_bl
+    p_z = p_s * np.exp((-G_0 * h_bl) / (GAS_CON * t_s))  # Barometric eq.
+    t_z = thz * (P_0 / p_z)**(-AKAP)
+    return ztlcl, t_z, htop
+
+
+def fldmean(cube):
+    """Compute the area-weighted global mean of a cube, as CDO fldmean.
 
+    The latitude and longitude dimensions are kept with length one.
 
-def init_mkthe_te(model, wdir, input_data):
+    Arguments:
+    ---------
+    cube: a cube with latitude and longitude coordinates;
+    """
+    cube = cube.copy()
+    for coord in (cube.coord('latitude'), cube.coord('longitude')):
+        if not coord.has_bounds():
+            coord.guess_bounds()
+    weights = area_weights(cube, compute=False)
+    mean = cube.collapsed(['latitude', 'longitude'],
+                          iris.analysis.MEAN,
+                          weights=weights)
+    mean = iris.util.new_axis(mean, 'longitude')
+    mean = iris.util.new_axis(mean, 'latitude')
+    mean.transpose([2, 0, 1])
+    return mean
+
+
+def init_mkthe_te(model, wdir, input_data, engine='cdo', keep=False):
     """Compute auxiliary fields or perform time averaging of existing fields.
 
     Arguments:
@@ -55,6 +149,8 @@ def init_mkthe_te(model, wdir, input_data):
     model: the model name;
     wdir: the working directory where the outputs are stored;
     filelist: a list of file names containing the input fields;
+    engine: the engine used for the computations ('cdo' or 'iris');
+    keep: if True, intermediate fields of the 'iris' engine are stored;
 
     Returns
     -------
@@ -62,17 +158,24 @@ def init_mkthe_te(model, wdir, input_data):
     globally averaged emission temperature, the file containing emission
     temperature fields.
     """
-    cdo = Cdo()
+    if engine not in ENGINES:
+        raise ValueError("Unknown engine '{}', expected one of {}".format(
+            engine, ENGINES))
     rlut_file = e.select_metadata(input_data, short_name='rlut',
                                   dataset=model)[0]['filename']
     # Compute monthly mean fields from 2D surface daily fields
     # emission temperature
     te_file = wdir + '/{}_te.nc'.format(model)
+    te_ymm_file = wdir + '/{}_te_ymm.nc'.format(model)
+    te_gmean_file = wdir + '/{}_te_gmean.nc'.format(model)
+    if engine == 'iris':
+        te_gmean_constant = mkthe_te_lazy(rlut_file, te_file, te_ymm_file,
+                                          te_gmean_file if keep else None)
+        return te_ymm_file, te_gmean_constant, te_file
+    cdo = Cdo()
     cdo.sqrt(input="-sqrt -mulc,{} {}".format(SIGMAINV, rlut_file),
              output=te_file)
-    te_ymm_file = wdir + '/{}_te_ymm.nc'.format(model)
     cdo.yearmonmean(input=te_file, output=te_ymm_file)
-    te_gmean_file = wdir + '/{}_te_gmean.nc'.format(model)
     cdo.timmean(input='-fldmean {}'.format(te_ymm_file), output=te_gmean_file)
     with Dataset(te_gmean_file) as f_l:
         te_gmean_constant = f_l.variables['rlut'][0, 0, 0]
@@ -130,7 +233,13 @@ def init_mkthe_lec(model, wdir, input_data):
     return uasmn_file, vasmn_file
 
 
-def init_mkthe_direntr(model, wdir, input_data, te_file, flags):
+def init_mkthe_direntr(model,
+                       wdir,
+                       input_data,
+                       te_file,
+                       flags,
+                       engine='cdo',
+                       keep=False):
     """Compute the MEP with the direct method.
 
     Arguments:
@@ -143,13 +252,17 @@ def init_mkthe_direntr(model, wdir, input_data, te_file, flags):
             entr: a flag for the material entropy production (y or n);
             met: a flag for the material entropy production method
             (1: indirect, 2, direct, 3: both));
+    engine: the engine used for the computations ('cdo' or 'iris');
+    keep: if True, intermediate fields of the 'iris' engine are stored;
 
     Returns
     -------
     A list of files cotiaining the components of the MEP with the direct
     method.
     """
-    cdo = Cdo()
+    if engine not in ENGINES:
+        raise ValueError("Unknown engine '{}', expected one of {}".format(
+            engine, ENGINES))
     met = flags[3]
     if met in {'2', '3'}:
         evspsbl_file, prr_file = wfluxes(model, wdir, input_data)
@@ -186,7 +299,15 @@ def init_mkthe_direntr(model, wdir, input_data, te_file, flags):
         mk_list = [
             ts_file, hus_file, ps_file, uas_file, vas_file, hfss_file, te_file
         ]
+        if engine == 'iris':
+            (htop_file, tabl_file, tlcl_file, tasvert_file, tcloud_file,
+             tcolumn_file) = mkthe_lazy(wdir, mk_list, model, keep)
+            return [
+                evspsbl_file, htop_file, prr_file, tabl_file, tasvert_file,
+                tcloud_file, tcolumn_file, tlcl_file
+            ]
         htop_file, tabl_file, tlcl_file = mkthe_main(wdir, mk_list, model)
+        cdo = Cdo()
         # Working temperatures for the hydrological cycle
         tcloud_file = (wdir + '/{}_tcloud.nc'.format(model))
         removeif(tcloud_file)
@@ -282,6 +403,120 @@ def input_fields(wdir, file_list):
     return hfss, huss, p_s, t_e, t_s, vv_hor
 
 
+def lazy_input_fields(file_list):
+    """Read input fields as lazy arrays.
+
+    This is the counterpart of input_fields for the 'iris' engine. Zeros are
+    treated as missing values, and missing values are replaced by NaN.
+
+    Arguments:
+    ---------
+    file_list: the list of file containing ts, hus, ps, uas, vas, hfss, te;
+
+    Returns
+    -------
+    hfss, huss, ps, te, ts and teh near-surface wind speed fields, the cube
+    of ts (used as template for the outputs).
+    """
+    names = ['ts', 'hus', 'ps', 'uas', 'vas', 'hfss', 'rlut']
+    cubes = [load_field(*item) for item in zip(file_list, names)]
+    fields = [da.ma.filled(cube.lazy_data(), np.nan) for cube in cubes]
+    t_s, hus, p_s, u_s, v_s, hfss, t_e = fields
+    vv_hor = np.sqrt(u_s.astype(np.float32)**2 + v_s.astype(np.float32)**2)
+    t_s, hus, p_s, vv_hor, hfss, t_e = [
+        np.where(fld == 0., np.nan, fld)
+        for fld in (t_s, hus, p_s, vv_hor, hfss, t_e)
+    ]
+    lev = cubes[1].coord('air_pressure').points
+    huss = hus[:, 0, :, :]
+    huss = np.where(lev[0] >= p_s, huss, 0.)
+    for l_l, p_l in enumerate(lev):
+        huss = huss + np.where(p_s >= p_l, hus[:, l_l, :, :], 0.)
+    return hfss, huss, p_s, t_e, t_s, vv_hor, cubes[0]
+
+
+def load_field(filename, short_name):
+    """Load a variable from a NetCDF file as a cube with lazy data.
+
+    Arguments:
+    ---------
+    filename: the name of the file;
+    short_name: the name of the variable in the file;
+    """
+    return iris.load_cube(filename, iris.NameConstraint(var_name=short_name))
+
+
+def mkthe_lazy(wdir, file_list, modelname, keep=False):
+    """Compute the auxiliary variables and working temperatures in memory.
+
+    This is the counterpart of mkthe_main and of the computation of the
+    working temperatures in init_mkthe_direntr for the 'iris' engine. The
+    same files are produced, but intermediate fields are only stored if keep
+    is True.
+
+    Arguments:
+    ---------
+    wdir: the working directory path;
+    file_list: the list of file containing ts, hus, ps, uas, vas, hfss, te;
+    modelname: the name of the model from which the fields are;
+    keep: if True, the near-surface specific humidity and wind speed are
+          stored as well;
+
+    Returns
+    -------
+    The files containing boundary layer top height, boundary layer mean
+    temperature, temperature at the lifting condensation level (LCL), the
+    global mean temperature of the boundary layer, the temperature of the
+    cloud layer and the mean temperature of the column.
+    """
+    hfss, huss, p_s, t_e, t_s, vv_hor, template = lazy_input_fields(
+        file_list)
+    ztlcl, t_z, htop = boundary_layer(hfss, huss, p_s, t_e, t_s, vv_hor)
+    # Unrealistic values are set to missing, as with setrtomiss in the
+    # 'cdo' engine
+    ztlcl, t_z, htop = [
+        da.ma.masked_inside(da.ma.masked_invalid(fld), v_min, 1e36)
+        for fld, v_min in ((ztlcl, 400.), (t_z, 400.), (htop, 12000.))
+    ]
+    tlcl = new_field(template, ztlcl, 'tlcl', 'LCL Temperature', 'K')
+    tabl = new_field(template, t_z, 'tabl', 'Temperature at BL top', 'K')
+    htop = new_field(template, htop, 'htop', 'Height at BL top', 'm')
+    # Working temperatures for the hydrological cycle
+    t_s = template.lazy_data()
+    t_e = load_field(file_list[6], 'rlut').lazy_data()
+    tcloud = 0.5 * (tlcl.lazy_data() + t_e)
+    tcolumn = 0.5 * (t_s + tcloud)
+    # Working temperatures for the kin. en. diss. (updated)
+    tasvert = fldmean(
+        new_field(template, 0.5 * (t_s + tabl.lazy_data()), 'ts',
+                  'Boundary layer temperature', 'K'))
+    outputs = {
+        '{}_htop.nc': htop.copy(htop.lazy_data().astype(np.float64)),
+        '{}_tabl.nc': tabl.copy(tabl.lazy_data().astype(np.float64)),
+        '{}_tlcl.nc': tlcl.copy(tlcl.lazy_data().astype(np.float64)),
+        '{}_tboundlay.nc': tasvert.copy(
+            tasvert.lazy_data().astype(np.float32)),
+        '{}_tcloud.nc': new_field(template, tcloud.astype(np.float32),
+                                  'tlcl', 'Cloud layer temperature', 'K'),
+        '{}_t_vertav_pot.nc': new_field(template,
+                                        tcolumn.astype(np.float32), 'ts',
+                                        'Column mean temperature', 'K'),
+    }
+    if keep:
+        outputs['{}_huss.nc'] = new_field(template, huss, 'huss',
+                                          'Near-surface specific humidity',
+                                          '1')
+        outputs['{}_sfcwind.nc'] = new_field(template, vv_hor, 'sfcWind',
+                                             'Near-surface wind speed',
+                                             'm s-1')
+    filenames = {
+        key: os.path.join(wdir, key.format(modelname))
+        for key in outputs
+    }
+    save_fields([(outputs[key], filenames[key]) for key in outputs])
+    return tuple(filenames[key] for key in list(outputs)[:6])
+
+
 def mkthe_main(wdir, file_list, modelname):
     """Compute the auxiliary variables for the Thermodynamic diagnostic tool.
 
@@ -302,37 +537,43 @@ def mkthe_main(wdir, file_list, modelname):
     temperature, temperature at the lifting condensation level (LCL).
     """
     hfss, huss, p_s, t_e, t_s, vv_hor = input_fields(wdir, file_list)
-    ricr = RIC_RU
-    h_bl = H_U
-    ricr = np.where(hfss >= 0.75, ricr, RIC_RS)
-    h_bl = np.where(hfss >= 0.75, h_bl, H_S)
-    ev_p = huss * p_s / (huss + GAS_CON / RV)  # Water vapour pressure
-    td_inv = (1 / T_MELT) - (RV / ALV) * np.log(ev_p / RA_1)  # Dewpoint t.
-    t_d = 1 / td_inv
-    hlcl = 125. * (t_s - t_d)  # Empirical formula for LCL height
-    #  Negative heights are replaced by the height of the stable
-    #  boundary layer (lower constraint to the height of the cloud layer)
-    hlcl = np.where(hlcl >= 0., hlcl, h_bl)
-    cp_d = GAS_CON / AKAP
-    ztlcl = t_s - (G_0 / cp_d) * hlcl
-    # Compute the pseudo-adiabatic lapse rate to obtain the height of cloud
-    # top knowing emission temperature.
-    gw_pa = (G_0 / cp_d) * (1 + ((ALV * huss) / (GAS_CON * ztlcl)) /
-                            (1 + ((ALV**2 * huss * 0.622) /
-                                  (cp_d * GAS_CON * ztlcl**2))))
-    htop = -(t_e - ztlcl) / gw_pa + hlcl
-    #  Use potential temperature and critical Richardson number to compute
-    #  temperature and height of the boundary layer top
-    ths = t_s * (P_0 / p_s)**AKAP
-    thz = ths + 0.03 * ricr * (vv_hor)**2 / h_bl
-    p_z = p_s * np.exp((-G_0 * h_bl) / (GAS_CON * t_s))  # Barometric eq.
-    t_z = thz * (P_0 / p_z)**(-AKAP)
+    ztlcl, t_z, htop = boundary_layer(hfss, huss, p_s, t_e, t_s, vv_hor)
     outlist = [ztlcl, t_z, htop]
     htop_file, tabl_file, tlcl_file = write_output(wdir, modelname, file_list,
                                                    outlist)
     return htop_file, tabl_file, tlcl_file
 
 
+def mkthe_te_lazy(rlut_file, te_file, te_ymm_file, te_gmean_file=None):
+    """Compute the emission temperature from OLR in memory.
+
+    This is the counterpart of init_mkthe_te for the 'iris' engine.
+
+    Arguments:
+    ---------
+    rlut_file: the file containing the OLR;
+    te_file: the file where the emission temperature is stored;
+    te_ymm_file: the file where the annual mean emission temperature is
+                 stored;
+    te_gmean_file: the file where the time mean globally averaged emission
+                   temperature is stored (optional);
+
+    Returns
+    -------
+    The time mean globally averaged emission temperature.
+    """
+    rlut = load_field(rlut_file, 'rlut')
+    t_e = new_field(rlut, np.sqrt(np.sqrt(SIGMAINV * rlut.lazy_data())),
+                    'rlut', 'Emission temperature', 'K')
+    te_ymm = yearmonmean(t_e)
+    te_gmean = fldmean(te_ymm).collapsed('time', iris.analysis.MEAN)
+    outputs = [(t_e, te_file), (te_ymm, te_ymm_file)]
+    if te_gmean_file is not None:
+        outputs.append((te_gmean, te_gmean_file))
+    _, te_gmean_constant = save_fields(outputs, te_gmean.lazy_data())
+    return te_gmean_constant[0, 0]
+
+
 def mon_from_day(wdir, model, name, filein):
     """Compute monthly mean from daily mean.
 
@@ -359,6 +600,26 @@ def mon_from_day(wdir, model, name, filein):
     return fileout
 
 
+def new_field(template, data, var_name, long_name, units):
+    """Create a cube with the coordinates of a template cube and new data.
+
+    Arguments:
+    ---------
+    template: the cube whose coordinates are used;
+    data: the data of the new cube;
+    var_name: the name of the variable;
+    long_name: the long name of the variable;
+    units: the units of the variable;
+    """
+    cube = template.copy(data)
+    cube.standard_name = None
+    cube.long_name = long_name
+    cube.var_name = var_name
+    cube.units = units
+    cube.attributes.clear()
+    return cube
+
+
 def removeif(filename):
     """Remove filename if it exists."""
     try:
@@ -367,6 +628,29 @@ def removeif(filename):
         pass
 
 
+def save_fields(outputs, *results):
+    """Store cubes to NetCDF files.
+
+    All cubes are computed at the same time, so that the lazy operations that
+    they share are only performed once.
+
+    Arguments:
+    ---------
+    outputs: a list of tuples of cubes and file names;
+    results: other lazy arrays that are computed together with the cubes;
+
+    Returns
+    -------
+    A list of the files and the computed arrays.
+    """
+    delayed = []
+    for cube, filename in outputs:
+        removeif(filename)
+        delayed.append(iris.save(cube, filename, compute=False))
+    computed = dask.compute(*delayed, *results)
+    return [filename for _, filename in outputs], *computed[len(delayed):]
+
+
 def wfluxes(model, wdir, input_data):
     """Compute evaporation and rainfall mass fluxes.
 
@@ -514,3 +798,35 @@ def write_output(wdir, model, file_list, varlist):
     htop_file = wdir + '/{}_htop.nc'.format(model)
     cdo.setrtomiss('12000,1e36', input=htop_temp, output=htop_file)
     return htop_file, tabl_file, tlcl_file
+
+
+def yearmonmean(cube):
+    """Compute annual means from monthly means, as CDO yearmonmean.
+
+    Each month is weighted by its number of days.
+
+    Arguments:
+    ---------
+    cube: a cube of monthly mean fields;
+    """
+    time = cube.coord('time')
+    calendar = time.units.calendar
+    month_lengths = []
+    for date in time.units.num2date(time.points):
+        start = cftime.datetime(date.year, date.month, 1, calendar=calendar)
+        end = cftime.datetime(date.year + date.month // 12,
+                              date.month % 12 + 1,
+                              1,
+                              calendar=calendar)
+        month_lengths.append((end - start).days)
+    cube = cube.copy()
+    iris.coord_categorisation.add_year(cube, 'time')
+    cube.add_aux_coord(
+        iris.coords.AuxCoord(month_lengths, long_name='month_length'),
+        cube.coord_dims('time'))
+    ymm = cube.aggregated_by('year',
+                             iris.analysis.MEAN,
+                             weights='month_length')
+    ymm.remove_coord('year')
+    ymm.remove_coord('month_length')
+    return ymm
@@ -132,6 +132,16 @@ USAGE
        - met: if set to 1, the program will compute the MEP with the indirect
               method, if set to 2 with the direct method, if set to 3, both
               methods will be computed and compared with each other;
+       - n_jobs: maximum number of years for which the LEC is computed in
+                 parallel (default: 1);
+       - engine: if set to iris, the auxiliary fields (emission temperature,
+                 boundary layer and working temperatures) are computed in
+                 memory with lazy arrays instead of CDO (default: cdo);
+       - keep_intermediates: if set to true, intermediate auxiliary fields
+                             of the iris engine are stored (default: false);
+       - lec_maps: if set to false, the annual mean (lat,wave) fields of the
+                   LEC reservoirs and conversion terms are not stored
+                   (default: true);
    In the 'variables' subsection of the 'diagnostics' section, you have to
    comment the fields that are not needed depending on the options set in
    the 'scripts' section. Energy budget and transport computations are
@@ -313,6 +323,8 @@ def main(cfg):
     lec = str(cfg['lec'])
     entr = str(cfg['entr'])
     met = str(cfg['met'])
+    engine = cfg.get('engine', 'cdo')
+    keep = cfg.get('keep_intermediates', False)
     flags = [wat, lec, entr, met]
     # Initialize multi-model arrays
     modnum = len(model_names)
@@ -349,7 +361,7 @@ def main(cfg):
         os.makedirs(pdir)
         aux_file = wdir + '/aux.nc'
         te_ymm_file, te_gmean_constant, te_file = mkthe.init_mkthe_te(
-            model, wdir, input_data)
+            model, wdir, input_data, engine=engine, keep=keep)
         te_all[i_m] = te_gmean_constant
         logger.info('Computing energy budgets\n')
         in_list, eb_gmean, eb_file, toab_ymm_file = comp.budgets(
@@ -425,7 +437,12 @@ def main(cfg):
             logger.info('Computation of the Lorenz Energy '
                         'Cycle (year by year)\n')
             _, _ = mkthe.init_mkthe_lec(model, wdir, input_data)
-            lect = lorenz.preproc_lec(model, wdir, pdir, input_data)
+            lect = lorenz.preproc_lec(model,
+                                      wdir,
+                                      pdir,
+                                      input_data,
+                                      n_jobs=cfg.get('n_jobs', 1),
+                                      write_maps=cfg.get('lec_maps', True))
             plotsmod.lec_plot(model, pdir, lect)
             lec_all[i_m, 0] = np.nanmean(lect)
             lec_all[i_m, 1] = np.nanstd(lect)
@@ -464,9 +481,16 @@ def main(cfg):
                                  'Vertical entropy production', model)
                 logger.info('Done\n')
             if met in {'2', '3'}:
-                matentr, irrevers, entr_list = comp.direntr(
-                    logger, model, wdir, input_data, aux_file, te_file, lect,
-                    flags)
+                matentr, irrevers, entr_list = comp.direntr(logger,
+                                                            model,
+                                                            wdir,
+                                                            input_data,
+                                                            aux_file,
+                                                            te_file,
+                                                            lect,
+                                                            flags,
+                                                            engine=engine,
+                                                            keep=keep)
                 provenance_meta.meta_direntr(cfg, model, input_data, entr_list)
                 matentr_all[i_m, 0] = matentr
                 if met in {'3'}:
@@ -1,6 +1,7 @@
 """A collection of functions to calibrate the shape parameters (sigmas)."""
 import logging
 import os
+from concurrent.futures import ThreadPoolExecutor
 from typing import Union
 
 import matplotlib.pyplot as plt
@@ -14,11 +15,13 @@ from esmvaltool.diag_scripts.shared import (
 )
 from esmvaltool.diag_scripts.weighting.climwip.core_functions import (
     area_weighted_mean,
+    calculate_independence_denominator,
     calculate_model_distances,
     calculate_weights,
     combine_ensemble_members,
     compute_overall_mean,
     weighted_quantile,
+    weighted_quantile_batch,
 )
 from esmvaltool.diag_scripts.weighting.climwip.io_functions import (
     read_metadata,
@@ -29,6 +32,7 @@ from esmvaltool.diag_scripts.weighting.climwip.io_functions import (
 logger = logging.getLogger(os.path.basename(__file__))
 
 SIGMA_RANGE = (.1, 2)  # allow this to be set by the recipe later
+N_SIGMAS = 100  # number of sigma values evaluated in SIGMA_RANGE
 PERCENTILES = [.1, .9]  # allow this to be set by the recipe later
 
 confidence_test_values = {'baseline': {}}
@@ -179,7 +183,8 @@ def evaluate_target(performance_sigma: list,
                     overall_performance: 'xr.DataArray',
                     target: 'xr.DataArray',
                     overall_independence: 'xr.DataArray',
-                    independence_sigma: float) -> float:
+                    independence_sigma: float,
+                    denominator: 'xr.DataArray' = None) -> float:
     """Evaluate the weighting in the target period.
 
     Parameters
@@ -198,6 +203,10 @@ def evaluate_target(performance_sigma: list,
         Matrix containing model-model distances for independence.
     independence_sigma : float
         Independence weighting shape parameter.
+    denominator : array_like, shape (N, N), optional
+        Independence denominator of the weights for each perfect model (see
+        independence_denominators). It does not depend on the performance
+        sigma, so it can be computed once for all evaluations.
 
     Returns
     -------
@@ -211,14 +220,149 @@ def evaluate_target(performance_sigma: list,
     overall_performance.values[idx_diag] = np.nan
 
     weights_matrix = calculate_weights(overall_performance,
-                                       overall_independence, performance_sigma,
-                                       independence_sigma)
+                                       overall_independence,
+                                       performance_sigma,
+                                       independence_sigma,
+                                       denominator=denominator)
 
     cost_function_value = compute_cost_function(target, weights_matrix,
                                                 performance_sigma)
     return cost_function_value
 
 
+def independence_denominators(
+        overall_performance: 'xr.DataArray',
+        overall_independence: Union['xr.DataArray', None],
+        independence_sigma: Union[float, None]
+) -> Union['xr.DataArray', None]:
+    """Calculate the independence denominator for each perfect model.
+
+    The perfect model (nan in overall_performance) is not considered for the
+    independence of the other models.
+
+    Returns
+    -------
+    denominator : array_like, shape (N, N) or None
+        Denominator of the weights in the model_ensemble dimension for each
+        perfect model in the perfect_model_ensemble dimension. None if no
+        independence weighting is used.
+    """
+    if overall_independence is None:
+        return None
+    models = overall_performance['model_ensemble'].values
+    independence = overall_independence.sel(
+        model_ensemble=models, model_ensemble_reference=models).transpose(
+            'model_ensemble', 'model_ensemble_reference')
+    not_nan = np.isfinite(
+        overall_performance.transpose('perfect_model_ensemble',
+                                      'model_ensemble'))
+    denominator = calculate_independence_denominator(independence.values,
+                                                     independence_sigma,
+                                                     not_nan.values)
+    return xr.DataArray(denominator, coords=not_nan.coords, dims=not_nan.dims)
+
+
+def evaluate_sigmas(performance_sigmas: 'np.array',
+                    overall_performance: 'xr.DataArray',
+                    target: 'xr.DataArray',
+                    denominator: Union['xr.DataArray', None] = None,
+                    n_jobs: int = 1) -> 'np.array':
+    """Evaluate the weighting in the target period for many sigmas at once.
+
+    Vectorized counterpart of evaluate_target: the weights, percentiles and
+    cost function of all performance sigmas and all perfect models are
+    computed as batched array operations. The sigmas are split into up to
+    `n_jobs` blocks, which are evaluated in parallel.
+
+    Parameters
+    ----------
+    performance_sigmas : array_like, shape (S,)
+        Performance weighting shape parameters to evaluate.
+    overall_performance : array_like, shape (N, N)
+        See evaluate_target for more information. The perfect model of each
+        row is excluded (set to nan).
+    target : array_like, shape (N,)
+        See calculate_percentiles for more information.
+    denominator : array_like, shape (N, N), optional
+        Independence denominator of the weights for each perfect model (see
+        independence_denominators). If None, only the performance is used.
+    n_jobs : int, optional
+        Maximum number of blocks of sigmas evaluated in parallel.
+
+    Returns
+    -------
+    cost_function_values : array_like, shape (S,)
+        See compute_cost_function for more information.
+    """
+    percentiles = PERCENTILES
+    inside_ratio_reference = percentiles[1] - percentiles[0]
+    performance_sigmas = np.asarray(performance_sigmas, dtype=float)
+
+    # exclude perfect model in each row by setting it to nan
+    idx_diag = np.diag_indices(overall_performance['model_ensemble'].size)
+    overall_performance.values[idx_diag] = np.nan
+
+    performance = overall_performance.transpose('perfect_model_ensemble',
+                                                'model_ensemble')
+    models = performance['model_ensemble'].values
+    perfect_models = performance['perfect_model_ensemble']
+    target_values = target.sel(model_ensemble=models).values
+    target_perfect = target.sel(model_ensemble=perfect_models.values).values
+    not_nan = np.isfinite(performance.values)
+    if denominator is None:
+        denominator = 1.
+    else:
+        denominator = denominator.transpose(*performance.dims).values
+
+    def weights_matrices(sigmas):
+        """Weights of each perfect model for each sigma, shape (S, N, N)."""
+        numerator = np.exp(-(
+            (performance.values / sigmas[:, np.newaxis, np.newaxis])**2))
+        weights = numerator / denominator
+        weights /= weights.sum(axis=-1, where=not_nan, keepdims=True)
+        return weights
+
+    def confidence_test(weights):
+        """Percentile spread and inside ratio for each set of weights."""
+        percentiles_data = weighted_quantile_batch(target_values, percentiles,
+                                                   weights)
+        inside_count = np.logical_and(
+            target_perfect >= percentiles_data[..., 0],
+            target_perfect <= percentiles_data[..., 1])
+        inside_ratio = inside_count.sum(axis=-1) / inside_count.shape[-1]
+        spread = percentiles_data[..., 1] - percentiles_data[..., 0]
+        return spread, inside_ratio
+
+    # calculate the equally weighted case once as baseline
+    if len(confidence_test_values['baseline']) == 0:
+        weights = weights_matrices(performance_sigmas[:1])[0]
+        percentiles_spread, inside_ratio = confidence_test(0 * weights + 1)
+        confidence_test_values['baseline']['percentile_spread'] = (
+            xr.DataArray(percentiles_spread, coords=[perfect_models]))
+        confidence_test_values['baseline']['inside_ratio'] = inside_ratio
+
+    blocks = np.array_split(performance_sigmas,
+                            max(1, min(n_jobs, len(performance_sigmas))))
+    with ThreadPoolExecutor(max_workers=len(blocks)) as executor:
+        results = list(
+            executor.map(lambda sigmas: confidence_test(
+                weights_matrices(sigmas)), blocks))
+    percentiles_spread = np.concatenate([result[0] for result in results])
+    inside_ratio = np.concatenate([result[1] for result in results])
+
+    for sigma, spread, ratio in zip(performance_sigmas, percentiles_spread,
+                                    inside_ratio):
+        confidence_test_values[sigma] = {
+            'percentile_spread': xr.DataArray(spread,
+                                              coords=[perfect_models]),
+            'inside_ratio': ratio,
+        }
+
+    difference = inside_ratio - inside_ratio_reference
+    # overconfident if difference < 0
+    return np.where(difference < 0, 99 - difference, performance_sigmas)
+
+
 def visualize_save_calibration(performance_sigma, cfg, success):
     """Visualize a summary of the calibration."""
     percentiles = PERCENTILES
@@ -360,15 +504,34 @@ def calibrate_performance_sigma(performance_contributions: list,
             overall_performance, ['model_ensemble', 'perfect_model_ensemble'])
         target_data, _ = combine_ensemble_members(target_data)
 
-    performance_sigma, fval, _, _ = brute(
-        evaluate_target,
-        ranges=(SIGMA_RANGE, ),
-        Ns=100,
-        finish=None,
-        args=(overall_performance, target_data, overall_independence,
-              independence_sigma),
-        full_output=True,
-    )
+    # exclude perfect model in each row by setting it to nan
+    idx_diag = np.diag_indices(overall_performance['model_ensemble'].size)
+    overall_performance.values[idx_diag] = np.nan
+    # reused for all performance sigmas
+    denominator = independence_denominators(overall_performance,
+                                            overall_independence,
+                                            independence_sigma)
+
+    if settings.get('vectorized', False):
+        # same sigma values as brute
+        performance_sigmas = np.mgrid[slice(*SIGMA_RANGE, complex(N_SIGMAS))]
+        cost_function_values = evaluate_sigmas(performance_sigmas,
+                                               overall_performance,
+                                               target_data,
+                                               denominator,
+                                               n_jobs=cfg.get('n_jobs', 1))
+        performance_sigma = performance_sigmas[cost_function_values.argmin()]
+        fval = cost_function_values.min()
+    else:
+        performance_sigma, fval, _, _ = brute(
+            evaluate_target,
+            ranges=(SIGMA_RANGE, ),
+            Ns=N_SIGMAS,
+            finish=None,
+            args=(overall_performance, target_data, overall_independence,
+                  independence_sigma, denominator),
+            full_output=True,
+        )
 
     success = fval < 99
     visualize_save_calibration(performance_sigma, cfg, success=success)
@@ -1,15 +1,19 @@
 """A collection of core functions."""
 import logging
 import os
+import warnings
 from collections import defaultdict
 from typing import Union
 
+import dask.array as da
 import numpy as np
 import xarray as xr
-from scipy.spatial.distance import pdist, squareform
 
 logger = logging.getLogger(os.path.basename(__file__))
 
+# Number of grid cells in the tiles used for the model distances
+DISTANCE_CHUNK_SIZE = 2**16
+
 
 def area_weighted_mean(data_array: 'xr.DataArray') -> 'xr.DataArray':
     """Calculate area mean weighted by the latitude.
@@ -24,12 +28,18 @@ def area_weighted_mean(data_array: 'xr.DataArray') -> 'xr.DataArray':
 
 
 def distance_matrix(values: 'np.ndarray',
-                    weights: 'np.ndarray' = None) -> 'np.ndarray':
+                    weights: 'np.ndarray' = None,
+                    chunk_size: int = DISTANCE_CHUNK_SIZE) -> 'np.ndarray':
     """Calculate the pairwise distance between model members.
 
     Takes a dataset with ensemble member/lon/lat. Flattens lon/lat
-    into a single dimension. Calculates the distance between every
-    ensemble member.
+    into a single dimension. Calculates the weighted euclidean distance
+    between every ensemble member.
+
+    The squared distances are computed from Gram matrices, accumulated over
+    tiles of `chunk_size` grid cells, which are processed in parallel by
+    dask. Values and weights can be numpy or dask arrays. Grid cells where
+    one of the two members of a pair is NaN are ignored for that pair only.
 
     If weights are passed, they should have the same shape as values.
 
@@ -37,19 +47,32 @@ def distance_matrix(values: 'np.ndarray',
     """
     n_members = values.shape[0]
 
-    values = values.reshape(n_members, -1)
-
-    # pdist does not work with NaN
-    not_nan = np.where(np.all(np.isfinite(values), axis=0))[0]
-    values = values[:, not_nan]
+    values = da.asarray(values).reshape(n_members, -1).astype(np.float64)
+    values = values.rechunk((-1, chunk_size))
 
-    if weights is not None:
-        # Reshape weights to match values array
-        weights = weights.reshape(n_members, -1)
-        weights = weights[:, not_nan]
-        weights = weights[0]  # Weights are equal along first dim
-
-    d_matrix = squareform(pdist(values, metric='euclidean', w=weights))
+    if weights is None:
+        weights = da.ones(values.shape[1], chunks=values.chunks[1])
+    else:
+        # Weights are equal along first dim
+        weights = da.asarray(weights).reshape(n_members, -1)[0]
+        weights = weights.astype(np.float64).rechunk(values.chunks[1])
+
+    valid = da.isfinite(values)
+    # Distances do not depend on a common offset, removing it limits the
+    # cancellation in the Gram matrix formulation
+    with warnings.catch_warnings():
+        warnings.filterwarnings('ignore', 'Mean of empty slice')
+        offset = da.nanmean(values, axis=0)
+    values = da.where(valid, values - offset, 0.)
+    valid = valid.astype(np.float64)
+
+    # sum_k w_k (x_ik - x_jk)**2 over the cells valid for both i and j
+    norms = (weights * values**2) @ valid.T
+    gram = (weights * values) @ values.T
+    d_squared = (norms + norms.T - 2. * gram).compute()
+
+    np.fill_diagonal(d_squared, 0.)
+    d_matrix = np.sqrt(np.clip(d_squared, 0., None))
 
     return d_matrix
 
@@ -60,7 +83,8 @@ def calculate_model_distances(
     """Calculate pair-wise distances between all values in data_array.
 
     Distances are calculated as the area weighted euclidean distance
-    between each pair of models in data_array. Returned is a square matrix
+    between each pair of models in data_array (see distance_matrix), which
+    can be backed by numpy or dask arrays. Returned is a square matrix
     with where the number of elements along each edge equals the number
     of ensemble members.
 
@@ -89,6 +113,7 @@ def calculate_model_distances(
         input_core_dims=[['model_ensemble', 'lat', 'lon'],
                          ['model_ensemble', 'lat', 'lon']],
         output_core_dims=[[dimension, 'model_ensemble']],
+        dask='allowed',
     )
 
     diff.name = f'd{data_array.name}'
@@ -170,11 +195,48 @@ def combine_ensemble_members(
     return dataset, groups
 
 
+def calculate_independence_denominator(
+        independence: 'np.array',
+        independence_sigma: float,
+        not_nan: 'np.array' = None) -> 'np.array':
+    """Calculate the denominator of the weights for model independence.
+
+    The denominator only depends on the model-model distances, so it can be
+    computed once and reused for several performance sigmas (e.g., when
+    calibrating the performance sigma).
+
+    Parameters
+    ----------
+    independence : array_like, shape (N, N)
+        Array specifying the model independence.
+    independence_sigma : float
+        Sigma value defining the form of the weighting function
+        for the independence.
+    not_nan : array_like, shape (N,) or (M, N), optional
+        Models to consider for the independence of other models, for one or
+        several (M) sets of models (e.g., one per perfect model). By default
+        all models with finite distances are considered.
+
+    Returns
+    -------
+    denominator : ndarray, shape (N,) or (M, N)
+    """
+    independence = np.asarray(independence)
+    if not_nan is None:
+        not_nan = np.isfinite(independence[0])
+    not_nan = np.asarray(not_nan, dtype=bool)
+    exp = np.exp(-((independence / independence_sigma)**2))
+    # Note diagonal = exp(0) = 1, thus this is equal to 1 + sum(i!=j)
+    # don't consider nan models for independence of other models!
+    return np.where(not_nan[..., np.newaxis, :], exp, 0.).sum(axis=-1)
+
+
 def calculate_weights_data(
         performance: Union['np.array', None],
         independence: Union['np.array', None],
         performance_sigma: Union[float, None],
-        independence_sigma: Union[float, None]) -> 'np.array':
+        independence_sigma: Union[float, None],
+        denominator: Union['np.array', None] = None) -> 'np.array':
     """Calculate normalized weights for each model N.
 
     Parameters
@@ -193,6 +255,10 @@ def calculate_weights_data(
     independence_sigma : float or None
         Sigma value defining the form of the weighting function
             for the independence. Can be one only if independence is also None.
+    denominator : array_like, shape (N,) or None
+        Precomputed independence denominator (see
+        calculate_independence_denominator). If given, independence is not
+        used.
 
     Returns
     -------
@@ -200,19 +266,20 @@ def calculate_weights_data(
     """
     numerator = 1
     not_nan = None
-    denominator = 1
 
     if performance is not None:
         numerator = np.exp(-((performance / performance_sigma)**2))
         # nans in the performance vector indicate models to be excluded
         not_nan = np.isfinite(performance)
-    if independence is not None:
-        if not_nan is None:
-            not_nan = np.isfinite(independence[0])
-        # don't consider nan models for independence of other models!
-        exp = np.exp(-((independence[:, not_nan] / independence_sigma)**2))
-        # Note diagonal = exp(0) = 1, thus this is equal to 1 + sum(i!=j)
-        denominator = exp.sum(axis=1)
+    if denominator is None:
+        denominator = 1
+        if independence is not None:
+            if not_nan is None:
+                not_nan = np.isfinite(independence[0])
+            denominator = calculate_independence_denominator(
+                independence, independence_sigma, not_nan)
+    elif not_nan is None:
+        not_nan = np.isfinite(denominator)
 
     weights = numerator / denominator
     weights /= weights.sum(where=not_nan)
@@ -223,12 +290,21 @@ def calculate_weights(
         performance: Union['xr.DataArray', None],
         independence: Union['xr.DataArray', None],
         performance_sigma: Union[float, None],
-        independence_sigma: Union[float, None]) -> 'xr.DataArray':
-    """Xarray wrapper for calculate_weights_data."""
+        independence_sigma: Union[float, None],
+        denominator: Union['xr.DataArray', None] = None) -> 'xr.DataArray':
+    """Xarray wrapper for calculate_weights_data.
+
+    A precomputed independence `denominator` (with a model_ensemble
+    dimension) can be passed instead of recomputing it from `independence`.
+    """
     performance_core_dims = [] if performance is None else ['model_ensemble']
     independence_core_dims = [] if independence is None else [
         'model_ensemble', 'model_ensemble_reference'
     ]
+    if denominator is not None:
+        independence = None
+        independence_core_dims = []
+    denominator_core_dims = [] if denominator is None else ['model_ensemble']
 
     weights = xr.apply_ufunc(
         calculate_weights_data,
@@ -236,8 +312,10 @@ def calculate_weights(
         independence,
         performance_sigma,
         independence_sigma,
+        denominator,
         input_core_dims=[
-            performance_core_dims, independence_core_dims, [], []
+            performance_core_dims, independence_core_dims, [], [],
+            denominator_core_dims
         ],
         output_core_dims=[['model_ensemble']],
         vectorize=True,
@@ -299,3 +377,75 @@ def weighted_quantile(values: list,
     weighted_quantiles = (weighted_quantiles - min_val) / max_val
 
     return np.interp(quantiles, weighted_quantiles, values)
+
+
+def weighted_quantile_batch(values: list, quantiles: list,
+                            weights: 'np.array') -> 'np.array':
+    """Calculate weighted quantiles for many sets of weights at once.
+
+    Vectorized version of weighted_quantile for values which are the same
+    for all sets of weights. Values or weights which are not finite are
+    excluded separately for each set of weights.
+
+    Parameters
+    ----------
+    values: array_like, shape (N,)
+        List of input values.
+    quantiles: array_like, shape (Q,)
+        List of quantiles between 0.0 and 1.0.
+    weights: array_like, shape (..., N)
+        Sets of weights, along the last dimension.
+
+    Returns
+    -------
+    np.array, shape (..., Q)
+        Numpy array with computed quantiles for each set of weights.
+    """
+    values = np.asarray(values, dtype=float)
+    quantiles = np.asarray(quantiles, dtype=float)
+    weights = np.asarray(weights, dtype=float)
+
+    if not np.all((quantiles >= 0) & (quantiles <= 1)):
+        raise ValueError('Quantiles should be between 0.0 and 1.0')
+
+    idx = np.argsort(values)
+    values = values[idx]
+    weights = weights[..., idx]
+
+    # move the valid values to the front of each set, keeping their order
+    valid = np.isfinite(values) & np.isfinite(weights)
+    compact = np.argsort(~valid, axis=-1, kind='stable')
+    weights = np.take_along_axis(np.where(valid, weights, 0.), compact, -1)
+    values = np.broadcast_to(values, weights.shape)
+    values = np.take_along_axis(values, compact, -1)
+    last = np.maximum(valid.sum(axis=-1, keepdims=True) - 1, 0)
+
+    weighted_quantiles = np.cumsum(weights, axis=-1) - 0.5 * weights
+
+    # Cast weighted quantiles to 0-1 To be consistent with np.quantile
+    min_val = weighted_quantiles[..., :1]
+    max_val = np.take_along_axis(weighted_quantiles, last, -1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        weighted_quantiles = (weighted_quantiles - min_val) / max_val
+    weighted_quantiles[np.arange(weights.shape[-1]) > last] = np.inf
+
+    # linear interpolation as np.interp, for each set of weights
+    results = []
+    last_values = np.take_along_axis(values, last, -1)[..., 0]
+    for quantile in quantiles:
+        j_lo = np.sum(weighted_quantiles <= quantile, axis=-1,
+                      keepdims=True) - 1
+        j_hi = np.minimum(j_lo + 1, last)
+        j_lo = np.maximum(j_lo, 0)
+        x_lo, x_hi = (np.take_along_axis(weighted_quantiles, j, -1)[..., 0]
+                      for j in (j_lo, j_hi))
+        y_lo, y_hi = (np.take_along_axis(values, j, -1)[..., 0]
+                      for j in (j_lo, j_hi))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            slope = (y_hi - y_lo) / (x_hi - x_lo)
+            result = slope * (quantile - x_lo) + y_lo
+        result = np.where(quantile < weighted_quantiles[..., 0],
+                          values[..., 0], result)
+        result = np.where(j_lo[..., 0] >= last[..., 0], last_values, result)
+        results.append(result)
+    return np.stack(results, axis=-1)
@@ -9,6 +9,9 @@ import netCDF4
 import numpy as np
 from scipy import signal
 
+# Number of time steps processed at once by the EOF analysis
+NT_BLOCK = 3650
+
 
 def butter_filter(data, freq, lowcut=None, order=2):
     """Function to perform time filtering."""
@@ -29,10 +32,107 @@ def butter_filter(data, freq, lowcut=None, order=2):
     return ysig
 
 
+def lead_eofs(zg_lp, lat, lat_weighting=True, block_size=NT_BLOCK):
+    """Compute the leading EOF and PC of all levels at once.
+
+    The covariance matrices of all levels are accumulated over blocks of
+    `block_size` time steps and diagonalized with a batched symmetric
+    eigensolver, so only one block of anomalies is held in memory.
+
+    Parameters
+    ----------
+    zg_lp: array (time, plev, lat)
+        Low-pass filtered geopotential height.
+    lat: array (lat)
+        Latitudes in degrees.
+    lat_weighting: bool
+        Weight the field by the square root of the cosine of latitude.
+    block_size: int
+        Number of time steps processed at once.
+
+    Returns
+    -------
+    eofs: array (plev, lat)
+        Leading EOF of each level.
+    eigs: array (plev)
+        Fraction of variance explained by the leading EOF.
+    pcs: array (time, plev)
+        Standardized leading PC of each level.
+    """
+    n_tim = zg_lp.shape[0]
+    if lat_weighting:
+        weights = np.sqrt(np.abs(np.cos(np.deg2rad(lat))))
+    else:
+        weights = np.ones(len(lat))
+    zg_mean = np.mean(zg_lp, axis=0) * weights
+
+    def anomalies(start):
+        """Weighted anomalies of a block, (plev, time, lat)."""
+        anom = zg_lp[start:start + block_size] * weights - zg_mean
+        return anom.transpose(1, 0, 2)
+
+    cov = np.zeros(zg_lp.shape[1:] + zg_lp.shape[2:])
+    for start in range(0, n_tim, block_size):
+        anom = anomalies(start)
+        cov += np.matmul(anom.transpose(0, 2, 1), anom)
+    cov /= n_tim - 1
+
+    # Eigenvalues in ascending order, the last one is the largest
+    eigenval, eigenvec = np.linalg.eigh(cov)
+    eigs = eigenval[:, -1] / np.trace(cov, axis1=1, axis2=2)
+    lead_eof = eigenvec[:, :, -1]
+
+    pcs = np.empty((n_tim, zg_lp.shape[1]))
+    for start in range(0, n_tim, block_size):
+        pcs[start:start + block_size] = np.matmul(
+            anomalies(start), lead_eof[:, :, np.newaxis])[:, :, 0].T
+
+    # Latitude de-weighting
+    eofs = lead_eof / weights
+
+    # Standardized PCs
+    pcs = (pcs - np.mean(pcs, axis=0)) / np.std(pcs, ddof=1, axis=0)
+
+    # Constrain meridional EOF structure
+    max_lat = np.argmax(lat)
+    min_lat = np.argmin(lat)
+    if np.min(lat) > 0.:
+        flip = eofs[:, max_lat] > eofs[:, min_lat]
+    elif np.min(lat) < 0.:
+        flip = eofs[:, min_lat] > eofs[:, max_lat]
+    else:
+        flip = np.zeros(len(eofs), dtype=bool)
+    sign = np.where(flip, -1., 1.)
+    return eofs * sign[:, np.newaxis], eigs, pcs * sign
+
+
+def month_bounds(date):
+    """Find the first, 15th and last day of each month of daily dates.
+
+    Calendar-independent, the time series can start and end in the middle of
+    a month. Only months that contain a 15th are kept.
+    """
+    months = np.array([day.month for day in date])
+    days = np.array([day.day for day in date])
+    new_month = np.ones(len(months), dtype=bool)
+    new_month[1:] = months[1:] != months[:-1]
+    sta_mon = np.flatnonzero(new_month)
+    end_mon = np.append(sta_mon[1:] - 1, len(months) - 1)
+    mid_mon = np.flatnonzero(days == 15)
+    i_mon = np.searchsorted(sta_mon, mid_mon, side='right') - 1
+    return sta_mon[i_mon], mid_mon, end_mon[i_mon]
+
+
+def monthly_means(pcs, sta_mon, end_mon):
+    """Average daily values between the first and last day of each month."""
+    sums = np.cumsum(pcs, axis=0)
+    sums = np.concatenate([np.zeros((1, ) + pcs.shape[1:]), sums])
+    counts = end_mon - sta_mon + 1
+    return (sums[end_mon + 1] - sums[sta_mon]) / counts[:, np.newaxis]
+
+
 def zmnam_calc(da_fname, outdir, src_props):
     """Function to do EOF/PC decomposition of zg field."""
-    deg_to_r = np.pi / 180.
-    lat_weighting = True
     outfiles = []
 
     # Note: daily/monthly means have been
@@ -69,114 +169,25 @@ def zmnam_calc(da_fname, outdir, src_props):
 
         zg_da = np.squeeze(np.array(in_file.variables['zg'][:], dtype='d'))
 
-    n_tim = len(time_dim)
     print('end infile close')
 
     # Start zmNAM index calculation
 
     # Lowpass filter
     zg_da_lp = butter_filter(zg_da, 1, lowcut=1. / 90, order=2)
+    del zg_da
 
-    # Outputs: stored by level
-    # EOFs, eigenvalues, daily and monthly PCs
-    eofs = np.zeros((len(lev), len(lat)), dtype='d')
-    eigs = np.zeros(len(lev), dtype='d')
-    pcs_da = np.zeros((n_tim, len(lev)), dtype='d')
+    # EOFs, eigenvalues, daily and monthly PCs, stored by level
+    eofs, eigs, pcs_da = lead_eofs(zg_da_lp, lat)
+    if np.min(lat) > 0.:
+        index_name = 'NAM'
+    else:
+        index_name = 'SAM'
 
     # Calendar-independent monthly mean
-    sta_mon = []  # first day of the month
-    mid_mon = []  # 15th of the month
-    end_mon = []  # last day of the month (add +1 when slicing)
-
-    mon = 999
-    idate = 0
-
-    while idate < len(date):
-
-        # Save first day of the month
-        if date[idate].month != mon:
-            mon = date[idate].month
-            sta_mon.append(idate)
-
-        # Save month mid-day
-        if date[idate].day == 15:
-            mid_mon.append(idate)
-
-        # Save last day of the month
-        if idate == len(date) - 1 or (date[idate].month == mon and
-                                      date[idate + 1].month != mon):
-            end_mon.append(idate)
-
-        idate += 1
-
-    pcs_mo = np.zeros((len(date[mid_mon]), len(lev)), dtype='d')
-
-    # Perform analysis by level
-    for i_lev in np.arange(len(lev)):
-        # Latitude weighting
-        if lat_weighting is True:
-            for j_lat in np.arange(len(lat)):
-                zg_da_lp[:, i_lev,
-                         j_lat] *= np.sqrt(abs(np.cos(lat[j_lat] * deg_to_r)))
-
-        zg_da_lp_an = zg_da_lp[:, i_lev, :] - np.mean(zg_da_lp[:, i_lev, :],
-                                                      axis=0)
-        cov = np.dot(zg_da_lp_an.T, zg_da_lp_an) / (n_tim - 1)
-
-        # Compute eigenvectors and eigenvalues
-        eigenval, eigenvec = np.linalg.eig(cov)
-
-        sum_eigenval = np.sum(eigenval)
-
-        eigenval_norm = eigenval[:] / sum_eigenval
-
-        # Largest eigenvalue
-        max_eigenval = eigenval_norm.argmax()
-
-        # PC calculation
-        pc = np.dot(zg_da_lp_an[:, :], eigenvec)
-
-        # Latitude de-weighting
-        if lat_weighting is True:
-            for i_lat in np.arange(len(lat)):
-                eigenvec[i_lat, :] /= np.sqrt(
-                    abs(np.cos(lat[i_lat] * deg_to_r)))
-
-        # Retain leading standardized PC & EOF
-        lead_pc_mean = np.mean(pc[:, max_eigenval], axis=0)
-        lead_pc_std = np.std(pc[:, max_eigenval], ddof=1, axis=0)
-        lead_pc = (pc[:, max_eigenval] - lead_pc_mean) / lead_pc_std
-        lead_eof = eigenvec[:, max_eigenval]
-
-        # Constrain meridional EOF structure
-        max_lat = max(range(len(lat)), key=lambda x: lat[x])
-        min_lat = min(range(len(lat)), key=lambda x: lat[x])
-
-        if np.min(lat) > 0. and (lead_eof[max_lat] > lead_eof[min_lat]):
-            lead_pc *= -1
-            lead_eof *= -1
-            index_name = 'NAM'
-
-        if np.min(lat) < 0. and (lead_eof[min_lat] > lead_eof[max_lat]):
-            lead_pc *= -1
-            lead_eof *= -1
-            index_name = 'SAM'
-
-        lead_pc_mo = np.zeros(len(date[mid_mon]), dtype='d')
-        time_mo = np.zeros(len(date[mid_mon]), dtype='d')
-
-        # print(lead_pc)
-
-        for k_mo in range(len(date[mid_mon])):
-            lead_pc_mo[k_mo] = np.mean(lead_pc[sta_mon[k_mo]:end_mon[k_mo] +
-                                               1])
-            time_mo[k_mo] = time[mid_mon[k_mo]]
-
-        # Store PC/EOF for this level (no time dependent)
-        eigs[i_lev] = eigenval_norm[max_eigenval]
-        eofs[i_lev, :] = lead_eof
-        pcs_da[:, i_lev] = lead_pc
-        pcs_mo[:, i_lev] = lead_pc_mo
+    sta_mon, mid_mon, end_mon = month_bounds(date)
+    pcs_mo = monthly_means(pcs_da, sta_mon, end_mon)
+    time_mo = time[mid_mon]
 
     # Save output files
 
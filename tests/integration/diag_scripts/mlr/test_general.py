@@ -3,9 +3,17 @@
 import os
 from unittest import mock
 
+import iris
+import numpy as np
+import pandas as pd
 import pytest
 import yaml
+from lime.lime_tabular import LimeTabularExplainer
+from sklearn.linear_model import LinearRegression
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import StandardScaler
 
+from esmvaltool.diag_scripts.mlr import models as mlr_models
 from esmvaltool.diag_scripts.mlr.models import MLRModel
 
 # Load test configuration
@@ -87,3 +95,125 @@ class TestMLRModel():
         mock_mlr_model_init.reset_mock()
         mock_logger.reset_mock()
         MLRModel._MODELS = {}
+
+
+FEATURES = np.array(['a', 'b', 'c'])
+COEFS = np.array([1.0, -2.0, 0.5])
+
+
+def _fitted_mlr_model(linear_prediction):
+    """Get :class:`MLRModel` with a fitted linear pipeline."""
+    rng = np.random.default_rng(0)
+    x_train = pd.DataFrame(rng.normal(size=(100, 3)) * [1.0, 2.0, 3.0],
+                           columns=FEATURES)
+    y_train = x_train.values @ COEFS + 1.0
+    mlr_model = object.__new__(MLRModel)
+    mlr_model._LINEAR_PREDICTION = linear_prediction
+    mlr_model._cfg = {'dtype': np.float64, 'n_jobs': 1}
+    mlr_model._classes = {
+        'features': pd.DataFrame({'categorical': [False, False, False]},
+                                 index=FEATURES),
+    }
+    mlr_model._clf = Pipeline([('x_scaler', StandardScaler()),
+                               ('final', LinearRegression())])
+    mlr_model._clf.fit(x_train, y_train)
+    mlr_model._lime_explainer = LimeTabularExplainer(
+        x_train.values,
+        mode='regression',
+        training_labels=y_train,
+        feature_names=FEATURES,
+        discretize_continuous=False,
+        sample_around_instance=True,
+        random_state=0,
+    )
+    return mlr_model
+
+
+@pytest.mark.parametrize('linear_prediction', [True, False])
+def test_lime_coefficients(linear_prediction):
+    """Test local coefficients of linear model (exact and using LIME)."""
+    mlr_model = _fitted_mlr_model(linear_prediction)
+    x_pred = pd.DataFrame(np.arange(12.0).reshape(4, 3), columns=FEATURES)
+    x_err = pd.DataFrame(np.ones((4, 3)), columns=FEATURES)
+    scale = mlr_model._lime_explainer.scaler.scale_
+    rtol = 1e-10 if linear_prediction else 1e-2
+
+    lime_coefs = mlr_model._get_lime_coefficients(x_pred)
+    assert lime_coefs.shape == (4, 3)
+    np.testing.assert_allclose(lime_coefs,
+                               np.broadcast_to(COEFS * scale, (4, 3)),
+                               rtol=rtol)
+
+    importance = mlr_model._get_lime_feature_importance(
+        x_pred, lime_coefs=lime_coefs)
+    expected = np.abs(COEFS * scale) / np.sum(np.abs(COEFS * scale))
+    for (feature, value) in zip(FEATURES, expected):
+        np.testing.assert_allclose(importance[feature], value, rtol=rtol)
+
+    errors = mlr_model._propagate_input_errors(x_pred, x_err,
+                                               lime_coefs=lime_coefs)
+    np.testing.assert_allclose(errors, np.sum(COEFS**2), rtol=rtol)
+
+
+@mock.patch.object(MLRModel, '_load_lime_explainer', autospec=True)
+def test_save_and_load_fitted_pipeline(mock_load_lime_explainer, tmp_path):
+    """Test reusing a fitted pipeline."""
+    mlr_model = _fitted_mlr_model(True)
+    path = str(tmp_path / 'pipeline.joblib')
+    mlr_model.save_fitted_pipeline(path)
+
+    new_mlr_model = _fitted_mlr_model(True)
+    new_mlr_model._clf = Pipeline([('x_scaler', StandardScaler()),
+                                   ('final', LinearRegression())])
+    new_mlr_model.load_fitted_pipeline(path)
+    x_pred = pd.DataFrame(np.arange(12.0).reshape(4, 3), columns=FEATURES)
+    np.testing.assert_allclose(new_mlr_model._clf.predict(x_pred),
+                               mlr_model._clf.predict(x_pred))
+    mock_load_lime_explainer.assert_called_once_with(new_mlr_model)
+
+
+def test_load_cube_cache(monkeypatch, tmp_path):
+    """Test that cubes are read once and copied for every MLR model."""
+    path = str(tmp_path / 'x.nc')
+    iris.save(iris.cube.Cube(np.arange(3), var_name='x', units='m'), path)
+    dataset = {'filename': path, 'units': 'km', 'var_type': 'feature',
+               'tag': 'X', 'convert_units_to': 'km'}
+    monkeypatch.setattr(mlr_models, '_CUBE_CACHE', {})
+    mlr_model = object.__new__(MLRModel)
+    mlr_model._cfg = {'dtype': np.float32}
+
+    with mock.patch.object(iris, 'load_cube',
+                           wraps=iris.load_cube) as mock_load_cube:
+        cube = mlr_model._load_cube(dataset)
+        cube.data[0] = -1.0
+        cached_cube = mlr_model._load_cube(dataset)
+    mock_load_cube.assert_called_once_with(path)
+    assert cached_cube.dtype == np.float32
+    assert cached_cube.units == 'km'
+    np.testing.assert_allclose(cached_cube.data, [0.0, 0.001, 0.002])
+
+    with pytest.raises(ValueError):
+        mlr_model._load_cube({**dataset, 'units': 'm'})
+
+
+def test_load_cube_cache_invalidated(monkeypatch, tmp_path):
+    """Test that cached cubes are reloaded for changed files and cleared."""
+    path = str(tmp_path / 'x.nc')
+    iris.save(iris.cube.Cube(np.arange(3), var_name='x', units='m'), path)
+    dataset = {'filename': path, 'units': 'm', 'var_type': 'feature',
+               'tag': 'X'}
+    monkeypatch.setattr(mlr_models, '_CUBE_CACHE', {})
+    mlr_model = object.__new__(MLRModel)
+    mlr_model._cfg = {'dtype': np.float64}
+    mlr_model._load_cube(dataset)
+
+    iris.save(iris.cube.Cube(np.arange(3) + 1, var_name='x', units='m'),
+              path)
+    mtime = os.path.getmtime(path) + 1.0
+    os.utime(path, (mtime, mtime))
+    cube = mlr_model._load_cube(dataset)
+    np.testing.assert_allclose(cube.data, [1.0, 2.0, 3.0])
+    assert len(mlr_models._CUBE_CACHE) == 2
+
+    MLRModel.clear_cube_cache()
+    assert mlr_models._CUBE_CACHE == {}
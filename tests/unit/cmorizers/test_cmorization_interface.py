@@ -61,3 +61,38 @@ def test_downloaders_have_required_interface():
             error = True
 
     assert not error
+
+
+def test_formatter_tasks_have_required_interface():
+    formatters_folder = os.path.dirname(fdt.__file__)
+    arg_names = ('in_dir', 'out_dir', 'cfg', 'cfg_user', 'start_date',
+                 'end_date')
+    unused_arg_names = ('_', '__', '___')
+
+    error = False
+
+    for formatter in os.listdir(formatters_folder):
+        if not formatter.endswith('.py') or formatter == '__init__.py':
+            continue
+        module = formatter[:-3]
+        member = importlib.import_module(
+            f".{module}",
+            package="esmvaltool.cmorizers.data.formatters.datasets")
+        has_hooks = [
+            hasattr(member, name) for name in ('get_tasks', 'run_task')
+        ]
+        if not any(has_hooks):
+            continue
+        try:
+            assert all(has_hooks)
+            for name, expected in (('get_tasks', arg_names),
+                                   ('run_task', arg_names + ('task', ))):
+                spec = inspect.getfullargspec(member.__getattribute__(name))
+                assert len(spec.args) == len(expected)
+                for x, arg in enumerate(spec.args):
+                    assert arg == expected[x] or arg in unused_arg_names
+        except AssertionError:
+            print(f'Bad task functions in '
+                  f'{os.path.join(formatters_folder, formatter)}')
+            error = True
+    assert not error
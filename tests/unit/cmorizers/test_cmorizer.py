@@ -0,0 +1,206 @@
+"""Tests for :mod:`esmvaltool.cmorizers.data.cmorizer`."""
+
+import os
+import types
+from unittest.mock import MagicMock, Mock
+
+import iris
+import numpy as np
+import pytest
+
+from esmvaltool.cmorizers.data import cmorizer, utilities
+from esmvaltool.cmorizers.data.cmorizer import _Formatter
+from esmvaltool.cmorizers.data.downloaders.downloader import BaseDownloader
+
+ATTRIBUTES = {
+    'project_id': 'OBS6',
+    'dataset_id': 'DATASET',
+    'modeling_realm': 'sat',
+    'version': 'v1',
+    'mip': 'Amon',
+}
+
+
+def _get_units(tmp_path, names):
+    return [{
+        'dataset': 'DATASET',
+        'name': name,
+        'tier': 'Tier2',
+        'in_dir': str(tmp_path),
+        'out_dir': str(tmp_path),
+        'script': __file__,
+        'task': {'name': name, 'in_files': [str(tmp_path / f'{name}.raw')]},
+        'period': 'None/None',
+        'record': False,
+    } for name in names]
+
+
+def _run_pyt_script(in_dir, out_dir, dataset, start, end, task):
+    if task['name'] == 'bad':
+        raise ValueError('failed')
+    utilities.save_variable(
+        iris.cube.Cube(np.zeros(2, dtype=np.float32), var_name='tas'),
+        task['name'], out_dir, ATTRIBUTES)
+    return True
+
+
+def test_run_units(tmp_path, monkeypatch):
+    formatter = _Formatter({})
+    formatter.config = Mock(run_dir=str(tmp_path / 'run'))
+    monkeypatch.setattr(formatter, '_run_pyt_script', _run_pyt_script)
+    units = _get_units(tmp_path, ['good', 'bad'])
+
+    results = formatter._run_units(units, None, None, 1)
+
+    assert results == [{}, None]
+    for name in ('good', 'bad'):
+        assert (tmp_path / 'run' / 'DATASET' / f'{name}.log').exists()
+    log = (tmp_path / 'run' / 'DATASET' / 'bad.log').read_text()
+    assert 'Formatting task bad failed' in log
+    assert not formatter._finish_dataset('DATASET', units, results, False)
+    assert formatter._finish_dataset('DATASET', units[:1], results[:1],
+                                     False)
+
+
+def _get_incremental_formatter(tmp_path, monkeypatch):
+    formatter = _Formatter({})
+    formatter.config = MagicMock(run_dir=str(tmp_path / 'run'))
+    formatter.config.__getitem__.return_value = {
+        'OBS': [str(tmp_path / 'obs')],
+        'default': [str(tmp_path / 'default')],
+    }
+    monkeypatch.setattr(formatter, '_run_pyt_script', _run_pyt_script)
+
+    def _format(names, session, install):
+        out_dir = tmp_path / 'output' / session / 'Tier2' / 'DATASET'
+        out_dir.mkdir(parents=True)
+        units = _get_units(tmp_path, names)
+        for unit in units:
+            unit['out_dir'] = str(out_dir)
+        manifest, changed = formatter._skip_unchanged_units(
+            'DATASET', units, install)
+        results = iter(formatter._run_units(changed, None, None, 1))
+        results = [
+            manifest[unit['name']] if unit['name'] in manifest else
+            next(results) for unit in units
+        ]
+        assert formatter._finish_dataset('DATASET', units, results, install,
+                                         manifest)
+        return [unit['name'] for unit in changed]
+
+    return _format
+
+
+def test_incremental_format(tmp_path, monkeypatch):
+    _format = _get_incremental_formatter(tmp_path, monkeypatch)
+
+    for name in ('jan', 'feb'):
+        (tmp_path / f'{name}.raw').write_text(name)
+    assert _format(['jan', 'feb'], 'session1', True) == ['jan', 'feb']
+    installed = tmp_path / 'obs' / 'Tier2' / 'DATASET'
+    assert (installed / utilities.MANIFEST_FILENAME).exists()
+
+    # Nothing changed
+    assert _format(['jan', 'feb'], 'session2', True) == []
+
+    # New and modified input
+    (tmp_path / 'feb.raw').write_text('february')
+    (tmp_path / 'mar.raw').write_text('mar')
+    assert _format(['jan', 'feb', 'mar'], 'session3', True) == ['feb', 'mar']
+    manifest = utilities.read_manifest(str(installed))
+    assert sorted(manifest) == ['feb', 'jan', 'mar']
+    for name in ('jan', 'feb', 'mar'):
+        assert (installed / f'OBS6_DATASET_sat_v1_Amon_{name}.nc').exists()
+
+
+def test_incremental_format_without_install(tmp_path, monkeypatch):
+    _format = _get_incremental_formatter(tmp_path, monkeypatch)
+
+    for name in ('jan', 'feb'):
+        (tmp_path / f'{name}.raw').write_text(name)
+    assert _format(['jan', 'feb'], 'session1', False) == ['jan', 'feb']
+    assert not (tmp_path / 'obs').exists()
+
+    # The output of the previous run is reused
+    (tmp_path / 'feb.raw').write_text('february')
+    assert _format(['jan', 'feb'], 'session2', False) == ['feb']
+    out_dir = tmp_path / 'output' / 'session2' / 'Tier2' / 'DATASET'
+    manifest = utilities.read_manifest(str(out_dir))
+    assert sorted(manifest) == ['feb', 'jan']
+    for name in ('jan', 'feb'):
+        assert (out_dir / f'OBS6_DATASET_sat_v1_Amon_{name}.nc').exists()
+
+    # Installing the output of the previous run
+    assert _format(['jan', 'feb'], 'session3', True) == []
+    installed = tmp_path / 'obs' / 'Tier2' / 'DATASET'
+    assert sorted(utilities.read_manifest(str(installed))) == ['feb', 'jan']
+    for name in ('jan', 'feb'):
+        assert (installed / f'OBS6_DATASET_sat_v1_Amon_{name}.nc').exists()
+
+
+def test_max_parallel_tasks():
+    formatter = _Formatter({})
+    formatter.config = {}
+    assert formatter.max_parallel_tasks is None
+    formatter.config = {'max_parallel_tasks': 4}
+    assert formatter.max_parallel_tasks == 4
+
+
+def test_default_parallel_tasks(monkeypatch):
+    modules = {
+        'esmvaltool.cmorizers.data.formatters.datasets.era_interim':
+        types.SimpleNamespace(DEFAULT_MAX_PARALLEL_TASKS=3),
+        'esmvaltool.cmorizers.data.formatters.datasets.woa':
+        types.SimpleNamespace(),
+    }
+    monkeypatch.setattr(cmorizer, 'importlib',
+                        types.SimpleNamespace(import_module=modules.get))
+    unit = {'script': '/formatters/era_interim.py', 'task': None}
+    assert _Formatter._get_default_parallel_tasks(unit) == 1
+    unit['task'] = {'variable': 'tas', 'year': 2000}
+    assert _Formatter._get_default_parallel_tasks(unit) == 3
+    unit['script'] = '/formatters/woa.py'
+    assert _Formatter._get_default_parallel_tasks(unit) == 1
+
+
+def test_get_units_fails(tmp_path, monkeypatch):
+    (tmp_path / 'rawobs' / 'Tier3' / 'ERA-Interim').mkdir(parents=True)
+    formatter = _Formatter({})
+    formatter.config = MagicMock(session_dir=str(tmp_path / 'out'))
+    formatter.config.__getitem__.return_value = {
+        'RAWOBS': [str(tmp_path / 'rawobs')],
+    }
+
+    def get_tasks(*_):
+        raise FileNotFoundError('missing input files')
+
+    module = types.SimpleNamespace(get_tasks=get_tasks, run_task=None)
+    monkeypatch.setattr(
+        cmorizer, 'importlib',
+        types.SimpleNamespace(import_module=lambda *_, **__: module))
+    cwd = os.getcwd()
+
+    assert formatter._get_units('ERA-Interim', None, None) is None
+    assert os.getcwd() == cwd
+
+
+def test_download_dataset_closes_downloaders(monkeypatch):
+    downloaders = []
+
+    def download_dataset(config, dataset, dataset_info, *_):
+        downloader = BaseDownloader(config, dataset, dataset_info, False)
+        downloader.close = Mock()
+        downloaders.append(downloader)
+        raise ValueError('failed')
+
+    formatter = _Formatter({'datasets': {'DATASET': {'tier': 2}}})
+    formatter.config = {}
+    monkeypatch.setattr(formatter, 'has_downloader', lambda _: True)
+    module = types.SimpleNamespace(download_dataset=download_dataset)
+    monkeypatch.setattr(
+        cmorizer, 'importlib',
+        types.SimpleNamespace(import_module=lambda *_, **__: module))
+
+    with pytest.raises(ValueError):
+        formatter.download_dataset('DATASET', None, None, False)
+    downloaders[0].close.assert_called_once_with()
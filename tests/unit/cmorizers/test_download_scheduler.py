@@ -0,0 +1,83 @@
+"""Tests for :mod:`esmvaltool.cmorizers.data.downloaders.scheduler`."""
+
+import threading
+import time
+
+import pytest
+
+from esmvaltool.cmorizers.data.downloaders.scheduler import (
+    DownloadManifest,
+    DownloadScheduler,
+)
+
+
+def test_map_keeps_order():
+    scheduler = DownloadScheduler(max_workers=4)
+    assert scheduler.map(lambda x: x * 2, range(10)) == list(range(0, 20, 2))
+
+
+def test_map_runs_all_tasks_before_raising():
+    scheduler = DownloadScheduler(max_workers=3)
+    done = []
+
+    def _task(item):
+        if item == 0:
+            raise ValueError('failed')
+        time.sleep(0.01)
+        done.append(item)
+
+    with pytest.raises(ValueError):
+        scheduler.map(_task, range(5))
+    assert sorted(done) == [1, 2, 3, 4]
+
+
+def test_host_slot_limits_concurrency():
+    scheduler = DownloadScheduler(max_workers=8, max_per_host=2)
+    lock = threading.Lock()
+    active = {'now': 0, 'max': 0}
+
+    def _task(_):
+        with scheduler.host_slot('https://example.com/file.nc'):
+            with lock:
+                active['now'] += 1
+                active['max'] = max(active['max'], active['now'])
+            time.sleep(0.01)
+            with lock:
+                active['now'] -= 1
+
+    scheduler.map(_task, range(8))
+    assert active['max'] == 2
+
+
+@pytest.mark.parametrize('server_path, host', [
+    ('https://example.com/data/file.nc', 'example.com'),
+    ('ftp://user@ftp.example.com/file.nc', 'ftp.example.com'),
+    ('ftp.example.com', 'ftp.example.com'),
+])
+def test_get_host(server_path, host):
+    assert DownloadScheduler.get_host(server_path) == host
+
+
+def test_manifest(tmp_path):
+    path = str(tmp_path / 'manifests' / 'manifest.jsonl')
+    local_path = tmp_path / 'file.nc'
+    local_path.write_bytes(b'1234')
+
+    manifest = DownloadManifest(path)
+    assert not manifest.is_complete('remote/file.nc', str(local_path))
+    manifest.set_listing('remote', ['file.nc', 'other.nc'])
+    manifest.mark_complete('remote/file.nc', str(local_path))
+
+    # Simulate an interrupted write
+    with open(path, 'a', encoding='utf-8') as manifest_file:
+        manifest_file.write('{"source": "remote/oth')
+
+    reloaded = DownloadManifest(path)
+    assert reloaded.is_complete('remote/file.nc', str(local_path))
+    assert reloaded.get_listing('remote') == ['file.nc', 'other.nc']
+
+    local_path.write_bytes(b'12')
+    assert not reloaded.is_complete('remote/file.nc', str(local_path))
+
+    reloaded.set_listing('remote', ['file.nc', 'other.nc'], complete=True)
+    assert reloaded.get_listing('remote') is None
@@ -0,0 +1,135 @@
+"""Tests for :mod:`esmvaltool.cmorizers.data.downloaders.ftp`."""
+
+import socket
+import threading
+
+import pytest
+
+from esmvaltool.cmorizers.data.downloaders import scheduler
+from esmvaltool.cmorizers.data.downloaders.downloader import close_downloaders
+from esmvaltool.cmorizers.data.downloaders.ftp import (
+    FTPDownloader,
+    FTPSessionPool,
+)
+
+pyftpdlib_servers = pytest.importorskip('pyftpdlib.servers')
+pyftpdlib_handlers = pytest.importorskip('pyftpdlib.handlers')
+pyftpdlib_authorizers = pytest.importorskip('pyftpdlib.authorizers')
+
+N_FILES = 12
+
+
+@pytest.fixture
+def ftp_server(tmp_path):
+    """Serve a folder with some files through a local FTP server."""
+    remote = tmp_path / 'remote'
+    for year in ('2000', '2001'):
+        (remote / year).mkdir(parents=True)
+        for i in range(N_FILES):
+            (remote / year / f'file_{i:02d}.nc').write_bytes(
+                bytes(range(256)) * (i + 1))
+    (remote / '2001' / 'README').write_text('not data')
+
+    authorizer = pyftpdlib_authorizers.DummyAuthorizer()
+    authorizer.add_anonymous(str(remote))
+    handler = pyftpdlib_handlers.FTPHandler
+    handler.authorizer = authorizer
+    server = pyftpdlib_servers.ThreadedFTPServer(('127.0.0.1', 0), handler)
+    thread = threading.Thread(target=server.serve_forever,
+                              kwargs={'timeout': 0.1})
+    thread.start()
+    yield server.address[1], remote
+    server.close_all()
+    thread.join()
+
+
+@pytest.fixture
+def parallel_scheduler():
+    """Use four download workers."""
+    yield scheduler.configure_scheduler(max_workers=4, max_per_host=3)
+    scheduler.configure_scheduler()
+
+
+def _get_downloader(tmp_path, port, overwrite=False):
+    config = {'rootpath': {'RAWOBS': [str(tmp_path / 'rawobs')]}}
+    return FTPDownloader(config, '127.0.0.1', 'DATASET', {'tier': 2},
+                         overwrite, port=port)
+
+
+def test_download_folder(tmp_path, ftp_server, parallel_scheduler):
+    port, remote = ftp_server
+    downloader = _get_downloader(tmp_path, port)
+    downloader.connect()
+    assert sorted(downloader.list_folders()) == ['2000', '2001']
+    assert downloader.exists('2000')
+    downloader.set_cwd('2001')
+    downloader.download_folder('.', filter_files=r'.*\.nc')
+    downloader.close()
+
+    local = tmp_path / 'rawobs' / 'Tier2' / 'DATASET'
+    downloaded = sorted(path.name for path in local.iterdir())
+    assert downloaded == [f'file_{i:02d}.nc' for i in range(N_FILES)]
+    for i in range(N_FILES):
+        assert ((local / f'file_{i:02d}.nc').read_bytes() ==
+                (remote / '2001' / f'file_{i:02d}.nc').read_bytes())
+
+
+def test_resume_partial_download(tmp_path, ftp_server, parallel_scheduler):
+    port, remote = ftp_server
+    local = tmp_path / 'rawobs' / 'Tier2' / 'DATASET'
+    local.mkdir(parents=True)
+    expected = (remote / '2000' / 'file_05.nc').read_bytes()
+    (local / 'file_05.nc.part').write_bytes(expected[:100])
+
+    downloader = _get_downloader(tmp_path, port)
+    downloader.connect()
+    downloader.set_cwd('2000')
+    downloader.download_file('file_05.nc')
+    downloader.close()
+
+    assert (local / 'file_05.nc').read_bytes() == expected
+    assert not (local / 'file_05.nc.part').exists()
+
+
+def test_session_pool_reconnects(ftp_server):
+    port, _ = ftp_server
+    pool = FTPSessionPool('127.0.0.1', size=2, port=port, keepalive=0)
+    pool.cwd = '/2000'
+    with pool.session() as client:
+        first = client
+        assert client.pwd() == '/2000'
+    first.sock.shutdown(socket.SHUT_RDWR)
+
+    # The broken session is detected with NOOP and replaced
+    with pool.session() as client:
+        assert client is not first
+        assert client.pwd() == '/2000'
+    pool.close()
+
+
+def test_session_pool_closes_borrowed_sessions(ftp_server):
+    port, _ = ftp_server
+    pool = FTPSessionPool('127.0.0.1', size=2, port=port, timeout=5)
+    with pool.session() as first:
+        with pool.session() as second:
+            pass
+    with pool.session() as borrowed:
+        assert borrowed.sock.gettimeout() == 5
+        pool.close()
+        assert first.sock is None
+        assert second.sock is None
+
+    # The closed session is not handed out again
+    with pool.session() as client:
+        assert client is not borrowed
+        assert client.pwd() == '/'
+    pool.close()
+
+
+def test_close_downloaders(tmp_path, ftp_server):
+    port, _ = ftp_server
+    downloader = _get_downloader(tmp_path, port)
+    downloader.connect()
+    close_downloaders('DATASET')
+    assert downloader._client is None
+    assert downloader._pool is None
@@ -1,5 +1,9 @@
 """Tests for the module :mod:`esmvaltool.cmorizers.data.utilities`."""
 
+import gzip
+import os
+import shutil
+import tarfile
 from unittest.mock import Mock
 
 import dask.array as da
@@ -338,3 +342,208 @@ def test_read_cmor_config():
     assert 'thetao' in cfg['variables']
     assert 'Omon' in cfg['cmor_table'].tables
     assert 'thetao' in cfg['cmor_table'].tables['Omon']
+
+
+def test_save_variable_records_files(tmp_path):
+    """Test recording of the files written by save_variable."""
+    cube = iris.cube.Cube(np.zeros(2, dtype=np.float32), var_name='thetao')
+    attrs = {
+        'project_id': 'OBS6',
+        'dataset_id': 'DATASET',
+        'modeling_realm': 'sat',
+        'version': 'v1',
+        'mip': 'Omon',
+    }
+    with utils.record_saved_files() as saved_files:
+        utils.save_variable(cube, 'thetao', str(tmp_path), attrs)
+    assert len(saved_files) == 1
+    assert saved_files[0].startswith(str(tmp_path))
+    utils.save_variable(cube, 'so', str(tmp_path), attrs)
+    assert len(saved_files) == 1
+
+
+def _get_time_series_cube(lazy):
+    """Get a cube with time, latitude and longitude dimensions."""
+    data = np.arange(10 * 20 * 30, dtype=np.float32).reshape(10, 20, 30)
+    time = iris.coords.DimCoord(np.arange(10.),
+                                standard_name='time',
+                                units='days since 2000-01-01')
+    lat = iris.coords.DimCoord(np.linspace(-80., 80., 20),
+                               standard_name='latitude',
+                               units='degrees')
+    lon = iris.coords.DimCoord(np.linspace(0., 348., 30),
+                               standard_name='longitude',
+                               units='degrees')
+    return iris.cube.Cube(np_to_da(data, lazy),
+                          var_name='tas',
+                          units='K',
+                          dim_coords_and_dims=[(time, 0), (lat, 1),
+                                               (lon, 2)])
+
+
+@pytest.mark.parametrize('chunking,chunk_size,expected', [
+    ('map', 4, (1, 20, 30)),
+    ('timeseries', 4, (10, 20, 30)),
+    ('timeseries', 10 * 4 * 2**-20, (10, 1, 1)),
+    ('map', 100 * 4 * 2**-20, (1, 8, 12)),
+    ({'latitude': 5}, 4, (10, 5, 30)),
+])
+def test_get_chunksizes(chunking, chunk_size, expected):
+    """Test the chunk shapes of the output profiles."""
+    cube = _get_time_series_cube(lazy=False)
+    assert utils.get_chunksizes(cube, chunking, chunk_size) == expected
+
+
+def test_get_chunksizes_invalid():
+    """Test unknown chunking."""
+    cube = _get_time_series_cube(lazy=False)
+    with pytest.raises(ValueError):
+        utils.get_chunksizes(cube, 'random')
+
+
+@pytest.mark.parametrize('lazy', [True, False])
+def test_save_variable_output_profile(tmp_path, lazy):
+    """Test saving with a chunked, compressed and packed output profile."""
+    cube = _get_time_series_cube(lazy)
+    attrs = {
+        'project_id': 'OBS6',
+        'dataset_id': 'DATASET',
+        'modeling_realm': 'atmos',
+        'version': 'v1',
+        'mip': 'day',
+    }
+    profile = {
+        'compression': 'zlib',
+        'complevel': 2,
+        'chunking': {'time': 2},
+        'packing': 'int16',
+    }
+    with utils.record_saved_files() as saved_files:
+        with utils.output_profile(profile):
+            utils.save_variable(cube, 'tas', str(tmp_path), attrs)
+    assert cube.has_lazy_data() == lazy
+
+    netcdf4 = pytest.importorskip('netCDF4')
+    with netcdf4.Dataset(saved_files[0]) as dataset:
+        var = dataset.variables['tas']
+        assert var.dtype == np.int16
+        assert var.chunking() == [2, 20, 30]
+        assert var.filters()['zlib']
+        assert var.filters()['complevel'] == 2
+    loaded = iris.load_cube(saved_files[0])
+    np.testing.assert_allclose(loaded.data,
+                               cube.data,
+                               atol=loaded.attributes.get('scale_factor', 1.))
+
+
+def test_save_variable_invalid_profile(tmp_path):
+    """Test unsupported compression."""
+    cube = _get_time_series_cube(lazy=False)
+    with utils.output_profile({'compression': 'lzma'}):
+        with pytest.raises(ValueError):
+            utils.save_variable(cube, 'tas', str(tmp_path), {})
+
+
+def test_have_inputs_changed(tmp_path):
+    """Test the detection of modified input files."""
+    in_file = tmp_path / 'input.nc'
+    in_file.write_bytes(b'data')
+    paths = [str(in_file)]
+    fingerprints = utils.get_fingerprints(paths)
+    assert fingerprints[str(in_file)]['size'] == 4
+
+    utils.write_manifest(str(tmp_path), {'unit': {'inputs': fingerprints}})
+    recorded = utils.read_manifest(str(tmp_path))['unit']['inputs']
+    assert not utils.have_inputs_changed(paths, recorded)
+
+    # Touched but not modified
+    stat = in_file.stat()
+    os.utime(in_file, (stat.st_atime, stat.st_mtime + 10))
+    assert not utils.have_inputs_changed(paths, recorded)
+
+    in_file.write_bytes(b'dota')
+    assert utils.have_inputs_changed(paths, recorded)
+    assert utils.have_inputs_changed(paths + ['other.nc'], recorded)
+
+
+def test_read_manifest_missing(tmp_path):
+    """Test reading a manifest that does not exist."""
+    assert utils.read_manifest(str(tmp_path)) == {}
+
+
+def _create_tar(path, files):
+    """Create a tar file with the given files."""
+    with tarfile.open(path, 'w:gz' if path.suffix == '.tgz' else 'w') as tar:
+        for file in files:
+            tar.add(file, arcname=os.path.join('nested', file.name))
+            file.unlink()
+
+
+def test_unpack_files_in_folder(tmp_path):
+    """Test unpacking of nested archives and folders."""
+    for i in range(4):
+        with gzip.open(tmp_path / f'day_{i}.nc.gz', 'wb') as file:
+            file.write(f'day {i}'.encode())
+    _create_tar(tmp_path / 'inner.tar',
+                [tmp_path / 'day_2.nc.gz', tmp_path / 'day_3.nc.gz'])
+    _create_tar(tmp_path / 'outer.tgz', [tmp_path / 'inner.tar'])
+    (tmp_path / 'subdir').mkdir()
+    (tmp_path / 'subdir' / 'readme.txt').write_text('readme')
+
+    utils.unpack_files_in_folder(str(tmp_path), max_workers=2)
+
+    assert sorted(os.listdir(tmp_path)) == [
+        'day_0.nc', 'day_1.nc', 'day_2.nc', 'day_3.nc', 'readme.txt'
+    ]
+    assert (tmp_path / 'day_3.nc').read_text() == 'day 3'
+
+
+def test_unpack_files_in_folder_same_name(tmp_path):
+    """Test that files with the same name are not overwritten."""
+    for name in ('first', 'second'):
+        (tmp_path / 'day_0.nc').write_text(name)
+        _create_tar(tmp_path / f'{name}.tar', [tmp_path / 'day_0.nc'])
+
+    with pytest.raises(FileExistsError) as exc:
+        utils.unpack_files_in_folder(str(tmp_path), max_workers=2)
+
+    # The archive that was unpacked last and its extracted files are kept
+    unpacked = (tmp_path / 'day_0.nc').read_text()
+    kept = 'second' if unpacked == 'first' else 'first'
+    work_dirs = [path for path in tmp_path.iterdir() if path.is_dir()]
+    assert len(work_dirs) == 1
+    assert str(work_dirs[0]) in str(exc.value)
+    assert (work_dirs[0] / 'nested' / 'day_0.nc').read_text() == kept
+    assert sorted(path.name for path in tmp_path.iterdir()) == sorted(
+        ['day_0.nc', f'{kept}.tar', work_dirs[0].name])
+    with tarfile.open(tmp_path / f'{kept}.tar') as tar:
+        assert tar.getnames() == ['nested/day_0.nc']
+
+
+def test_unpack_files_in_folder_move_fails(tmp_path, monkeypatch):
+    """Test that no placeholders are left if moving a file fails."""
+    (tmp_path / 'day_0.nc').write_text('day 0')
+    _create_tar(tmp_path / 'days.tar', [tmp_path / 'day_0.nc'])
+    monkeypatch.setattr(os, 'replace', Mock(side_effect=OSError))
+
+    with pytest.raises(OSError):
+        utils.unpack_files_in_folder(str(tmp_path))
+    assert (tmp_path / 'days.tar').exists()
+    assert not (tmp_path / 'day_0.nc').exists()
+
+
+def test_unpack_files_in_folder_same_name_in_archive(tmp_path):
+    """Test that files with the same name in an archive are not moved."""
+    for folder in ('a', 'b'):
+        (tmp_path / folder).mkdir()
+        (tmp_path / folder / 'day_0.nc').write_text(folder)
+    with tarfile.open(tmp_path / 'days.tar', 'w') as tar:
+        for folder in ('a', 'b'):
+            tar.add(tmp_path / folder / 'day_0.nc',
+                    arcname=f'{folder}/day_0.nc')
+            shutil.rmtree(tmp_path / folder)
+
+    with pytest.raises(FileExistsError):
+        utils.unpack_files_in_folder(str(tmp_path))
+    assert (tmp_path / 'days.tar').exists()
+    assert not (tmp_path / 'day_0.nc').exists()
@@ -0,0 +1,80 @@
+"""Tests for :mod:`esmvaltool.cmorizers.data.downloaders.wget`."""
+
+import pytest
+
+from esmvaltool.cmorizers.data.downloaders import wget
+from esmvaltool.cmorizers.data.downloaders.wget import WGetDownloader
+
+SERVER_PATH = 'https://example.com/data/file.nc'
+
+
+@pytest.fixture
+def fake_wget(monkeypatch):
+    """Replace wget by a function appending to its output document."""
+    commands = []
+
+    def check_output(command):
+        commands.append(command)
+        output = [
+            arg for arg in command if arg.startswith('--output-document=')
+        ][0].split('=', 1)[1]
+        mode = 'ab' if '--continue' in command else 'wb'
+        with open(output, mode) as file:
+            file.write(b'data')
+        return b''
+
+    monkeypatch.setattr(wget.subprocess, 'check_output', check_output)
+    return commands
+
+
+def _get_downloader(tmp_path, overwrite=False):
+    config = {'rootpath': {'RAWOBS': [str(tmp_path / 'rawobs')]}}
+    return WGetDownloader(config, 'DATASET', {'tier': 2}, overwrite)
+
+
+def test_download_file(tmp_path, fake_wget):
+    downloader = _get_downloader(tmp_path)
+    local_path = tmp_path / 'rawobs' / 'Tier2' / 'DATASET' / 'file.nc'
+
+    downloader.download_file(SERVER_PATH, [])
+
+    assert local_path.read_bytes() == b'data'
+    assert not local_path.with_suffix('.nc.part').exists()
+    assert '--continue' in fake_wget[0]
+    assert downloader.manifest.is_complete(SERVER_PATH, str(local_path))
+
+
+def test_download_file_resumes_part(tmp_path, fake_wget):
+    downloader = _get_downloader(tmp_path)
+    local_path = tmp_path / 'rawobs' / 'Tier2' / 'DATASET' / 'file.nc'
+    local_path.parent.mkdir(parents=True)
+    local_path.with_suffix('.nc.part').write_bytes(b'partial ')
+
+    downloader.download_file(SERVER_PATH, [])
+
+    assert local_path.read_bytes() == b'partial data'
+
+
+def test_download_file_keeps_existing(tmp_path, fake_wget):
+    downloader = _get_downloader(tmp_path)
+    local_path = tmp_path / 'rawobs' / 'Tier2' / 'DATASET' / 'file.nc'
+    local_path.parent.mkdir(parents=True)
+    local_path.write_bytes(b'complete')
+
+    downloader.download_file(SERVER_PATH, [])
+
+    assert local_path.read_bytes() == b'complete'
+    assert fake_wget == []
+
+
+def test_download_file_overwrite(tmp_path, fake_wget):
+    downloader = _get_downloader(tmp_path, overwrite=True)
+    local_path = tmp_path / 'rawobs' / 'Tier2' / 'DATASET' / 'file.nc'
+    local_path.parent.mkdir(parents=True)
+    local_path.write_bytes(b'old')
+    local_path.with_suffix('.nc.part').write_bytes(b'stale ')
+
+    downloader.download_file(SERVER_PATH, [])
+
+    assert local_path.read_bytes() == b'data'
+    assert '--continue' not in fake_wget[0]
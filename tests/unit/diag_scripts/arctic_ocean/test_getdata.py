@@ -0,0 +1,117 @@
+"""Tests for the data extraction of the Arctic Ocean diagnostics."""
+
+import numpy as np
+import pytest
+from netCDF4 import Dataset
+from scipy.sparse import csr_matrix
+
+from esmvaltool.diag_scripts.arctic_ocean import getdata
+
+REGIONS = ['EB', 'AB', 'Barents_sea', 'North_sea']
+SHAPE = (7, 6, 45, 90)
+
+
+@pytest.fixture
+def ocean_files(tmp_path):
+    """Files with a masked 3D ocean field and the cell areas."""
+    ntime, nlev, nlat, nlon = SHAPE
+    lat, lon = np.meshgrid(np.linspace(-89., 89., nlat),
+                           np.linspace(0., 356., nlon),
+                           indexing='ij')
+    rng = np.random.default_rng(0)
+    data = np.ma.masked_array(rng.normal(size=SHAPE).astype(np.float32))
+    data[:, :, 40:, 25:35] = np.ma.masked
+    data[:, 3:, 38:40, 10:15] = np.ma.masked
+    data[:, 5:] = np.ma.masked
+    area = np.ma.masked_array(np.cos(np.radians(lat)) * 1e9)
+    area[43:, 0:5] = np.ma.masked
+
+    data_file = str(tmp_path / 'thetao.nc')
+    with Dataset(data_file, 'w') as dataset:
+        for name, size in zip(('time', 'lev', 'j', 'i'), SHAPE):
+            dataset.createDimension(name, size)
+        time = dataset.createVariable('time', 'f8', ('time', ))
+        time.units = 'days since 2000-01-01'
+        time[:] = 30. * np.arange(ntime)
+        dataset.createVariable('lev', 'f8', ('lev', ))[:] = np.linspace(
+            5., 2000., nlev)
+        dataset.createVariable('lat', 'f8', ('j', 'i'))[:] = lat
+        dataset.createVariable('lon', 'f8', ('j', 'i'))[:] = lon
+        dataset.createVariable('thetao',
+                               'f4', ('time', 'lev', 'j', 'i'),
+                               fill_value=1e20)[:] = data
+    area_file = str(tmp_path / 'areacello.nc')
+    with Dataset(area_file, 'w') as dataset:
+        dataset.createDimension('j', nlat)
+        dataset.createDimension('i', nlon)
+        dataset.createVariable('areacello', 'f8', ('j', 'i'),
+                               fill_value=1e20)[:] = area
+    return data_file, area_file
+
+
+@pytest.mark.parametrize('chunk_bytes', [2**10, 2**27])
+def test_hofm_extract(monkeypatch, ocean_files, chunk_bytes):
+    """Test that all regions are the same as with `hofm_extract_region`."""
+    monkeypatch.setattr(getdata, 'HOFM_CHUNK_BYTES', chunk_bytes)
+    extracted = getdata.hofm_extract(*ocean_files, 'thetao', REGIONS, 1000.)
+    assert extracted['lev_limit'] == 4
+    assert len(extracted['time']) == SHAPE[0]
+
+    metadata = getdata.load_meta(*ocean_files)
+    for region in REGIONS:
+        indexes = getdata.hofm_regions(region, metadata['lon2d'],
+                                       metadata['lat2d'])
+        expected = np.zeros((4, SHAPE[0]))
+        for mon in range(SHAPE[0]):
+            for ind in range(4):
+                expected[ind, mon] = getdata.hofm_extract_region(
+                    metadata, 'thetao', indexes, ind, mon)
+        np.testing.assert_allclose(extracted['hofm'][region],
+                                   expected,
+                                   rtol=1e-6)
+    metadata['datafile'].close()
+
+
+def test_hofm_extract_masked_levels(ocean_files):
+    """Test that the mean of levels without valid data is not a number."""
+    extracted = getdata.hofm_extract(*ocean_files, 'thetao', ['EB'], 3000.)
+    assert extracted['hofm']['EB'].shape == (SHAPE[1], SHAPE[0])
+    assert np.isnan(extracted['hofm']['EB'][5:]).all()
+    assert np.isfinite(extracted['hofm']['EB'][:5]).all()
+
+
+def test_transect_weights_cache(monkeypatch, tmp_path, ocean_files):
+    """Test that transect weights are computed once per grid and transect."""
+    calls = []
+
+    def regrid_weights(ifilename, lon_s4new, lat_s4new):
+        calls.append(ifilename)
+        cols = np.arange(lon_s4new.shape[0]) * 7
+        return csr_matrix((np.ones(lon_s4new.shape[0]),
+                           (np.arange(lon_s4new.shape[0]), cols)),
+                          shape=(lon_s4new.shape[0], SHAPE[2] * SHAPE[3]))
+
+    monkeypatch.setattr(getdata, 'transect_regrid_weights', regrid_weights)
+    monkeypatch.setattr(getdata, '_TRANSECT_WEIGHTS', {})
+    cfg = {'work_dir': str(tmp_path / 'work')}
+    lon_s4new = np.linspace(0., 20., 5)
+    lat_s4new = np.linspace(75., 80., 5)
+    with Dataset(ocean_files[0]) as datafile:
+        weights = getdata.transect_weights(cfg, ocean_files[0], datafile,
+                                           lon_s4new, lat_s4new)
+        again = getdata.transect_weights(cfg, ocean_files[0], datafile,
+                                         lon_s4new, lat_s4new)
+        assert again is weights
+        assert len(calls) == 1
+
+        # Weights are read from the cache directory in a new session
+        monkeypatch.setattr(getdata, '_TRANSECT_WEIGHTS', {})
+        cached = getdata.transect_weights(cfg, ocean_files[0], datafile,
+                                          lon_s4new, lat_s4new)
+        assert len(calls) == 1
+        np.testing.assert_array_equal(cached.toarray(), weights.toarray())
+
+        # Another transect needs new weights
+        getdata.transect_weights(cfg, ocean_files[0], datafile, lon_s4new,
+                                 lat_s4new + 1.)
+        assert len(calls) == 2
@@ -0,0 +1,43 @@
+"""Tests for the drought characteristics of the droughtindex diagnostic."""
+
+import dask.array as da
+import numpy as np
+
+from esmvaltool.diag_scripts.droughtindex.collect_drought_func import (
+    count_spells,
+    lazy_count_spells,
+    spell_statistics,
+)
+
+SERIES = [-2.0, -3.0, 0.0, 1.0, -1.5, 0.0, -2.0, -2.0]
+
+
+def test_spell_statistics():
+    """Test number, duration, severity and mean index of events."""
+    data = np.ma.masked_array([SERIES, np.zeros(8), SERIES])
+    data[2] = np.ma.masked
+    result = spell_statistics(data, -1.0)
+    np.testing.assert_allclose(result[0], [3.0, 5.0 / 3.0, 6.5 / 3.5, -2.0])
+    np.testing.assert_array_equal(result[1],
+                                  [0.0, np.nan, np.nan, np.nan])
+    np.testing.assert_array_equal(result[2], np.full(4, np.nan))
+
+
+def test_count_spells_lazy():
+    """Test that the lazy aggregation gives the same result."""
+    rng = np.random.default_rng(0)
+    data = rng.normal(size=(6, 5, 120)).astype(np.float32)
+    data = np.ma.masked_array(data)
+    data[1, 2] = np.ma.masked
+    # Layout of the data passed by Iris for realized and lazy data
+    realized = np.ma.repeat(data[:, :, np.newaxis, :], 4, axis=2)
+    lazy = da.from_array(np.moveaxis(realized, -1, 0),
+                         chunks=(30, 4, 3, 4),
+                         asarray=False)
+
+    expected = count_spells(realized, -1.0, -1)
+    result = lazy_count_spells(lazy, -1.0, 0)
+    assert expected.shape == (6, 5, 4)
+    assert isinstance(result, da.Array)
+    np.testing.assert_allclose(result.compute(), expected, rtol=1e-6)
+    assert np.isnan(expected[1, 2]).all()
@@ -0,0 +1,96 @@
+"""Tests for the ECS emergent constraints diagnostic script."""
+
+import numpy as np
+import pytest
+from iris.coords import DimCoord
+from iris.cube import Cube
+from scipy.interpolate import CubicSpline, interp1d
+
+from esmvaltool.diag_scripts.emergent_constraints import ecs_scatter
+
+PLEV = np.array([
+    100000.0, 92500.0, 85000.0, 70000.0, 60000.0, 50000.0, 40000.0, 30000.0,
+    25000.0, 20000.0, 15000.0, 10000.0, 7000.0, 5000.0, 3000.0, 2000.0,
+    1000.0
+])
+
+
+@pytest.fixture
+def columns():
+    """Geopotential heights and air pressure bounds of multiple grid cells."""
+    rng = np.random.default_rng(0)
+    zg = np.ma.masked_array(7000.0 * np.log(101325.0 / PLEV) +
+                            50.0 * rng.normal(size=(2, 30, PLEV.size)))
+    for (idx, n_masked) in enumerate(rng.integers(0, 12, size=60)):
+        zg[idx // 30, idx % 30, :n_masked] = np.ma.masked
+    zg[0, 0, 5] = np.ma.masked
+    zg[0, 1] = np.ma.masked
+    zg[0, 2, 1:] = np.ma.masked
+    edges = np.sort(rng.uniform(500.0, 105000.0, size=(2, 30, 11)))[..., ::-1]
+    return (zg, edges[..., :-1], edges[..., 1:])
+
+
+def test_get_level_width(columns):
+    """Test level widths against cubic interpolation of every grid cell."""
+    (zg, lower_bounds, upper_bounds) = columns
+    level_widths = ecs_scatter._get_level_width(lower_bounds, upper_bounds,
+                                                zg, PLEV)
+    assert level_widths.shape == lower_bounds.shape
+    for idx in np.ndindex(zg.shape[:-1]):
+        mask = np.ma.getmaskarray(zg[idx])
+        if np.sum(~mask) < 2:
+            assert np.isnan(level_widths[idx]).all()
+            continue
+        func = interp1d(PLEV[~mask],
+                        zg[idx].compressed(),
+                        kind='cubic',
+                        fill_value='extrapolate')
+        expected = np.abs(func(lower_bounds[idx]) - func(upper_bounds[idx]))
+        np.testing.assert_allclose(level_widths[idx], expected, rtol=1e-7)
+
+
+@pytest.mark.parametrize('n_valid', [2, 3])
+def test_get_level_width_few_levels(columns, n_valid):
+    """Test level widths for grid cells with few valid values."""
+    (zg, lower_bounds, upper_bounds) = columns
+    zg = zg[:1, :1].copy()
+    zg[..., :-n_valid] = np.ma.masked
+    level_widths = ecs_scatter._get_level_width(lower_bounds[:1, :1],
+                                                upper_bounds[:1, :1], zg, PLEV)
+    func = CubicSpline(PLEV[:-n_valid - 1:-1], zg[0, 0, :-n_valid - 1:-1])
+    expected = np.abs(func(lower_bounds[0, 0]) - func(upper_bounds[0, 0]))
+    np.testing.assert_allclose(level_widths[0, 0], expected, rtol=1e-7)
+
+
+@pytest.mark.parametrize('n_jobs', [1, 2, -1])
+def test_get_level_widths(columns, n_jobs):
+    """Test level widths of a whole cube."""
+    (zg, lower_bounds, upper_bounds) = columns
+    zg = zg[0, 3:]
+    bounds = np.stack((lower_bounds[0, 0], upper_bounds[0, 0]), axis=-1)
+    time = DimCoord(np.arange(zg.shape[0]),
+                    var_name='time',
+                    units='days since 2000-01-01')
+    cube = Cube(np.zeros((zg.shape[0], bounds.shape[0])),
+                dim_coords_and_dims=[
+                    (time, 0),
+                    (DimCoord(bounds.mean(axis=-1),
+                              bounds=bounds,
+                              standard_name='air_pressure',
+                              units='Pa'), 1),
+                ])
+    zg_cube = Cube(zg,
+                   dim_coords_and_dims=[
+                       (time, 0),
+                       (DimCoord(PLEV,
+                                 standard_name='air_pressure',
+                                 units='Pa'), 1),
+                   ])
+    level_widths = ecs_scatter._get_level_widths(cube, zg_cube, n_jobs=n_jobs)
+    expected = ecs_scatter._get_level_width(
+        np.broadcast_to(bounds[..., 0], cube.shape),
+        np.broadcast_to(bounds[..., 1], cube.shape), zg, PLEV)
+    assert isinstance(level_widths, np.ma.MaskedArray)
+    np.testing.assert_allclose(level_widths,
+                               np.ma.masked_invalid(expected),
+                               rtol=1e-7)
@@ -0,0 +1,135 @@
+"""Tests for :mod:`esmvaltool.diag_scripts.emergent_constraints`."""
+
+import numpy as np
+import pytest
+from scipy import integrate
+from scipy.stats import linregress
+
+from esmvaltool.diag_scripts import emergent_constraints as ec
+
+
+def _constraint(seed, noise=1.0):
+    """Data of an emergent constraint and observations."""
+    rng = np.random.default_rng(seed)
+    x_data = rng.normal(size=20)
+    y_data = 2.0 * x_data + 1.0 + noise * rng.normal(size=20)
+    return (x_data, y_data, 0.3 * seed, 0.2 + 0.1 * seed)
+
+
+def _quad_target_pdf(x_data, y_data, obs_mean, obs_std):
+    """PDF of target variable using adaptive quadrature for every y value."""
+    spe = ec.standard_prediction_error(x_data, y_data)
+    reg = linregress(x_data, y_data)
+    y_range = 1.5 * (np.max(y_data) - np.min(y_data))
+    y_lin = np.linspace(np.min(y_data) - y_range, np.max(y_data) + y_range,
+                        1000)
+
+    def comb_pdf(x_new, y_new):
+        return (ec._gaussian_pdf(x_new, obs_mean, obs_std) *
+                ec._gaussian_pdf(y_new, reg.slope * x_new + reg.intercept,
+                                 spe(x_new)))
+
+    y_pdf = [
+        integrate.quad(comb_pdf,
+                       obs_mean - 3.0 * obs_std,
+                       obs_mean + 3.0 * obs_std,
+                       args=(y, ))[0] for y in y_lin
+    ]
+    return (y_lin, np.array(y_pdf))
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_target_pdf(seed):
+    """Test PDF of target variable against adaptive quadrature."""
+    constraint = _constraint(seed)
+    (y_lin, y_pdf) = ec.target_pdf(*constraint)
+    (expected_y_lin, expected_y_pdf) = _quad_target_pdf(*constraint)
+    np.testing.assert_allclose(y_lin, expected_y_lin)
+    np.testing.assert_allclose(y_pdf, expected_y_pdf, rtol=1e-6, atol=1e-12)
+
+
+def test_target_pdf_narrow():
+    """Test PDF of target variable for a very tight emergent relationship."""
+    (x_data, y_data, obs_mean, obs_std) = _constraint(3, noise=0.01)
+    (y_lin, y_pdf) = ec.target_pdf(x_data, y_data, obs_mean, obs_std)
+
+    # Reference using trapezoidal rule on a very fine grid
+    spe = ec.standard_prediction_error(x_data, y_data)
+    reg = linregress(x_data, y_data)
+    x_new = np.linspace(obs_mean - 3.0 * obs_std, obs_mean + 3.0 * obs_std,
+                        100001)
+    comb_pdf = (ec._gaussian_pdf(x_new, obs_mean, obs_std) *
+                ec._gaussian_pdf(y_lin[:, np.newaxis],
+                                 reg.slope * x_new + reg.intercept,
+                                 spe(x_new)))
+    expected = integrate.trapezoid(comb_pdf, x_new, axis=1)
+    np.testing.assert_allclose(y_pdf, expected, atol=1e-6 * expected.max())
+
+
+def test_target_pdfs():
+    """Test that multiple constraints give the same as single constraints."""
+    constraints = [_constraint(seed) for seed in range(4)]
+    (x_data, y_data, obs_mean, obs_std) = zip(*constraints)
+    (y_lins, y_pdfs) = ec.target_pdfs(x_data, y_data, obs_mean, obs_std,
+                                      n_points=200)
+    assert y_lins.shape == (4, 200)
+    assert y_pdfs.shape == (4, 200)
+    for (idx, constraint) in enumerate(constraints):
+        (y_lin, y_pdf) = ec.target_pdf(*constraint, n_points=200)
+        np.testing.assert_allclose(y_lins[idx], y_lin)
+        np.testing.assert_allclose(y_pdfs[idx],
+                                   y_pdf,
+                                   atol=1e-10 * y_pdf.max())
+
+    # Unconstrained PDF if relationship is not significant
+    (_, y_pdfs) = ec.target_pdfs(x_data,
+                                 y_data,
+                                 obs_mean,
+                                 obs_std,
+                                 n_points=200,
+                                 necessary_p_value=0.0)
+    np.testing.assert_allclose(
+        y_pdfs[0],
+        ec._gaussian_pdf(y_lins[0], np.mean(y_data[0]), np.std(y_data[0])))
+
+
+@pytest.mark.parametrize('noise', [1e-4, 0.0])
+def test_target_pdf_near_perfect_fit(noise):
+    """Test PDF of target variable for a (near-)perfect linear fit."""
+    x_data = np.arange(10.0)
+    y_data = 2.0 * x_data + 1.0 + noise * np.sin(x_data)
+    (y_lin, y_pdf) = ec.target_pdf(x_data, y_data, 4.5, 1.0)
+
+    # P(y) is the PDF of the observations mapped onto y by the fit
+    expected = ec._gaussian_pdf(y_lin, 10.0, 2.0)
+    expected[np.abs(y_lin - 10.0) > 6.0] = 0.0
+    assert np.all(np.isfinite(y_pdf))
+    np.testing.assert_allclose(y_pdf, expected, atol=0.02 * expected.max())
+    np.testing.assert_allclose(integrate.trapezoid(y_pdf, y_lin),
+                               0.9973,
+                               rtol=1e-3)
+
+
+def test_target_pdfs_chunks(monkeypatch):
+    """Test that chunking within a constraint gives the same PDFs."""
+    constraints = [_constraint(seed) for seed in range(3)]
+    (x_data, y_data, obs_mean, obs_std) = zip(*constraints)
+    (_, expected) = ec.target_pdfs(x_data, y_data, obs_mean, obs_std,
+                                   n_points=200)
+    monkeypatch.setattr(ec, 'PDF_GRID_SIZE', 200 * 7)
+    (_, y_pdfs) = ec.target_pdfs(x_data, y_data, obs_mean, obs_std,
+                                 n_points=200)
+    np.testing.assert_allclose(y_pdfs, expected, atol=1e-12)
+
+
+@pytest.mark.parametrize('n_points', [1, 2, 3, 50, 51])
+def test_cdf(n_points):
+    """Test CDF against Simpson's rule for every prefix."""
+    rng = np.random.default_rng(0)
+    data = np.cumsum(rng.random(n_points))
+    pdf = np.exp(-(data - np.mean(data))**2)
+    expected = [
+        integrate.simpson(pdf[:idx], x=data[:idx])
+        for idx in range(1, n_points + 1)
+    ]
+    np.testing.assert_allclose(ec.cdf(data, pdf), expected, atol=1e-14)
@@ -0,0 +1,58 @@
+"""Tests for the Poisson solver of the implied heat transport diagnostic."""
+
+import logging
+
+import numpy as np
+import pytest
+
+from esmvaltool.diag_scripts.iht_toa.poisson_solver import (
+    SphericalPoisson,
+    assemble_laplacian,
+)
+
+logger = logging.getLogger(__name__)
+
+
+@pytest.fixture
+def source():
+    """Smooth source term with zero mean on a 5 degree grid."""
+    lat = np.radians(np.arange(-87.5, 90., 5.))
+    lon = np.radians(np.arange(2.5, 360., 5.))
+    field = (np.cos(2. * lat)[:, np.newaxis] +
+             0.3 * np.cos(lat)[:, np.newaxis] * np.sin(lon))
+    weights = np.broadcast_to(np.cos(lat)[:, np.newaxis], field.shape)
+    return (field - np.average(field, weights=weights)) * 6371e3**2
+
+
+def test_assemble_laplacian(source):
+    """Test that the sparse Laplacian matches the five-point stencil."""
+    solver = SphericalPoisson(logger, source)
+    field = np.zeros(np.array(source.shape) + 2)
+    field[1:-1, 1:-1] = np.random.default_rng(0).random(source.shape)
+    expected = solver.calc_ax(field)[1:-1, 1:-1]
+    laplacian = assemble_laplacian(source.shape)
+    result = laplacian @ field[1:-1, 1:-1].ravel()
+    np.testing.assert_allclose(result.reshape(source.shape), expected,
+                               rtol=1e-10, atol=1e-10 * np.abs(expected).max())
+
+
+def test_sparse_solver(source):
+    """Test that both solvers give the same result."""
+    results = {}
+    for method in ('bicgstab', 'sparse'):
+        solver = SphericalPoisson(logger, source, tolerance=1e-8,
+                                  solver=method)
+        solver.solve()
+        solver.calc_meridional_heat_transport()
+        efp = solver.energy_flux_potential
+        results[method] = (efp - efp[1:-1, 1:-1].mean(),
+                           solver.meridional_heat_transport)
+    for expected, result in zip(results['bicgstab'], results['sparse']):
+        np.testing.assert_allclose(result, expected,
+                                   atol=1e-6 * np.abs(expected).max())
+
+
+def test_unknown_solver(source):
+    """Test that an unknown solver is rejected."""
+    with pytest.raises(ValueError):
+        SphericalPoisson(logger, source, solver='multigrid')
@@ -0,0 +1,42 @@
+"""Tests for the single model diagnostics of the implied heat transport."""
+
+import iris
+import numpy as np
+import pytest
+
+from esmvaltool.diag_scripts.iht_toa.single_model_diagnostics import (
+    call_poisson,
+)
+
+
+@pytest.fixture
+def flux_cube():
+    """Flux field on a 10 degree grid."""
+    lat = iris.coords.DimCoord(np.arange(-85., 90., 10.),
+                               standard_name='latitude',
+                               units='degrees')
+    lon = iris.coords.DimCoord(np.arange(5., 360., 10.),
+                               standard_name='longitude',
+                               units='degrees')
+    time = iris.coords.AuxCoord(0., standard_name='time',
+                                units='days since 2000-01-01')
+    data = (np.cos(np.radians(2. * lat.points))[:, np.newaxis] +
+            0.3 * np.sin(np.radians(lon.points)))
+    return iris.cube.Cube(data,
+                          var_name='rtnt',
+                          units='W m-2',
+                          dim_coords_and_dims=[(lat, 0), (lon, 1)],
+                          aux_coords_and_dims=[(time, None)])
+
+
+@pytest.mark.parametrize('solver', ['bicgstab', 'sparse'])
+def test_call_poisson_attributes(flux_cube, solver):
+    """Test that the solver is recorded in the energy flux potential."""
+    efp_cube, _ = call_poisson(flux_cube, solver=solver)
+    assert efp_cube.attributes['poisson_solver'] == solver
+    if solver == 'sparse':
+        assert 'zero' in efp_cube.attributes['comment']
+        np.testing.assert_allclose(efp_cube.data.mean(), 0.,
+                                   atol=1e-8 * np.abs(efp_cube.data).max())
+    else:
+        assert 'comment' not in efp_cube.attributes
@@ -0,0 +1,51 @@
+"""Tests for the recombination search of the KCS local resampling."""
+
+from itertools import product
+
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+from esmvaltool.diag_scripts.kcs.local_resampling import (
+    _best_subset,
+    _find_single_top1000,
+)
+
+
+@pytest.mark.parametrize('n_segments,n_members', [(1, 5), (4, 6), (5, 5)])
+def test_find_single_top1000(n_segments, n_members):
+    """Compare with a search through all combinations."""
+    rng = np.random.default_rng(0)
+    values = rng.random((n_segments, n_members))
+    segment_means = xr.DataArray(values, dims=['segment', 'ensemble_member'])
+    target = values.mean()
+
+    result = _find_single_top1000(segment_means, target, block_size=64)
+
+    combinations = np.array(
+        list(product(range(n_members), repeat=n_segments)))
+    distance = np.abs(
+        values[np.arange(n_segments), combinations].mean(axis=1) - target)
+    expected = np.sort(distance)[:1000]
+    assert list(result.columns) == list(range(n_segments)) + ['distance']
+    np.testing.assert_allclose(result['distance'], expected)
+    selected = result.drop('distance', axis=1).values
+    np.testing.assert_allclose(
+        np.abs(values[np.arange(n_segments), selected].mean(axis=1) - target),
+        result['distance'])
+
+
+def test_best_subset():
+    """Test that the selected samples reuse members as little as possible."""
+    combinations = pd.Series(
+        [np.array([i % 4, i % 3, 0]) for i in range(12)])
+    best = _best_subset(combinations, n_sample=4, n_iterations=2000,
+                        batch_size=300, rng=np.random.default_rng(0))
+    assert best.shape == (4, 3)
+    assert best.dtypes.unique() == [np.int64]
+    # The last segment always uses member 0, which costs a penalty of 5
+    counts = [np.unique(segment, return_counts=True)[1] for segment in
+              best.values.T]
+    assert max(counts[0]) <= 2
+    assert max(counts[1]) <= 2
@@ -0,0 +1,73 @@
+"""Unit tests for the module :mod:`esmvaltool.diag_scripts.mlr.postprocess`."""
+
+import iris.cube
+import numpy as np
+import pytest
+
+from esmvaltool.diag_scripts.mlr import postprocess
+
+
+def _pearson(array, weights=None):
+    """Pearson correlation coefficients of the rows of an array."""
+    mean = np.ma.average(array, axis=1, weights=weights).reshape(-1, 1)
+    demean = array - mean
+    if weights is not None:
+        demean = demean * np.ma.sqrt(weights)
+    norms = np.ma.sqrt(np.ma.sum(demean**2, axis=1))
+    return np.ma.dot(demean, demean.T) / np.ma.outer(norms, norms)
+
+
+@pytest.fixture
+def data():
+    """Errors, weights and data to estimate the covariance structure."""
+    rng = np.random.default_rng(0)
+    error = np.ma.masked_array(rng.random((6, 20)) + 0.1)
+    error[:, :2] = np.ma.masked
+    weights = np.ma.masked_array(rng.random((6, 20)) + 0.5,
+                                 mask=np.ma.getmaskarray(error))
+    mask = np.zeros((15, 6, 20), dtype=bool)
+    mask.ravel()[7::11] = True
+    cov_est = np.ma.masked_array(
+        rng.normal(size=(15, 6, 20)) + rng.normal(size=(15, 1, 1)),
+        mask=mask)
+    cov_est[..., 3] = 1.0
+    return (error, weights, cov_est)
+
+
+@pytest.mark.parametrize('chunk_size', [40, postprocess.COV_CHUNK_SIZE])
+def test_estim_cov_differing_shape(monkeypatch, data, chunk_size):
+    """Test estimation of error with covariance from larger dataset."""
+    (error, weights, cov_est) = data
+    monkeypatch.setattr(postprocess, 'COV_CHUNK_SIZE', chunk_size)
+    result = postprocess._estim_cov_differing_shape(
+        {}, iris.cube.Cube(error**2), iris.cube.Cube(cov_est), weights)
+
+    weighted_error = np.ma.filled(error * weights, 0.0).ravel()
+    pearson = _pearson(cov_est.reshape(15, -1).T)
+    expected = np.sqrt(
+        np.ma.sum(pearson * np.outer(weighted_error, weighted_error)))
+    np.testing.assert_allclose(result, expected, rtol=1e-12)
+
+
+def test_estim_cov_identical_shape(data):
+    """Test estimation of error with covariance from dataset of same shape."""
+    (error, weights, cov_est) = data
+    cov_est = cov_est[0]
+    result = postprocess._estim_cov_identical_shape(
+        iris.cube.Cube(error**2), iris.cube.Cube(cov_est), weights)
+
+    weighted_error = np.ma.filled(error * weights, 0.0)
+    pearson_dim0 = _pearson(cov_est, weights)
+    pearson_dim1 = _pearson(cov_est.T, weights.T)
+    error_dim0 = np.sqrt([
+        np.ma.sum(pearson_dim1 * np.outer(row, row)) for row in weighted_error
+    ])
+    error_dim1 = np.sqrt([
+        np.ma.sum(pearson_dim0 * np.outer(col, col))
+        for col in weighted_error.T
+    ])
+    expected = max(
+        np.sqrt(np.ma.sum(pearson_dim0 * np.outer(error_dim0, error_dim0))),
+        np.sqrt(np.ma.sum(pearson_dim1 * np.outer(error_dim1, error_dim1))),
+    )
+    np.testing.assert_allclose(result, expected, rtol=1e-12)
@@ -0,0 +1,86 @@
+"""Tests for the grid cell selection of the shapeselect diagnostic."""
+
+import iris
+import iris.coords
+import iris.cube
+import numpy as np
+import pytest
+from shapely.geometry import Point, Polygon, box
+
+from esmvaltool.diag_scripts.shapeselect.diag_shapeselect import (
+    extract_time_series,
+    get_selection,
+    load_selection,
+    save_selection,
+)
+
+
+@pytest.fixture
+def cube():
+    """Global cube on a 5 degree grid with longitudes in [0, 360]."""
+    lon = iris.coords.DimCoord(np.arange(2.5, 360., 5.),
+                               standard_name='longitude',
+                               units='degrees')
+    lat = iris.coords.DimCoord(np.arange(-87.5, 90., 5.),
+                               standard_name='latitude',
+                               units='degrees')
+    time = iris.coords.DimCoord(np.arange(3.),
+                                standard_name='time',
+                                units='days since 2000-01-01')
+    data = np.random.default_rng(0).random((3, 36, 72))
+    return iris.cube.Cube(data,
+                          dim_coords_and_dims=[(time, 0), (lat, 1),
+                                               (lon, 2)])
+
+
+SHAPES = np.array([
+    box(-20., 10., 20., 40.),
+    Polygon([(100., -30.), (140., -30.), (120., 10.)]),
+    box(1., 1., 2., 2.),
+])
+
+
+def test_mean_inside(cube):
+    """Compare with testing each grid point."""
+    weights, reprs = get_selection(SHAPES, cube, 'mean_inside')
+    result = extract_time_series(cube, weights)
+    assert result.shape == (3, 3)
+
+    lon = cube.coord('longitude').points
+    lat = cube.coord('latitude').points
+    for ishp, multi in enumerate(SHAPES[:2]):
+        inside = np.array([[
+            Point(x - 360. if x > 180. else x, y).within(multi) for x in lon
+        ] for y in lat])
+        expected = cube.data[:, inside].mean(axis=1)
+        np.testing.assert_allclose(result[:, ishp], expected)
+
+    # No grid point inside the last shape, the closest one is used
+    assert reprs[2] == 18 * 72
+    np.testing.assert_allclose(result[:, 2], cube.data[:, 18, 0])
+
+
+def test_area_weighted(cube):
+    """Test the weights of overlapping grid cells."""
+    weights, _ = get_selection(SHAPES, cube, 'area_weighted')
+    cell_area = np.cos(np.radians(cube.coord('latitude').points))
+    cell_area = np.broadcast_to(cell_area[:, np.newaxis], (36, 72)) * 25.
+    row = weights.getrow(0).toarray().reshape(36, 72)
+    # Cells fully inside the first box
+    np.testing.assert_allclose(row[20:26, :4], cell_area[20:26, :4])
+    np.testing.assert_allclose(row[20:26, -4:], cell_area[20:26, -4:])
+    assert weights.getrow(2).nnz == 1
+
+
+def test_masked_data_and_cache(cube, tmp_path):
+    """Test that masked values are ignored and the cache round trip."""
+    cube.data = np.ma.masked_greater(cube.data, 0.5)
+    weights, reprs = get_selection(SHAPES, cube, 'mean_inside')
+    filename = str(tmp_path / 'selection.npz')
+    save_selection(filename, weights, reprs)
+    cached_weights, cached_reprs = load_selection(filename)
+    np.testing.assert_array_equal(cached_reprs, reprs)
+    assert (cached_weights != weights).nnz == 0
+
+    result = extract_time_series(cube, cached_weights)
+    assert np.all(result[~np.isnan(result)] <= 0.5)
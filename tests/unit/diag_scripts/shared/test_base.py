@@ -1,6 +1,12 @@
+import datetime
 import logging
+import multiprocessing
+import os
+import pickle
 import sys
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+from unittest import mock
 
 import pytest
 import yaml
@@ -215,6 +221,119 @@ def test_sorted_metadata():
     ]
 
 
+INPUT_DATA = {
+    'file1.nc': {
+        'short_name': 'ta',
+        'dataset': 'Dataset2',
+        'exp': 'historical',
+    },
+    'file2.nc': {
+        'short_name': 'pr',
+        'dataset': 'dataset1',
+        'exp': ['historical', 'ssp585'],
+    },
+    'file3.nc': {
+        'short_name': 'ta',
+        'dataset': 'dataset1',
+        'exp': 'historical',
+        'alias': None,
+    },
+    'file4.nc': {
+        'short_name': 'ta',
+        'dataset': 'dataset3',
+        'alias': 'A',
+    },
+}
+
+
+@pytest.mark.parametrize('attributes', [
+    {
+        'short_name': 'ta'
+    },
+    {
+        'short_name': 'ta',
+        'dataset': 'dataset1'
+    },
+    {
+        'alias': None
+    },
+    {
+        'alias': '*',
+        'short_name': 'ta'
+    },
+    {
+        'exp': ['historical', 'ssp585']
+    },
+    {
+        'exp': 'historical',
+        'dataset': 'dataset1'
+    },
+    {
+        'short_name': 'tas'
+    },
+])
+def test_select_metadata_index(attributes):
+    """Test that selecting from the index gives the same result."""
+    input_data = shared._base.InputData(INPUT_DATA)
+    metadata = input_data.values()
+    assert isinstance(metadata, shared.MetadataIndex)
+    expected = shared.select_metadata(list(INPUT_DATA.values()), **attributes)
+    assert shared.select_metadata(metadata, **attributes) == expected
+
+
+@pytest.mark.parametrize('attribute', ['short_name', 'alias', 'dataset'])
+def test_group_metadata_index(attribute):
+    """Test that grouping the index gives the same result."""
+    metadata = shared._base.InputData(INPUT_DATA).values()
+    expected = shared.group_metadata(list(INPUT_DATA.values()), attribute)
+    result = shared.group_metadata(metadata, attribute)
+    assert list(result) == list(expected)
+    assert result == expected
+
+
+def test_sorted_metadata_index():
+    """Test that sorting the index gives the same result."""
+    metadata = shared._base.InputData(INPUT_DATA).values()
+    for sort in ('dataset', ['short_name', 'dataset'], ['alias']):
+        expected = shared.sorted_metadata(list(INPUT_DATA.values()), sort)
+        assert shared.sorted_metadata(metadata, sort) == expected
+
+
+def test_metadata_index_changes():
+    """Test that the index is updated if the metadata changes."""
+    input_data = shared._base.InputData(INPUT_DATA)
+    metadata = input_data.values()
+    assert len(shared.select_metadata(metadata, dataset='dataset1')) == 2
+
+    input_data['file1.nc']['dataset'] = 'dataset1'
+    assert len(shared.select_metadata(metadata, dataset='dataset1')) == 3
+    assert input_data.values() is metadata
+
+    input_data['file5.nc'] = {'dataset': 'dataset1'}
+    assert input_data.values() is not metadata
+    assert len(shared.select_metadata(input_data.values(),
+                                      dataset='dataset1')) == 4
+
+    del input_data['file5.nc']
+    assert input_data.values() is not metadata
+
+
+def test_input_data_copies():
+    """Test that copies of the input data are normal dictionaries."""
+    input_data = shared._base.InputData(INPUT_DATA)
+    assert input_data == INPUT_DATA
+
+    copy = pickle.loads(pickle.dumps(input_data))
+    assert type(copy) is dict
+    assert type(copy['file1.nc']) is dict
+    assert copy == INPUT_DATA
+    assert type(pickle.loads(pickle.dumps(input_data.values()))) is list
+
+    assert yaml.safe_load(yaml.safe_dump(input_data)) == INPUT_DATA
+    assert yaml.safe_load(yaml.safe_dump(list(
+        input_data.values()))) == list(INPUT_DATA.values())
+
+
 @pytest.mark.parametrize('as_iris', [True, False])
 def test_extract_variables(as_iris):
 
@@ -427,3 +546,186 @@ def test_rerun_diagnostic_flag(tmp_path, monkeypatch, flag):
                 Path(settings['plot_dir']) / 'example_output.txt',
         ):
             assert file.exists() == exist
+
+
+def test_get_input_data_files_cached(tmp_path, monkeypatch):
+
+    metadata = {'file1.nc': {'short_name': 'ta', 'dataset': 'dataset1'}}
+    metadata_file = tmp_path / 'metadata.yml'
+    metadata_file.write_text(yaml.safe_dump(metadata))
+    cfg = {'input_files': [str(tmp_path)]}
+    monkeypatch.setattr(shared._base, '_METADATA_CACHE', {})
+
+    input_data = shared._base._get_input_data_files(cfg)
+    assert input_data == metadata
+    assert os.listdir(tmp_path) == ['metadata.yml']
+
+    # The cached metadata is used while the file is unchanged, changes to
+    # the returned metadata do not affect the cache
+    input_data['file1.nc']['dataset'] = 'changed'
+    with mock.patch.object(yaml, 'load') as mock_load:
+        assert shared._base._get_input_data_files(cfg) == metadata
+    mock_load.assert_not_called()
+
+    # The file is read again after it changed
+    metadata['file2.nc'] = {'short_name': 'pr', 'dataset': 'dataset2'}
+    metadata_file.write_text(yaml.safe_dump(metadata))
+    assert shared._base._get_input_data_files(cfg) == metadata
+
+
+def test_run_diagnostic_provenance(tmp_path, monkeypatch):
+    """Test that provenance is combined into one file at the end."""
+    settings = create_settings(tmp_path)
+    settings_file = write_settings(settings)
+    monkeypatch.setattr(sys, 'argv', ['', settings_file])
+    provenance_file = tmp_path / 'run_dir' / 'diagnostic_provenance.yml'
+
+    records = {f'output{i}.nc': {'caption': f'Output {i}'} for i in range(3)}
+    with shared.run_diagnostic() as cfg:
+        for filename, record in records.items():
+            with shared.ProvenanceLogger(cfg) as prov:
+                prov.log(filename, record)
+        with shared.ProvenanceLogger(cfg) as prov:
+            with pytest.raises(KeyError):
+                prov.log('output0.nc', {})
+        assert not provenance_file.exists()
+
+    provenance = yaml.safe_load(provenance_file.read_bytes())
+    assert provenance == records
+    run_dir = tmp_path / 'run_dir'
+    assert list(run_dir.glob('diagnostic_provenance.[0-9]*.yml')) == []
+
+
+def test_run_diagnostic_provenance_processes(tmp_path, monkeypatch):
+    """Test that records of other processes are combined as well."""
+    settings = create_settings(tmp_path)
+    settings_file = write_settings(settings)
+    monkeypatch.setattr(sys, 'argv', ['', settings_file])
+    run_dir = tmp_path / 'run_dir'
+
+    with shared.run_diagnostic() as cfg:
+        with shared.ProvenanceLogger(cfg) as prov:
+            prov.log('output1.nc', {'caption': 'Output 1'})
+        (run_dir / 'diagnostic_provenance.1.yml').write_text(
+            '---\noutput2.nc:\n  caption: Output 2\n')
+
+    provenance = yaml.safe_load(
+        (run_dir / 'diagnostic_provenance.yml').read_bytes())
+    assert provenance == {
+        'output1.nc': {
+            'caption': 'Output 1'
+        },
+        'output2.nc': {
+            'caption': 'Output 2'
+        },
+    }
+
+
+def test_run_diagnostic_provenance_types(tmp_path, monkeypatch):
+    """Test that buffered records keep all types supported by YAML."""
+    settings = create_settings(tmp_path)
+    settings_file = write_settings(settings)
+    monkeypatch.setattr(sys, 'argv', ['', settings_file])
+    record = {
+        'caption': 'Output',
+        'start_date': datetime.date(2000, 1, 1),
+        'levels': {
+            850: 'lower',
+            200.5: 'upper',
+        },
+    }
+
+    with shared.run_diagnostic() as cfg:
+        with shared.ProvenanceLogger(cfg) as prov:
+            prov.log('output.nc', record)
+
+    provenance = yaml.safe_load(
+        (tmp_path / 'run_dir' / 'diagnostic_provenance.yml').read_bytes())
+    assert provenance == {'output.nc': record}
+
+
+def test_run_diagnostic_provenance_fails(tmp_path, monkeypatch, caplog):
+    """Test that combining provenance does not hide the diagnostic error."""
+    settings = create_settings(tmp_path)
+    settings_file = write_settings(settings)
+    monkeypatch.setattr(sys, 'argv', ['', settings_file])
+
+    with pytest.raises(ValueError, match='Diagnostic failed'):
+        with shared.run_diagnostic() as cfg:
+            with shared.ProvenanceLogger(cfg) as prov:
+                prov.log('output.nc', {'caption': 'Output'})
+            with shared.ProvenanceLogger(cfg) as prov:
+                prov.table['output.nc'] = {'caption': 'Output'}
+            raise ValueError('Diagnostic failed')
+
+    assert "Unable to combine the provenance records" in caplog.text
+    assert "already exists" in caplog.text
+
+
+def test_run_diagnostic_provenance_duplicate_raises(tmp_path, monkeypatch):
+    """Test that combining provenance raises if the diagnostic succeeded."""
+    settings = create_settings(tmp_path)
+    settings_file = write_settings(settings)
+    monkeypatch.setattr(sys, 'argv', ['', settings_file])
+
+    with pytest.raises(KeyError, match='already exists'):
+        with shared.run_diagnostic() as cfg:
+            for _ in range(2):
+                with shared.ProvenanceLogger(cfg) as prov:
+                    prov.table['output.nc'] = {'caption': 'Output'}
+
+
+def _log_provenance(cfg, filename):
+    """Log provenance of a single file (in a worker process)."""
+    with shared.ProvenanceLogger(cfg) as prov:
+        prov.log(filename, {'caption': filename})
+
+
+def test_run_diagnostic_provenance_spawned_worker(tmp_path, monkeypatch):
+    """Test that records of spawned worker processes are buffered."""
+    settings = create_settings(tmp_path)
+    settings_file = write_settings(settings)
+    monkeypatch.setattr(sys, 'argv', ['', settings_file])
+    run_dir = tmp_path / 'run_dir'
+    context = multiprocessing.get_context('spawn')
+
+    with shared.run_diagnostic() as cfg:
+        with ProcessPoolExecutor(max_workers=1,
+                                 mp_context=context) as executor:
+            executor.submit(_log_provenance, {'run_dir': cfg['run_dir']},
+                            'output1.nc').result()
+        _log_provenance(cfg, 'output2.nc')
+        assert not (run_dir / 'diagnostic_provenance.yml').exists()
+        assert len(list(run_dir.glob('diagnostic_provenance.[0-9]*.yml'))) == 2
+
+    provenance = yaml.safe_load(
+        (run_dir / 'diagnostic_provenance.yml').read_bytes())
+    assert provenance == {
+        'output1.nc': {
+            'caption': 'output1.nc'
+        },
+        'output2.nc': {
+            'caption': 'output2.nc'
+        },
+    }
+
+
+def test_run_diagnostic_provenance_other_dir(tmp_path, monkeypatch):
+    """Test that provenance of other directories is written directly."""
+    settings = create_settings(tmp_path)
+    settings_file = write_settings(settings)
+    monkeypatch.setattr(sys, 'argv', ['', settings_file])
+    plot_dir = tmp_path / 'plot_dir'
+
+    with shared.run_diagnostic() as cfg:
+        # Pattern used by autoassess/land_surface_surfrad/surfrad.py
+        for _ in range(2):
+            other_cfg = {'run_dir': cfg['plot_dir']}
+            if not (plot_dir / 'diagnostic_provenance.yml').exists():
+                with shared.ProvenanceLogger(other_cfg) as prov:
+                    prov.log('plot.png', {'caption': 'Plot'})
+        assert list(plot_dir.glob('diagnostic_provenance.[0-9]*.yml')) == []
+
+    provenance = yaml.safe_load(
+        (plot_dir / 'diagnostic_provenance.yml').read_bytes())
+    assert provenance == {'plot.png': {'caption': 'Plot'}}
@@ -0,0 +1,79 @@
+"""Tests for the Fourier coefficients of the thermodynamic diagnostic tool."""
+
+import numpy as np
+import pytest
+from netCDF4 import Dataset
+
+from esmvaltool.diag_scripts.thermodyn_diagtool.fourier_coefficients import (
+    compute_coeff,
+    fourier_coeff,
+    read_coeff,
+)
+
+SHAPE = (3, 4, 32, 64)
+
+
+def _write(filename, fields):
+    ntime, nlev, nlat, nlon = SHAPE
+    coords = {
+        'time': np.arange(ntime, dtype=float),
+        'plev': np.array([90000., 70000., 50000., 30000.]),
+        'lat': np.linspace(85., -85., nlat),
+        'lon': np.linspace(0., 360., nlon, endpoint=False),
+    }
+    with Dataset(filename, 'w') as dataset:
+        for name, values in coords.items():
+            dataset.createDimension(name, len(values))
+            dataset.createVariable(name, 'f8', (name, ))[:] = values
+        dataset.variables['lat'].units = 'degrees_north'
+        for name, values in fields.items():
+            dims = ('time', 'plev', 'lat', 'lon')
+            if values.ndim == 3:
+                dims = ('time', 'lat', 'lon')
+            dataset.createVariable(name, 'f4', dims)[:] = values
+
+
+@pytest.fixture
+def input_files(tmp_path):
+    """Files with t,u,v,w on pressure levels and near-surface temperature."""
+    rng = np.random.default_rng(0)
+    fields = {
+        name: rng.normal(size=SHAPE)
+        for name in ('ta', 'ua', 'va', 'wap')
+    }
+    fields['ta'] = 250. + 10. * fields['ta']
+    # Points below the surface are filled with zeros
+    fields['ta'][:, 0, :4, :8] = 0.
+    ta_file = tmp_path / 'ta.nc'
+    _write(ta_file, fields)
+    tas_file = tmp_path / 'tas.nc'
+    _write(tas_file, {'tas': 280. + rng.normal(size=(3, 32, 64))})
+    return str(ta_file), str(tas_file)
+
+
+def test_compute_coeff(input_files):
+    """Test the shape of the coefficients and the zonal mean."""
+    coeffs = compute_coeff(*input_files)
+    assert coeffs['ta'].shape == (3, 4, 32, 22)
+    np.testing.assert_array_equal(coeffs['wave'], np.arange(22))
+    assert coeffs['lat_attrs'] == {'units': 'degrees_north'}
+    assert coeffs['wave_attrs'] == {}
+    with Dataset(input_files[0]) as dataset:
+        u_a = dataset.variables['ua'][:]
+    np.testing.assert_allclose(coeffs['ua'][..., 0], u_a.mean(axis=-1),
+                               atol=1e-6)
+    np.testing.assert_array_equal(coeffs['ua'][..., 1], 0.)
+
+
+def test_read_coeff(input_files, tmp_path):
+    """Test that coefficients in memory match those written to file."""
+    tadiag_file = str(tmp_path / 'ta_filled.nc')
+    coeff_file = str(tmp_path / 'fourier_coeff.nc')
+    fourier_coeff(tadiag_file, coeff_file, *input_files)
+    expected = read_coeff(coeff_file)
+    coeffs = compute_coeff(*input_files)
+    assert sorted(coeffs) == sorted(expected)
+    for key in ('ta', 'ua', 'va', 'wap', 'lat', 'plev', 'time', 'wave'):
+        np.testing.assert_array_equal(coeffs[key], expected[key])
+    assert coeffs['lat_attrs'] == expected['lat_attrs']
+    assert coeffs['wave_attrs'] == expected['wave_attrs']
@@ -0,0 +1,257 @@
+"""Tests for the Lorenz Energy Cycle of the thermodynamic diagnostic tool."""
+
+import numpy as np
+import pytest
+from netCDF4 import Dataset
+
+from esmvaltool.diag_scripts.thermodyn_diagtool import lorenz_cycle
+
+NTIME, NLEV, NLAT, NWAVE = 5, 4, 8, 6
+
+
+@pytest.fixture
+def fields():
+    """Complex Fourier coefficients (time, lev, lat, wave) of t,u,v,w."""
+    rng = np.random.default_rng(0)
+    shape = (NTIME, NLEV, NLAT, NWAVE)
+    return [
+        rng.normal(size=shape) + 1j * rng.normal(size=shape)
+        for _ in range(4)
+    ]
+
+
+@pytest.fixture
+def coords():
+    """Pressure levels, latitudes and stability profiles."""
+    lev = np.array([90000., 70000., 50000., 30000.])
+    lat = np.radians(np.linspace(70., -70., NLAT))
+    gam = np.linspace(1., 2., NLEV)
+    gam_z = np.linspace(1., 2., NLEV * NLAT).reshape(NLEV, NLAT)
+    return lev, lat, gam, gam_z
+
+
+def _kernels(fields, coords):
+    """Call all kernels on the given (lev, lat, wave) or 4D fields."""
+    t_a, u_a, v_a, wap = fields
+    lev, lat, gam, gam_z = coords
+    g_w = np.cos(lat)
+    _, t_g = lorenz_cycle.averages(t_a, g_w)
+    _, w_g = lorenz_cycle.averages(wap, g_w)
+    ttt = np.full((NLEV, NLAT, NWAVE), 250.) + np.arange(NLAT)[:, None]
+    utt = np.full((NLEV, NLAT, NWAVE), 5.) + np.arange(NLEV)[:, None, None]
+    vtt = np.full((NLEV, NLAT, NWAVE), 1.) + np.arange(NLAT)[:, None]
+    ttg = np.full(NLEV, 250.)
+    ttz = np.real(ttt[:, :, 0])
+    ntp = NWAVE + 1
+    return [
+        lorenz_cycle.makek(u_a, v_a),
+        lorenz_cycle.makea(t_a, t_g, gam),
+        lorenz_cycle.mka2k(wap, t_a, w_g, t_g, lev),
+        lorenz_cycle.mkaeaz(v_a, wap, t_a, ttt, ttg, lev, lat, gam, NLAT,
+                            NLEV),
+        lorenz_cycle.mkkekz(u_a, v_a, wap, utt, vtt, lev, lat, NLAT, ntp,
+                            NLEV),
+        lorenz_cycle.mkatas(u_a, v_a, wap, t_a, ttz, gam_z, lev, lat, NLAT,
+                            ntp, NLEV),
+        lorenz_cycle.mkktks(u_a, v_a, utt, vtt, lat, NLAT, ntp, NLEV),
+    ]
+
+
+def _ref_ddp(fld, p_l):
+    """Vertical derivative of (lev, lat) as in the original loops."""
+    nlev = len(p_l)
+    dfdp = np.zeros(fld.shape)
+    for l_l in range(nlev):
+        if l_l == 0:
+            dfdp[l_l] = (fld[l_l + 1] - fld[l_l]) / (p_l[l_l + 1] - p_l[l_l])
+        elif l_l == nlev - 1:
+            dfdp[l_l] = (fld[l_l] - fld[l_l - 1]) / (p_l[l_l] - p_l[l_l - 1])
+        else:
+            dfdp1 = (fld[l_l + 1] - fld[l_l]) / (p_l[l_l + 1] - p_l[l_l])
+            dfdp2 = (fld[l_l] - fld[l_l - 1]) / (p_l[l_l] - p_l[l_l - 1])
+            dfdp[l_l] = ((dfdp1 * (p_l[l_l] - p_l[l_l - 1]) + dfdp2 *
+                          (p_l[l_l + 1] - p_l[l_l])) /
+                         (p_l[l_l + 1] - p_l[l_l - 1]))
+    return dfdp
+
+
+def _ref_dlat(fld, lat):
+    """Meridional differences of (lev, lat, ...) and latitude steps."""
+    nlat = len(lat)
+    dfld = np.zeros(fld.shape, dtype=fld.dtype)
+    dlat = np.zeros(nlat)
+    for i_l in range(nlat):
+        i_0, i_1 = max(i_l - 1, 0), min(i_l + 1, nlat - 1)
+        dfld[:, i_l] = fld[:, i_1] - fld[:, i_0]
+        dlat[i_l] = lat[i_1] - lat[i_0]
+    return dfld, dlat
+
+
+def _ref_kernels(fields, coords):
+    """Original formulas of the kernels for a single timestep."""
+    u_t, v_t, wap, t_t = (fields[1], fields[2], fields[3], fields[0])
+    p_l, lat, gam, gam_z = coords
+    aa, r_d, c_p = lorenz_cycle.AA, lorenz_cycle.R, lorenz_cycle.CP
+    g_w = np.cos(lat)
+    t_g = np.sum(np.real(t_t[:, :, 0]) * g_w, axis=1) / np.sum(g_w)
+    w_g = np.sum(np.real(wap[:, :, 0]) * g_w, axis=1) / np.sum(g_w)
+    ttt = np.full((NLEV, NLAT, NWAVE), 250.) + np.arange(NLAT)[:, None]
+    utt = np.full((NLEV, NLAT, NWAVE), 5.) + np.arange(NLEV)[:, None, None]
+    vtt = np.full((NLEV, NLAT, NWAVE), 1.) + np.arange(NLAT)[:, None]
+    ttg = np.full(NLEV, 250.)
+    ttz = np.real(ttt[:, :, 0])
+    k_k = np.arange(NWAVE)
+    coslat = np.cos(lat)[:, np.newaxis]
+    tanlat = np.tan(lat)[:, np.newaxis]
+    p_3d = p_l[:, np.newaxis, np.newaxis]
+
+    # makek
+    e_k = np.real(u_t * np.conj(u_t) + v_t * np.conj(v_t))
+    e_k[:, :, 0] = 0.5 * np.real(u_t[:, :, 0] * u_t[:, :, 0] +
+                                 v_t[:, :, 0] * v_t[:, :, 0])
+
+    # makea
+    ape = gam[:, np.newaxis, np.newaxis] * np.real(t_t * np.conj(t_t))
+    ape[:, :, 0] = (gam[:, np.newaxis] * 0.5 * np.real(
+        (t_t[:, :, 0] - t_g[:, np.newaxis])**2))
+
+    # mka2k
+    a2k = -np.real(r_d / p_3d * (t_t * np.conj(wap) + np.conj(t_t) * wap))
+    a2k[:, :, 0] = -np.real(r_d / p_l[:, np.newaxis] *
+                            (t_t[:, :, 0] - t_g[:, np.newaxis]) *
+                            (wap[:, :, 0] - w_g[:, np.newaxis]))
+
+    # mkaeaz
+    t_0 = ttt[:, :, 0] - ttg[:, np.newaxis]
+    dtdp = (_ref_ddp(t_0, p_l) - r_d / (c_p * p_l[:, np.newaxis]) * t_0)
+    dtdy, dlat = _ref_dlat(ttt[:, :, 0], lat)
+    dtdy = dtdy / dlat / aa
+    c_1 = np.real(v_t * np.conj(t_t) + t_t * np.conj(v_t))
+    c_2 = np.real(wap * np.conj(t_t) + t_t * np.conj(wap))
+    ae2az = (gam[:, np.newaxis, np.newaxis] *
+             (dtdy[:, :, np.newaxis] * c_1 + dtdp[:, :, np.newaxis] * c_2))
+    ae2az[:, :, 0] = 0.
+
+    # mkkekz
+    dudp = _ref_ddp(utt[:, :, 0], p_l)[:, :, np.newaxis]
+    dvdp = _ref_ddp(vtt[:, :, 0], p_l)[:, :, np.newaxis]
+    dudy, dlat = _ref_dlat(utt[:, :, 0], lat)
+    dudy = (dudy / dlat / aa)[:, :, np.newaxis]
+    dvdy, dlat = _ref_dlat(vtt[:, :, 0], lat)
+    dvdy = (dvdy / dlat / aa)[:, :, np.newaxis]
+    u_u = np.real(2. * u_t * np.conj(u_t))
+    u_v = np.real(u_t * np.conj(v_t) + v_t * np.conj(u_t))
+    v_v = np.real(2. * v_t * np.conj(v_t))
+    u_w = np.real(u_t * np.conj(wap) + wap * np.conj(u_t))
+    v_w = np.real(v_t * np.conj(wap) + wap * np.conj(v_t))
+    ke2kz = (dudy * u_v + dvdy * v_v + dudp * u_w + dvdp * v_w +
+             tanlat / aa * utt[:, :, :1] * u_v -
+             tanlat / aa * vtt[:, :, :1] * u_u)
+    ke2kz[:, :, 0] = 0.
+
+    # mkatas
+    t_r = np.fft.ifft(t_t, axis=2)
+    t_u = np.fft.fft(t_r * np.fft.ifft(u_t, axis=2), axis=2)
+    t_v = np.fft.fft(t_r * np.fft.ifft(v_t, axis=2), axis=2)
+    t_w = np.fft.fft(t_r * np.fft.ifft(wap, axis=2), axis=2)
+    ttz_3d = ttz[:, :, np.newaxis]
+    c_1 = t_u * np.conj(ttz_3d) - ttz_3d * np.conj(t_u)
+    c_6 = t_w * np.conj(ttz_3d) - ttz_3d * np.conj(t_w)
+    dttz, dlat = _ref_dlat(ttz, lat)
+    dttz = dttz[:, :, np.newaxis]
+    dlat = dlat[:, np.newaxis]
+    c_2 = np.real(t_v / (aa * dlat) * np.conj(dttz))
+    c_3 = np.real(np.conj(t_v) / (aa * dlat) * dttz)
+    c_5 = _ref_ddp(ttz, p_l)[:, :, np.newaxis]
+    at2as = (((k_k - 1) * np.imag(c_1) / (aa * coslat) +
+              np.real(t_w * np.conj(c_5) + np.conj(t_w) * c_5) +
+              np.real(c_2 + c_3) + r_d / (c_p * p_3d) * np.real(c_6)) *
+             gam_z[:, :, np.newaxis])
+    at2as[:, :, 0] = 0.
+
+    # mkktks
+    u_r = np.fft.irfft(u_t, axis=2)
+    v_r = np.fft.irfft(v_t, axis=2)
+    u_u = np.fft.rfft(u_r * u_r, axis=2)
+    v_v = np.fft.rfft(v_r * v_r, axis=2)
+    u_v = np.fft.rfft(u_r * v_r, axis=2)
+    c_1 = u_u * np.conj(u_t) - u_t * np.conj(u_u)
+    c_5 = u_u * np.conj(v_t) + v_t * np.conj(u_u)
+    c_6 = u_v * np.conj(v_t) - v_t * np.conj(u_v)
+    dut, dlat = _ref_dlat(utt, lat)
+    dvt, dlat = _ref_dlat(vtt, lat)
+    dlat = dlat[:, np.newaxis]
+    kt2ks = (np.real(np.conj(u_u) * dut / dlat + u_u * np.conj(dut) / dlat +
+                     np.conj(v_v) * dvt / dlat + v_v * np.conj(dvt) / dlat) /
+             aa + tanlat * np.real(c_1 - c_5) / aa + np.imag(c_1 + c_6) *
+             (k_k - 1) / (aa * coslat))
+    kt2ks[:, :, 0] = 0.
+    return [e_k, ape, a2k, ae2az, ke2kz, at2as, kt2ks]
+
+
+def test_kernels_original_formulas(fields, coords):
+    """Test the kernels against the original formulas of each timestep."""
+    block = _kernels(fields, coords)
+    for t_t in range(NTIME):
+        expected = _ref_kernels([fld[t_t] for fld in fields], coords)
+        for term_block, term in zip(block, expected):
+            np.testing.assert_allclose(term_block[t_t],
+                                       term,
+                                       rtol=1e-10,
+                                       atol=1e-10 * np.abs(term).max())
+
+
+def test_kernels_time_blocks(fields, coords):
+    """Test that kernels give the same result for blocks of timesteps."""
+    block = _kernels(fields, coords)
+    for t_t in range(NTIME):
+        single = _kernels([fld[t_t] for fld in fields], coords)
+        for term_block, term in zip(block, single):
+            assert term.shape == (NLEV, NLAT, NWAVE)
+            np.testing.assert_allclose(term_block[t_t], term, rtol=1e-12,
+                                       atol=1e-12)
+
+
+def test_dfdlat():
+    """Test centred differences with one-sided ones at the boundaries."""
+    lat = np.array([0., 1., 3., 6.])
+    fld = np.array([[0., 1., 9., 36.]])
+    expected = [[1., 3., 7., 9.]]
+    np.testing.assert_allclose(lorenz_cycle.dfdlat(fld, lat, 1), expected)
+    np.testing.assert_allclose(lorenz_cycle.dfdlat(fld.T, lat, 0),
+                               np.transpose(expected))
+
+
+def test_time_mean():
+    """Test that running sums over blocks give the NaN-aware time mean."""
+    rng = np.random.default_rng(1)
+    fld = rng.normal(size=(7, 3, 4))
+    fld[2:5, 0, 0] = np.nan
+    fld[:, 1, 1] = np.nan
+    sums = {}
+    for t_0 in range(0, 7, 3):
+        lorenz_cycle.accumulate(sums, 'ek', fld[t_0:t_0 + 3])
+    result = lorenz_cycle.time_mean(sums, 'ek')
+    with np.errstate(invalid='ignore'), pytest.warns(RuntimeWarning):
+        expected = np.nanmean(fld, axis=0)
+    np.testing.assert_allclose(result, expected)
+    assert np.isnan(result[1, 1])
+
+
+def test_pr_output(tmp_path):
+    """Test that the coordinates are written with their attributes."""
+    filep = {
+        'lat': np.linspace(70., -70., NLAT),
+        'lat_attrs': {'units': 'degrees_north'},
+        'wave': np.arange(2 * NWAVE, dtype=float),
+        'wave_attrs': {'long_name': 'zonal wavenumber'},
+    }
+    varo = np.ones((NLAT, NWAVE))
+    nc_f = str(tmp_path / 'output.nc')
+    lorenz_cycle.pr_output(varo, 'ek', filep, nc_f)
+    with Dataset(nc_f) as dataset:
+        assert dataset.variables['lat'].units == 'degrees_north'
+        assert dataset.variables['wave'].long_name == 'zonal wavenumber'
+        np.testing.assert_array_equal(dataset.variables['wave'][:],
+                                      np.arange(NWAVE))
+        np.testing.assert_array_equal(dataset.variables['ek'][:], varo)
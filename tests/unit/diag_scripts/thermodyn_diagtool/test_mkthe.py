@@ -0,0 +1,250 @@
+"""Tests for the in-memory auxiliary fields of the thermodynamic tool."""
+
+import dask.array as da
+import iris
+import numpy as np
+import pytest
+from cf_units import Unit
+from iris.coords import DimCoord
+from iris.cube import Cube
+
+from esmvaltool.diag_scripts.thermodyn_diagtool import mkthe
+
+NLAT, NLON = 18, 36
+MONTH_DAYS = [31, 29, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31] + \
+    [31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31]
+
+
+def _cube(data, var_name='rlut', units='W m-2'):
+    days = np.cumsum([0] + MONTH_DAYS, dtype=float)
+    bounds = np.stack([days[:-1], days[1:]], axis=1)
+    time = DimCoord(bounds.mean(axis=1),
+                    bounds=bounds,
+                    standard_name='time',
+                    var_name='time',
+                    units=Unit('days since 2000-01-01', calendar='standard'))
+    lat = DimCoord(np.linspace(-85., 85., NLAT),
+                   standard_name='latitude',
+                   var_name='lat',
+                   units='degrees')
+    lon = DimCoord(np.linspace(5., 355., NLON),
+                   standard_name='longitude',
+                   var_name='lon',
+                   units='degrees')
+    return Cube(data,
+                var_name=var_name,
+                units=units,
+                dim_coords_and_dims=[(time, 0), (lat, 1), (lon, 2)])
+
+
+def _lat_weights():
+    edges = np.linspace(-90., 90., NLAT + 1)
+    return np.diff(np.sin(np.radians(edges)))
+
+
+@pytest.fixture
+def rlut():
+    """Monthly mean OLR for two years."""
+    rng = np.random.default_rng(0)
+    data = 240. + 20. * rng.normal(size=(len(MONTH_DAYS), NLAT, NLON))
+    return data.astype(np.float32)
+
+
+def test_yearmonmean(rlut):
+    """Test that months are weighted by their number of days."""
+    ymm = mkthe.yearmonmean(_cube(rlut))
+    assert ymm.shape == (2, NLAT, NLON)
+    for year in range(2):
+        months = slice(12 * year, 12 * year + 12)
+        expected = np.average(rlut[months],
+                              axis=0,
+                              weights=MONTH_DAYS[months])
+        np.testing.assert_allclose(ymm.data[year], expected, rtol=1e-6)
+
+
+def test_fldmean(rlut):
+    """Test the area-weighted mean and the shape of the output."""
+    mean = mkthe.fldmean(_cube(rlut))
+    assert mean.shape == (len(MONTH_DAYS), 1, 1)
+    assert [coord.name() for coord in mean.dim_coords] == [
+        'time', 'latitude', 'longitude'
+    ]
+    expected = np.average(rlut.mean(axis=2), axis=1, weights=_lat_weights())
+    np.testing.assert_allclose(mean.data[:, 0, 0], expected, rtol=1e-6)
+
+
+def test_mkthe_te_lazy(tmp_path, rlut):
+    """Test the emission temperature against a numpy computation."""
+    rlut_file = str(tmp_path / 'rlut.nc')
+    iris.save(_cube(rlut), rlut_file)
+    te_file = str(tmp_path / 'te.nc')
+    te_ymm_file = str(tmp_path / 'te_ymm.nc')
+    te_gmean = mkthe.mkthe_te_lazy(rlut_file, te_file, te_ymm_file)
+
+    t_e = np.sqrt(np.sqrt(mkthe.SIGMAINV * rlut))
+    te_ymm = np.stack([
+        np.average(t_e[12 * year:12 * year + 12],
+                   axis=0,
+                   weights=MONTH_DAYS[12 * year:12 * year + 12])
+        for year in range(2)
+    ])
+    expected = np.average(te_ymm.mean(axis=(0, 2)), weights=_lat_weights())
+    np.testing.assert_allclose(te_gmean, expected, rtol=1e-6)
+    te_cube = iris.load_cube(te_file)
+    assert te_cube.var_name == 'rlut'
+    assert te_cube.units == 'K'
+    np.testing.assert_allclose(te_cube.data, t_e, rtol=1e-6)
+    np.testing.assert_allclose(iris.load_cube(te_ymm_file).data,
+                               te_ymm,
+                               rtol=1e-6)
+    assert not (tmp_path / 'te_gmean.nc').exists()
+
+
+def test_boundary_layer_lazy():
+    """Test that the boundary layer is the same with numpy and dask."""
+    rng = np.random.default_rng(1)
+    shape = (4, NLAT, NLON)
+    fields = [
+        20. * rng.normal(size=shape),
+        0.005 + 0.002 * rng.random(size=shape),
+        98000. + 3000. * rng.normal(size=shape),
+        255. + 5. * rng.normal(size=shape),
+        285. + 10. * rng.normal(size=shape),
+        np.abs(5. * rng.normal(size=shape)),
+    ]
+    expected = mkthe.boundary_layer(*fields)
+    result = mkthe.boundary_layer(
+        *[da.from_array(field, chunks=(1, NLAT, NLON)) for field in fields])
+    for res, exp in zip(result, expected):
+        assert isinstance(res, da.Array)
+        np.testing.assert_allclose(res.compute(), exp)
+
+
+def _input_files(path):
+    """Write synthetic ts, hus, ps, uas, vas, hfss and te files."""
+    rng = np.random.default_rng(2)
+    shape = (len(MONTH_DAYS), NLAT, NLON)
+    plev = np.array([100000., 92500., 85000.])
+    fields = {
+        'ts': 285. + 10. * rng.normal(size=shape),
+        'hus': 0.005 + 0.002 * rng.random(size=(shape[0], 3) + shape[1:]),
+        'ps': 96000. + 3000. * rng.normal(size=shape),
+        'uas': 5. * rng.normal(size=shape),
+        'vas': 5. * rng.normal(size=shape),
+        'hfss': 20. * rng.normal(size=shape),
+        'rlut': 255. + 5. * rng.normal(size=shape),
+    }
+    # Zeros are missing values, also for the derived wind speed
+    for name in ('ts', 'hus', 'ps', 'hfss', 'rlut'):
+        fields[name][0, 1, 2] = 0.
+    fields['uas'][1, 2, 3] = 0.
+    fields['vas'][1, 2, 3] = 0.
+    # Values above the thresholds of setrtomiss (a dew point above the
+    # surface temperature and a very cold emission temperature)
+    fields['ts'][2, 3, 4] = 450.
+    fields['ps'][2, 3, 4] = 1e7
+    fields['hus'][2, :, 3, 4] = 0.2
+    fields['rlut'][4, 5, 6] = 150.
+    files = []
+    for (name, data) in fields.items():
+        if name == 'hus':
+            cube = _cube(data[:, 0], var_name=name, units='1')
+            cube = Cube(data,
+                        var_name=name,
+                        units='1',
+                        dim_coords_and_dims=[
+                            (cube.coord('time'), 0),
+                            (DimCoord(plev,
+                                      standard_name='air_pressure',
+                                      var_name='plev',
+                                      units='Pa'), 1),
+                            (cube.coord('latitude'), 2),
+                            (cube.coord('longitude'), 3),
+                        ])
+        else:
+            cube = _cube(data, var_name=name)
+        files.append(str(path / f'{name}.nc'))
+        iris.save(cube, files[-1])
+    return (files, fields, plev)
+
+
+def _masked(data, v_min):
+    """Mask invalid values and values in [v_min, 1e36], as setrtomiss."""
+    data = np.ma.masked_invalid(data)
+    return np.ma.masked_inside(data, v_min, 1e36)
+
+
+def test_mkthe_lazy(tmp_path):
+    """Test the auxiliary fields against a numpy computation."""
+    (files, fields, plev) = _input_files(tmp_path)
+    filenames = mkthe.mkthe_lazy(str(tmp_path), files, 'model')
+    assert filenames == tuple(
+        str(tmp_path / f'model_{name}.nc')
+        for name in ('htop', 'tabl', 'tlcl', 'tboundlay', 'tcloud',
+                     't_vertav_pot'))
+    assert not (tmp_path / 'model_huss.nc').exists()
+    assert not (tmp_path / 'model_sfcwind.nc').exists()
+
+    # Reference: zeros are missing (NaN) and huss is taken from the lowest
+    # level above the surface
+    vv_hor = np.sqrt(fields['uas'].astype(np.float32)**2 +
+                     fields['vas'].astype(np.float32)**2)
+    (t_s, hus, p_s, vv_hor, hfss, t_e) = [
+        np.where(fld == 0., np.nan, fld)
+        for fld in (fields['ts'], fields['hus'], fields['ps'], vv_hor,
+                    fields['hfss'], fields['rlut'])
+    ]
+    huss = np.where(plev[0] >= p_s, hus[:, 0], 0.)
+    for (idx, level) in enumerate(plev):
+        huss = huss + np.where(p_s >= level, hus[:, idx], 0.)
+    (ztlcl, t_z, htop) = mkthe.boundary_layer(hfss, huss, p_s, t_e, t_s,
+                                              vv_hor)
+    expected = {}
+    for (name, data, v_min) in (('htop', htop, 12000.), ('tabl', t_z, 400.),
+                                ('tlcl', ztlcl, 400.)):
+        assert np.nanmax(data) >= v_min
+        assert np.isnan(data).any()
+        expected[name] = _masked(data, v_min)
+    expected['tcloud'] = 0.5 * (expected['tlcl'] + fields['rlut'])
+    expected['t_vertav_pot'] = 0.5 * (fields['ts'] + expected['tcloud'])
+    tboundlay = 0.5 * (fields['ts'] + expected['tabl'])
+    weights = np.broadcast_to(_lat_weights()[:, np.newaxis], (NLAT, NLON))
+    expected['tboundlay'] = np.ma.stack([
+        np.ma.average(field, weights=weights) for field in tboundlay
+    ])[:, np.newaxis, np.newaxis]
+
+    var_names = {
+        'htop': 'htop',
+        'tabl': 'tabl',
+        'tlcl': 'tlcl',
+        'tboundlay': 'ts',
+        'tcloud': 'tlcl',
+        't_vertav_pot': 'ts',
+    }
+    for (name, filename) in zip(var_names, filenames):
+        cube = iris.load_cube(filename)
+        assert cube.var_name == var_names[name]
+        assert cube.units == 'K' or name == 'htop'
+        np.testing.assert_array_equal(np.ma.getmaskarray(cube.data),
+                                      np.ma.getmaskarray(expected[name]))
+        np.testing.assert_allclose(cube.data.compressed(),
+                                   expected[name].compressed(),
+                                   rtol=1e-5)
+
+
+def test_unknown_engine(tmp_path):
+    """Test that an unknown engine is rejected."""
+    with pytest.raises(ValueError):
+        mkthe.init_mkthe_te('model', str(tmp_path), {}, engine='fortran')
+
+
+@pytest.mark.parametrize('engine', ['cdo', 'iris'])
+def test_init_mkthe_direntr_indirect(tmp_path, monkeypatch, engine):
+    """Test that cdo is not needed without the direct method."""
+    def no_cdo():
+        raise AssertionError('cdo should not be used')
+
+    monkeypatch.setattr(mkthe, 'Cdo', no_cdo)
+    flags = ['y', 'y', 'y', '1']
+    assert mkthe.init_mkthe_direntr('model', str(tmp_path), {}, 'te.nc',
+                                    flags, engine=engine) == []
@@ -0,0 +1,187 @@
+"""Tests for the core functions of the climwip weighting scheme."""
+
+import dask.array as da
+import numpy as np
+import pytest
+import xarray as xr
+from scipy.spatial.distance import pdist, squareform
+
+from esmvaltool.diag_scripts.weighting.climwip import calibrate_sigmas
+from esmvaltool.diag_scripts.weighting.climwip.core_functions import (
+    calculate_independence_denominator,
+    calculate_model_distances,
+    calculate_weights,
+    calculate_weights_data,
+    distance_matrix,
+    weighted_quantile,
+    weighted_quantile_batch,
+)
+
+N_MEMBERS, N_LAT, N_LON = 8, 10, 20
+
+
+@pytest.fixture
+def model_data():
+    """Model fields with a common missing region."""
+    rng = np.random.default_rng(0)
+    values = 280. + rng.normal(size=(N_MEMBERS, N_LAT, N_LON))
+    values[:, :2, :3] = np.nan
+    lat = np.linspace(-80., 80., N_LAT)
+    return xr.DataArray(values,
+                        dims=('model_ensemble', 'lat', 'lon'),
+                        coords={
+                            'model_ensemble':
+                            [f'model{i}_r1i1p1f1_ssp585' for i in range(8)],
+                            'lat': lat,
+                            'lon': np.arange(0., 360., 18.),
+                        },
+                        name='tas',
+                        attrs={'units': 'K'})
+
+
+def _weights(model_data):
+    weights = np.cos(np.radians(model_data.lat.values))[:, np.newaxis]
+    return np.broadcast_to(weights, model_data.shape)
+
+
+@pytest.mark.parametrize('chunk_size', [7, 2**16])
+def test_distance_matrix(model_data, chunk_size):
+    """Test the distances against scipy for a common mask."""
+    values = model_data.values.reshape(N_MEMBERS, -1)
+    weights = _weights(model_data).reshape(N_MEMBERS, -1)[0]
+    not_nan = np.all(np.isfinite(values), axis=0)
+    expected = squareform(
+        pdist(values[:, not_nan], metric='euclidean', w=weights[not_nan]))
+
+    result = distance_matrix(model_data.values,
+                             _weights(model_data),
+                             chunk_size=chunk_size)
+    np.testing.assert_allclose(result, expected, rtol=1e-10)
+
+    lazy = distance_matrix(da.from_array(model_data.values, chunks=(3, 5, 20)),
+                           da.from_array(_weights(model_data)),
+                           chunk_size=chunk_size)
+    np.testing.assert_allclose(lazy, expected, rtol=1e-10)
+
+
+def test_distance_matrix_pairwise_mask(model_data):
+    """Test that missing values only affect the pairs of their member."""
+    values = model_data.values.copy()
+    values[2, 5:, 10:] = np.nan
+    result = distance_matrix(values)
+
+    flat = values.reshape(N_MEMBERS, -1)
+    for i in range(N_MEMBERS):
+        for j in range(N_MEMBERS):
+            expected = np.sqrt(np.nansum((flat[i] - flat[j])**2))
+            np.testing.assert_allclose(result[i, j], expected, rtol=1e-10)
+
+
+def test_calculate_model_distances(model_data):
+    """Test that numpy and dask backed data give the same distances."""
+    distances = calculate_model_distances(model_data)
+    assert distances.dims == ('model_ensemble_reference', 'model_ensemble')
+    assert distances.name == 'dtas'
+    lazy = calculate_model_distances(model_data.chunk({'lat': 4}))
+    np.testing.assert_allclose(lazy.values, distances.values)
+
+
+def test_calculate_independence_denominator():
+    """Test that excluded models are not considered."""
+    independence = np.array([[0., 1., 2.], [1., 0., 1.], [2., 1., 0.]])
+    not_nan = np.array([[True, True, True], [True, False, True]])
+    result = calculate_independence_denominator(independence, 1., not_nan)
+    expected = [
+        np.exp(-independence**2).sum(axis=1),
+        np.exp(-independence[:, [0, 2]]**2).sum(axis=1),
+    ]
+    np.testing.assert_allclose(result, expected)
+
+
+def test_calculate_weights_denominator(model_data):
+    """Test that a precomputed denominator gives the same weights."""
+    independence = calculate_model_distances(model_data) / 20.
+    performance = independence.rename(
+        {'model_ensemble_reference': 'perfect_model_ensemble'}).copy()
+    performance.values[np.diag_indices(N_MEMBERS)] = np.nan
+    not_nan = np.isfinite(performance.values)
+    denominator = xr.DataArray(
+        calculate_independence_denominator(independence.values, .5, not_nan),
+        coords=performance.coords,
+        dims=performance.dims)
+
+    expected = calculate_weights(performance, independence, .4, .5)
+    result = calculate_weights(performance,
+                               independence,
+                               .4,
+                               .5,
+                               denominator=denominator)
+    np.testing.assert_allclose(result.transpose(*expected.dims).values,
+                               expected.values,
+                               rtol=1e-12)
+    np.testing.assert_allclose(np.nansum(result.values, axis=-1), 1.)
+
+    weights = calculate_weights_data(None, independence.values, None, .5)
+    np.testing.assert_allclose(weights.sum(), 1.)
+
+
+def test_weighted_quantile_batch():
+    """Test that all sets of weights agree with `weighted_quantile`."""
+    rng = np.random.default_rng(1)
+    values = rng.normal(size=15)
+    values[:2] = np.nan
+    weights = rng.random(size=(4, 6, 15))
+    weights[:, 2, 3] = np.nan
+    weights[0, 3, :] = 1.
+    quantiles = [.05, .5, .95]
+    result = weighted_quantile_batch(values, quantiles, weights)
+    assert result.shape == (4, 6, 3)
+    for idx in np.ndindex(*weights.shape[:2]):
+        expected = weighted_quantile(values, quantiles, weights[idx])
+        np.testing.assert_allclose(result[idx], expected, rtol=1e-12)
+
+
+@pytest.mark.parametrize('independence_sigma', [None, .5])
+def test_evaluate_sigmas(model_data, monkeypatch, independence_sigma):
+    """Test the vectorized calibration against evaluating each sigma."""
+    # Enough models for some of the sigmas to pass the confidence test
+    n_models = 3 * N_MEMBERS
+    model_data = xr.concat([model_data + offset for offset in (0., .3, .6)],
+                           dim='model_ensemble')
+    model_data['model_ensemble'] = [f'model{i}' for i in range(n_models)]
+    independence = calculate_model_distances(model_data) / 20.
+    performance = independence.rename(
+        {'model_ensemble_reference': 'perfect_model_ensemble'})
+    target = model_data.isel(lat=5, lon=7) - 280.
+    if independence_sigma is None:
+        independence = None
+    sigmas = np.linspace(.1, 2., 20)
+
+    expected = {'baseline': {}}
+    monkeypatch.setattr(calibrate_sigmas, 'confidence_test_values', expected)
+    expected_costs = [
+        calibrate_sigmas.evaluate_target([sigma], performance.copy(), target,
+                                         independence, independence_sigma)
+        for sigma in sigmas
+    ]
+
+    result = {'baseline': {}}
+    monkeypatch.setattr(calibrate_sigmas, 'confidence_test_values', result)
+    performance = performance.copy()
+    performance.values[np.diag_indices(n_models)] = np.nan
+    denominator = calibrate_sigmas.independence_denominators(
+        performance, independence, independence_sigma)
+    costs = calibrate_sigmas.evaluate_sigmas(sigmas,
+                                             performance,
+                                             target,
+                                             denominator,
+                                             n_jobs=2)
+
+    np.testing.assert_allclose(costs, expected_costs, rtol=1e-12)
+    assert sorted(result, key=str) == sorted(expected, key=str)
+    for key in expected:
+        assert result[key]['inside_ratio'] == expected[key]['inside_ratio']
+        np.testing.assert_allclose(
+            result[key]['percentile_spread'].values,
+            expected[key]['percentile_spread'].values,
+            rtol=1e-10)
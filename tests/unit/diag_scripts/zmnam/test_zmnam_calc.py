@@ -0,0 +1,87 @@
+"""Tests for the EOF analysis of the zonal mean annular mode diagnostic."""
+
+import cftime
+import numpy as np
+import pytest
+
+from esmvaltool.diag_scripts.zmnam.zmnam_calc import (
+    lead_eofs,
+    month_bounds,
+    monthly_means,
+)
+
+NT, NLEV, NLAT = 400, 3, 12
+
+
+def _reference(zg_lp, lat):
+    """EOF analysis level by level, as in the original implementation."""
+    weights = np.sqrt(np.abs(np.cos(np.deg2rad(lat))))
+    eofs = np.zeros((zg_lp.shape[1], len(lat)))
+    eigs = np.zeros(zg_lp.shape[1])
+    pcs = np.zeros(zg_lp.shape[:2])
+    for i_lev in range(zg_lp.shape[1]):
+        anom = zg_lp[:, i_lev] * weights
+        anom = anom - np.mean(anom, axis=0)
+        cov = np.dot(anom.T, anom) / (zg_lp.shape[0] - 1)
+        eigenval, eigenvec = np.linalg.eig(cov)
+        lead = eigenval.argmax()
+        pc = np.dot(anom, eigenvec[:, lead])
+        pc = (pc - pc.mean()) / np.std(pc, ddof=1)
+        eof = eigenvec[:, lead] / weights
+        if eof[lat.argmax()] > eof[lat.argmin()]:
+            pc, eof = -pc, -eof
+        eofs[i_lev] = eof
+        eigs[i_lev] = eigenval[lead] / np.sum(eigenval)
+        pcs[:, i_lev] = pc
+    return eofs, eigs, pcs
+
+
+@pytest.fixture
+def zg_lp():
+    """Geopotential height anomalies with a dominant meridional mode."""
+    rng = np.random.default_rng(0)
+    lat = np.linspace(20., 85., NLAT)
+    mode = np.cumsum(rng.normal(size=(NT, NLEV, 1)), axis=0)
+    zg_lp = (mode * np.cos(np.deg2rad(2. * lat)) +
+             5. * rng.normal(size=(NT, NLEV, NLAT)))
+    return zg_lp, lat
+
+
+@pytest.mark.parametrize('block_size', [7, 1000])
+def test_lead_eofs(zg_lp, block_size):
+    """Test the batched EOF analysis against a level by level analysis."""
+    eofs, eigs, pcs = lead_eofs(*zg_lp, block_size=block_size)
+    expected = _reference(*zg_lp)
+    assert eofs.shape == (NLEV, NLAT)
+    assert eigs.shape == (NLEV, )
+    assert pcs.shape == (NT, NLEV)
+    for result, reference in zip((eofs, eigs, pcs), expected):
+        np.testing.assert_allclose(result, reference, rtol=1e-8, atol=1e-10)
+
+
+def test_monthly_means():
+    """Test monthly means of a series starting in the middle of a month."""
+    date = cftime.num2date(np.arange(20., 100.), 'days since 2001-01-01',
+                           '360_day')
+    sta_mon, mid_mon, end_mon = month_bounds(date)
+    np.testing.assert_array_equal(sta_mon, [10, 40])
+    np.testing.assert_array_equal(end_mon, [39, 69])
+    np.testing.assert_array_equal(mid_mon, [24, 54])
+
+    pcs = np.arange(80.)[:, np.newaxis] * [1., -1.]
+    result = monthly_means(pcs, sta_mon, end_mon)
+    expected = [[24.5, -24.5], [54.5, -54.5]]
+    np.testing.assert_allclose(result, expected)
+
+
+def test_monthly_means_partial_last_month():
+    """Test monthly means of a series ending after the 15th of a month."""
+    date = cftime.num2date(np.arange(50.), 'days since 2001-01-01',
+                           '360_day')
+    sta_mon, mid_mon, end_mon = month_bounds(date)
+    np.testing.assert_array_equal(sta_mon, [0, 30])
+    np.testing.assert_array_equal(end_mon, [29, 49])
+    np.testing.assert_array_equal(mid_mon, [14, 44])
+
+    result = monthly_means(np.arange(50.)[:, np.newaxis], sta_mon, end_mon)
+    np.testing.assert_allclose(result, [[14.5], [39.5]])